@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
-
-from typing import Union
+import threading
+import time
+from typing import List, Union
 
 import numpy as np
 import pandas as pd
@@ -18,18 +19,121 @@ from core.utils.time_utils import (
     current_date,
 )
 
+class IndexTradeCalendar(object):
+    """
+    交易日历,从上证指数的日k线一次读入所有交易日,保存为排序的数组,之后的查询都在内存中完成.
+
+    index kdata recorder写入新的日k线后会调用refresh,
+    查询的日期超过已读入的最后交易日时,也会每隔refresh_interval秒增量读取一次(其他进程写入的情况)
+    """
+
+    def __init__(self, entity_id="index_sh_000001", provider="em", refresh_interval: float = 60) -> None:
+        self.entity_id = entity_id
+        self.provider = provider
+        self.refresh_interval = refresh_interval
+
+        self.dates = np.array([], dtype="datetime64[ns]")
+        self.loaded = False
+        self.refresh_time = 0
+        self.lock = threading.Lock()
+
+    def _query_dates(self, start=None) -> np.ndarray:
+        filters = [Index1dKdata.timestamp > start] if start is not None else None
+        df = Index1dKdata.query_data(
+            entity_id=self.entity_id,
+            provider=self.provider,
+            columns=["timestamp"],
+            filters=filters,
+            order=Index1dKdata.timestamp.asc(),
+            return_type="df",
+        )
+        if pd_is_not_null(df):
+            return df["timestamp"].to_numpy(dtype="datetime64[ns]")
+        return np.array([], dtype="datetime64[ns]")
+
+    def refresh(self):
+        """
+        read the trade dates after the last loaded date
+        """
+        with self.lock:
+            if not self.loaded:
+                self.dates = self._query_dates()
+                self.loaded = True
+            else:
+                last = pd.Timestamp(self.dates[-1]) if len(self.dates) else None
+                added = self._query_dates(start=last)
+                if len(added):
+                    self.dates = np.concatenate([self.dates, added])
+            self.refresh_time = time.time()
+
+    def ensure_loaded(self, end=None):
+        if not self.loaded:
+            self.refresh()
+        elif (time.time() - self.refresh_time) > self.refresh_interval and (
+            not len(self.dates) or end is None or to_pd_timestamp(end) > pd.Timestamp(self.dates[-1])
+        ):
+            self.refresh()
+
+    def _position(self, the_date, side="left") -> int:
+        return int(np.searchsorted(self.dates, np.datetime64(to_pd_timestamp(the_date), "ns"), side=side))
+
+    def get_dates(self, start=None, end=None) -> List[pd.Timestamp]:
+        """
+        the trade dates in [start, end]
+        """
+        self.ensure_loaded(end)
+        dates = self.dates
+        start_index = self._position(start) if start is not None else 0
+        end_index = self._position(end, side="right") if end is not None else len(dates)
+        return pd.DatetimeIndex(dates[start_index:end_index]).tolist()
+
+    def offset(self, the_date, n: int):
+        """
+        the n-th trade date after the_date if n > 0, or before the_date if n < 0, the_date self if n == 0 and
+        the_date is a trade date
+
+        :return: None if out of the calendar
+        """
+        self.ensure_loaded(the_date if n <= 0 else None)
+        if n > 0:
+            index = self._position(the_date, side="right") + n - 1
+        elif n < 0:
+            index = self._position(the_date, side="left") + n
+        else:
+            index = self._position(the_date, side="left")
+            if index >= len(self.dates) or self.dates[index] != np.datetime64(to_pd_timestamp(the_date), "ns"):
+                return None
+        if 0 <= index < len(self.dates):
+            return pd.Timestamp(self.dates[index])
+        return None
+
+    def count(self, start, end) -> int:
+        """
+        count of the trade dates in (start, end], negative if end < start, which is like count_interval for trade dates
+        """
+        self.ensure_loaded(max(to_pd_timestamp(start), to_pd_timestamp(end)))
+        return self._position(end, side="right") - self._position(start, side="right")
+
+
+_index_trade_calendar = None
+_index_trade_calendar_lock = threading.Lock()
+
+
+def get_index_trade_calendar() -> IndexTradeCalendar:
+    """
+    process wide trade calendar
+    """
+    global _index_trade_calendar
+    if _index_trade_calendar is None:
+        with _index_trade_calendar_lock:
+            if _index_trade_calendar is None:
+                _index_trade_calendar = IndexTradeCalendar()
+    return _index_trade_calendar
+
+
 #获取指定日期范围内的交易日历（即股票市场的开盘日期）
 def get_trade_dates(start, end=None):
-    df = Index1dKdata.query_data(
-        entity_id="index_sh_000001",
-        provider="em",
-        columns=["timestamp"],
-        start_timestamp=start,
-        end_timestamp=end,
-        order=Index1dKdata.timestamp.asc(),
-        return_type="df",
-    )
-    return df["timestamp"].tolist()
+    return get_index_trade_calendar().get_dates(start=start, end=end)
 
 
 def get_recent_trade_dates(target_date=current_date(), days_count=5):
@@ -136,6 +240,19 @@ def generate_kdata_id(entity_id, timestamp, level):
         return "{}_{}".format(entity_id, to_time_str(timestamp, fmt=TIME_FORMAT_ISO8601))
 
 
+def generate_kdata_ids(entity_id, timestamps: pd.Series, level) -> pd.Series:
+    """
+    column-wise version of generate_kdata_id, entity_id could be str or Series aligned with timestamps
+    """
+    timestamps = pd.to_datetime(pd.Series(timestamps))
+    if level >= IntervalLevel.LEVEL_1DAY:
+        time_strs = timestamps.dt.strftime("%Y-%m-%d")
+    else:
+        # TIME_FORMAT_ISO8601 keeps milliseconds
+        time_strs = timestamps.dt.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-3]
+    return entity_id + "_" + time_strs
+
+
 def to_high_level_kdata(kdata_df: pd.DataFrame, to_level: IntervalLevel):
     def to_close(s):
         if pd_is_not_null(s):
@@ -206,6 +323,8 @@ if __name__ == "__main__":
 
 # the __all__ is generated
 __all__ = [
+    "IndexTradeCalendar",
+    "get_index_trade_calendar",
     "get_trade_dates",
     "get_recent_trade_dates",
     "get_latest_kdata_date",
@@ -213,5 +332,6 @@ __all__ = [
     "get_kdata",
     "default_adjust_type",
     "generate_kdata_id",
+    "generate_kdata_ids",
     "to_high_level_kdata",
 ]
@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 import enum
-import itertools
 import logging
 from typing import Union
 
+import numpy as np
 import pandas as pd
 
 from core.api.kdata import get_kdata_schema, default_adjust_type, get_latest_kdata_date, get_trade_dates
@@ -20,6 +20,7 @@ from core.utils.time_utils import (
     is_same_date,
     now_pd_timestamp,
     date_time_by_interval,
+    to_pd_timestamp,
 )
 
 logger = logging.getLogger(__name__)
@@ -73,7 +74,15 @@ def get_top_performance_entities_by_periods(
     turnover_threshold=100000000,
     turnover_rate_threshold=0.02,
     return_type=TopType.positive,
+    close_df: pd.DataFrame = None,
 ):
+    """
+    select the top entities of the periods before target_date, the top_count entities of every period are selected
+
+    :param close_df: preloaded close matrix covering the periods, index is timestamp and columns are entity_id,
+        it's used instead of querying the kdata if set
+    :return: selected entity ids and the longest real period
+    """
     if periods is None:
         periods = [*range(1, 21)]
     if not adjust_type:
@@ -116,8 +125,8 @@ def get_top_performance_entities_by_periods(
         return []
 
     logger.info(f"{entity_type} filter_entity_ids size: {len(filter_entity_ids)}")
-    filters = [kdata_schema.entity_id.in_(filter_entity_ids)]
-    selected = []
+    # 先根据交易日历确定每个周期的区间,再一次读入最长区间的收盘价,所有周期在内存中计算
+    windows = []
     current_start = None
     real_period = 1
     for i, period in enumerate(periods):
@@ -136,30 +145,86 @@ def get_top_performance_entities_by_periods(
             break
         current_start = trade_days[0]
         current_end = trade_days[-1]
-
         logger.info(f"trade days in: {current_start} to {current_end}, real_period: {real_period} ")
-        positive_df, negative_df = get_top_performance_entities(
-            entity_type=entity_type,
-            start_timestamp=current_start,
-            end_timestamp=current_end,
-            kdata_filters=filters,
-            pct=1,
-            show_name=True,
-            entity_provider=entity_provider,
-            data_provider=data_provider,
-            return_type=return_type,
+        windows.append((current_start, current_end))
+
+    if not windows:
+        return [], real_period
+
+    start_timestamp = min(start for start, _ in windows)
+    end_timestamp = max(end for _, end in windows)
+    if close_df is not None:
+        close_df = close_df.loc[
+            to_pd_timestamp(start_timestamp) : to_pd_timestamp(end_timestamp),
+            close_df.columns.isin(list(filter_entity_ids)),
+        ]
+    else:
+        kdata_df = kdata_schema.query_data(
+            provider=data_provider,
+            start_timestamp=start_timestamp,
+            end_timestamp=end_timestamp,
+            filters=[kdata_schema.entity_id.in_(list(filter_entity_ids))],
+            columns=["entity_id", "timestamp", "close"],
+            index=None,
         )
+        if pd_is_not_null(kdata_df):
+            close_df = kdata_df.pivot(index="timestamp", columns="entity_id", values="close").sort_index()
+    if not pd_is_not_null(close_df):
+        return [], real_period
 
-        if return_type == TopType.positive:
-            df = positive_df
-        else:
-            df = negative_df
-        if pd_is_not_null(df):
-            selected = selected + df.index[:top_count].tolist()
-            selected = list(dict.fromkeys(selected))
+    selected = []
+    for entity_ids in rank_change_by_windows(close_df, windows=windows, return_type=return_type):
+        selected = selected + entity_ids[:top_count]
+    selected = list(dict.fromkeys(selected))
     return selected, real_period
 
 
+def rank_change_by_windows(close_df: pd.DataFrame, windows, return_type=TopType.positive):
+    """
+    rank the entities by the change in every window, the change of the entity is computed with its first and last
+    close in the window, which is same as get_top_entities with WindowMethod.change
+
+    :param close_df: close matrix, index is timestamp and columns are entity_id
+    :param windows: [(start_timestamp, end_timestamp)]
+    :param return_type: TopType.positive from big to small, TopType.negative from small to big
+    :return: entity ids list of every window
+    """
+    close_df = close_df.sort_index(axis=1)
+    closes = close_df.to_numpy(dtype=float)
+    timestamps = close_df.index.to_numpy(dtype="datetime64[ns]")
+    entity_ids = close_df.columns.to_numpy()
+    size, count = closes.shape
+
+    # 每个位置之前(含)最近有数据的行,之后(含)最近有数据的行
+    positions = np.broadcast_to(np.arange(size)[:, None], closes.shape)
+    valid = ~np.isnan(closes)
+    last_positions = np.maximum.accumulate(np.where(valid, positions, -1), axis=0)
+    first_positions = np.minimum.accumulate(np.where(valid, positions, size)[::-1], axis=0)[::-1]
+    columns = np.arange(count)
+
+    result = []
+    for start_timestamp, end_timestamp in windows:
+        start = np.searchsorted(timestamps, np.datetime64(to_pd_timestamp(start_timestamp), "ns"), side="left")
+        end = np.searchsorted(timestamps, np.datetime64(to_pd_timestamp(end_timestamp), "ns"), side="right")
+        if start >= end:
+            result.append([])
+            continue
+        first_position = first_positions[start]
+        has_data = first_position < end
+        first_position = first_position[has_data]
+        last_position = last_positions[end - 1][has_data]
+        first = closes[first_position, columns[has_data]]
+        last = closes[last_position, columns[has_data]]
+        change = np.divide(last - first, np.abs(first), out=np.zeros_like(first), where=first != 0)
+
+        if return_type == TopType.negative:
+            order = np.argsort(change, kind="stable")
+        else:
+            order = np.argsort(-change, kind="stable")
+        result.append(entity_ids[has_data][order].tolist())
+    return result
+
+
 def get_top_performance_entities(
     entity_type="stock",
     start_timestamp=None,
@@ -475,53 +540,62 @@ def get_top_entities(
     )
     if not pd_is_not_null(all_df):
         return None, None
+    return compute_top_entities(all_df, column=column, pct=pct, method=method, return_type=return_type)
+
+
+def compute_top_entities(
+    all_df: pd.DataFrame,
+    column: str,
+    pct=0.1,
+    method: WindowMethod = WindowMethod.change,
+    return_type: TopType = None,
+):
+    """
+    compute the top entities of the data queried by get_top_entities, the entities are ranked by the aggregation of
+    their rows, the name would be kept if the data has the name column
+
+    :param all_df: data with entity_id and column, the rows of every entity are in time order
+    :param column:
+    :param pct: range (0,1]
+    :param method:
+    :param return_type:
+    :return: positive_df and negative_df indexed by entity_id with score column
+    """
     g = all_df.groupby("entity_id")
-    tops = {}
-    names = {}
-    for entity_id, df in g:
-        if method == WindowMethod.change:
-            start = df[column].iloc[0]
-            end = df[column].iloc[-1]
-            if start != 0:
-                change = (end - start) / abs(start)
-            else:
-                change = 0
-            tops[entity_id] = change
-        elif method == WindowMethod.avg:
-            tops[entity_id] = df[column].mean()
-        elif method == WindowMethod.sum:
-            tops[entity_id] = df[column].sum()
-
-        if show_name:
-            names[entity_id] = df["name"].iloc[0]
+    if method == WindowMethod.change:
+        agg_df = g[column].agg(["first", "last"])
+        start = agg_df["first"]
+        tops = ((agg_df["last"] - start) / start.abs()).where(start != 0, 0)
+    elif method == WindowMethod.avg:
+        tops = g[column].mean()
+    else:
+        tops = g[column].sum()
+    tops = tops.astype(float).rename_axis(None)
+
+    names = None
+    if "name" in all_df.columns:
+        names = g["name"].first()
 
     positive_df = None
     negative_df = None
     top_index = int(len(tops) * pct)
+    col = "score"
+    # nlargest/nsmallest keep the order of the same scores only when selecting part of them
+    partial = top_index < len(tops)
     if return_type is None or return_type == TopType.positive:
         # from big to small
-        positive_tops = {k: v for k, v in sorted(tops.items(), key=lambda item: item[1], reverse=True)}
-        positive_tops = dict(itertools.islice(positive_tops.items(), top_index))
-        positive_df = pd.DataFrame.from_dict(positive_tops, orient="index")
-
-        col = "score"
-        positive_df.columns = [col]
-        positive_df.sort_values(by=col, ascending=False)
+        positive = tops.nlargest(top_index) if partial else tops.sort_values(ascending=False, kind="stable")
+        positive_df = positive.to_frame(col)
     if return_type is None or return_type == TopType.negative:
         # from small to big
-        negative_tops = {k: v for k, v in sorted(tops.items(), key=lambda item: item[1])}
-        negative_tops = dict(itertools.islice(negative_tops.items(), top_index))
-        negative_df = pd.DataFrame.from_dict(negative_tops, orient="index")
-
-        col = "score"
-        negative_df.columns = [col]
-        negative_df.sort_values(by=col)
+        negative = tops.nsmallest(top_index) if partial else tops.sort_values(kind="stable")
+        negative_df = negative.to_frame(col)
 
-    if names:
+    if names is not None:
         if pd_is_not_null(positive_df):
-            positive_df["name"] = positive_df.index.map(lambda x: names[x])
+            positive_df["name"] = positive_df.index.map(names)
         if pd_is_not_null(negative_df):
-            negative_df["name"] = negative_df.index.map(lambda x: names[x])
+            negative_df["name"] = negative_df.index.map(names)
     return positive_df, negative_df
 
 
@@ -587,6 +661,7 @@ __all__ = [
     "TopType",
     "get_top_performance_by_month",
     "get_top_performance_entities_by_periods",
+    "rank_change_by_windows",
     "get_top_performance_entities",
     "get_top_fund_holding_stocks",
     "get_performance",
@@ -595,6 +670,7 @@ __all__ = [
     "get_top_volume_entities",
     "get_top_turnover_rate_entities",
     "get_top_entities",
+    "compute_top_entities",
     "show_month_performance",
     "show_industry_composition",
     "get_change_ratio",
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from core.api import kdata
+from core.api.kdata import IndexTradeCalendar, get_index_trade_calendar, get_trade_dates
+from core.domain import Index1dKdata
+
+
+def to_dates(dates) -> list:
+    return [pd.Timestamp(the_date) for the_date in dates]
+
+
+class IndexTradeCalendarTest(unittest.TestCase):
+    """IndexTradeCalendar test"""
+
+    def setUp(self):
+        self.dates = to_dates(["2023-01-03", "2023-01-04", "2023-01-05", "2023-01-06", "2023-01-09"])
+        self.queried_starts = []
+        self.now = 1000.0
+        patches = [
+            mock.patch.object(Index1dKdata, "query_data", side_effect=self.query_data),
+            mock.patch.object(kdata.time, "time", side_effect=lambda: self.now),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.calendar = IndexTradeCalendar(refresh_interval=60)
+
+    def query_data(self, entity_id=None, provider=None, filters=None, **kwargs):
+        self.assertEqual((entity_id, provider), ("index_sh_000001", "em"))
+        # the value of the Index1dKdata.timestamp > start filter
+        start = filters[0].right.value if filters else None
+        self.queried_starts.append(start)
+        dates = [the_date for the_date in self.dates if start is None or the_date > start]
+        if not dates:
+            return None
+        return pd.DataFrame({"timestamp": dates})
+
+    def test_get_dates(self):
+        self.assertEqual(self.calendar.get_dates(), self.dates)
+        self.assertEqual(self.calendar.get_dates("2023-01-04", "2023-01-06"), self.dates[1:4])
+        self.assertEqual(self.calendar.get_dates("2023-01-07", "2023-01-08"), [])
+        self.assertEqual(self.calendar.get_dates(start="2023-01-06"), self.dates[3:])
+        self.assertEqual(self.calendar.get_dates(end="2023-01-04"), self.dates[:2])
+        # 都在内存中查询
+        self.assertEqual(self.queried_starts, [None])
+
+    def test_offset(self):
+        self.assertEqual(self.calendar.offset("2023-01-04", 1), pd.Timestamp("2023-01-05"))
+        self.assertEqual(self.calendar.offset("2023-01-04", 3), pd.Timestamp("2023-01-09"))
+        self.assertEqual(self.calendar.offset("2023-01-07", 1), pd.Timestamp("2023-01-09"))
+        self.assertEqual(self.calendar.offset("2023-01-05", -2), pd.Timestamp("2023-01-03"))
+        self.assertEqual(self.calendar.offset("2023-01-08", -1), pd.Timestamp("2023-01-06"))
+        self.assertEqual(self.calendar.offset("2023-01-05", 0), pd.Timestamp("2023-01-05"))
+        self.assertIsNone(self.calendar.offset("2023-01-07", 0))
+        # 超出日历
+        self.assertIsNone(self.calendar.offset("2023-01-06", 2))
+        self.assertIsNone(self.calendar.offset("2023-01-03", -1))
+
+    def test_count(self):
+        self.assertEqual(self.calendar.count("2023-01-03", "2023-01-09"), 4)
+        self.assertEqual(self.calendar.count("2023-01-07", "2023-01-09"), 1)
+        self.assertEqual(self.calendar.count("2023-01-06", "2023-01-08"), 0)
+        self.assertEqual(self.calendar.count("2023-01-09", "2023-01-04"), -3)
+
+    def test_refresh(self):
+        self.calendar.get_dates()
+        self.dates.append(pd.Timestamp("2023-01-10"))
+        # 读入后未到刷新间隔
+        self.now += 30
+        self.assertEqual(self.calendar.get_dates(end="2023-01-10"), self.dates[:-1])
+
+        # 查询的日期没有超过最后的交易日不刷新
+        self.now += 60
+        self.assertEqual(self.calendar.get_dates(end="2023-01-09"), self.dates[:-1])
+        self.assertEqual(self.queried_starts, [None])
+
+        # 增量读取最后交易日之后的数据
+        self.assertEqual(self.calendar.get_dates(end="2023-01-10"), self.dates)
+        self.assertEqual(self.queried_starts, [None, pd.Timestamp("2023-01-09")])
+
+        # 主动刷新
+        self.dates.append(pd.Timestamp("2023-01-11"))
+        self.calendar.refresh()
+        self.assertEqual(self.calendar.get_dates(), self.dates)
+        self.assertEqual(self.queried_starts[-1], pd.Timestamp("2023-01-10"))
+
+    def test_empty(self):
+        self.dates = []
+        self.assertEqual(self.calendar.get_dates(), [])
+        self.assertIsNone(self.calendar.offset("2023-01-04", 1))
+        self.assertEqual(self.calendar.count("2023-01-03", "2023-01-09"), 0)
+
+        # 没有数据时过了刷新间隔就重新读取
+        self.dates = to_dates(["2023-01-03"])
+        self.now += 61
+        self.assertEqual(self.calendar.get_dates(), self.dates)
+        self.assertEqual(self.queried_starts, [None, None])
+
+    def test_get_trade_dates(self):
+        with mock.patch.object(kdata, "_index_trade_calendar", None):
+            self.assertIs(get_index_trade_calendar(), get_index_trade_calendar())
+            self.assertEqual(get_trade_dates("2023-01-05"), self.dates[2:])
+            self.assertEqual(get_trade_dates("2023-01-04", "2023-01-05"), self.dates[1:3])
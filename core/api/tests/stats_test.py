@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from core.api import stats
+from core.api.stats import (
+    WindowMethod,
+    TopType,
+    compute_top_entities,
+    get_top_performance_entities_by_periods,
+    rank_change_by_windows,
+)
+from core.domain import Stock1dHfqKdata
+
+
+def gen_top_df() -> pd.DataFrame:
+    """
+    4个标的3天的收盘价, 按时间排序
+
+    change: 000001 0.2, 000002 -0.25, 000003 起始价格为0记为0, 000004 0.2(与000001相同)
+    avg: 11, 53/3, 11/3, 35/3
+    sum: 33, 53, 11, 35
+    """
+    closes = {
+        "stock_sz_000001": [10, 11, 12],
+        "stock_sz_000002": [20, 18, 15],
+        "stock_sz_000003": [0, 5, 6],
+        "stock_sz_000004": [10, 13, 12],
+    }
+    df = pd.DataFrame(
+        {
+            "entity_id": np.repeat(list(closes), 3),
+            "timestamp": np.tile(pd.date_range("2023-01-01", periods=3), len(closes)),
+            "close": np.concatenate(list(closes.values())).astype(float),
+            "name": np.repeat(["甲", "乙", "丙", "丁"], 3),
+        }
+    )
+    return df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+def top_df(scores: dict) -> pd.DataFrame:
+    """按code给出的分数, 结果以entity_id为索引"""
+    names = {"000001": "甲", "000002": "乙", "000003": "丙", "000004": "丁"}
+    return pd.DataFrame(
+        {"score": list(scores.values()), "name": [names[code] for code in scores]},
+        index=[f"stock_sz_{code}" for code in scores],
+    )
+
+
+class ComputeTopEntitiesTest(unittest.TestCase):
+    """compute_top_entities test"""
+
+    def setUp(self):
+        self.all_df = gen_top_df()
+
+    def assert_top(self, method, pct, positive: dict, negative: dict):
+        for return_type in (None, TopType.positive, TopType.negative):
+            with self.subTest(method=method, pct=pct, return_type=return_type):
+                positive_df, negative_df = compute_top_entities(
+                    self.all_df, "close", pct=pct, method=method, return_type=return_type
+                )
+                if return_type == TopType.negative:
+                    self.assertIsNone(positive_df)
+                else:
+                    pd.testing.assert_frame_equal(positive_df, top_df(positive))
+                if return_type == TopType.positive:
+                    self.assertIsNone(negative_df)
+                else:
+                    pd.testing.assert_frame_equal(negative_df, top_df(negative))
+
+    def test_change(self):
+        # 相同的分数保持标的顺序
+        positive = {"000001": 0.2, "000004": 0.2, "000003": 0.0, "000002": -0.25}
+        negative = {"000002": -0.25, "000003": 0.0, "000001": 0.2, "000004": 0.2}
+        self.assert_top(WindowMethod.change, 1, positive, negative)
+        self.assert_top(WindowMethod.change, 0.5, dict(list(positive.items())[:2]), dict(list(negative.items())[:2]))
+        self.assert_top(WindowMethod.change, 0.3, dict(list(positive.items())[:1]), dict(list(negative.items())[:1]))
+
+    def test_avg(self):
+        positive = {"000002": 53 / 3, "000004": 35 / 3, "000001": 11.0, "000003": 11 / 3}
+        self.assert_top(WindowMethod.avg, 1, positive, dict(reversed(list(positive.items()))))
+
+    def test_sum(self):
+        positive = {"000002": 53.0, "000004": 35.0, "000001": 33.0, "000003": 11.0}
+        self.assert_top(WindowMethod.sum, 1, positive, dict(reversed(list(positive.items()))))
+        self.assert_top(WindowMethod.sum, 0.5, {"000002": 53.0, "000004": 35.0}, {"000003": 11.0, "000001": 33.0})
+
+    def test_without_name(self):
+        positive_df, _ = compute_top_entities(
+            self.all_df.drop(columns=["name"]), "close", method=WindowMethod.sum, pct=0.5, return_type=TopType.positive
+        )
+        pd.testing.assert_frame_equal(positive_df, top_df({"000002": 53.0, "000004": 35.0})[["score"]])
+
+
+def gen_close_df(entity_count=30, size=40) -> pd.DataFrame:
+    """随机的收盘价矩阵, 有缺失, 0价格和整段没有数据的标的"""
+    rng = np.random.default_rng(1)
+    close = 10 + rng.standard_normal((size, entity_count)).cumsum(axis=0) * 0.2
+    close[rng.random((size, entity_count)) < 0.2] = np.nan
+    # 起始价格为0
+    close[:5, ::7] = 0
+    # 前半段停牌
+    close[: size // 2, 3] = np.nan
+    # 相同的行情
+    close[:, 11] = close[:, 10]
+    entity_ids = [f"stock_sz_{i:06d}" for i in rng.permutation(entity_count)]
+    return pd.DataFrame(close, index=pd.date_range("2023-01-01", periods=size), columns=entity_ids)
+
+
+def rank_by_compute_top_entities(close_df: pd.DataFrame, start, end, return_type) -> list:
+    all_df = (
+        close_df.loc[start:end]
+        .rename_axis(index="timestamp", columns="entity_id")
+        .reset_index()
+        .melt(id_vars="timestamp", value_name="close")
+        .dropna()
+        .sort_values("timestamp", kind="stable")
+    )
+    if all_df.empty:
+        return []
+    positive_df, negative_df = compute_top_entities(
+        all_df, "close", pct=1, method=WindowMethod.change, return_type=return_type
+    )
+    return (negative_df if return_type == TopType.negative else positive_df).index.tolist()
+
+
+class RankChangeByWindowsTest(unittest.TestCase):
+    """rank_change_by_windows should be same as compute_top_entities window by window"""
+
+    def setUp(self):
+        self.close_df = gen_close_df()
+        days = self.close_df.index
+        self.windows = [
+            (days[0], days[-1]),
+            (days[0], days[4]),
+            (days[3], days[15]),
+            (days[20], days[20]),
+            (days[10] - pd.Timedelta(hours=12), days[30] + pd.Timedelta(hours=12)),
+            (days[-1] + pd.Timedelta(days=1), days[-1] + pd.Timedelta(days=5)),
+            (days[0] - pd.Timedelta(days=5), days[0] - pd.Timedelta(days=1)),
+        ]
+
+    def test_rank_change_by_windows(self):
+        for return_type in (TopType.positive, TopType.negative):
+            result = rank_change_by_windows(self.close_df, windows=self.windows, return_type=return_type)
+            self.assertEqual(len(result), len(self.windows))
+            for (start, end), entity_ids in zip(self.windows, result):
+                with self.subTest(return_type=return_type, start=start, end=end):
+                    self.assertEqual(
+                        entity_ids, rank_by_compute_top_entities(self.close_df, start, end, return_type)
+                    )
+
+    def test_empty_windows(self):
+        days = self.close_df.index
+        self.assertEqual(rank_change_by_windows(self.close_df, windows=[]), [])
+        self.assertEqual(rank_change_by_windows(self.close_df, windows=[(days[5], days[4])]), [[]])
+        # 区间内没有数据的标的不参与排名
+        entity_ids = rank_change_by_windows(self.close_df, windows=[(days[0], days[5])])[0]
+        self.assertNotIn(self.close_df.columns[3], entity_ids)
+
+
+def kdata_filter_ids(filters) -> list:
+    """the entity ids of the kdata_schema.entity_id.in_ filter"""
+    return filters[0].right.value
+
+
+class TopPerformanceByPeriodsTest(unittest.TestCase):
+    periods = [1, 3, 7, 15, 30]
+
+    def setUp(self):
+        self.close_df = gen_close_df()
+        self.kdata_df = (
+            self.close_df.rename_axis(index="timestamp", columns="entity_id")
+            .reset_index()
+            .melt(id_vars="timestamp", value_name="close")
+            .dropna()
+        )
+        # 成交额过滤后剩下的标的
+        self.turnover_entity_ids = self.close_df.columns[::2].tolist()
+        self.entity_ids = self.close_df.columns[:20].tolist()
+
+        days = self.close_df.index
+        patches = [
+            mock.patch.object(Stock1dHfqKdata, "query_data", side_effect=self.query_data),
+            mock.patch.object(stats, "get_entity_ids_by_filter", return_value=self.entity_ids),
+            mock.patch.object(
+                stats,
+                "get_trade_dates",
+                side_effect=lambda start, end: days[(days >= start) & (days <= end)].tolist(),
+            ),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def query_data(self, index=None, start_timestamp=None, end_timestamp=None, **kwargs):
+        if index == "entity_id":
+            return pd.DataFrame({"entity_id": self.turnover_entity_ids}).set_index("entity_id", drop=False)
+        df = self.kdata_df
+        df = df[(df["timestamp"] >= start_timestamp) & (df["timestamp"] <= end_timestamp)]
+        return df[df["entity_id"].isin(kdata_filter_ids(kwargs["filters"]))]
+
+    def top_by_periods(self, **kwargs):
+        return get_top_performance_entities_by_periods(
+            entity_provider="em",
+            data_provider="em",
+            target_date=self.close_df.index[-1],
+            periods=self.periods,
+            adjust_type="hfq",
+            top_count=3,
+            **kwargs,
+        )
+
+    def test_close_df(self):
+        candidates = sorted(set(self.entity_ids) & set(self.turnover_entity_ids))
+        target_date = self.close_df.index[-1]
+        for return_type in (TopType.positive, TopType.negative):
+            with self.subTest(return_type=return_type):
+                selected, real_period = self.top_by_periods(close_df=self.close_df, return_type=return_type)
+                self.assertEqual(real_period, self.periods[-1])
+
+                expected = []
+                for period in self.periods:
+                    start = target_date - pd.Timedelta(days=period)
+                    entity_ids = rank_by_compute_top_entities(
+                        self.close_df[candidates], start, target_date, return_type
+                    )
+                    expected = expected + entity_ids[:3]
+                self.assertEqual(selected, list(dict.fromkeys(expected)))
+
+                # 与查询数据库的结果一致
+                self.assertEqual(self.top_by_periods(return_type=return_type), (selected, real_period))
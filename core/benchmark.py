@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+向量化实现与原实现的耗时对比
+
+原来的逐行/逐个标的实现作为对照保存在这里, 数据由core.utils.testing.gen_kdata_df生成,
+正确性由对应的单元测试用手算的结果保证
+
+    python -m core.benchmark            # 运行所有
+    python -m core.benchmark stats      # 只运行某一项
+"""
+import itertools
+import sys
+import time
+
+
+def timeit(name, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{name}: {time.perf_counter() - start:.3f}s")
+    return result
+
+
+def legacy_top_entities(all_df, column, pct, method, return_type):
+    """原get_top_entities逐个标的计算分数"""
+    import pandas as pd
+
+    from core.api.stats import TopType, WindowMethod
+
+    g = all_df.groupby("entity_id")
+    tops = {}
+    names = {}
+    for entity_id, df in g:
+        if method == WindowMethod.change:
+            start = df[column].iloc[0]
+            end = df[column].iloc[-1]
+            if start != 0:
+                change = (end - start) / abs(start)
+            else:
+                change = 0
+            tops[entity_id] = change
+        elif method == WindowMethod.avg:
+            tops[entity_id] = df[column].mean()
+        elif method == WindowMethod.sum:
+            tops[entity_id] = df[column].sum()
+        names[entity_id] = df["name"].iloc[0]
+
+    positive_df = None
+    negative_df = None
+    top_index = int(len(tops) * pct)
+    if return_type is None or return_type == TopType.positive:
+        positive_tops = {k: v for k, v in sorted(tops.items(), key=lambda item: item[1], reverse=True)}
+        positive_tops = dict(itertools.islice(positive_tops.items(), top_index))
+        positive_df = pd.DataFrame.from_dict(positive_tops, orient="index")
+        positive_df.columns = ["score"]
+        positive_df["name"] = positive_df.index.map(lambda x: names[x])
+    if return_type is None or return_type == TopType.negative:
+        negative_tops = {k: v for k, v in sorted(tops.items(), key=lambda item: item[1])}
+        negative_tops = dict(itertools.islice(negative_tops.items(), top_index))
+        negative_df = pd.DataFrame.from_dict(negative_tops, orient="index")
+        negative_df.columns = ["score"]
+        negative_df["name"] = negative_df.index.map(lambda x: names[x])
+    return positive_df, negative_df
+
+
+def bench_stats(entity_count=5000, size=250):
+    """get_top_entities 排序计算"""
+    from core.api.stats import WindowMethod, compute_top_entities
+    from core.utils.testing import gen_kdata_df
+
+    all_df = gen_kdata_df(entity_count, size)
+    print(f"entities: {entity_count}, rows: {len(all_df)}")
+    for method in WindowMethod:
+        timeit(f"{method.value} by loop", lambda: legacy_top_entities(all_df, "close", 0.1, method, None))
+        timeit(
+            f"{method.value} by groupby.agg",
+            lambda: compute_top_entities(all_df, "close", pct=0.1, method=method, return_type=None),
+        )
+
+
+def legacy_macd_transform(transformer, input_df):
+    """原MacdTransformer按标的groupby.apply计算"""
+    import pandas as pd
+
+    from core.factors.algorithm import macd
+
+    macd_df = input_df.groupby(level=0)["close"].apply(
+        lambda x: macd(
+            x,
+            slow=transformer.slow,
+            fast=transformer.fast,
+            n=transformer.n,
+            return_type="df",
+            normal=transformer.normal,
+            count_live_dead=transformer.count_live_dead,
+        )
+    )
+    macd_df = macd_df.reset_index(level=0, drop=True)
+    return pd.concat([input_df, macd_df], axis=1, sort=False, verify_integrity=True)
+
+
+def legacy_acc(accumulator, input_df, acc_df, states):
+    """原Accumulator.acc每个标的都对acc_df做一次groupby"""
+    new_states = {}
+
+    def cal_acc(x):
+        entity_id = x.index[0][0]
+        acc_g = acc_df.groupby(level=0)
+        acc_one_df = None
+        if entity_id in acc_g.groups:
+            acc_one_df = acc_g.get_group(entity_id).reset_index(level=0, drop=True)
+        one_result, state = accumulator.acc_one(
+            entity_id=entity_id, df=x.reset_index(level=0, drop=True), acc_df=acc_one_df, state=states.get(entity_id)
+        )
+        new_states[entity_id] = state
+        return one_result
+
+    return input_df.groupby(level=0).apply(lambda x: cal_acc(x)), new_states
+
+
+def bench_factor(entity_count=3000, size=250):
+    """panel Transformer/Accumulator 批量计算, 新增一根k线时的增量计算"""
+    from core.contract.factor import Accumulator
+    from core.factors.algorithm import MacdTransformer
+    from core.utils.pd_utils import pd_is_not_null
+    from core.utils.testing import gen_kdata_df
+
+    class CumVolumeAccumulator(Accumulator):
+        def acc_one(self, entity_id, df, acc_df, state):
+            start = acc_df["cum_volume"].iloc[-1] if pd_is_not_null(acc_df) else 0
+            df = df.copy()
+            df["cum_volume"] = df["volume"].cumsum() + start
+            return df, {"count": len(df) + (state or {}).get("count", 0)}
+
+    def gen_panel_df(size):
+        df = gen_kdata_df(entity_count, size, columns=("close", "volume"))
+        return df.set_index(["entity_id", "timestamp"], drop=False).sort_index()
+
+    input_df = gen_panel_df(size)
+    print(f"entities: {entity_count}, rows: {len(input_df)}")
+
+    transformer = MacdTransformer(normal=True, count_live_dead=True)
+    timeit("macd by groupby.apply", lambda: legacy_macd_transform(transformer, input_df.copy()))
+    timeit("macd by panel", lambda: transformer.transform(input_df.copy()))
+
+    timestamps = input_df.index.levels[1]
+    pre_df = input_df[input_df.index.get_level_values(1) < timestamps[-1]]
+    added_index = input_df.index[input_df.index.get_level_values(1) == timestamps[-1]]
+    _, states = transformer.transform_incremental(pre_df, pre_df.index, {})
+    timeit(
+        "macd incremental for one added bar", lambda: transformer.transform_incremental(input_df, added_index, states)
+    )
+
+    # 已有20个结果, 增量计算新的数据
+    acc_input_df = gen_panel_df(20)
+    accumulator = CumVolumeAccumulator()
+    acc_df, states = accumulator.acc(acc_input_df, None, {})
+    timeit("acc by groupby.apply", lambda: legacy_acc(accumulator, acc_input_df, acc_df, states))
+    timeit("acc by pre-split", lambda: accumulator.acc(acc_input_df, acc_df, states))
+
+
+def legacy_build(kdata_df):
+    """原query_kdata逐行apply后groupby.agg构造响应"""
+    from core.trading.trading_service import KDATA_DATA_COLUMNS
+
+    kdata_df["timestamp"] = kdata_df["timestamp"].apply(lambda x: int(x.timestamp()))
+    kdata_df["data"] = kdata_df.apply(lambda x: x[KDATA_DATA_COLUMNS].values.tolist(), axis=1)
+    df = kdata_df.groupby("entity_id").agg(
+        code=("code", "first"),
+        name=("name", "first"),
+        level=("level", "first"),
+        datas=("data", lambda data: list(data)),
+    )
+    df = df.reset_index(drop=False)
+    return df.to_dict(orient="records")
+
+
+def bench_kdata_response(entity_count=300, size=1000):
+    """query_kdata 响应构造"""
+    import numpy as np
+
+    from core.trading.trading_models import DataFormat
+    from core.trading.trading_service import KDATA_DATA_COLUMNS, build_arrow_stream, build_entity_datas
+    from core.utils.testing import gen_kdata_df
+
+    def build(kdata_df, data_format):
+        kdata_df["timestamp"] = kdata_df["timestamp"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+        if data_format == DataFormat.arrow:
+            return build_arrow_stream(kdata_df, KDATA_DATA_COLUMNS, ["code", "name", "level"])
+        return build_entity_datas(kdata_df, KDATA_DATA_COLUMNS, ["code", "name", "level"], data_format)
+
+    kdata_df = gen_kdata_df(entity_count, size, columns=KDATA_DATA_COLUMNS[1:])
+    print(f"entities: {entity_count}, rows: {len(kdata_df)}")
+    timeit("rows by apply + groupby.agg", lambda: legacy_build(kdata_df.copy()))
+    for data_format in DataFormat:
+        timeit(f"{data_format.value} format", lambda: build(kdata_df.copy(), data_format))
+
+
+def legacy_rsi_strategy(data, initial_capital=100000, trade_volume=100, commission_rate=0.0003, rsi_period=14,
+                        overbought=70, oversold=30):
+    """原backtest_rsi_strategy逐行回测"""
+    from internal.pkg.strategy.rsi import calculate_rsi
+
+    data = data.copy()
+    data["signal"] = 0
+    data["position"] = 0
+    data["cash"] = initial_capital
+    data["stock_value"] = 0.0
+    data["total_asset"] = initial_capital
+    data["trade_amount"] = 0.0
+
+    data = calculate_rsi(data, rsi_period)
+    float_cols = ["cash", "stock_value", "total_asset"]
+    data[float_cols] = data[float_cols].astype("float64")
+
+    for i in range(1, len(data)):
+        prev_row = data.iloc[i - 1]
+        current_row = data.iloc[i]
+
+        data.iloc[i, data.columns.get_loc("position")] = prev_row["position"]
+        data.iloc[i, data.columns.get_loc("cash")] = prev_row["cash"]
+
+        if i >= 2 and prev_row["RSI"] > oversold and data.iloc[i - 2]["RSI"] <= oversold:
+            buy_cost = current_row["开盘"] * trade_volume * (1 + commission_rate)
+            if prev_row["cash"] >= buy_cost:
+                data.iloc[i, data.columns.get_loc("signal")] = 1
+                data.iloc[i, data.columns.get_loc("position")] = prev_row["position"] + trade_volume
+                data.iloc[i, data.columns.get_loc("cash")] = float(prev_row["cash"] - buy_cost)
+                data.iloc[i, data.columns.get_loc("trade_amount")] = -buy_cost
+        elif i >= 2 and prev_row["RSI"] < overbought and data.iloc[i - 2]["RSI"] >= overbought:
+            if prev_row["position"] >= trade_volume:
+                sell_revenue = current_row["开盘"] * trade_volume * (1 - commission_rate)
+                data.iloc[i, data.columns.get_loc("signal")] = -1
+                data.iloc[i, data.columns.get_loc("position")] = prev_row["position"] - trade_volume
+                data.iloc[i, data.columns.get_loc("cash")] = prev_row["cash"] + sell_revenue
+                data.iloc[i, data.columns.get_loc("trade_amount")] = sell_revenue
+
+        data.iloc[i, data.columns.get_loc("stock_value")] = data.iloc[i]["position"] * current_row["收盘"]
+        data.iloc[i, data.columns.get_loc("total_asset")] = data.iloc[i]["cash"] + data.iloc[i]["stock_value"]
+
+    return data
+
+
+def bench_rsi(size=2000):
+    """rsi策略回测: 逐行回测 与 向量化回测/参数网格"""
+    import pandas as pd
+
+    from core.utils.testing import gen_kdata_df
+    from internal.pkg.strategy.rsi import backtest_rsi_grid, backtest_rsi_strategy
+
+    data = gen_kdata_df(1, size, columns=("open", "close")).rename(columns={"open": "开盘", "close": "收盘"})
+    data.index = pd.to_datetime(data["timestamp"])
+    print(f"rows: {size}")
+    timeit("by row", lambda: legacy_rsi_strategy(data))
+    timeit("vectorized", lambda: backtest_rsi_strategy(data))
+    grid = dict(rsi_periods=range(5, 31), overboughts=range(60, 91, 5), oversolds=range(10, 41, 5))
+    combinations = len(list(itertools.product(*grid.values())))
+    timeit(f"grid of {combinations}", lambda: backtest_rsi_grid(data, **grid))
+
+
+def bench_df_to_db(size=50000):
+    """df_to_db 写入(SQLite), 一半数据已存在, 模拟每日增量刷新"""
+    import os
+    import tempfile
+
+    import numpy as np
+    import pandas as pd
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from core.contract.api import df_to_db
+    from core.utils.testing import MockBase, MockKdata
+
+    def gen_df(count):
+        prices = np.random.rand(count) * 100
+        return pd.DataFrame(
+            {
+                "id": [f"stock_sz_000001_{i}" for i in range(count)],
+                "entity_id": "stock_sz_000001",
+                "code": "000001",
+                "timestamp": pd.date_range("2000-01-01", periods=count),
+                "open": prices,
+                "close": prices,
+                "high": prices,
+                "low": prices,
+                "volume": prices * 1000,
+            }
+        )
+
+    print(f"rows: {size}")
+    for force_update in (False, True):
+        for bulk_upsert in (False, True):
+            with tempfile.TemporaryDirectory() as tmp:
+                engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+                MockBase.metadata.create_all(engine)
+                session = sessionmaker(bind=engine)()
+                df_to_db(gen_df(size // 2), MockKdata, provider="mock", session=session, bulk_upsert=bulk_upsert)
+                df = gen_df(size)
+                name = "bulk upsert" if bulk_upsert else "select/delete+insert"
+                timeit(
+                    f"force_update={force_update} {name}",
+                    lambda: df_to_db(
+                        df,
+                        MockKdata,
+                        provider="mock",
+                        session=session,
+                        force_update=force_update,
+                        bulk_upsert=bulk_upsert,
+                    ),
+                )
+                session.close()
+                engine.dispose()
+
+
+def bench_em_kdata_parse(rows=50000):
+    """em_api kline解析: 逐行split+to_float 与 read_csv批量解析"""
+    import numpy as np
+    import pandas as pd
+
+    from core.api.kdata import generate_kdata_id
+    from core.api.utils import value_to_pct
+    from core.contract import IntervalLevel
+    from core.recorders.em.em_api import _parse_kdata
+    from core.utils.time_utils import to_pd_timestamp
+    from core.utils.utils import to_float
+
+    def parse_by_row(results, entity_id, level):
+        data = results["data"]
+        kdatas = []
+        for result in data["klines"]:
+            fields = result.split(",")
+            the_timestamp = to_pd_timestamp(fields[0])
+            kdatas.append(
+                dict(
+                    id=generate_kdata_id(entity_id=entity_id, timestamp=the_timestamp, level=level),
+                    timestamp=the_timestamp,
+                    entity_id=entity_id,
+                    provider="em",
+                    code="600000",
+                    name=data["name"],
+                    level=level.value,
+                    open=to_float(fields[1]),
+                    close=to_float(fields[2]),
+                    high=to_float(fields[3]),
+                    low=to_float(fields[4]),
+                    volume=to_float(fields[5]),
+                    turnover=to_float(fields[6]),
+                    turnover_rate=value_to_pct(to_float(fields[10])),
+                    change_pct=value_to_pct(to_float(fields[8])),
+                )
+            )
+        return pd.DataFrame.from_records(kdatas)
+
+    rng = np.random.default_rng(0)
+    for level, size in ((IntervalLevel.LEVEL_1MIN, rows), (IntervalLevel.LEVEL_1DAY, rows // 10)):
+        freq, time_fmt = ("1min", "%Y-%m-%d %H:%M") if level < IntervalLevel.LEVEL_1DAY else ("1D", "%Y-%m-%d")
+        timestamps = pd.date_range("2015-01-05 09:31", periods=size, freq=freq)
+        close = np.round(10 + rng.standard_normal(size).cumsum() * 0.01, 2)
+        klines = [
+            f"{t.strftime(time_fmt)},{c:.2f},{c:.2f},{c + 0.05:.2f},{c - 0.05:.2f},{v},{v * c:.2f},1.00,{p:.2f},0.01,{r:.2f},0,0,0"
+            for t, c, v, p, r in zip(
+                timestamps, close, rng.integers(100, 100000, size), rng.normal(0, 2, size), rng.uniform(0, 5, size)
+            )
+        ]
+        results = {"data": {"name": "浦发银行", "klines": klines}}
+        print(f"level: {level.value}, rows: {size}")
+        timeit("by row", lambda: parse_by_row(results, "stock_sh_600000", level))
+        timeit("by read_csv", lambda: _parse_kdata(results, entity_id="stock_sh_600000", level=level))
+
+
+benchmarks = {
+    "factor": bench_factor,
+    "stats": bench_stats,
+    "kdata_response": bench_kdata_response,
+    "df_to_db": bench_df_to_db,
+    "em_kdata_parse": bench_em_kdata_parse,
+    "rsi": bench_rsi,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or benchmarks.keys():
+        print(f"---------------------- {name} ----------------------")
+        benchmarks[name]()
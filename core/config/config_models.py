@@ -1,6 +1,6 @@
 #其他配置
 
-from typing import Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field, validator
 
 class ProxyConfig(BaseModel):
@@ -93,3 +93,26 @@ class SqlInfo(BaseModel):
         False,
         description="是否启用生成表"
     )
+
+class ColumnarConfig(BaseModel):
+    """列式存储(Parquet)配置"""
+    enabled: bool = Field(
+        False,
+        description="是否启用列式存储读取"
+    )
+    root_path: str = Field(
+        "data/columnar",
+        description="列式存储根目录"
+    )
+    partition_by: Literal["entity", "year"] = Field(
+        "entity",
+        description="分区方式: entity按标的分区, year按年份分区"
+    )
+    dual_write: bool = Field(
+        True,
+        description="df_to_db写库时是否同时写入列式存储"
+    )
+    schemas: List[str] = Field(
+        default_factory=list,
+        description="启用列式存储的表名, 为空时默认所有kdata表"
+    )
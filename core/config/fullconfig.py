@@ -1,7 +1,8 @@
 from typing import Generic, TypeVar, Optional, Dict, Any, List, Literal
 from pydantic import BaseModel, validator, Field
 
-from core.config.config_models import JQDataConfig, ProxyConfig, EmailConfig, WeChatConfig, QMTConfig, AIConfig, SqlInfo
+from core.config.config_models import JQDataConfig, ProxyConfig, EmailConfig, WeChatConfig, QMTConfig, AIConfig, SqlInfo, \
+    ColumnarConfig
 from core.pkg.logger.config import LoggerConfig
 from core.pkg.scheduler.config import SchedulerConfig
 
@@ -60,4 +61,5 @@ class FullConfig(BaseModel):
     wechat: WeChatConfig = Field(default_factory=WeChatConfig)
     qmt: QMTConfig = Field(default_factory=QMTConfig)
     ai: AIConfig = Field(default_factory=AIConfig)
-    sqlinfo: SqlInfo = Field(default_factory=SqlInfo)
\ No newline at end of file
+    sqlinfo: SqlInfo = Field(default_factory=SqlInfo)
+    columnar: ColumnarConfig = Field(default_factory=ColumnarConfig)
\ No newline at end of file
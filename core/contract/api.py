@@ -2,11 +2,11 @@
 import json
 import logging
 import platform
-from typing import List, Union, Type
+from typing import Iterator, List, Optional, Union, Type
 
 import pandas as pd
 from sqlalchemy import create_engine, bindparam, TextClause
-from sqlalchemy import func, exists, and_
+from sqlalchemy import func, exists, and_, select
 from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import DeclarativeMeta
 from sqlalchemy.orm import Query
@@ -17,6 +17,7 @@ from core.config.fullconfig import FullConfig
 from core.contract import IntervalLevel
 from core.contract import zvt_context
 from core.contract.schema import Mixin, TradableEntity
+from core.db.columnarmanager import ColumnarStoreManager
 from core.db.databasemanager import DatabaseManager
 from core.utils.pd_utils import pd_is_not_null, index_df
 from core.utils.time_utils import to_pd_timestamp
@@ -320,6 +321,34 @@ def get_data(
     if not provider:
         provider = data_schema.providers[0]
 
+    # 简单的范围查询走列式存储, 复杂的sql过滤条件仍然走数据库
+    if (
+        return_type == "df"
+        and not filters
+        and order is None
+        and distinct is None
+        and not col_label
+        and ColumnarStoreManager.is_enabled_for(data_schema)
+    ):
+        df = ColumnarStoreManager.read(
+            data_schema=data_schema,
+            provider=provider,
+            columns=[col if isinstance(col, str) else col.name for col in columns] if columns else None,
+            ids=ids,
+            entity_ids=entity_ids,
+            entity_id=entity_id,
+            codes=codes,
+            code=code,
+            start_timestamp=start_timestamp,
+            end_timestamp=end_timestamp,
+            limit=limit,
+            time_field=time_field,
+        )
+        if df is not None:
+            if pd_is_not_null(df) and index:
+                df = index_df(df, index=index, drop=drop_index_col, time_field=time_field)
+            return df
+
     if not session:
         session = get_db_session(provider=provider,data_schema=data_schema)
 
@@ -459,6 +488,138 @@ def get_data_count(data_schema, filters=None, session=None):
     return count
 
 
+def _keyset_select(
+    data_schema: Type[Mixin],
+    provider: str,
+    session: Session,
+    columns: List[str],
+    entity_ids: List[str] = None,
+    codes: List[str] = None,
+    start_timestamp: Union[pd.Timestamp, str] = None,
+    end_timestamp: Union[pd.Timestamp, str] = None,
+    after_id: str = None,
+    limit: int = None,
+    time_field: str = "timestamp",
+):
+    return get_data(
+        data_schema=data_schema,
+        provider=provider,
+        session=session,
+        columns=list(columns),
+        entity_ids=entity_ids,
+        codes=codes,
+        start_timestamp=start_timestamp,
+        end_timestamp=end_timestamp,
+        filters=[data_schema.id > after_id] if after_id else None,
+        order=data_schema.id.asc(),
+        limit=limit,
+        time_field=time_field,
+        return_type="select",
+    )
+
+
+def iter_data(
+    data_schema: Type[Mixin],
+    provider: str = None,
+    columns: List[str] = None,
+    entity_ids: List[str] = None,
+    codes: List[str] = None,
+    start_timestamp: Union[pd.Timestamp, str] = None,
+    end_timestamp: Union[pd.Timestamp, str] = None,
+    after_id: str = None,
+    limit: int = None,
+    chunk_size: int = 10000,
+    time_field: str = "timestamp",
+) -> Iterator[pd.DataFrame]:
+    """
+    iterate the data in chunks ordered by id, the rows are fetched by server side cursor,
+    so the memory is bounded by chunk_size whatever the size of the table.
+
+    keyset pagination: pass the id of the last row as after_id to get the next page
+
+    :param data_schema:
+    :param provider:
+    :param columns: column names, default all columns. id is always included
+    :param entity_ids:
+    :param codes:
+    :param start_timestamp:
+    :param end_timestamp:
+    :param after_id: only the rows with id > after_id
+    :param limit: max rows, default all rows
+    :param chunk_size: rows of every chunk
+    :param time_field:
+    :return: iterator of chunk df
+    """
+    if not provider:
+        provider = data_schema.providers[0]
+    if not columns:
+        columns = get_schema_columns(data_schema)
+    elif "id" not in columns:
+        columns = ["id"] + list(columns)
+
+    session = get_db_session(provider=provider, data_schema=data_schema, force_new=True)
+    try:
+        selectable = _keyset_select(
+            data_schema,
+            provider=provider,
+            session=session,
+            columns=columns,
+            entity_ids=entity_ids,
+            codes=codes,
+            start_timestamp=start_timestamp,
+            end_timestamp=end_timestamp,
+            after_id=after_id,
+            limit=limit,
+            time_field=time_field,
+        )
+        result = session.execute(selectable.execution_options(stream_results=True, yield_per=chunk_size))
+        keys = list(result.keys())
+        for rows in result.partitions(chunk_size):
+            yield pd.DataFrame.from_records(rows, columns=keys)
+    finally:
+        session.close()
+
+
+def get_next_data_cursor(
+    data_schema: Type[Mixin],
+    limit: int,
+    provider: str = None,
+    entity_ids: List[str] = None,
+    codes: List[str] = None,
+    start_timestamp: Union[pd.Timestamp, str] = None,
+    end_timestamp: Union[pd.Timestamp, str] = None,
+    after_id: str = None,
+    time_field: str = "timestamp",
+) -> Optional[str]:
+    """
+    the after_id of the next page of iter_data with the same arguments, only the ids of the page are scanned
+
+    :return: None if the page is the last page
+    """
+    if not provider:
+        provider = data_schema.providers[0]
+    session = get_db_session(provider=provider, data_schema=data_schema, force_new=True)
+    try:
+        page = _keyset_select(
+            data_schema,
+            provider=provider,
+            session=session,
+            columns=["id"],
+            entity_ids=entity_ids,
+            codes=codes,
+            start_timestamp=start_timestamp,
+            end_timestamp=end_timestamp,
+            after_id=after_id,
+            limit=limit,
+            time_field=time_field,
+        ).subquery()
+        # 第一列是id
+        count, last_id = session.execute(select(func.count(), func.max(page.c[0]))).one()
+    finally:
+        session.close()
+    return last_id if count >= limit else None
+
+
 def get_group(provider, data_schema, column, group_func=func.count, session=None):
     if not session:
         session = get_db_session(provider=provider, data_schema=data_schema)
@@ -517,6 +678,74 @@ def get_entity_code(entity_id: str):
     return code
 
 
+_upsert_dialects = ("mysql", "postgresql", "sqlite")
+
+
+def _bulk_upsert(session: Session, data_schema: DeclarativeMeta, df: pd.DataFrame, force_update: bool = False) -> int:
+    """
+    upsert the df with dialect native statement in one executemany:
+    mysql: INSERT ... ON DUPLICATE KEY UPDATE / ON DUPLICATE KEY UPDATE id=id
+    postgresql and sqlite: INSERT ... ON CONFLICT (id) DO UPDATE / DO NOTHING
+
+    :param session: db session
+    :param data_schema: data schema
+    :param df: data with columns of the schema
+    :param force_update: whether update the data with id existed
+    :return: affected rows count
+    """
+    if not pd_is_not_null(df):
+        return 0
+
+    dialect = session.bind.dialect
+    if dialect.name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+    elif dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    table = data_schema.__table__
+    cols = df.columns.tolist()
+    stmt = insert(table)
+    new_values = stmt.inserted if dialect.name == "mysql" else stmt.excluded
+    update_cols = {col: new_values[col] for col in cols if col != "id"}
+
+    if dialect.name == "mysql":
+        if force_update and update_cols:
+            stmt = stmt.on_duplicate_key_update(update_cols)
+        else:
+            # INSERT IGNORE会把截断, 非空等错误也变成警告, id=id只跳过重复的数据
+            # DatabaseManager创建的连接不带CLIENT_FOUND_ROWS, 跳过的数据不计入rowcount
+            stmt = stmt.on_duplicate_key_update({"id": table.c.id})
+    else:
+        if force_update and update_cols:
+            stmt = stmt.on_conflict_do_update(index_elements=[table.c.id], set_=update_cols)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.id])
+
+    # compile once and bind column wise, skip the per row parameter processing of sqlalchemy
+    compiled = stmt.compile(dialect=dialect, column_keys=cols)
+    col_values = {}
+    for col in cols:
+        series = df[col]
+        values = series.astype(object).to_numpy()
+        values[pd.isna(series).to_numpy()] = None
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = [v.to_pydatetime() if v is not None else None for v in values]
+        processor = table.c[col].type.dialect_impl(dialect).bind_processor(dialect)
+        col_values[col] = [processor(v) for v in values] if processor else values
+
+    if compiled.positional:
+        params = list(zip(*[col_values[key] for key in compiled.positiontup]))
+    else:
+        params = [dict(zip(cols, row)) for row in zip(*[col_values[col] for col in cols])]
+
+    result = session.connection().exec_driver_sql(str(compiled), params)
+    if force_update or result.rowcount is None or result.rowcount < 0:
+        return len(params)
+    return result.rowcount
+
+
 def df_to_db(
     df: pd.DataFrame,
     data_schema: DeclarativeMeta,
@@ -527,6 +756,7 @@ def df_to_db(
     dtype=None,
     session=None,
     need_check=True,
+    bulk_upsert=True,
 ) -> object:
     """
     store the df to db
@@ -537,6 +767,8 @@ def df_to_db(
     :param force_update: whether update the data with id existed
     :param sub_size: update batch size
     :param drop_duplicates: whether drop duplicates
+    :param bulk_upsert: use the dialect native upsert(one round trip per chunk) if supported,
+        otherwise select/delete the existing ids before inserting
     :return:
     """
     if not pd_is_not_null(df):
@@ -573,10 +805,14 @@ def df_to_db(
     if not session:
         session = get_db_session(provider=provider, data_schema=data_schema)
 
+    upsert = need_check and bulk_upsert and session.bind.dialect.name in _upsert_dialects
+
     for step in range(step_size):
         df_current = df.iloc[sub_size * step : sub_size * (step + 1)]
 
-        if need_check:
+        if upsert:
+            saved = saved + _bulk_upsert(session, data_schema, df_current, force_update=force_update)
+        elif need_check:
             if force_update:
                 ids = df_current["id"].tolist()
                 if not ids:  # 空列表检查
@@ -595,8 +831,10 @@ def df_to_db(
                         session.execute(sql, {'ids': ids})
                     else:
                         # MySQL 和其他数据库使用 IN
-                        sql = text(f'DELETE FROM {tablename} WHERE id IN :ids')
-                        session.execute(sql, {'ids': tuple(ids)})
+                        sql = text(f'DELETE FROM {tablename} WHERE id IN :ids').bindparams(
+                            bindparam('ids', expanding=True)
+                        )
+                        session.execute(sql, {'ids': ids})
                 #session.execute(sql)
             else:
                 current = get_data(
@@ -609,12 +847,15 @@ def df_to_db(
                 if pd_is_not_null(current):
                     df_current = df_current[~df_current["id"].isin(current["id"])]
 
-        if pd_is_not_null(df_current):
+        if not upsert and pd_is_not_null(df_current):
             saved = saved + len(df_current)
             df_current.to_sql(
                 data_schema.__tablename__, session.connection(), index=False, if_exists="append", dtype=dtype
             )
         session.commit()
+
+    if ColumnarStoreManager.is_dual_write_for(data_schema):
+        ColumnarStoreManager.write(df, data_schema=data_schema, provider=provider, force_update=force_update)
     return saved
 
 
@@ -755,6 +996,8 @@ __all__ = [
     "get_data",
     "data_exist",
     "get_data_count",
+    "iter_data",
+    "get_next_data_cursor",
     "get_group",
     "decode_entity_id",
     "get_entity_type",
@@ -3,7 +3,7 @@ import json
 import logging
 import time
 from enum import Enum
-from typing import List, Union, Optional, Type
+from typing import Dict, List, Union, Optional, Type
 
 import pandas as pd
 
@@ -32,9 +32,23 @@ class Indicator(object):
 
 
 class Transformer(Indicator):
+    #: set it to True if transform_panel is implemented, the whole (entity_id, timestamp) frame
+    #: would be computed at once instead of calling transform_one for every entity
+    panel_vectorizable = False
+    #: set it to True if transform_incremental is implemented, after data changed only the added rows
+    #: would be computed instead of the whole data
+    incremental = False
+
     def __init__(self) -> None:
         super().__init__()
 
+    @property
+    def warmup_window(self) -> int:
+        """
+        the rows before the added rows needed by transform_incremental for every entity
+        """
+        return 0
+
     def transform(self, input_df: pd.DataFrame) -> pd.DataFrame:
         """
         input_df format::
@@ -49,6 +63,9 @@ class Transformer(Indicator):
         :param input_df:
         :return:
         """
+        if self.panel_vectorizable:
+            return self.transform_panel(input_df)
+
         g = input_df.groupby(level=0)
         if len(g.groups) == 1:
             entity_id = input_df.index[0][0]
@@ -61,6 +78,33 @@ class Transformer(Indicator):
         else:
             return g.apply(lambda x: self.transform_one(x.index[0][0], x.reset_index(level=0, drop=True)))
 
+    def transform_panel(self, input_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        compute all the entities at once, the input and output format is same as transform.
+        the rolling computing should be grouped by entity, e.g. input_df.groupby(level=0)["close"].rolling(5)
+
+        :param input_df:
+        :return:
+        """
+        raise NotImplementedError
+
+    def transform_incremental(
+        self, input_df: pd.DataFrame, added_index: pd.MultiIndex, states: dict
+    ) -> (pd.DataFrame, dict):
+        """
+        compute the rows of added_index only, the result should be same as transform(input_df).loc[added_index].
+
+        input_df contains the added rows and at least warmup_window rows before them for every entity,
+        the states returned by last calling could be used to continue the computing, e.g. the last value of ema.
+        call it with all the rows and empty states for initializing.
+
+        :param input_df: the data of the entities, format is same as transform
+        :param added_index: the (entity_id, timestamp) index of the added rows
+        :param states: the states returned by last calling
+        :return: the result of the added rows and new states
+        """
+        raise NotImplementedError
+
     def transform_one(self, entity_id: str, df: pd.DataFrame) -> pd.DataFrame:
         """
         df format::
@@ -114,24 +158,17 @@ class Accumulator(Indicator):
             return None, {entity_id: state}
         else:
             new_states = {}
+            #: split the previous result once, instead of grouping acc_df for every entity
+            acc_dfs = self.split_acc_df(acc_df)
+
 
             def cal_acc(x):
                 entity_id = x.index[0][0]
-                if pd_is_not_null(acc_df):
-                    acc_g = acc_df.groupby(level=0)
-                    acc_one_df = None
-                    if entity_id in acc_g.groups:
-                        acc_one_df = acc_g.get_group(entity_id)
-                        if pd_is_not_null(acc_one_df):
-                            acc_one_df = acc_one_df.reset_index(level=0, drop=True)
-                else:
-                    acc_one_df = None
-
                 one_result, state = self.acc_one(
                     entity_id=entity_id,
                     df=x.reset_index(level=0, drop=True),
-                    acc_df=acc_one_df,
-                    state=states.get(x.index[0][0]),
+                    acc_df=acc_dfs.get(entity_id),
+                    state=states.get(entity_id),
                 )
 
                 new_states[entity_id] = state
@@ -140,6 +177,22 @@ class Accumulator(Indicator):
             ret_df = g.apply(lambda x: cal_acc(x))
             return ret_df, new_states
 
+    @staticmethod
+    def split_acc_df(acc_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """
+        split the (entity_id, timestamp) acc_df to {entity_id: timestamp indexed df}
+
+        :param acc_df:
+        :return:
+        """
+        if not pd_is_not_null(acc_df):
+            return {}
+        return {
+            entity_id: df.reset_index(level=0, drop=True)
+            for entity_id, df in acc_df.groupby(level=0)
+            if pd_is_not_null(df)
+        }
+
     def acc_one(self, entity_id, df: pd.DataFrame, acc_df: pd.DataFrame, state: dict) -> (pd.DataFrame, dict):
         """
         df format::
@@ -225,6 +278,7 @@ class Factor(DataReader, EntityStateService, DataListener):
         factor_name: str = None,
         clear_state: bool = False,
         only_load_factor: bool = False,
+        incremental: bool = False,
     ) -> None:
         """
         :param keep_all_timestamp:
@@ -237,8 +291,15 @@ class Factor(DataReader, EntityStateService, DataListener):
         :param factor_name:
         :param clear_state:
         :param only_load_factor: only load factor and compute result
+        :param incremental: only compute the added rows after data changed, the transformer should support it
+            and no accumulator
         """
         self.only_load_factor = only_load_factor
+        self.incremental = incremental
+        #: transformer的增量计算状态,不持久化
+        self.transform_states = {}
+        #: 最近一次增量计算的结果
+        self.added_factor_df: pd.DataFrame = None
 
         #: define unique name of your factor if you want to keep factor state
         #: the factor state is defined by factor_name and entity_id
@@ -289,6 +350,14 @@ class Factor(DataReader, EntityStateService, DataListener):
         self.need_persist = need_persist
         self.only_compute_factor = only_compute_factor
 
+        if self.incremental:
+            if not self.transformer or not self.transformer.incremental or self.accumulator:
+                self.logger.warning(f"{self.name} could not compute incrementally, transformer:{self.transformer}")
+                self.incremental = False
+            elif self.computing_window and self.computing_window < self.transformer.warmup_window:
+                #: 保留的数据至少要满足增量计算的预热
+                self.computing_window = self.transformer.warmup_window
+
         #: 中间结果，不持久化
         #: data_df->pipe_df
         self.pipe_df: pd.DataFrame = None
@@ -401,7 +470,13 @@ class Factor(DataReader, EntityStateService, DataListener):
             return
         #: 无状态的转换运算
         if pd_is_not_null(self.data_df) and self.transformer:
-            self.pipe_df = self.transformer.transform(self.data_df)
+            if self.incremental:
+                #: 全量计算,同时初始化增量计算的状态
+                self.pipe_df, self.transform_states = self.transformer.transform_incremental(
+                    self.data_df, self.data_df.index, {}
+                )
+            else:
+                self.pipe_df = self.transformer.transform(self.data_df)
         else:
             self.pipe_df = self.data_df
 
@@ -411,6 +486,20 @@ class Factor(DataReader, EntityStateService, DataListener):
         else:
             self.factor_df = self.pipe_df
 
+    def compute_added_factor(self):
+        """
+        only compute the rows added by move_on, the result is same as compute_factor
+        """
+        self.added_factor_df, self.transform_states = self.transformer.transform_incremental(
+            self.data_df, self.added_df.index, self.transform_states
+        )
+        factor_df = pd.concat([self.factor_df, self.added_factor_df], sort=False)
+        factor_df = factor_df[~factor_df.index.duplicated(keep="last")]
+        #: 和data_df保持一致,data_df在move_on时已按computing_window裁剪
+        factor_df = factor_df[factor_df.index.isin(self.data_df.index)]
+        self.factor_df = factor_df.sort_index(level=[0, 1])
+        self.pipe_df = self.factor_df
+
     def compute_result(self):
         if pd_is_not_null(self.factor_df):
             cols = []
@@ -448,6 +537,21 @@ class Factor(DataReader, EntityStateService, DataListener):
         self.logger.info("after_compute finished,cost_time:{}s".format(cost_time))
         self.logger.info(f"[[[ ^^^^^^^^factor:{self.name} ^^^^^^^^]]]")
 
+    def compute_added(self):
+        self.logger.info(f"[[[ ~~~~~~~~factor:{self.name} added ~~~~~~~~]]]")
+        start_time = time.time()
+        self.compute_added_factor()
+        self.compute_result()
+        cost_time = time.time() - start_time
+        self.logger.info("compute added finished,cost_time:{}s".format(cost_time))
+
+        if self.keep_all_timestamp:
+            self.fill_gap()
+
+        #: 只持久化新增的数据
+        if self.need_persist and pd_is_not_null(self.added_factor_df):
+            self.persist_factor(factor_df=self.added_factor_df)
+
     def drawer_main_df(self) -> Optional[pd.DataFrame]:
         if self.only_load_factor:
             return self.factor_df
@@ -557,7 +661,10 @@ class Factor(DataReader, EntityStateService, DataListener):
 
         :param data:
         """
-        self.compute()
+        if self.incremental and pd_is_not_null(self.added_df) and pd_is_not_null(self.factor_df):
+            self.compute_added()
+        else:
+            self.compute()
 
     def on_entity_data_changed(self, entity, added_data: pd.DataFrame):
         """
@@ -568,8 +675,13 @@ class Factor(DataReader, EntityStateService, DataListener):
         """
         pass
 
-    def persist_factor(self):
-        df = self.factor_df.copy()
+    def persist_factor(self, factor_df: pd.DataFrame = None):
+        """
+        :param factor_df: the rows to persist, default is factor_df
+        """
+        if factor_df is None:
+            factor_df = self.factor_df
+        df = factor_df.copy()
         #: encode json columns
         if pd_is_not_null(df) and self.factor_col_map_object_hook():
             for col in self.factor_col_map_object_hook():
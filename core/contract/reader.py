@@ -107,6 +107,8 @@ class DataReader(Drawable):
         self.data_listeners: List[DataListener] = []
 
         self.data_df: pd.DataFrame = None
+        #: the data added by last move_on
+        self.added_df: pd.DataFrame = None
 
         self.load_data()
 
@@ -167,17 +169,30 @@ class DataReader(Drawable):
         for listener in self.data_listeners:
             listener.on_data_loaded(self.data_df)
 
-    def move_on(self, to_timestamp: Union[str, pd.Timestamp] = None, timeout: int = 20) -> object:
+    def move_on(
+        self,
+        to_timestamp: Union[str, pd.Timestamp] = None,
+        timeout: int = 20,
+        poll_interval: float = 0.5,
+        max_poll_interval: float = 5,
+    ) -> object:
         """
         using continual fetching data in realtime
         1)get the data happened before to_timestamp,if not set,get all the data which means to now
         2)if computing_window set,the data_df would be cut for saving memory
 
+        the data of all the entities is fetched by one query in every poll,
+        the interval between polls starts at poll_interval and doubles until max_poll_interval
+
 
         :param to_timestamp:
         :type to_timestamp:
         :param timeout:
         :type timeout: int
+        :param poll_interval: the first interval between polls in seconds
+        :type poll_interval: float
+        :param max_poll_interval: the max interval between polls in seconds
+        :type max_poll_interval: float
         :return:
         :rtype:
         """
@@ -187,70 +202,73 @@ class DataReader(Drawable):
             return
 
         start_time = time.time()
+        self.added_df = None
 
-        has_got = []
-        dfs = []
-        changed = False
+        #: 每个entity已有数据的最新时间
+        timestamps = self.data_df.index.get_level_values(1)
+        last_seen: pd.Series = timestamps.to_series(index=self.data_df.index.get_level_values(0)).groupby(level=0).max()
+        pending = set(last_seen.index)
+
+        added_dfs = []
+        interval = poll_interval
         while True:
-            for entity_id, df in self.data_df.groupby(level=0):
-                if entity_id in has_got:
-                    continue
-
-                recorded_timestamp = df.index.levels[1].max()
-
-                #: move_on读取数据，表明之前的数据已经处理完毕，只需要保留computing_window的数据
-                if self.computing_window:
-                    df = df.iloc[-self.computing_window :]
-
-                added_filter = [self.category_col == entity_id, self.time_col > recorded_timestamp]
-                if self.filters:
-                    filters = self.filters + added_filter
-                else:
-                    filters = added_filter
-
-                added_df = self.data_schema.query_data(
-                    provider=self.provider,
-                    columns=self.columns,
-                    end_timestamp=to_timestamp,
-                    filters=filters,
-                    level=self.level,
-                    index=[self.category_field, self.time_field],
-                )
+            pending_seen = last_seen[last_seen.index.isin(pending)]
+            #: 一次查询所有entity的新数据,再按entity的watermark过滤
+            added_filter = [self.category_col.in_(pending_seen.index.to_list()), self.time_col > pending_seen.min()]
+            if self.filters:
+                filters = self.filters + added_filter
+            else:
+                filters = added_filter
+
+            added_df = self.data_schema.query_data(
+                provider=self.provider,
+                columns=self.columns,
+                end_timestamp=to_timestamp,
+                filters=filters,
+                level=self.level,
+                index=[self.category_field, self.time_field],
+            )
 
-                if pd_is_not_null(added_df):
-                    self.logger.info(f'got new data:{df.to_json(orient="records", force_ascii=False)}')
+            if pd_is_not_null(added_df):
+                entity_ids = added_df.index.get_level_values(0)
+                added_df = added_df[added_df.index.get_level_values(1) > entity_ids.map(pending_seen).to_numpy()]
 
+            if pd_is_not_null(added_df):
+                for entity_id, df in added_df.groupby(level=0):
+                    self.logger.info(f"got new data:{entity_id} size:{len(df)}")
                     for listener in self.data_listeners:
-                        listener.on_entity_data_changed(entity=entity_id, added_data=added_df)
+                        listener.on_entity_data_changed(entity=entity_id, added_data=df)
                     #: if got data,just move to another entity_id
-                    changed = True
-                    has_got.append(entity_id)
-                    # df = df.append(added_df, sort=False)
-                    df = pd.concat([df, added_df], sort=False)
-                    dfs.append(df)
-                else:
-                    cost_time = time.time() - start_time
-                    if cost_time > timeout:
-                        #: if timeout,just add the old data
-                        has_got.append(entity_id)
-                        dfs.append(df)
-                        self.logger.warning(
-                            "category:{} level:{} getting data timeout,to_timestamp:{},now:{}".format(
-                                entity_id, self.level, to_timestamp, now_pd_timestamp()
-                            )
-                        )
-                        continue
-
-            if len(has_got) == len(self.data_df.index.levels[0]):
+                    pending.discard(entity_id)
+                added_dfs.append(added_df)
+
+            if not pending:
                 break
 
-        if dfs:
-            self.data_df = pd.concat(dfs, sort=False)
+            cost_time = time.time() - start_time
+            if cost_time >= timeout:
+                #: if timeout,just keep the old data
+                self.logger.warning(
+                    "categories:{} level:{} getting data timeout,to_timestamp:{},now:{}".format(
+                        sorted(pending), self.level, to_timestamp, now_pd_timestamp()
+                    )
+                )
+                break
+
+            time.sleep(min(interval, timeout - cost_time))
+            interval = min(interval * 2, max_poll_interval)
+
+        #: move_on读取数据，表明之前的数据已经处理完毕，只需要保留computing_window的数据
+        if self.computing_window:
+            self.data_df = self.data_df.groupby(level=0).tail(self.computing_window)
+
+        if added_dfs:
+            self.added_df = pd.concat(added_dfs, sort=False).sort_index(level=[0, 1])
+            self.data_df = pd.concat([self.data_df, self.added_df], sort=False)
             self.data_df.sort_index(level=[0, 1], inplace=True)
 
-            if changed:
-                for listener in self.data_listeners:
-                    listener.on_data_changed(self.data_df)
+            for listener in self.data_listeners:
+                listener.on_data_changed(self.data_df)
 
     def register_data_listener(self, listener):
         if listener not in self.data_listeners:
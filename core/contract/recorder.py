@@ -2,6 +2,7 @@
 import logging
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List
 
 import pandas as pd
@@ -10,12 +11,13 @@ from sqlalchemy.orm import Session
 
 from core.contract import IntervalLevel
 from core.contract.api import get_db_session, get_schema_columns
-from core.contract.api import get_entities, get_data
+from core.contract.api import get_entities, get_data, df_to_db
 from core.contract.base_service import OneStateService
 from core.contract.schema import Mixin, TradableEntity
 from core.contract.utils import is_in_same_interval, evaluate_size_from_timestamp
 from core.contract.zvt_info import RecorderState
 from core.utils.pd_utils import pd_is_not_null
+from core.utils.rate_limiter import HostRateLimiter, mount_rate_limiter
 from core.utils.time_utils import (
     to_pd_timestamp,
     TIME_FORMAT_DAY,
@@ -177,6 +179,8 @@ class EntityEventRecorder(Recorder):
 
 class TimeSeriesDataRecorder(EntityEventRecorder):
     default_size = 2000
+    #: requests per second for the hosts when recording concurrently, e.g. {"push2his.eastmoney.com": 5}
+    host_rate_limits = {}
 
     def __init__(
         self,
@@ -195,7 +199,11 @@ class TimeSeriesDataRecorder(EntityEventRecorder):
         start_timestamp=None,
         end_timestamp=None,
         return_unfinished=False,
+        max_workers=1,
     ) -> None:
+        """
+        :param max_workers: record the entities concurrently if > 1, see run_concurrently
+        """
         self.start_timestamp = to_pd_timestamp(start_timestamp)
         self.end_timestamp = to_pd_timestamp(end_timestamp)
         super().__init__(
@@ -216,6 +224,12 @@ class TimeSeriesDataRecorder(EntityEventRecorder):
         self.close_hour, self.close_minute = self.entity_schema.get_close_hour_and_minute()
         self.fix_duplicate_way = fix_duplicate_way
 
+        self.max_workers = max_workers
+        if self.max_workers > 1 and self.host_rate_limits:
+            mount_rate_limiter(
+                self.http_session, HostRateLimiter(host_rates=self.host_rate_limits), pool_maxsize=self.max_workers
+            )
+
     def get_latest_saved_record(self, entity):
         order = eval("self.data_schema.{}.desc()".format(self.get_evaluated_time_field()))
 
@@ -342,19 +356,7 @@ class TimeSeriesDataRecorder(EntityEventRecorder):
             return got_new_data, None
 
         if not items:
-            timestamp_str = original_data[self.get_original_time_field()]
-            timestamp = None
-            try:
-                timestamp = to_pd_timestamp(timestamp_str)
-            except Exception as e:
-                self.logger.exception(e)
-
-            if "name" in get_schema_columns(self.data_schema):
-                domain_item = self.data_schema(
-                    id=the_id, code=entity.code, name=entity.name, entity_id=entity.id, timestamp=timestamp
-                )
-            else:
-                domain_item = self.data_schema(id=the_id, code=entity.code, entity_id=entity.id, timestamp=timestamp)
+            domain_item = self.new_domain(entity, the_id, original_data)
             got_new_data = True
         else:
             domain_item = items[0]
@@ -362,6 +364,103 @@ class TimeSeriesDataRecorder(EntityEventRecorder):
         fill_domain_from_dict(domain_item, original_data, self.get_data_map())
         return got_new_data, domain_item
 
+    def new_domain(self, entity, the_id, original_data):
+        """
+        create the data_schema instance which not saved before
+
+        :param entity:
+        :param the_id:
+        :param original_data:
+        """
+        timestamp_str = original_data[self.get_original_time_field()]
+        timestamp = None
+        try:
+            timestamp = to_pd_timestamp(timestamp_str)
+        except Exception as e:
+            self.logger.exception(e)
+
+        if "name" in get_schema_columns(self.data_schema):
+            return self.data_schema(
+                id=the_id, code=entity.code, name=entity.name, entity_id=entity.id, timestamp=timestamp
+            )
+        return self.data_schema(id=the_id, code=entity.code, entity_id=entity.id, timestamp=timestamp)
+
+    def generate_domain_list(self, entity, original_list):
+        """
+        batch version of generate_domain, query the saved ids of the entity once and handle the duplicated id with
+        a set instead of querying db for every original data
+
+        :param entity:
+        :param original_list:
+        :return: tuple of (all_duplicated, domain_list)
+        """
+        ids = [
+            None if isinstance(original_data, self.data_schema) else self.generate_domain_id(entity, original_data)
+            for original_data in original_list
+        ]
+        query_ids = list({the_id for the_id in ids if the_id})
+
+        saved_items = {}
+        saved_ids = set()
+        if query_ids:
+            if self.force_update:
+                items = get_data(
+                    data_schema=self.data_schema,
+                    session=self.session,
+                    provider=self.provider,
+                    entity_id=entity.id,
+                    ids=query_ids,
+                    return_type="domain",
+                )
+                saved_items = {item.id: item for item in items}
+                saved_ids = set(saved_items.keys())
+            else:
+                df = get_data(
+                    data_schema=self.data_schema,
+                    session=self.session,
+                    provider=self.provider,
+                    entity_id=entity.id,
+                    ids=query_ids,
+                    columns=[self.data_schema.id],
+                )
+                if pd_is_not_null(df):
+                    saved_ids = set(df["id"].tolist())
+
+        all_duplicated = True
+        domain_list = []
+        domain_ids = set()
+        data_map = self.get_data_map()
+        for the_id, original_data in zip(ids, original_list):
+            #: the domain is directly generated in record method
+            if the_id is None:
+                domain_item = original_data
+                all_duplicated = False
+            elif the_id in saved_ids:
+                if not self.force_update:
+                    self.logger.info("ignore the data {}:{} saved before".format(self.data_schema, the_id))
+                    continue
+                domain_item = saved_items[the_id]
+                fill_domain_from_dict(domain_item, original_data, data_map)
+            else:
+                domain_item = self.new_domain(entity, the_id, original_data)
+                fill_domain_from_dict(domain_item, original_data, data_map)
+                all_duplicated = False
+
+            #: handle the case  generate_domain_id generate duplicate id
+            if domain_item.id in domain_ids:
+                #: regenerate the id
+                if self.fix_duplicate_way == "add":
+                    domain_item.id = "{}_{}".format(domain_item.id, uuid.uuid1())
+                #: ignore
+                else:
+                    self.logger.info(f"ignore original duplicate item:{domain_item.id}")
+                    continue
+
+            domain_ids.add(domain_item.id)
+            domain_list.append(domain_item)
+
+        return all_duplicated, domain_list
+
     def persist(self, entity, domain_list):
         """
         persist the domain list to db
@@ -405,7 +504,87 @@ class TimeSeriesDataRecorder(EntityEventRecorder):
     def on_finish_entity(self, entity):
         pass
 
+    def evaluate_entity(self, entity_item):
+        start_timestamp, end_timestamp, size, timestamps = self.evaluate_start_end_size_timestamps(entity_item)
+        size = int(size)
+
+        if timestamps:
+            self.logger.info(
+                "entity_id:{},evaluate_start_end_size_timestamps result:{},{},{},{}-{}".format(
+                    entity_item.id, start_timestamp, end_timestamp, size, timestamps[0], timestamps[-1]
+                )
+            )
+        else:
+            self.logger.info(
+                "entity_id:{},evaluate_start_end_size_timestamps result:{},{},{},{}".format(
+                    entity_item.id, start_timestamp, end_timestamp, size, timestamps
+                )
+            )
+        return start_timestamp, end_timestamp, size, timestamps
+
+    def handle_record_result(self, entity_item, start_timestamp, original_list) -> bool:
+        """
+        persist the result of record method and check whether the entity is finished
+
+        :param entity_item:
+        :param start_timestamp:
+        :param original_list: json list, domain list or DataFrame returned by record
+        :return: whether the entity is finished
+        """
+        all_duplicated = True
+
+        if isinstance(original_list, pd.DataFrame):
+            #: the DataFrame is the whole result of the entity,so we handle it as recorder which persisted in record
+            if pd_is_not_null(original_list):
+                df_to_db(
+                    df=original_list,
+                    data_schema=self.data_schema,
+                    provider=self.provider,
+                    force_update=self.force_update,
+                    session=self.session,
+                )
+            original_list = None
+        elif original_list:
+            all_duplicated, domain_list = self.generate_domain_list(entity_item, original_list)
+
+            if domain_list:
+                self.persist(entity_item, domain_list)
+            else:
+                self.logger.info("just got {} duplicated data in this cycle".format(len(original_list)))
+
+        #: could not get more data
+        entity_finished = False
+        if not original_list or all_duplicated:
+            #: not realtime
+            if not self.real_time:
+                entity_finished = True
+
+            #: realtime and to the close time
+            if self.real_time and (self.close_hour is not None) and (self.close_minute is not None):
+                current_timestamp = pd.Timestamp.now()
+                if current_timestamp.hour >= self.close_hour:
+                    if current_timestamp.minute - self.close_minute >= 5:
+                        self.logger.info("{} now is the close time:{}".format(entity_item.id, current_timestamp))
+
+                        entity_finished = True
+
+        if entity_finished:
+            latest_saved_record = self.get_latest_saved_record(entity=entity_item)
+            if latest_saved_record:
+                start_timestamp = eval("latest_saved_record.{}".format(self.get_evaluated_time_field()))
+
+            self.logger.info(
+                "finish recording {} for entity_id:{},latest_timestamp:{}".format(
+                    self.data_schema, entity_item.id, start_timestamp
+                )
+            )
+            self.on_finish_entity(entity_item)
+        return entity_finished
+
     def run(self):
+        if self.max_workers > 1:
+            return self.run_concurrently()
+
         finished_items = []
         unfinished_items = self.entities
         raising_exception = None
@@ -415,23 +594,7 @@ class TimeSeriesDataRecorder(EntityEventRecorder):
                 try:
                     self.logger.info(f"run to {index + 1}/{count}")
 
-                    start_timestamp, end_timestamp, size, timestamps = self.evaluate_start_end_size_timestamps(
-                        entity_item
-                    )
-                    size = int(size)
-
-                    if timestamps:
-                        self.logger.info(
-                            "entity_id:{},evaluate_start_end_size_timestamps result:{},{},{},{}-{}".format(
-                                entity_item.id, start_timestamp, end_timestamp, size, timestamps[0], timestamps[-1]
-                            )
-                        )
-                    else:
-                        self.logger.info(
-                            "entity_id:{},evaluate_start_end_size_timestamps result:{},{},{},{}".format(
-                                entity_item.id, start_timestamp, end_timestamp, size, timestamps
-                            )
-                        )
+                    start_timestamp, end_timestamp, size, timestamps = self.evaluate_entity(entity_item)
 
                     #: no more to record
                     if size == 0:
@@ -452,69 +615,10 @@ class TimeSeriesDataRecorder(EntityEventRecorder):
                         entity_item, start=start_timestamp, end=end_timestamp, size=size, timestamps=timestamps
                     )
 
-                    all_duplicated = True
-
-                    if original_list:
-                        domain_list = []
-                        for original_item in original_list:
-                            got_new_data, domain_item = self.generate_domain(entity_item, original_item)
-
-                            if got_new_data:
-                                all_duplicated = False
-
-                            #: handle the case  generate_domain_id generate duplicate id
-                            if domain_item:
-                                duplicate = [item for item in domain_list if item.id == domain_item.id]
-                                if duplicate:
-                                    #: regenerate the id
-                                    if self.fix_duplicate_way == "add":
-                                        domain_item.id = "{}_{}".format(domain_item.id, uuid.uuid1())
-                                    #: ignore
-                                    else:
-                                        self.logger.info(f"ignore original duplicate item:{domain_item.id}")
-                                        continue
-
-                                domain_list.append(domain_item)
-
-                        if domain_list:
-                            self.persist(entity_item, domain_list)
-                        else:
-                            self.logger.info("just got {} duplicated data in this cycle".format(len(original_list)))
-
-                    #: could not get more data
-                    entity_finished = False
-                    if not original_list or all_duplicated:
-                        #: not realtime
-                        if not self.real_time:
-                            entity_finished = True
-
-                        #: realtime and to the close time
-                        if self.real_time and (self.close_hour is not None) and (self.close_minute is not None):
-                            current_timestamp = pd.Timestamp.now()
-                            if current_timestamp.hour >= self.close_hour:
-                                if current_timestamp.minute - self.close_minute >= 5:
-                                    self.logger.info(
-                                        "{} now is the close time:{}".format(entity_item.id, current_timestamp)
-                                    )
-
-                                    entity_finished = True
-
                     #: add finished entity to finished_items
-                    if entity_finished:
+                    if self.handle_record_result(entity_item, start_timestamp, original_list):
                         finished_items.append(entity_item)
 
-                        latest_saved_record = self.get_latest_saved_record(entity=entity_item)
-                        if latest_saved_record:
-                            start_timestamp = eval("latest_saved_record.{}".format(self.get_evaluated_time_field()))
-
-                        self.logger.info(
-                            "finish recording {} for entity_id:{},latest_timestamp:{}".format(
-                                self.data_schema, entity_item.id, start_timestamp
-                            )
-                        )
-                        self.on_finish_entity(entity_item)
-                        continue
-
                 except Exception as e:
                     self.logger.exception(
                         "recording data for entity_id:{},{},error:{}".format(entity_item.id, self.data_schema, e)
@@ -540,6 +644,75 @@ class TimeSeriesDataRecorder(EntityEventRecorder):
         if raising_exception:
             raise raising_exception
 
+    def run_concurrently(self):
+        """
+        record the entities with a thread pool of max_workers, only the record method(network) runs in the workers,
+        evaluating and persisting run in the current thread which is the single writer of the db session.
+        the requests of self.http_session are throttled by host_rate_limits instead of sleeping between entities.
+        """
+        finished_items = []
+        unfinished_items = self.entities
+        raising_exception = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.__class__.__name__) as executor:
+            while True:
+                count = len(unfinished_items)
+                future_map = {}
+                try:
+                    for index, entity_item in enumerate(unfinished_items):
+                        self.logger.info(f"run to {index + 1}/{count}")
+                        start_timestamp, end_timestamp, size, timestamps = self.evaluate_entity(entity_item)
+
+                        #: no more to record
+                        if size == 0:
+                            finished_items.append(entity_item)
+                            self.logger.info(
+                                "finish recording {} for entity_id:{},latest_timestamp:{}".format(
+                                    self.data_schema, entity_item.id, start_timestamp
+                                )
+                            )
+                            self.on_finish_entity(entity_item)
+                            continue
+
+                        future = executor.submit(
+                            self.record,
+                            entity_item,
+                            start=start_timestamp,
+                            end=end_timestamp,
+                            size=size,
+                            timestamps=timestamps,
+                        )
+                        future_map[future] = (entity_item, start_timestamp)
+
+                    for future in as_completed(future_map):
+                        entity_item, start_timestamp = future_map[future]
+                        if self.handle_record_result(entity_item, start_timestamp, future.result()):
+                            finished_items.append(entity_item)
+
+                except Exception as e:
+                    self.logger.exception("recording data for {},error:{}".format(self.data_schema, e))
+                    raising_exception = e
+                    for future in future_map:
+                        future.cancel()
+                    if self.return_unfinished:
+                        self.on_finish()
+                        unfinished_items = set(unfinished_items) - set(finished_items)
+                        return [item.entity_id for item in unfinished_items]
+
+                    finished_items = unfinished_items
+
+                unfinished_items = set(unfinished_items) - set(finished_items)
+
+                if len(unfinished_items) == 0:
+                    break
+
+        self.on_finish()
+        if self.return_unfinished:
+            return []
+
+        if raising_exception:
+            raise raising_exception
+
 
 class FixedCycleDataRecorder(TimeSeriesDataRecorder):
     def __init__(
@@ -562,6 +735,7 @@ class FixedCycleDataRecorder(TimeSeriesDataRecorder):
         kdata_use_begin_time=False,
         one_day_trading_minutes=24 * 60,
         return_unfinished=False,
+        max_workers=1,
     ) -> None:
         super().__init__(
             force_update,
@@ -579,6 +753,7 @@ class FixedCycleDataRecorder(TimeSeriesDataRecorder):
             start_timestamp=start_timestamp,
             end_timestamp=end_timestamp,
             return_unfinished=return_unfinished,
+            max_workers=max_workers,
         )
 
         self.level = IntervalLevel(level)
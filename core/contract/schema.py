@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import inspect
-from datetime import timedelta
 from typing import List, Union
 
 import pandas as pd
@@ -10,6 +9,7 @@ from sqlalchemy.dialects.postgresql import BOOLEAN
 from sqlalchemy.dialects.mysql import TINYINT
 from sqlalchemy.dialects.postgresql import TIMESTAMP
 from core.contract import IntervalLevel
+from core.contract.trading_calendar import get_entity_interval_calendar
 from core.utils.time_utils import date_and_time, is_same_time, now_pd_timestamp
 from core.contract.data_string import String  # 使用自定义 String
 
@@ -383,6 +383,15 @@ class TradableEntity(Entity):
         hour, minute = cls.get_trading_intervals()[-1][1].split(":")
         return int(hour), int(minute)
 
+    @classmethod
+    def get_interval_calendar(cls):
+        """
+        the cached trading calendar of the entity, built from get_trading_dates and get_trading_intervals
+
+        :return: EntityIntervalCalendar
+        """
+        return get_entity_interval_calendar(cls)
+
     @classmethod
     def get_interval_timestamps(cls, start_date, end_date, level: IntervalLevel):
         """
@@ -392,42 +401,15 @@ class TradableEntity(Entity):
         :param end_date:
         :param level:
         """
-
-        for current_date in cls.get_trading_dates(start_date=start_date, end_date=end_date):
-            if level == IntervalLevel.LEVEL_1DAY:
-                yield current_date
-            elif level == IntervalLevel.LEVEL_1WEEK:
-                if current_date.weekday() == 4:
-                    yield current_date
-            else:
-                start_end_list = cls.get_trading_intervals()
-
-                for start_end in start_end_list:
-                    start = start_end[0]
-                    end = start_end[1]
-
-                    current_timestamp = date_and_time(the_date=current_date, the_time=start)
-                    end_timestamp = date_and_time(the_date=current_date, the_time=end)
-
-                    while current_timestamp <= end_timestamp:
-                        yield current_timestamp
-                        current_timestamp = current_timestamp + timedelta(minutes=level.to_minute())
+        yield from cls.get_interval_calendar().get_interval_timestamps(start_date, end_date, level=level)
 
     @classmethod
     def is_open_timestamp(cls, timestamp):
-        timestamp = pd.Timestamp(timestamp)
-        return is_same_time(
-            timestamp,
-            date_and_time(the_date=timestamp.date(), the_time=cls.get_trading_intervals()[0][0]),
-        )
+        return cls.get_interval_calendar().is_open_timestamp(timestamp)
 
     @classmethod
     def is_close_timestamp(cls, timestamp):
-        timestamp = pd.Timestamp(timestamp)
-        return is_same_time(
-            timestamp,
-            date_and_time(the_date=timestamp.date(), the_time=cls.get_trading_intervals()[-1][1]),
-        )
+        return cls.get_interval_calendar().is_close_timestamp(timestamp)
 
     @classmethod
     def is_finished_kdata_timestamp(cls, timestamp: pd.Timestamp, level: IntervalLevel):
@@ -439,13 +421,7 @@ class TradableEntity(Entity):
         :return:
         :rtype: bool
         """
-        timestamp = pd.Timestamp(timestamp)
-
-        for t in cls.get_interval_timestamps(timestamp.date(), timestamp.date(), level=level):
-            if is_same_time(t, timestamp):
-                return True
-
-        return False
+        return cls.get_interval_calendar().is_interval_timestamp(timestamp, level=level)
 
     @classmethod
     def could_short(cls):
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import pandas as pd
+
+from core.contract.api import _bulk_upsert, df_to_db, get_data, get_db_session, get_next_data_cursor, iter_data
+from core.utils.testing import MOCK_DB_NAME, MOCK_PROVIDER, MockBase, MockKdata, use_sqlite_db
+
+
+def gen_rows(start: int, end: int, close: float) -> pd.DataFrame:
+    timestamps = pd.date_range("2024-01-01", periods=end)[start:end]
+    return pd.DataFrame(
+        {
+            "id": [f"stock_sz_000001_{ts.strftime('%Y-%m-%d')}" for ts in timestamps],
+            "entity_id": "stock_sz_000001",
+            "code": "000001",
+            "timestamp": timestamps,
+            "close": close,
+        }
+    )
+
+
+class BulkUpsertTest(unittest.TestCase):
+    def setUp(self) -> None:
+        use_sqlite_db(self, provider=MOCK_PROVIDER, db_name=MOCK_DB_NAME, schema_base=MockBase)
+        self.session = get_db_session(provider=MOCK_PROVIDER, data_schema=MockKdata)
+
+    def query_close(self) -> list:
+        df = get_data(
+            data_schema=MockKdata,
+            provider=MOCK_PROVIDER,
+            session=self.session,
+            columns=["id", "close"],
+            order=MockKdata.id.asc(),
+        )
+        return df["close"].tolist()
+
+    def test_insert(self):
+        self.assertEqual(_bulk_upsert(self.session, MockKdata, gen_rows(0, 3, 1.0)), 3)
+        self.session.commit()
+        self.assertEqual(self.query_close(), [1.0, 1.0, 1.0])
+
+    def test_skip_duplicates(self):
+        _bulk_upsert(self.session, MockKdata, gen_rows(0, 3, 1.0))
+        # 前3条已存在, 只保存后2条, 已存在的不更新
+        self.assertEqual(_bulk_upsert(self.session, MockKdata, gen_rows(0, 5, 2.0)), 2)
+        self.session.commit()
+        self.assertEqual(self.query_close(), [1.0, 1.0, 1.0, 2.0, 2.0])
+
+        self.assertEqual(_bulk_upsert(self.session, MockKdata, gen_rows(0, 5, 3.0)), 0)
+
+    def test_force_update(self):
+        _bulk_upsert(self.session, MockKdata, gen_rows(0, 3, 1.0))
+        self.assertEqual(_bulk_upsert(self.session, MockKdata, gen_rows(1, 5, 2.0), force_update=True), 4)
+        self.session.commit()
+        self.assertEqual(self.query_close(), [1.0, 2.0, 2.0, 2.0, 2.0])
+
+    def test_null_and_empty(self):
+        df = gen_rows(0, 2, 1.0)
+        df.loc[1, "close"] = None
+        self.assertEqual(_bulk_upsert(self.session, MockKdata, df), 2)
+        self.assertEqual(_bulk_upsert(self.session, MockKdata, df.iloc[0:0]), 0)
+        self.session.commit()
+        closes = self.query_close()
+        self.assertEqual(closes[0], 1.0)
+        self.assertTrue(pd.isna(closes[1]))
+
+    def test_df_to_db_chunks(self):
+        df_to_db(gen_rows(0, 3, 1.0), MockKdata, provider=MOCK_PROVIDER, session=self.session)
+        # 分成多批写入时返回每批新增个数的和, 两种写入方式结果一致
+        for bulk_upsert in (True, False):
+            saved = df_to_db(
+                gen_rows(0, 7, 2.0),
+                MockKdata,
+                provider=MOCK_PROVIDER,
+                session=self.session,
+                sub_size=2,
+                bulk_upsert=bulk_upsert,
+            )
+            self.assertEqual(saved, 4 if bulk_upsert else 0)
+        self.assertEqual(self.query_close(), [1.0] * 3 + [2.0] * 4)
+
+
+def gen_kdata(entity_ids: list, periods: int) -> pd.DataFrame:
+    dfs = []
+    for i, entity_id in enumerate(entity_ids):
+        timestamps = pd.date_range("2024-01-01", periods=periods)
+        dfs.append(
+            pd.DataFrame(
+                {
+                    "id": [f"{entity_id}_{ts.strftime('%Y-%m-%d')}" for ts in timestamps],
+                    "entity_id": entity_id,
+                    "code": entity_id[-6:],
+                    "timestamp": timestamps,
+                    "close": [float(i * 10 + day) for day in range(periods)],
+                }
+            )
+        )
+    return pd.concat(dfs, ignore_index=True)
+
+
+class IterDataTest(unittest.TestCase):
+    entity_ids = ["stock_sz_000001", "stock_sz_000002", "stock_sz_000003"]
+
+    def setUp(self) -> None:
+        use_sqlite_db(self, provider=MOCK_PROVIDER, db_name=MOCK_DB_NAME, schema_base=MockBase)
+        self.df = gen_kdata(self.entity_ids, 5)
+        df_to_db(self.df, MockKdata, provider=MOCK_PROVIDER)
+
+    def test_chunks(self):
+        chunks = list(iter_data(MockKdata, provider=MOCK_PROVIDER, columns=["close"], chunk_size=4))
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 4, 3])
+        # id和时间字段总是返回, 按id排序
+        self.assertTrue(all(chunk.columns.tolist() == ["id", "close", "timestamp"] for chunk in chunks))
+        df = pd.concat(chunks, ignore_index=True)
+        self.assertEqual(df["id"].tolist(), sorted(self.df["id"]))
+        self.assertEqual(df["close"].tolist(), self.df.sort_values("id")["close"].tolist())
+
+        chunks = list(iter_data(MockKdata, provider=MOCK_PROVIDER, chunk_size=100))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(set(chunks[0].columns), set(MockKdata.__table__.columns.keys()))
+
+    def test_filters(self):
+        df = pd.concat(
+            iter_data(
+                MockKdata,
+                provider=MOCK_PROVIDER,
+                columns=["timestamp"],
+                entity_ids=["stock_sz_000001", "stock_sz_000003"],
+                start_timestamp="2024-01-02",
+                end_timestamp="2024-01-03",
+                chunk_size=3,
+            )
+        )
+        self.assertEqual(
+            df["id"].tolist(),
+            [
+                "stock_sz_000001_2024-01-02",
+                "stock_sz_000001_2024-01-03",
+                "stock_sz_000003_2024-01-02",
+                "stock_sz_000003_2024-01-03",
+            ],
+        )
+        df = pd.concat(iter_data(MockKdata, provider=MOCK_PROVIDER, codes=["000002"]))
+        self.assertEqual(df["entity_id"].unique().tolist(), ["stock_sz_000002"])
+        self.assertEqual(list(iter_data(MockKdata, provider=MOCK_PROVIDER, codes=["000004"])), [])
+
+    def test_keyset_paging(self):
+        ids = []
+        after_id = None
+        cursors = []
+        while True:
+            page = pd.concat(
+                iter_data(MockKdata, provider=MOCK_PROVIDER, columns=["id"], after_id=after_id, limit=4, chunk_size=3)
+            )
+            ids.extend(page["id"])
+            after_id = get_next_data_cursor(MockKdata, limit=4, provider=MOCK_PROVIDER, after_id=after_id)
+            cursors.append(after_id)
+            if after_id is None:
+                break
+            # 游标就是当前页最后一行的id
+            self.assertEqual(after_id, page["id"].iloc[-1])
+        self.assertEqual(len(cursors), 4)
+        self.assertEqual(ids, sorted(self.df["id"]))
+
+        # 刚好取完时下一页为空
+        last_page_id = sorted(self.df["id"])[-6]
+        self.assertEqual(
+            get_next_data_cursor(MockKdata, limit=5, provider=MOCK_PROVIDER, after_id=last_page_id),
+            sorted(self.df["id"])[-1],
+        )
+        self.assertEqual(
+            list(iter_data(MockKdata, provider=MOCK_PROVIDER, after_id=sorted(self.df["id"])[-1], limit=5)), []
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
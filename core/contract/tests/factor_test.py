@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from core.contract.factor import Accumulator
+from core.factors.algorithm import MaTransformer, MacdTransformer
+from core.utils.pd_utils import pd_is_not_null
+from core.utils.testing import gen_kdata_df
+
+nan = np.nan
+
+
+def gen_panel_df(entity_count=20, size=30) -> pd.DataFrame:
+    df = gen_kdata_df(entity_count, size, columns=("close", "volume"))
+    return df.set_index(["entity_id", "timestamp"], drop=False).sort_index()
+
+
+def small_panel_df(columns: dict) -> pd.DataFrame:
+    """两个标的5天的数据, columns的值为两个标的的数据依次拼接"""
+    index = pd.MultiIndex.from_product(
+        [["stock_sz_000001", "stock_sz_000002"], pd.date_range("2023-01-01", periods=5)],
+        names=["entity_id", "timestamp"],
+    )
+    return pd.DataFrame(columns, index=index, dtype=float)
+
+
+class CumVolumeAccumulator(Accumulator):
+    def acc_one(self, entity_id, df: pd.DataFrame, acc_df: pd.DataFrame, state: dict) -> (pd.DataFrame, dict):
+        start = acc_df["cum_volume"].iloc[-1] if pd_is_not_null(acc_df) else 0
+        df = df.copy()
+        df["cum_volume"] = df["volume"].cumsum() + start
+        return df, {"count": len(df) + (state or {}).get("count", 0)}
+
+
+class PanelTransformerTest(unittest.TestCase):
+    """panel transform and pre-split acc test"""
+
+    def test_macd_transform_panel(self):
+        """
+        fast=1时ema_fast就是收盘价, slow=n=3时alpha为0.5, 前3个值之前没有ema_slow:
+        ema_slow: 8, 10, 10, 12, 11 -> diff: nan, nan, 0, 2, -1 -> dea: nan, nan, 0, 1, 0 -> macd: nan, nan, 0, 2, -2
+        """
+        input_df = small_panel_df({"close": [8, 12, 10, 14, 10] + [10] * 5})
+        transformer = MacdTransformer(fast=1, slow=3, n=3, count_live_dead=True)
+        result = transformer.transform(input_df.copy())
+
+        expected = input_df.copy()
+        expected["diff"] = [nan, nan, 0, 2, -1] + [nan, nan, 0, 0, 0]
+        expected["dea"] = [nan, nan, 0, 1, 0] + [nan, nan, 0, 0, 0]
+        expected["macd"] = [nan, nan, 0, 2, -2] + [nan, nan, 0, 0, 0]
+        expected["live"] = [-1, -1, -1, 1, -1] + [-1] * 5
+        expected["bull"] = [False, False, False, True, False] + [False] * 5
+        expected["live_count"] = [-1, -2, -3, 1, -1] + [-1, -2, -3, -4, -5]
+        pd.testing.assert_frame_equal(result, expected)
+
+        # 除以收盘价
+        result = MacdTransformer(fast=1, slow=3, n=3, normal=True).transform(input_df.copy())
+        np.testing.assert_allclose(result["diff"].iloc[:5], [nan, nan, 0, 2 / 14, -0.1])
+        np.testing.assert_allclose(result["macd"].iloc[:5], [nan, nan, 0, 2 / 14, -0.2])
+
+    def test_macd_transform_incremental(self):
+        input_df = gen_panel_df()
+        transformer = MacdTransformer(normal=True, count_live_dead=True)
+        expected = transformer.transform(input_df.copy())
+        timestamps = input_df.index.levels[1]
+        pre_df = input_df[input_df.index.get_level_values(1) < timestamps[-1]]
+        added_index = input_df.index[input_df.index.get_level_values(1) == timestamps[-1]]
+        _, states = transformer.transform_incremental(pre_df, pre_df.index, {})
+        added_df, _ = transformer.transform_incremental(input_df, added_index, states)
+        pd.testing.assert_frame_equal(added_df, expected.loc[added_index])
+
+    def test_acc(self):
+        input_df = small_panel_df({"volume": [1, 2, 3, 4, 5] + [10, 20, 30, 40, 50]})
+        accumulator = CumVolumeAccumulator()
+        timestamps = input_df.index.levels[1]
+
+        acc_df, states = accumulator.acc(input_df[input_df.index.get_level_values(1) <= timestamps[1]], None, {})
+        self.assertEqual(acc_df["cum_volume"].tolist(), [1, 3, 10, 30])
+        self.assertEqual(states, {"stock_sz_000001": {"count": 2}, "stock_sz_000002": {"count": 2}})
+
+        # 从之前的结果继续累加
+        added_df = input_df[input_df.index.get_level_values(1) > timestamps[1]]
+        result, states = accumulator.acc(added_df, acc_df, states)
+        self.assertEqual(result.index.tolist(), added_df.index.tolist())
+        self.assertEqual(result["cum_volume"].tolist(), [6, 10, 15, 60, 100, 150])
+        self.assertEqual(states, {"stock_sz_000001": {"count": 5}, "stock_sz_000002": {"count": 5}})
+
+        # 只有一个标的
+        one_df = input_df.loc[["stock_sz_000002"]]
+        result, states = accumulator.acc(one_df, acc_df.loc[["stock_sz_000002"]], {"stock_sz_000002": {"count": 2}})
+        self.assertEqual(result["cum_volume"].tolist(), [40, 60, 90, 130, 180])
+        self.assertEqual(states, {"stock_sz_000002": {"count": 7}})
+
+
+class MaTransformerTest(unittest.TestCase):
+    """MaTransformer incremental test"""
+
+    def setUp(self):
+        self.input_df = gen_panel_df()
+        self.transformer = MaTransformer(windows=[5, 10], cal_change_pct=True)
+
+    def test_transform_incremental(self):
+        expected = self.transformer.transform(self.input_df.copy())
+        timestamps = self.input_df.index.levels[1]
+        for added_count in [1, 3]:
+            added_index = self.input_df.index[self.input_df.index.get_level_values(1) >= timestamps[-added_count]]
+            result, _ = self.transformer.transform_incremental(self.input_df, added_index, {})
+            pd.testing.assert_frame_equal(result, expected.loc[added_index])
+
+    def test_transform_incremental_with_partial_entities(self):
+        expected = self.transformer.transform(self.input_df.copy())
+        added_index = self.input_df.index[
+            (self.input_df.index.get_level_values(0) == "stock_sz_000003")
+            & (self.input_df.index.get_level_values(1) >= self.input_df.index.levels[1][-2])
+        ]
+        result, _ = self.transformer.transform_incremental(self.input_df, added_index, {})
+        pd.testing.assert_frame_equal(result, expected.loc[added_index])
+
+    def test_transform_incremental_only_rolls_warmup_rows(self):
+        added_index = self.input_df.index[self.input_df.index.get_level_values(1) == self.input_df.index.levels[1][-1]]
+        rolled_sizes = []
+        original_rolling = pd.core.groupby.SeriesGroupBy.rolling
+
+        def rolling(group, *args, **kwargs):
+            rolled_sizes.append(len(group.obj))
+            return original_rolling(group, *args, **kwargs)
+
+        pd.core.groupby.SeriesGroupBy.rolling = rolling
+        try:
+            self.transformer.transform_incremental(self.input_df, added_index, {})
+        finally:
+            pd.core.groupby.SeriesGroupBy.rolling = original_rolling
+        entity_count = len(self.input_df.index.levels[0])
+        self.assertEqual(rolled_sizes, [entity_count * (self.transformer.warmup_window + 1)] * 2)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from core.contract import reader
+from core.contract.api import df_to_db
+from core.contract.reader import DataListener, DataReader
+from core.utils.testing import MOCK_DB_NAME, MOCK_PROVIDER, MockBase, MockKdata, use_sqlite_db
+
+ENTITY_A = "stock_sz_000001"
+ENTITY_B = "stock_sz_000002"
+
+
+def day(i: int) -> pd.Timestamp:
+    return pd.Timestamp("2024-01-01") + pd.Timedelta(days=i)
+
+
+def save_kdata(entity_id: str, days: list):
+    timestamps = [day(i) for i in days]
+    df = pd.DataFrame(
+        {
+            "id": [f"{entity_id}_{ts.strftime('%Y-%m-%d')}" for ts in timestamps],
+            "entity_id": entity_id,
+            "code": entity_id[-6:],
+            "timestamp": timestamps,
+            "close": [float(i) for i in days],
+        }
+    )
+    df_to_db(df, MockKdata, provider=MOCK_PROVIDER, force_update=False)
+
+
+class RecordingListener(DataListener):
+    def __init__(self):
+        self.entity_changes = []
+        self.changed_count = 0
+
+    def on_data_loaded(self, data: pd.DataFrame) -> object:
+        pass
+
+    def on_data_changed(self, data: pd.DataFrame) -> object:
+        self.changed_count = self.changed_count + 1
+
+    def on_entity_data_changed(self, entity: str, added_data: pd.DataFrame) -> object:
+        self.entity_changes.append((entity, added_data.index.get_level_values(1).tolist()))
+
+
+class MoveOnTest(unittest.TestCase):
+    """DataReader.move_on test"""
+
+    def setUp(self):
+        use_sqlite_db(self, provider=MOCK_PROVIDER, db_name=MOCK_DB_NAME, schema_base=MockBase)
+        # A已有0-2, B已有0-1
+        save_kdata(ENTITY_A, [0, 1, 2])
+        save_kdata(ENTITY_B, [0, 1])
+
+        # 用假的时钟, sleep时推进时间, 并可在某次sleep时写入新数据
+        self.now = 0.0
+        self.sleeps = []
+        self.on_sleep = {}
+        fake_time = mock.Mock()
+        fake_time.time.side_effect = lambda: self.now
+        fake_time.sleep.side_effect = self.sleep
+        patch = mock.patch.object(reader, "time", fake_time)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now = self.now + seconds
+        if len(self.sleeps) in self.on_sleep:
+            self.on_sleep[len(self.sleeps)]()
+
+    def create_reader(self, **kwargs) -> DataReader:
+        data_reader = DataReader(
+            data_schema=MockKdata,
+            provider=MOCK_PROVIDER,
+            entity_ids=[ENTITY_A, ENTITY_B],
+            start_timestamp=day(0),
+            end_timestamp=None,
+            columns=["close"],
+            **kwargs,
+        )
+        self.listener = RecordingListener()
+        data_reader.register_data_listener(self.listener)
+        return data_reader
+
+    def move_on(self, data_reader: DataReader, **kwargs):
+        with mock.patch.object(MockKdata, "query_data", wraps=MockKdata.query_data) as query_data:
+            data_reader.move_on(**kwargs)
+        return query_data
+
+    def assert_data(self, df: pd.DataFrame, expected: dict):
+        self.assertEqual(
+            df.index.tolist(), [(entity_id, day(i)) for entity_id, days in expected.items() for i in days]
+        )
+        self.assertEqual(df["close"].tolist(), [float(i) for days in expected.values() for i in days])
+
+    def test_move_on(self):
+        data_reader = self.create_reader()
+        self.assert_data(data_reader.data_df, {ENTITY_A: [0, 1, 2], ENTITY_B: [0, 1]})
+
+        save_kdata(ENTITY_A, [3])
+        save_kdata(ENTITY_B, [2, 3])
+        query_data = self.move_on(data_reader)
+
+        # 所有entity一次查询, 查询从最小的watermark开始, A已有的2不会重复加入
+        self.assertEqual(query_data.call_count, 1)
+        self.assertEqual(self.sleeps, [])
+        self.assert_data(data_reader.added_df, {ENTITY_A: [3], ENTITY_B: [2, 3]})
+        self.assert_data(data_reader.data_df, {ENTITY_A: [0, 1, 2, 3], ENTITY_B: [0, 1, 2, 3]})
+        self.assertEqual(self.listener.entity_changes, [(ENTITY_A, [day(3)]), (ENTITY_B, [day(2), day(3)])])
+        self.assertEqual(self.listener.changed_count, 1)
+
+    def test_new_rows_across_polls(self):
+        data_reader = self.create_reader()
+        save_kdata(ENTITY_A, [3])
+        # 第2次sleep后B才有新数据
+        self.on_sleep[2] = lambda: save_kdata(ENTITY_B, [2])
+        query_data = self.move_on(data_reader, poll_interval=0.5, max_poll_interval=5)
+
+        self.assertEqual(query_data.call_count, 3)
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+        # 之后的查询只查还没有新数据的B
+        filters = query_data.call_args.kwargs["filters"]
+        self.assertEqual(filters[0].right.value, [ENTITY_B])
+        self.assert_data(data_reader.added_df, {ENTITY_A: [3], ENTITY_B: [2]})
+        self.assert_data(data_reader.data_df, {ENTITY_A: [0, 1, 2, 3], ENTITY_B: [0, 1, 2]})
+        self.assertEqual(self.listener.entity_changes, [(ENTITY_A, [day(3)]), (ENTITY_B, [day(2)])])
+        self.assertEqual(self.listener.changed_count, 1)
+
+    def test_timeout(self):
+        data_reader = self.create_reader()
+        query_data = self.move_on(data_reader, timeout=5, poll_interval=0.5, max_poll_interval=2)
+
+        # 间隔翻倍到max_poll_interval, 最后一次不超过剩余的时间
+        self.assertEqual(self.sleeps, [0.5, 1.0, 2, 1.5])
+        self.assertEqual(query_data.call_count, 5)
+        self.assertIsNone(data_reader.added_df)
+        self.assert_data(data_reader.data_df, {ENTITY_A: [0, 1, 2], ENTITY_B: [0, 1]})
+        self.assertEqual(self.listener.changed_count, 0)
+
+    def test_timeout_keeps_partial_data(self):
+        data_reader = self.create_reader()
+        save_kdata(ENTITY_B, [2])
+        self.move_on(data_reader, timeout=1, poll_interval=0.5)
+
+        self.assertEqual(self.sleeps, [0.5, 0.5])
+        self.assert_data(data_reader.added_df, {ENTITY_B: [2]})
+        self.assertEqual(self.listener.entity_changes, [(ENTITY_B, [day(2)])])
+
+    def test_to_timestamp_and_keep_window(self):
+        data_reader = self.create_reader(keep_window=2)
+        save_kdata(ENTITY_A, [3, 4])
+        save_kdata(ENTITY_B, [2])
+        self.move_on(data_reader, to_timestamp=day(3))
+
+        self.assert_data(data_reader.added_df, {ENTITY_A: [3], ENTITY_B: [2]})
+        # 只保留每个entity最近的keep_window个数据再加入新数据
+        self.assert_data(data_reader.data_df, {ENTITY_A: [1, 2, 3], ENTITY_B: [0, 1, 2]})
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from core.contract import recorder as recorder_module
+from core.contract.api import df_to_db, get_data
+from core.contract.recorder import TimeSeriesDataRecorder
+from core.contract.zvt_info import ZvtInfoBase
+from core.domain.constants import stock_db_name
+from core.utils.rate_limiter import RateLimitedAdapter
+from core.utils.testing import MOCK_DB_NAME, MOCK_PROVIDER, MockBase, MockEntity, MockKdata, use_sqlite_db
+
+ENTITY_IDS = ["stock_sz_000001", "stock_sz_000002", "stock_sz_000003"]
+
+
+class MockKdataRecorder(TimeSeriesDataRecorder):
+    provider = MOCK_PROVIDER
+    data_schema = MockKdata
+    entity_provider = MOCK_PROVIDER
+    entity_schema = MockEntity
+    host_rate_limits = {"mock.com": 100}
+
+    def __init__(self, failed_entity_id=None, **kwargs) -> None:
+        self.failed_entity_id = failed_entity_id
+        #: (method, entity_id, thread)
+        self.calls = []
+        super().__init__(sleeping_time=0, **kwargs)
+
+    def record(self, entity, start, end, size, timestamps):
+        self.calls.append(("record", entity.id, threading.current_thread()))
+        if entity.id == self.failed_entity_id:
+            raise ValueError(f"failed to record {entity.id}")
+        return [{"timestamp": timestamp, "close": 1.0} for timestamp in pd.date_range("2024-01-01", periods=3)]
+
+    def persist(self, entity, domain_list):
+        self.calls.append(("persist", entity.id, threading.current_thread()))
+        super().persist(entity, domain_list)
+
+
+class RunConcurrentlyTest(unittest.TestCase):
+    def setUp(self) -> None:
+        use_sqlite_db(self, provider="zvt", db_name=stock_db_name, schema_base=ZvtInfoBase)
+        use_sqlite_db(self, provider=MOCK_PROVIDER, db_name=MOCK_DB_NAME, schema_base=MockBase)
+        entities = pd.DataFrame(
+            {
+                "id": ENTITY_IDS,
+                "entity_id": ENTITY_IDS,
+                "entity_type": "stock",
+                "exchange": "sz",
+                "code": [entity_id[-6:] for entity_id in ENTITY_IDS],
+            }
+        )
+        df_to_db(entities, MockEntity, provider=MOCK_PROVIDER)
+
+    def saved_ids(self) -> list:
+        df = get_data(data_schema=MockKdata, provider=MOCK_PROVIDER, columns=["id"], order=MockKdata.id.asc())
+        return df["id"].tolist()
+
+    def test_persist_in_calling_thread(self):
+        recorder = MockKdataRecorder(max_workers=3)
+        self.assertIsInstance(recorder.http_session.get_adapter("https://mock.com"), RateLimitedAdapter)
+        recorder.run()
+
+        # 每个标的第一次得到新数据, 第二次全部重复后结束
+        records = [call for call in recorder.calls if call[0] == "record"]
+        self.assertEqual(sorted(call[1] for call in records), sorted(ENTITY_IDS * 2))
+        self.assertTrue(all(call[2] is not threading.main_thread() for call in records))
+
+        persists = [call for call in recorder.calls if call[0] == "persist"]
+        self.assertEqual(sorted(call[1] for call in persists), ENTITY_IDS)
+        self.assertTrue(all(call[2] is threading.main_thread() for call in persists))
+
+        self.assertEqual(
+            self.saved_ids(),
+            [f"{entity_id}_2024-01-0{day}" for entity_id in ENTITY_IDS for day in (1, 2, 3)],
+        )
+
+    def test_same_as_sequential(self):
+        MockKdataRecorder(max_workers=1).run()
+        sequential_ids = self.saved_ids()
+        self.assertEqual(len(sequential_ids), 9)
+        self.setUp()
+        MockKdataRecorder(max_workers=3).run()
+        self.assertEqual(self.saved_ids(), sequential_ids)
+
+    def test_return_unfinished(self):
+        # 000001已经有结束时间之后的数据, 不需要再记录
+        df_to_db(
+            pd.DataFrame(
+                {
+                    "id": ["stock_sz_000001_2024-02-01"],
+                    "entity_id": ["stock_sz_000001"],
+                    "timestamp": [pd.Timestamp("2024-02-01")],
+                }
+            ),
+            MockKdata,
+            provider=MOCK_PROVIDER,
+        )
+        recorder = MockKdataRecorder(
+            max_workers=3, return_unfinished=True, failed_entity_id="stock_sz_000002", end_timestamp="2024-01-31"
+        )
+        unfinished = recorder.run()
+        self.assertEqual(sorted(unfinished), ["stock_sz_000002", "stock_sz_000003"])
+
+    def test_raise_without_return_unfinished(self):
+        recorder = MockKdataRecorder(max_workers=3, failed_entity_id="stock_sz_000002")
+        with self.assertRaises(ValueError):
+            recorder.run()
+
+
+class GenerateDomainListTest(unittest.TestCase):
+    """generate_domain_list test"""
+
+    def setUp(self) -> None:
+        use_sqlite_db(self, provider="zvt", db_name=stock_db_name, schema_base=ZvtInfoBase)
+        use_sqlite_db(self, provider=MOCK_PROVIDER, db_name=MOCK_DB_NAME, schema_base=MockBase)
+        df_to_db(
+            pd.DataFrame({"id": ENTITY_IDS[:1], "entity_id": ENTITY_IDS[:1], "entity_type": "stock", "code": "000001"}),
+            MockEntity,
+            provider=MOCK_PROVIDER,
+        )
+        # 已保存2024-01-01
+        df_to_db(
+            pd.DataFrame(
+                {
+                    "id": ["stock_sz_000001_2024-01-01"],
+                    "entity_id": ["stock_sz_000001"],
+                    "timestamp": [pd.Timestamp("2024-01-01")],
+                    "close": [0.5],
+                }
+            ),
+            MockKdata,
+            provider=MOCK_PROVIDER,
+        )
+
+    def generate(self, original_list, **kwargs):
+        recorder = MockKdataRecorder(entity_ids=ENTITY_IDS[:1], **kwargs)
+        with mock.patch.object(recorder_module, "get_data", wraps=get_data) as query:
+            all_duplicated, domain_list = recorder.generate_domain_list(recorder.entities[0], original_list)
+        return all_duplicated, domain_list, query
+
+    def test_ignore_saved(self):
+        original_list = [
+            {"timestamp": pd.Timestamp("2024-01-01"), "close": 1.0},
+            {"timestamp": pd.Timestamp("2024-01-02"), "close": 2.0},
+            {"timestamp": pd.Timestamp("2024-01-03"), "close": 3.0},
+        ]
+        all_duplicated, domain_list, query = self.generate(original_list)
+        self.assertFalse(all_duplicated)
+        self.assertEqual(
+            [(item.id, item.close) for item in domain_list],
+            [("stock_sz_000001_2024-01-02", 2.0), ("stock_sz_000001_2024-01-03", 3.0)],
+        )
+        self.assertEqual(domain_list[0].code, "000001")
+        self.assertEqual(domain_list[0].timestamp, pd.Timestamp("2024-01-02"))
+        # 一次IN查询所有的id
+        self.assertEqual(query.call_count, 1)
+        self.assertEqual(
+            sorted(query.call_args.kwargs["ids"]),
+            ["stock_sz_000001_2024-01-01", "stock_sz_000001_2024-01-02", "stock_sz_000001_2024-01-03"],
+        )
+
+        all_duplicated, domain_list, _ = self.generate(original_list[:1])
+        self.assertTrue(all_duplicated)
+        self.assertEqual(domain_list, [])
+
+    def test_duplicated_in_batch(self):
+        original_list = [
+            {"timestamp": pd.Timestamp("2024-01-02"), "close": 2.0},
+            {"timestamp": pd.Timestamp("2024-01-02"), "close": 3.0},
+        ]
+        _, domain_list, query = self.generate(original_list, fix_duplicate_way="add")
+        self.assertEqual(query.call_args.kwargs["ids"], ["stock_sz_000001_2024-01-02"])
+        self.assertEqual([item.close for item in domain_list], [2.0, 3.0])
+        self.assertEqual(domain_list[0].id, "stock_sz_000001_2024-01-02")
+        self.assertTrue(domain_list[1].id.startswith("stock_sz_000001_2024-01-02_"))
+
+        _, domain_list, _ = self.generate(original_list, fix_duplicate_way="ignore")
+        self.assertEqual([(item.id, item.close) for item in domain_list], [("stock_sz_000001_2024-01-02", 2.0)])
+
+    def test_force_update(self):
+        recorder = MockKdataRecorder(entity_ids=ENTITY_IDS[:1], force_update=True)
+        saved_item = recorder.session.get(MockKdata, "stock_sz_000001_2024-01-01")
+        all_duplicated, domain_list = recorder.generate_domain_list(
+            recorder.entities[0],
+            [
+                {"timestamp": pd.Timestamp("2024-01-01"), "close": 1.0},
+                {"timestamp": pd.Timestamp("2024-01-02"), "close": 2.0},
+            ],
+        )
+        self.assertFalse(all_duplicated)
+        # 更新已保存的数据
+        self.assertIs(domain_list[0], saved_item)
+        self.assertEqual(saved_item.close, 1.0)
+        self.assertEqual(domain_list[1].id, "stock_sz_000001_2024-01-02")
+
+        all_duplicated, domain_list = recorder.generate_domain_list(
+            recorder.entities[0], [{"timestamp": pd.Timestamp("2024-01-01"), "close": 1.5}]
+        )
+        self.assertTrue(all_duplicated)
+        self.assertEqual([item.close for item in domain_list], [1.5])
+
+    def test_domain_in_original_list(self):
+        domain_item = MockKdata(id="stock_sz_000001_2024-01-01", entity_id="stock_sz_000001", close=2.0)
+        all_duplicated, domain_list, query = self.generate([domain_item])
+        self.assertFalse(all_duplicated)
+        self.assertEqual(domain_list, [domain_item])
+        self.assertEqual(query.call_count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import pandas as pd
+
+from core.contract import IntervalLevel
+from core.contract.trading_calendar import (
+    EntityIntervalCalendar,
+    clear_entity_interval_calendar,
+    get_entity_interval_calendar,
+)
+
+TRADING_INTERVALS = [("09:30", "11:30"), ("13:00", "15:00")]
+
+
+class MockTradableEntity(object):
+    loaded_ranges = []
+
+    @classmethod
+    def get_trading_dates(cls, start_date=None, end_date=None):
+        cls.loaded_ranges.append((start_date, end_date))
+        # 2023-01-02 休市
+        return pd.bdate_range(start_date, end_date).drop(pd.Timestamp("2023-01-02"), errors="ignore")
+
+    @classmethod
+    def get_trading_intervals(cls):
+        return TRADING_INTERVALS
+
+
+class EntityIntervalCalendarTest(unittest.TestCase):
+    """EntityIntervalCalendar test"""
+
+    def setUp(self):
+        MockTradableEntity.loaded_ranges = []
+        self.calendar = EntityIntervalCalendar(
+            get_trading_dates=MockTradableEntity.get_trading_dates, trading_intervals=TRADING_INTERVALS, padding_days=10
+        )
+
+    def test_get_dates(self):
+        self.assertEqual(
+            self.calendar.get_dates("2022-12-30", "2023-01-06").strftime("%Y-%m-%d").tolist(),
+            ["2022-12-30", "2023-01-03", "2023-01-04", "2023-01-05", "2023-01-06"],
+        )
+        self.assertEqual(self.calendar.get_dates("2023-01-07", "2023-01-08").tolist(), [])
+        # 时间部分不影响日期的查询
+        self.assertEqual(
+            self.calendar.get_dates("2023-01-03 10:00", "2023-01-03 09:00").tolist(), [pd.Timestamp("2023-01-03")]
+        )
+
+    def test_load_with_padding(self):
+        self.calendar.get_dates("2023-01-03", "2023-01-06")
+        self.assertEqual(MockTradableEntity.loaded_ranges, [(pd.Timestamp("2023-01-03"), pd.Timestamp("2023-01-06"))])
+
+        # 已读入的范围内不再读取
+        self.calendar.get_dates("2023-01-04", "2023-01-05")
+        self.assertTrue(self.calendar.is_trading_date("2023-01-05"))
+        self.assertEqual(len(MockTradableEntity.loaded_ranges), 1)
+
+        # 超出范围时向外扩展padding_days
+        self.assertEqual(self.calendar.get_dates("2023-01-09", "2023-01-09").tolist(), [pd.Timestamp("2023-01-09")])
+        self.assertEqual(MockTradableEntity.loaded_ranges[-1], (pd.Timestamp("2023-01-03"), pd.Timestamp("2023-01-19")))
+        self.calendar.get_dates("2022-12-30", "2023-01-19")
+        self.assertEqual(MockTradableEntity.loaded_ranges[-1], (pd.Timestamp("2022-12-20"), pd.Timestamp("2023-01-19")))
+        self.assertEqual(len(MockTradableEntity.loaded_ranges), 3)
+
+    def test_is_trading_date(self):
+        self.assertTrue(self.calendar.is_trading_date("2023-01-03"))
+        self.assertTrue(self.calendar.is_trading_date("2023-01-03 14:00"))
+        self.assertFalse(self.calendar.is_trading_date("2023-01-02"))
+        self.assertFalse(self.calendar.is_trading_date("2023-01-07"))
+
+    def test_get_interval_timestamps(self):
+        self.assertEqual(
+            self.calendar.get_interval_timestamps("2023-01-02", "2023-01-13", IntervalLevel.LEVEL_1WEEK).tolist(),
+            [pd.Timestamp("2023-01-06"), pd.Timestamp("2023-01-13")],
+        )
+        days = self.calendar.get_interval_timestamps("2023-01-02", "2023-01-13", IntervalLevel.LEVEL_1DAY)
+        self.assertEqual(len(days), 9)
+
+        timestamps = self.calendar.get_interval_timestamps("2023-01-02", "2023-01-04", IntervalLevel.LEVEL_30MIN)
+        times = ["09:30", "10:00", "10:30", "11:00", "11:30", "13:00", "13:30", "14:00", "14:30", "15:00"]
+        self.assertEqual(
+            timestamps.strftime("%Y-%m-%d %H:%M").tolist(),
+            [f"{day} {time}" for day in ("2023-01-03", "2023-01-04") for time in times],
+        )
+        # 每个时段包含开始和结束
+        minutes = self.calendar.get_interval_timestamps("2023-01-03", "2023-01-03", IntervalLevel.LEVEL_1MIN)
+        self.assertEqual(len(minutes), 242)
+
+    def test_is_interval_timestamp(self):
+        self.assertTrue(self.calendar.is_interval_timestamp("2023-01-03 10:00", IntervalLevel.LEVEL_30MIN))
+        self.assertTrue(self.calendar.is_interval_timestamp("2023-01-03 10:00:00.500", IntervalLevel.LEVEL_30MIN))
+        self.assertTrue(self.calendar.is_interval_timestamp("2023-01-03 10:15", IntervalLevel.LEVEL_15MIN))
+        self.assertFalse(self.calendar.is_interval_timestamp("2023-01-03 10:15", IntervalLevel.LEVEL_30MIN))
+        # 午休
+        self.assertFalse(self.calendar.is_interval_timestamp("2023-01-03 12:00", IntervalLevel.LEVEL_1HOUR))
+        # 非交易日
+        self.assertFalse(self.calendar.is_interval_timestamp("2023-01-02 10:00", IntervalLevel.LEVEL_30MIN))
+        self.assertFalse(self.calendar.is_interval_timestamp("2023-01-07 10:00", IntervalLevel.LEVEL_30MIN))
+
+        self.assertTrue(self.calendar.is_interval_timestamp("2023-01-03", IntervalLevel.LEVEL_1DAY))
+        self.assertFalse(self.calendar.is_interval_timestamp("2023-01-03 15:00", IntervalLevel.LEVEL_1DAY))
+        self.assertTrue(self.calendar.is_interval_timestamp("2023-01-06", IntervalLevel.LEVEL_1WEEK))
+        self.assertFalse(self.calendar.is_interval_timestamp("2023-01-05", IntervalLevel.LEVEL_1WEEK))
+
+    def test_open_close_timestamp(self):
+        self.assertTrue(self.calendar.is_open_timestamp("2023-01-03 09:30"))
+        self.assertFalse(self.calendar.is_open_timestamp("2023-01-03 13:00"))
+        self.assertTrue(self.calendar.is_close_timestamp("2023-01-03 15:00"))
+        self.assertFalse(self.calendar.is_close_timestamp("2023-01-03 11:30"))
+
+
+class GetEntityIntervalCalendarTest(unittest.TestCase):
+    """get_entity_interval_calendar test"""
+
+    def tearDown(self):
+        clear_entity_interval_calendar()
+
+    def test_cache(self):
+        calendar = get_entity_interval_calendar(MockTradableEntity)
+        self.assertIs(get_entity_interval_calendar(MockTradableEntity), calendar)
+        self.assertEqual(calendar.trading_intervals, TRADING_INTERVALS)
+
+        clear_entity_interval_calendar(MockTradableEntity)
+        self.assertIsNot(get_entity_interval_calendar(MockTradableEntity), calendar)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import threading
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.contract import IntervalLevel
+from core.utils.time_utils import to_pd_timestamp
+
+_ONE_DAY_NS = 24 * 60 * 60 * 10**9
+_ONE_SECOND_NS = 10**9
+
+
+class EntityIntervalCalendar(object):
+    """
+    trading dates and intraday timestamps of a tradable entity schema.
+
+    the trading dates are loaded by get_trading_dates of the schema and kept as sorted datetime64 array,
+    the intraday timestamps of every level are kept as the offsets from the day start,
+    so checking a timestamp is a binary search of the date and a lookup of the offset.
+    """
+
+    #: extend the loaded dates with the padding for avoiding loading frequently
+    padding_days = 365
+
+    def __init__(
+        self, get_trading_dates: Callable, trading_intervals: List[Tuple[str, str]], padding_days: int = None
+    ) -> None:
+        """
+        :param get_trading_dates: function(start_date, end_date) to get the trading dates
+        :param trading_intervals: trading intervals in format [(start,end)], e.g. [("09:30", "11:30")]
+        :param padding_days:
+        """
+        self.get_trading_dates = get_trading_dates
+        self.trading_intervals = trading_intervals
+        if padding_days is not None:
+            self.padding_days = padding_days
+
+        self.start_date: pd.Timestamp = None
+        self.end_date: pd.Timestamp = None
+        self.dates = np.array([], dtype="datetime64[ns]")
+
+        self.level_offsets: Dict[IntervalLevel, np.ndarray] = {}
+        self.level_offset_sets: Dict[IntervalLevel, frozenset] = {}
+        self.lock = threading.Lock()
+
+    def _load_dates(self, start_date: pd.Timestamp, end_date: pd.Timestamp):
+        padding = pd.Timedelta(days=self.padding_days)
+        if self.start_date is not None:
+            if start_date < self.start_date:
+                start_date = start_date - padding
+            else:
+                start_date = self.start_date
+            if end_date > self.end_date:
+                end_date = end_date + padding
+            else:
+                end_date = self.end_date
+
+        dates = pd.DatetimeIndex(self.get_trading_dates(start_date=start_date, end_date=end_date)).normalize()
+        self.dates = np.unique(dates.values.astype("datetime64[ns]"))
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def ensure_dates(self, start_date, end_date):
+        start_date = to_pd_timestamp(start_date).normalize()
+        end_date = to_pd_timestamp(end_date).normalize()
+        if self.start_date is None or start_date < self.start_date or end_date > self.end_date:
+            with self.lock:
+                if self.start_date is None or start_date < self.start_date or end_date > self.end_date:
+                    self._load_dates(start_date, end_date)
+        return start_date, end_date
+
+    def get_dates(self, start_date, end_date) -> pd.DatetimeIndex:
+        """
+        get the trading dates in [start_date, end_date]
+        """
+        start_date, end_date = self.ensure_dates(start_date, end_date)
+        start = np.searchsorted(self.dates, np.datetime64(start_date, "ns"), side="left")
+        end = np.searchsorted(self.dates, np.datetime64(end_date, "ns"), side="right")
+        return pd.DatetimeIndex(self.dates[start:end])
+
+    def is_trading_date(self, timestamp) -> bool:
+        the_date = to_pd_timestamp(timestamp).normalize()
+        self.ensure_dates(the_date, the_date)
+        index = np.searchsorted(self.dates, np.datetime64(the_date, "ns"))
+        return index < len(self.dates) and self.dates[index] == np.datetime64(the_date, "ns")
+
+    def get_offsets(self, level: IntervalLevel) -> np.ndarray:
+        """
+        the intraday timestamps of the level in ns offset from the day start, [0] for day and week level
+        """
+        level = IntervalLevel(level)
+        offsets = self.level_offsets.get(level)
+        if offsets is None:
+            if level >= IntervalLevel.LEVEL_1DAY:
+                offsets = np.array([0], dtype=np.int64)
+            else:
+                step = level.to_minute() * 60 * _ONE_SECOND_NS
+                grids = []
+                for start, end in self.trading_intervals:
+                    start_offset = pd.Timedelta(f"{start}:00").value
+                    end_offset = pd.Timedelta(f"{end}:00").value
+                    grids.append(np.arange(start_offset, end_offset + 1, step, dtype=np.int64))
+                offsets = np.concatenate(grids) if grids else np.array([], dtype=np.int64)
+            self.level_offsets[level] = offsets
+            self.level_offset_sets[level] = frozenset(offsets.tolist())
+        return offsets
+
+    def get_interval_timestamps(self, start_date, end_date, level: IntervalLevel) -> pd.DatetimeIndex:
+        """
+        the timestamps of the level in [start_date, end_date]
+        """
+        level = IntervalLevel(level)
+        dates = self.get_dates(start_date, end_date)
+        if level == IntervalLevel.LEVEL_1WEEK:
+            return dates[dates.weekday == 4]
+        if level >= IntervalLevel.LEVEL_1DAY:
+            return dates
+        offsets = self.get_offsets(level)
+        timestamps = dates.values.astype(np.int64)[:, None] + offsets[None, :]
+        return pd.DatetimeIndex(timestamps.ravel().astype("datetime64[ns]"))
+
+    def _split(self, timestamp) -> Tuple[pd.Timestamp, int]:
+        timestamp = to_pd_timestamp(timestamp)
+        the_date = timestamp.normalize()
+        # 精确到秒
+        offset = (timestamp.value - the_date.value) // _ONE_SECOND_NS * _ONE_SECOND_NS
+        return the_date, offset
+
+    def is_interval_timestamp(self, timestamp, level: IntervalLevel) -> bool:
+        """
+        whether the timestamp is one of the timestamps of the level
+        """
+        level = IntervalLevel(level)
+        the_date, offset = self._split(timestamp)
+        if level == IntervalLevel.LEVEL_1WEEK and the_date.weekday() != 4:
+            return False
+        self.get_offsets(level)
+        if offset not in self.level_offset_sets[level]:
+            return False
+        return self.is_trading_date(the_date)
+
+    def is_open_timestamp(self, timestamp) -> bool:
+        _, offset = self._split(timestamp)
+        return offset == pd.Timedelta(f"{self.trading_intervals[0][0]}:00").value
+
+    def is_close_timestamp(self, timestamp) -> bool:
+        _, offset = self._split(timestamp)
+        return offset == pd.Timedelta(f"{self.trading_intervals[-1][1]}:00").value
+
+
+_calendars: Dict[type, EntityIntervalCalendar] = {}
+_calendars_lock = threading.Lock()
+
+
+def get_entity_interval_calendar(entity_schema) -> EntityIntervalCalendar:
+    """
+    get the cached calendar of the tradable entity schema
+    """
+    calendar = _calendars.get(entity_schema)
+    if calendar is None:
+        with _calendars_lock:
+            calendar = _calendars.get(entity_schema)
+            if calendar is None:
+                calendar = EntityIntervalCalendar(
+                    get_trading_dates=entity_schema.get_trading_dates,
+                    trading_intervals=entity_schema.get_trading_intervals(),
+                )
+                _calendars[entity_schema] = calendar
+    return calendar
+
+
+def clear_entity_interval_calendar(entity_schema=None):
+    """
+    clear the cached calendar, call it if the trading dates of the schema changed
+    """
+    with _calendars_lock:
+        if entity_schema:
+            _calendars.pop(entity_schema, None)
+        else:
+            _calendars.clear()
+
+
+# the __all__ is generated
+__all__ = ["EntityIntervalCalendar", "get_entity_interval_calendar", "clear_entity_interval_calendar"]
@@ -0,0 +1,250 @@
+import logging
+import os
+from threading import Lock
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from core.config.config_models import ColumnarConfig
+from core.config.configmanager import ConfigContainer
+from core.config.fullconfig import FullConfig
+from core.utils.time_utils import to_pd_timestamp
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class ColumnarStoreManager:
+    """
+    列式存储管理器, 与DatabaseManager并列
+
+    数据按 {root_path}/{provider}/{table}/ 存放, 每个分区一个parquet文件:
+    entity分区为 entity_id=xxx/data.parquet, year分区为 year=2024/data.parquet,
+    读取时借助pyarrow.dataset做列裁剪和谓词下推
+
+    双写只会写入部分标的, 只有export_table整表迁移完成并写入标记文件后才从列式存储读取
+    """
+
+    _locks = {}
+    _lock = Lock()
+    _file_name = "data.parquet"
+    # 以_开头的文件会被pyarrow.dataset忽略
+    _migrated_marker = "_MIGRATED"
+
+    @classmethod
+    def get_config(cls) -> ColumnarConfig:
+        """获取列式存储配置, 未初始化时返回默认配置(不启用)"""
+        try:
+            return ConfigContainer.get_config(FullConfig).columnar
+        except ValueError:
+            return ColumnarConfig()
+
+    @classmethod
+    def is_enabled_for(cls, data_schema) -> bool:
+        """schema是否使用列式存储"""
+        config = cls.get_config()
+        if not config.enabled:
+            return False
+        return cls._match_schema(config, data_schema)
+
+    @classmethod
+    def is_dual_write_for(cls, data_schema) -> bool:
+        """df_to_db时是否需要同时写入列式存储"""
+        config = cls.get_config()
+        if not (config.enabled and config.dual_write):
+            return False
+        return cls._match_schema(config, data_schema)
+
+    @classmethod
+    def _match_schema(cls, config: ColumnarConfig, data_schema) -> bool:
+        table_name = data_schema.__tablename__
+        if config.schemas:
+            return table_name in config.schemas
+        return table_name.endswith("_kdata")
+
+    @classmethod
+    def get_store_path(cls, provider: str, data_schema) -> str:
+        config = cls.get_config()
+        return os.path.join(config.root_path, provider, data_schema.__tablename__)
+
+    @classmethod
+    def has_data(cls, provider: str, data_schema) -> bool:
+        """整表是否已经迁移到列式存储"""
+        path = cls.get_store_path(provider, data_schema)
+        return os.path.exists(os.path.join(path, cls._migrated_marker))
+
+    @classmethod
+    def _get_path_lock(cls, path: str) -> Lock:
+        with cls._lock:
+            if path not in cls._locks:
+                cls._locks[path] = Lock()
+            return cls._locks[path]
+
+    @classmethod
+    def _partition_key(cls, config: ColumnarConfig) -> str:
+        return "entity_id" if config.partition_by == "entity" else "year"
+
+    @classmethod
+    def read(
+        cls,
+        data_schema,
+        provider: str,
+        columns: Optional[List[str]] = None,
+        ids: List[str] = None,
+        entity_ids: List[str] = None,
+        entity_id: str = None,
+        codes: List[str] = None,
+        code: str = None,
+        start_timestamp=None,
+        end_timestamp=None,
+        limit: int = None,
+        time_field: str = "timestamp",
+    ) -> Optional[pd.DataFrame]:
+        """
+        读取列式存储数据, 语义与get_data的df返回一致(按时间升序)
+
+        :return: 整表没有迁移时返回None, 调用方应回退到sql
+        """
+        if not cls.has_data(provider, data_schema):
+            return None
+
+        config = cls.get_config()
+        partition_key = cls._partition_key(config)
+        path = cls.get_store_path(provider, data_schema)
+        dataset = ds.dataset(path, format="parquet", partitioning="hive")
+
+        expr = None
+
+        def _and(e):
+            nonlocal expr
+            expr = e if expr is None else expr & e
+
+        if entity_id:
+            _and(ds.field("entity_id") == entity_id)
+        if entity_ids:
+            _and(ds.field("entity_id").isin(entity_ids))
+        if code:
+            _and(ds.field("code") == code)
+        if codes:
+            _and(ds.field("code").isin(codes))
+        if ids:
+            _and(ds.field("id").isin(ids))
+
+        start_timestamp = to_pd_timestamp(start_timestamp)
+        end_timestamp = to_pd_timestamp(end_timestamp)
+        if start_timestamp:
+            _and(ds.field(time_field) >= start_timestamp.to_pydatetime())
+            if partition_key == "year":
+                _and(ds.field("year") >= start_timestamp.year)
+        if end_timestamp:
+            _and(ds.field(time_field) <= end_timestamp.to_pydatetime())
+            if partition_key == "year":
+                _and(ds.field("year") <= end_timestamp.year)
+
+        if columns:
+            columns = list(dict.fromkeys(columns))
+            if time_field not in columns:
+                columns.append(time_field)
+
+        df = dataset.to_table(columns=columns, filter=expr).to_pandas()
+        if partition_key == "year" and "year" in df.columns and (not columns or "year" not in columns):
+            df = df.drop(columns=["year"])
+        if "entity_id" in df.columns and isinstance(df["entity_id"].dtype, pd.CategoricalDtype):
+            df["entity_id"] = df["entity_id"].astype(str)
+
+        df = df.sort_values(by=time_field, kind="stable").reset_index(drop=True)
+        if limit:
+            df = df.head(limit)
+        return df
+
+    @classmethod
+    def write(cls, df: pd.DataFrame, data_schema, provider: str, force_update: bool = False) -> int:
+        """
+        按分区upsert写入, force_update为True时新数据覆盖同id旧数据, 否则保留旧数据(与df_to_db语义一致)
+
+        :return: 写入的行数
+        """
+        if df is None or df.empty:
+            return 0
+
+        config = cls.get_config()
+        partition_key = cls._partition_key(config)
+        path = cls.get_store_path(provider, data_schema)
+        time_field = data_schema.time_field()
+
+        df = df.copy()
+        if time_field in df.columns:
+            df[time_field] = pd.to_datetime(df[time_field])
+        if partition_key == "year":
+            df["year"] = df[time_field].dt.year
+
+        for key, sub_df in df.groupby(partition_key, sort=False):
+            partition_dir = os.path.join(path, f"{partition_key}={key}")
+            file_path = os.path.join(partition_dir, cls._file_name)
+            sub_df = sub_df.drop(columns=[partition_key])
+
+            with cls._get_path_lock(file_path):
+                if os.path.exists(file_path):
+                    old_df = pq.read_table(file_path).to_pandas()
+                    if force_update:
+                        merged = pd.concat([old_df, sub_df], ignore_index=True)
+                    else:
+                        merged = pd.concat([sub_df, old_df], ignore_index=True)
+                    sub_df = merged.drop_duplicates(subset="id", keep="last")
+                if time_field in sub_df.columns:
+                    sub_df = sub_df.sort_values(by=time_field, kind="stable")
+
+                os.makedirs(partition_dir, exist_ok=True)
+                # 以.开头的临时文件会被pyarrow.dataset忽略
+                tmp_path = os.path.join(partition_dir, f".{cls._file_name}.tmp")
+                pq.write_table(pa.Table.from_pandas(sub_df, preserve_index=False), tmp_path)
+                os.replace(tmp_path, file_path)
+        return len(df)
+
+    @classmethod
+    def export_table(cls, data_schema, provider: str = None, entity_ids: List[str] = None) -> int:
+        """
+        一次性把sql表迁移到列式存储, 按entity逐个导出避免一次性加载整表,
+        整表导出完成后写入标记文件, 之后get_data才从列式存储读取
+
+        :param entity_ids: 只导出部分标的, 此时不写入标记文件
+        :return: 导出的行数
+        """
+        from core.contract.api import get_db_session, get_group, safe_read_sql
+
+        if not provider:
+            provider = data_schema.providers[0]
+
+        full_table = not entity_ids
+        if full_table:
+            entity_df = get_group(provider, data_schema, data_schema.entity_id, group_func=None)
+            entity_ids = entity_df["entity_id"].tolist() if entity_df is not None else []
+
+        session = get_db_session(provider=provider, data_schema=data_schema)
+        total = 0
+        for entity_id in entity_ids:
+            query = session.query(data_schema).filter(data_schema.entity_id == entity_id)
+            df = safe_read_sql(query, session)
+            total += cls.write(df, data_schema=data_schema, provider=provider, force_update=True)
+            logger.info(f"export {data_schema.__tablename__} {entity_id} to columnar store, total:{total}")
+
+        if full_table:
+            path = cls.get_store_path(provider, data_schema)
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, cls._migrated_marker), "w") as f:
+                f.write(pd.Timestamp.now().isoformat())
+        return total
+
+
+if __name__ == "__main__":
+    # 迁移示例: python -m core.db.columnarmanager Stock1dHfqKdata
+    import sys
+
+    import core.domain  # noqa: F401 注册schema
+    from core.contract.api import get_schema_by_name
+
+    schema = get_schema_by_name(sys.argv[1] if len(sys.argv) > 1 else "Stock1dHfqKdata")
+    print(ColumnarStoreManager.export_table(schema))
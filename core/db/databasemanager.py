@@ -1,5 +1,5 @@
 from typing import Optional, Union
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.engine import Engine, URL
 from sqlalchemy.exc import OperationalError, ProgrammingError
 import json
@@ -110,8 +110,19 @@ class DatabaseManager:
         elif config.db_type == mysql:
             engine.dialect.identifier_preparer.initial_quote = '`'
             engine.dialect.identifier_preparer.final_quote = '`'
+            # 不使用CLIENT_FOUND_ROWS, ON DUPLICATE KEY UPDATE id=id跳过的重复数据rowcount为0, 可直接作为新增个数
+            event.listen(engine, "do_connect", cls._clear_found_rows_flag)
+            engine.dialect.supports_sane_rowcount = False
+            engine.dialect.supports_sane_multi_rowcount = False
         return engine
 
+    @staticmethod
+    def _clear_found_rows_flag(dialect, conn_rec, cargs, cparams) -> None:
+        """sqlalchemy的mysql方言总是加上CLIENT_FOUND_ROWS, 建立连接前去掉"""
+        found_rows = dialect._found_rows_client_flag()
+        if found_rows is not None:
+            cparams["client_flag"] = cparams.get("client_flag", 0) & ~found_rows
+
     @classmethod
     def _ensure_database_exists(cls, config: DatabaseConfig, engine: Engine) -> None:
         """确保数据库存在，如不存在则自动创建"""
@@ -193,6 +204,13 @@ class DatabaseManager:
         finally:
             admin_engine.dispose()
 
+    @classmethod
+    def dispose_all(cls, close: bool = True):
+        """释放所有引擎的连接池, close=False时只丢弃连接不关闭, 用于fork出来的子进程"""
+        # 不加锁, fork时其他线程可能正持有锁
+        for engine in list(cls._engines.values()):
+            engine.dispose(close=close)
+
     @classmethod
     def close_all(cls):
         """关闭所有数据库连接"""
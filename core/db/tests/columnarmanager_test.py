@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from core.config.config_models import ColumnarConfig
+from core.contract.api import df_to_db, get_data, get_db_session
+from core.db.columnarmanager import ColumnarStoreManager
+from core.utils.testing import MOCK_DB_NAME, MOCK_PROVIDER, MockBase, MockKdata, use_sqlite_db
+
+ENTITY_IDS = ["stock_sz_000001", "stock_sz_000002"]
+
+
+def gen_kdata(days: pd.DatetimeIndex, close: float) -> pd.DataFrame:
+    dfs = []
+    for i, entity_id in enumerate(ENTITY_IDS):
+        dfs.append(
+            pd.DataFrame(
+                {
+                    "id": [f"{entity_id}_{day.strftime('%Y-%m-%d')}" for day in days],
+                    "entity_id": entity_id,
+                    "code": entity_id[-6:],
+                    "timestamp": days,
+                    "close": close + i,
+                    "volume": 100.0,
+                }
+            )
+        )
+    return pd.concat(dfs, ignore_index=True)
+
+
+# 跨年的数据, 按年分区时有两个分区
+DAYS = pd.date_range("2023-12-29", periods=6)
+
+
+class ColumnarStoreManagerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.root_path = tmp_dir.name
+        self.use_config()
+        use_sqlite_db(self, provider=MOCK_PROVIDER, db_name=MOCK_DB_NAME, schema_base=MockBase)
+
+    def use_config(self, **kwargs) -> ColumnarConfig:
+        config = ColumnarConfig(enabled=True, root_path=self.root_path, **kwargs)
+        patcher = mock.patch.object(ColumnarStoreManager, "get_config", return_value=config)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return config
+
+    def write_and_mark(self, df: pd.DataFrame, **kwargs) -> int:
+        saved = ColumnarStoreManager.write(df, data_schema=MockKdata, provider=MOCK_PROVIDER, **kwargs)
+        path = ColumnarStoreManager.get_store_path(MOCK_PROVIDER, MockKdata)
+        with open(os.path.join(path, ColumnarStoreManager._migrated_marker), "w") as f:
+            f.write("")
+        return saved
+
+    def read(self, **kwargs) -> pd.DataFrame:
+        return ColumnarStoreManager.read(data_schema=MockKdata, provider=MOCK_PROVIDER, **kwargs)
+
+    def test_partitions(self):
+        self.write_and_mark(gen_kdata(DAYS, 1.0))
+        path = ColumnarStoreManager.get_store_path(MOCK_PROVIDER, MockKdata)
+        self.assertEqual(
+            sorted(os.listdir(path)), ["_MIGRATED", "entity_id=stock_sz_000001", "entity_id=stock_sz_000002"]
+        )
+
+        self.root_path = os.path.join(self.root_path, "year")
+        self.use_config(partition_by="year")
+        self.write_and_mark(gen_kdata(DAYS, 1.0))
+        path = ColumnarStoreManager.get_store_path(MOCK_PROVIDER, MockKdata)
+        self.assertEqual(sorted(os.listdir(path)), ["_MIGRATED", "year=2023", "year=2024"])
+
+    def test_round_trip(self):
+        for partition_by in ("entity", "year"):
+            with self.subTest(partition_by=partition_by):
+                self.root_path = os.path.join(self.root_path, partition_by)
+                self.use_config(partition_by=partition_by)
+                df = gen_kdata(DAYS, 1.0)
+                self.assertEqual(self.write_and_mark(df), 12)
+
+                expected = df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+                result = self.read()
+                pd.testing.assert_frame_equal(
+                    result.sort_values(["timestamp", "entity_id"]).reset_index(drop=True),
+                    expected.sort_values(["timestamp", "entity_id"]).reset_index(drop=True),
+                    check_like=True,
+                )
+
+    def test_pruning(self):
+        for partition_by in ("entity", "year"):
+            with self.subTest(partition_by=partition_by):
+                self.root_path = os.path.join(self.root_path, partition_by)
+                self.use_config(partition_by=partition_by)
+                self.write_and_mark(gen_kdata(DAYS, 1.0))
+
+                # 时间字段总是返回
+                df = self.read(columns=["close"], entity_id="stock_sz_000002")
+                self.assertEqual(df.columns.tolist(), ["close", "timestamp"])
+                self.assertEqual(df["close"].tolist(), [2.0] * 6)
+
+                df = self.read(columns=["id"], start_timestamp="2023-12-31", end_timestamp="2024-01-02")
+                self.assertEqual(df["timestamp"].tolist(), list(DAYS[2:5].repeat(2)))
+                self.assertEqual(
+                    sorted(df["id"]),
+                    sorted(f"{entity_id}_{day}" for entity_id in ENTITY_IDS for day in DAYS[2:5].strftime("%Y-%m-%d")),
+                )
+
+                df = self.read(columns=["id"], codes=["000001"], start_timestamp="2024-01-01", limit=2)
+                self.assertEqual(df["id"].tolist(), ["stock_sz_000001_2024-01-01", "stock_sz_000001_2024-01-02"])
+
+                df = self.read(ids=["stock_sz_000002_2023-12-29"])
+                self.assertEqual(df["close"].tolist(), [2.0])
+                self.assertEqual(df["entity_id"].tolist(), ["stock_sz_000002"])
+
+    def test_upsert(self):
+        self.write_and_mark(gen_kdata(DAYS[:3], 1.0))
+        # 不强制更新时保留旧数据
+        ColumnarStoreManager.write(gen_kdata(DAYS, 5.0), data_schema=MockKdata, provider=MOCK_PROVIDER)
+        df = self.read(entity_id="stock_sz_000001")
+        self.assertEqual(df["close"].tolist(), [1.0] * 3 + [5.0] * 3)
+
+        ColumnarStoreManager.write(
+            gen_kdata(DAYS[1:2], 9.0), data_schema=MockKdata, provider=MOCK_PROVIDER, force_update=True
+        )
+        df = self.read(entity_id="stock_sz_000001")
+        self.assertEqual(df["close"].tolist(), [1.0, 9.0, 1.0, 5.0, 5.0, 5.0])
+
+    def test_migrated_gate(self):
+        # 双写只写入部分数据, 迁移完成前get_data仍然读数据库
+        df_to_db(gen_kdata(DAYS, 1.0), MockKdata, provider=MOCK_PROVIDER)
+        self.assertFalse(ColumnarStoreManager.has_data(MOCK_PROVIDER, MockKdata))
+        self.assertIsNone(self.read())
+        with mock.patch.object(ColumnarStoreManager, "read", wraps=ColumnarStoreManager.read) as read:
+            df = get_data(data_schema=MockKdata, provider=MOCK_PROVIDER, columns=["id", "close"])
+            read.assert_called_once()
+        self.assertEqual(len(df), 12)
+
+        # 双写的数据与数据库一致
+        path = ColumnarStoreManager.get_store_path(MOCK_PROVIDER, MockKdata)
+        self.assertEqual(sorted(os.listdir(path)), ["entity_id=stock_sz_000001", "entity_id=stock_sz_000002"])
+
+        self.assertEqual(ColumnarStoreManager.export_table(MockKdata, provider=MOCK_PROVIDER), 12)
+        self.assertTrue(ColumnarStoreManager.has_data(MOCK_PROVIDER, MockKdata))
+
+        # 迁移后删除数据库数据, get_data从列式存储读取
+        session = get_db_session(provider=MOCK_PROVIDER, data_schema=MockKdata)
+        session.query(MockKdata).delete()
+        session.commit()
+        df = get_data(
+            data_schema=MockKdata,
+            provider=MOCK_PROVIDER,
+            columns=["entity_id", "close"],
+            entity_id="stock_sz_000002",
+            start_timestamp="2024-01-01",
+            index=["entity_id", "timestamp"],
+        )
+        self.assertEqual(df.index.names, ["entity_id", "timestamp"])
+        self.assertEqual(df["close"].tolist(), [2.0] * 3)
+
+        # 带sql过滤条件时仍然读数据库
+        df = get_data(data_schema=MockKdata, provider=MOCK_PROVIDER, filters=[MockKdata.close > 0])
+        self.assertTrue(df.empty)
+
+    def test_dual_write_disabled(self):
+        self.use_config(dual_write=False)
+        df_to_db(gen_kdata(DAYS, 1.0), MockKdata, provider=MOCK_PROVIDER)
+        self.assertFalse(os.path.exists(ColumnarStoreManager.get_store_path(MOCK_PROVIDER, MockKdata)))
+
+    def test_schemas(self):
+        self.assertTrue(ColumnarStoreManager.is_enabled_for(MockKdata))
+        self.use_config(schemas=["mock_stock"])
+        self.assertFalse(ColumnarStoreManager.is_enabled_for(MockKdata))
+        self.assertFalse(ColumnarStoreManager.is_dual_write_for(MockKdata))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine, text
+
+from core.db.databasemanager import DatabaseManager
+
+
+class DisposeAllTest(unittest.TestCase):
+    """DatabaseManager.dispose_all test"""
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        patch = mock.patch.dict(DatabaseManager._engines, {"mock_mock": self.engine}, clear=True)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(self.engine.dispose)
+
+    def test_dispose_all(self):
+        with self.engine.connect() as conn:
+            conn.execute(text("select 1"))
+        for close in (False, True):
+            with self.subTest(close=close), mock.patch.object(self.engine, "dispose") as dispose:
+                DatabaseManager.dispose_all(close=close)
+                dispose.assert_called_once_with(close=close)
+        # 引擎保留, 可继续使用
+        DatabaseManager.dispose_all()
+        self.assertIs(DatabaseManager._engines["mock_mock"], self.engine)
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text("select 1")).scalar(), 1)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import numpy as np
 import pandas as pd
 
 from core.contract.factor import Scorer, Transformer
@@ -20,6 +21,25 @@ def ema(s: pd.Series, window: int = 12) -> pd.Series:
     return s.ewm(span=window, adjust=False, min_periods=window).mean()
 
 
+def continue_ewm(s: pd.Series, seeds: pd.Series, span: int) -> pd.Series:
+    """
+    continue the ewm(adjust=False) of every entity from its last value, the result is same as computing
+    the ewm over the whole history of the entities
+
+    :param s: (entity_id, timestamp) indexed series of the new values
+    :param seeds: entity_id indexed last ewm value, NaN or missing for the entity without history
+    :param span:
+    :return: ewm of the new values
+    """
+    entity_ids = s.index.get_level_values(0).unique()
+    seeds = seeds.reindex(entity_ids)
+    # 在每个entity前面插入上次的ewm值,作为ewm的起点
+    seed_index = pd.MultiIndex.from_arrays([entity_ids, [pd.Timestamp.min] * len(entity_ids)], names=s.index.names)
+    seeded = pd.concat([pd.Series(seeds.values, index=seed_index, dtype=float), s.astype(float)]).sort_index()
+    result = normalize_group_compute_result(group_by_entity_id(seeded).ewm(span=span, adjust=False).mean())
+    return result.reindex(s.index)
+
+
 def live_or_dead(x):
     if x:
         return 1
@@ -148,6 +168,9 @@ class RankScorer(Scorer):
 
 
 class MaTransformer(Transformer):
+    panel_vectorizable = True
+    incremental = True
+
     def __init__(self, windows=None, cal_change_pct=False) -> None:
         super().__init__()
         if windows is None:
@@ -155,7 +178,37 @@ class MaTransformer(Transformer):
         self.windows = windows
         self.cal_change_pct = cal_change_pct
 
-    def transform(self, input_df: pd.DataFrame) -> pd.DataFrame:
+    @property
+    def warmup_window(self) -> int:
+        return max(self.windows)
+
+    def transform_incremental(self, input_df, added_index, states):
+        """
+        rolling over the added rows and the warm-up rows before them, input_df is not changed
+        """
+        if len(added_index) < len(input_df):
+            #: 每个标的只保留第一根新增k线前warmup_window根k线及之后的数据
+            positions = input_df.groupby(level=0).cumcount()
+            first_added = positions[input_df.index.isin(added_index)].groupby(level=0).min()
+            starts = input_df.index.get_level_values(0).map(first_added) - self.warmup_window
+            input_df = input_df[positions.to_numpy() >= starts.to_numpy()]
+
+        added_df = input_df.loc[added_index].copy()
+        group_close = group_by_entity_id(input_df["close"])
+        if self.cal_change_pct:
+            added_df["change_pct"] = normalize_group_compute_result(group_close.pct_change()).loc[added_index]
+
+        for window in self.windows:
+            col = "ma{}".format(window)
+            if col not in self.indicators:
+                self.indicators.append(col)
+
+            group_ma = group_close.rolling(window=window, min_periods=window).mean()
+            added_df[col] = normalize_group_compute_result(group_ma).loc[added_index]
+
+        return added_df, states
+
+    def transform_panel(self, input_df: pd.DataFrame) -> pd.DataFrame:
         if self.cal_change_pct:
             group_pct = group_by_entity_id(input_df["close"]).pct_change()
             input_df["change_pct"] = normalize_group_compute_result(group_pct)
@@ -171,7 +224,7 @@ class MaTransformer(Transformer):
 
     def transform_one(self, entity_id, df: pd.DataFrame) -> pd.DataFrame:
         """
-        transform_one would not take effects if transform was implemented.
+        transform_one would not take effects if transform_panel was implemented.
         Just show how to implement it here, most of time you should overwrite transform directly for performance.
 
         :param entity_id:
@@ -267,6 +320,9 @@ class MaAndVolumeTransformer(Transformer):
 
 
 class MacdTransformer(Transformer):
+    panel_vectorizable = True
+    incremental = True
+
     def __init__(self, slow=26, fast=12, n=9, normal=False, count_live_dead=False) -> None:
         super().__init__()
         self.slow = slow
@@ -279,22 +335,101 @@ class MacdTransformer(Transformer):
         self.indicators.append("dea")
         self.indicators.append("macd")
 
-    def transform(self, input_df) -> pd.DataFrame:
-        macd_df = input_df.groupby(level=0)["close"].apply(
-            lambda x: macd(
-                x,
-                slow=self.slow,
-                fast=self.fast,
-                n=self.n,
-                return_type="df",
-                normal=self.normal,
-                count_live_dead=self.count_live_dead,
-            )
+    def transform_panel(self, input_df) -> pd.DataFrame:
+        """
+        same as macd for every entity, the ewm is computed by groupby so all the entities are computed at once
+        """
+        close = input_df["close"]
+        group_close = group_by_entity_id(close)
+        ema_fast = normalize_group_compute_result(
+            group_close.ewm(span=self.fast, adjust=False, min_periods=self.fast).mean()
+        )
+        ema_slow = normalize_group_compute_result(
+            group_close.ewm(span=self.slow, adjust=False, min_periods=self.slow).mean()
         )
-        macd_df = macd_df.reset_index(level=0, drop=True)
+
+        diff = ema_fast - ema_slow
+        dea = normalize_group_compute_result(group_by_entity_id(diff).ewm(span=self.n, adjust=False).mean())
+        m = (diff - dea) * 2
+
+        if self.normal:
+            diff = diff / close
+            dea = dea / close
+            m = m / close
+
+        macd_df = pd.DataFrame({"diff": diff, "dea": dea, "macd": m})
+        if self.count_live_dead:
+            live = pd.Series(np.where(diff > dea, 1, -1), index=diff.index)
+            bull = (diff > 0) & (dea > 0)
+            # 每个entity的第一个值shift后为空,一定是新的一段
+            bulk = (live != group_by_entity_id(live).shift()).cumsum()
+            live_count = live * (live.groupby(bulk).cumcount() + 1)
+            macd_df["live"] = live
+            macd_df["bull"] = bull
+            macd_df["live_count"] = live_count
+
         input_df = pd.concat([input_df, macd_df], axis=1, sort=False, verify_integrity=True)
         return input_df
 
+    def transform_incremental(self, input_df, added_index, states):
+        """
+        continue the ema of every entity from the states, so only the added rows are computed.
+
+        state of the entity: {"count": , "ema_fast": , "ema_slow": , "dea": , "live": , "live_count": }
+        """
+        added_df = input_df.loc[added_index]
+        close = added_df["close"]
+        entity_ids = close.index.get_level_values(0)
+        pre_df = pd.DataFrame.from_dict(
+            states, orient="index", columns=["count", "ema_fast", "ema_slow", "dea", "live", "live_count"]
+        ).reindex(entity_ids.unique()).astype(float)
+
+        # 包含历史数据的序号,用于min_periods
+        count = pd.Series(
+            entity_ids.map(pre_df["count"].fillna(0)).to_numpy(dtype=int) + group_by_entity_id(close).cumcount() + 1,
+            index=close.index,
+        )
+        raw_fast = continue_ewm(close, pre_df["ema_fast"], span=self.fast)
+        raw_slow = continue_ewm(close, pre_df["ema_slow"], span=self.slow)
+        ema_fast = raw_fast.where(count >= self.fast)
+        ema_slow = raw_slow.where(count >= self.slow)
+
+        diff = ema_fast - ema_slow
+        dea = continue_ewm(diff, pre_df["dea"], span=self.n)
+        m = (diff - dea) * 2
+
+        new_state_df = pd.DataFrame({"count": count, "ema_fast": raw_fast, "ema_slow": raw_slow, "dea": dea})
+
+        if self.normal:
+            diff = diff / close
+            dea = dea / close
+            m = m / close
+
+        macd_df = pd.DataFrame({"diff": diff, "dea": dea, "macd": m})
+        if self.count_live_dead:
+            live = pd.Series(np.where(diff > dea, 1, -1), index=diff.index)
+            bull = (diff > 0) & (dea > 0)
+            bulk = (live != group_by_entity_id(live).shift()).cumsum()
+            run_count = live.groupby(bulk).cumcount() + 1
+            # 每个entity的第一段如果和上次的live相同,接着上次的计数
+            first_bulk = bulk == group_by_entity_id(bulk).transform("first")
+            same_live = live.to_numpy() == entity_ids.map(pre_df["live"]).to_numpy()
+            pre_count = entity_ids.map(pre_df["live_count"].abs().fillna(0)).to_numpy(dtype=int)
+            run_count = run_count + np.where(first_bulk & same_live, pre_count, 0)
+            live_count = live * run_count
+            macd_df["live"] = live
+            macd_df["bull"] = bull
+            macd_df["live_count"] = live_count
+
+            new_state_df["live"] = live
+            new_state_df["live_count"] = live_count
+
+        new_states = dict(states)
+        new_states.update(group_by_entity_id(new_state_df).tail(1).droplevel(1).to_dict(orient="index"))
+
+        added_df = pd.concat([added_df, macd_df], axis=1, sort=False, verify_integrity=True)
+        return added_df, new_states
+
     def transform_one(self, entity_id, df: pd.DataFrame) -> pd.DataFrame:
         print(f"transform_one {entity_id} {df}")
         return macd(
@@ -364,6 +499,7 @@ class QuantileScorer(Scorer):
 __all__ = [
     "ma",
     "ema",
+    "continue_ewm",
     "live_or_dead",
     "macd",
     "point_in_range",
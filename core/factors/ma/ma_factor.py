@@ -51,6 +51,7 @@ class MaFactor(TechnicalFactor):
         only_load_factor: bool = False,
         adjust_type: Union[AdjustType, str] = None,
         windows=None,
+        incremental: bool = False,
     ) -> None:
         if need_persist:
             self.factor_schema = get_ma_factor_schema(entity_type=entity_schema.__name__, level=level)
@@ -88,6 +89,7 @@ class MaFactor(TechnicalFactor):
             clear_state,
             only_load_factor,
             adjust_type,
+            incremental,
         )
 
 
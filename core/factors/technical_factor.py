@@ -38,6 +38,7 @@ class TechnicalFactor(Factor, metaclass=FactorMeta):
         clear_state: bool = False,
         only_load_factor: bool = False,
         adjust_type: Union[AdjustType, str] = None,
+        incremental: bool = False,
     ) -> None:
         if columns is None:
             columns = [
@@ -95,6 +96,7 @@ class TechnicalFactor(Factor, metaclass=FactorMeta):
             factor_name,
             clear_state,
             only_load_factor,
+            incremental,
         )
 
     def drawer_sub_df_list(self) -> Optional[List[pd.DataFrame]]:
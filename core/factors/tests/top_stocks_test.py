@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from core.factors import top_stocks
+from core.factors.top_stocks import _init_backfill_worker, backfill_top_stocks
+
+DAYS = pd.date_range("2024-01-02", periods=6)
+ENTITY_IDS = ["stock_sz_000001", "stock_sz_000002", "stock_sz_000003"]
+
+
+def gen_close_df() -> pd.DataFrame:
+    """000003前3天没有数据"""
+    close = np.arange(len(DAYS) * len(ENTITY_IDS), dtype=float).reshape(len(DAYS), len(ENTITY_IDS))
+    close[:3, 2] = np.nan
+    return pd.DataFrame(close, index=DAYS, columns=ENTITY_IDS)
+
+
+def compute_top_stocks_of_date(target_date, provider="em", close_df: pd.DataFrame = None) -> dict:
+    """在子进程中运行, 返回子进程读到的当天收盘价"""
+    closes = close_df.loc[target_date].dropna()
+    return {
+        "id": f"block_zvt_000001_{target_date}",
+        "entity_id": "block_zvt_000001",
+        "timestamp": target_date,
+        "short_stocks": json.dumps(closes.tolist()),
+        "all_stocks_count": len(closes),
+        "long_count": os.getpid(),
+    }
+
+
+class InitBackfillWorkerTest(unittest.TestCase):
+    """_init_backfill_worker test"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.close_path = os.path.join(tmp.name, "close.npy")
+        self.addCleanup(setattr, top_stocks, "_backfill_close_df", None)
+
+    def test_init_backfill_worker(self):
+        close_df = gen_close_df()
+        np.save(self.close_path, close_df.to_numpy())
+        with mock.patch.object(top_stocks.DatabaseManager, "dispose_all") as dispose_all:
+            _init_backfill_worker(self.close_path, close_df.index.to_numpy(), close_df.columns.to_numpy())
+        # 不关闭父进程的连接
+        dispose_all.assert_called_once_with(close=False)
+        pd.testing.assert_frame_equal(top_stocks._backfill_close_df, close_df, check_freq=False)
+        # 只读共享
+        self.assertFalse(top_stocks._backfill_close_df.to_numpy().flags.writeable)
+
+    def test_init_empty(self):
+        np.save(self.close_path, np.empty((0, 0)))
+        with mock.patch.object(top_stocks.DatabaseManager, "dispose_all"):
+            _init_backfill_worker(self.close_path, [], [])
+        self.assertTrue(top_stocks._backfill_close_df.empty)
+
+
+class BackfillTopStocksTest(unittest.TestCase):
+    """backfill_top_stocks test"""
+
+    def setUp(self):
+        self.saved = []
+        patches = [
+            mock.patch.object(top_stocks, "load_close_panel", return_value=gen_close_df()),
+            # 子进程由fork创建, 同样使用替换后的函数
+            mock.patch.object(top_stocks, "compute_top_stocks_of_date", side_effect=compute_top_stocks_of_date),
+            mock.patch.object(top_stocks, "df_to_db", side_effect=lambda df, **kwargs: self.saved.append((df, kwargs))),
+        ]
+        self.mocks = [patch.start() for patch in patches]
+        for patch in patches:
+            self.addCleanup(patch.stop)
+
+    def saved_df(self) -> pd.DataFrame:
+        self.assertEqual(len(self.saved), 1)
+        df, kwargs = self.saved[0]
+        self.assertIs(kwargs["data_schema"], top_stocks.TopStocks)
+        self.assertTrue(kwargs["force_update"])
+        return df.sort_values("timestamp", ignore_index=True)
+
+    def test_backfill(self):
+        trade_days = DAYS[2:].tolist()
+        backfill_top_stocks(trade_days, provider="em", processes=2)
+
+        load_close_panel = self.mocks[0]
+        self.assertEqual(load_close_panel.call_args.kwargs["end_timestamp"], trade_days[-1])
+        self.assertEqual(
+            load_close_panel.call_args.kwargs["start_timestamp"],
+            trade_days[0] - pd.Timedelta(days=top_stocks.BACKFILL_PADDING_DAYS),
+        )
+
+        df = self.saved_df()
+        self.assertEqual(df["timestamp"].tolist(), trade_days)
+        self.assertEqual(df["all_stocks_count"].tolist(), [2, 3, 3, 3])
+        close_df = gen_close_df()
+        self.assertEqual(
+            df["short_stocks"].tolist(),
+            [json.dumps(close_df.loc[day].dropna().tolist()) for day in trade_days],
+        )
+        # 在子进程中计算, 连续的日期分给同一个进程
+        pids = df["long_count"].tolist()
+        self.assertNotIn(os.getpid(), pids)
+        self.assertEqual(pids[0], pids[1])
+        self.assertEqual(pids[2], pids[3])
+
+    def test_no_trade_days(self):
+        backfill_top_stocks([], processes=2)
+        self.assertEqual(self.mocks[0].call_count, 0)
+        self.assertEqual(self.saved, [])
@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import List
 
+import numpy as np
+import pandas as pd
 from sqlalchemy import Column, Integer
 from sqlalchemy.orm import declarative_base
 
@@ -17,12 +22,14 @@ from core.contract.data_string import String  # 使用自定义 String
 #     get_middle_and_big_stock,
 # )
 from core.contract import Mixin, AdjustType
-from core.contract.api import get_db_session
+from core.contract.api import get_db_session, df_to_db
 from core.contract.factor import TargetType
 from core.contract.register import register_schema
+from core.db.databasemanager import DatabaseManager
 from core.domain import Stock, Stock1dHfqKdata
 from core.domain.constants import stock_db_name
 from core.factors.ma.ma_factor import VolumeUpMaFactor
+from core.utils.pd_utils import pd_is_not_null
 from core.utils.time_utils import (
     date_time_by_interval,
     to_time_str,
@@ -32,6 +39,9 @@ from core.utils.time_utils import (
     to_pd_timestamp,
 )
 
+# 回填时预先读入的收盘价要覆盖最长的排名周期
+BACKFILL_PADDING_DAYS = 120
+
 TopStocksBase = declarative_base()
 
 
@@ -155,84 +165,184 @@ def update_vol_up():
         print(f"finish {target_date}")
 
 
-def compute_top_stocks(provider="em", start="2024-01-01"):
-    latest = TopStocks.query_data(limit=1, order=TopStocks.timestamp.desc(), return_type="domain")
-    if latest:
-        start = date_time_by_interval(to_time_str(latest[0].timestamp, fmt=TIME_FORMAT_DAY))
+def compute_top_stocks_of_date(target_date, provider="em", close_df: pd.DataFrame = None) -> dict:
+    """
+    compute the top stocks of target_date
 
-    trade_days = get_trade_dates(start=start, end=today())
+    :param target_date:
+    :param provider:
+    :param close_df: preloaded close matrix of Stock1dHfqKdata for the rankings, see load_close_panel
+    :return: the record of TopStocks
+    """
+    top_stocks = {"id": f"block_zvt_000001_{target_date}", "entity_id": "block_zvt_000001", "timestamp": target_date}
 
-    for target_date in trade_days:
-        print(f"to {target_date}")
-        session = get_db_session(provider="zvt", data_schema=TopStocks)
-        top_stocks = TopStocks(
-            id=f"block_zvt_000001_{target_date}", entity_id="block_zvt_000001", timestamp=target_date
-        )
+    count_bj = count_interval("2023-09-01", target_date)
+    ignore_bj = count_bj < 0
 
-        count_bj = count_interval("2023-09-01", target_date)
-        ignore_bj = count_bj < 0
+    entity_ids = get_entity_ids_by_filter(
+        target_date=target_date,
+        provider=provider,
+        ignore_delist=False,
+        ignore_st=False,
+        ignore_new_stock=False,
+        ignore_bj=ignore_bj,
+    )
 
-        entity_ids = get_entity_ids_by_filter(
-            target_date=target_date,
-            provider=provider,
-            ignore_delist=False,
-            ignore_st=False,
-            ignore_new_stock=False,
-            ignore_bj=ignore_bj,
-        )
+    short_selected, short_period = get_top_performance_entities_by_periods(
+        entity_provider=provider,
+        data_provider=provider,
+        target_date=target_date,
+        periods=[*range(1, 20)],
+        ignore_new_stock=False,
+        ignore_st=False,
+        entity_ids=entity_ids,
+        entity_type="stock",
+        adjust_type=None,
+        top_count=30,
+        turnover_threshold=0,
+        turnover_rate_threshold=0,
+        return_type=TopType.positive,
+        close_df=close_df,
+    )
+    limit_up_stocks = get_limit_up_stocks(timestamp=target_date)
+    short_selected = list(set(short_selected + limit_up_stocks))
+    top_stocks["short_count"] = len(short_selected)
+    top_stocks["short_stocks"] = json.dumps(short_selected, ensure_ascii=False)
 
-        short_selected, short_period = get_top_performance_entities_by_periods(
-            entity_provider=provider,
-            data_provider=provider,
-            target_date=target_date,
-            periods=[*range(1, 20)],
-            ignore_new_stock=False,
-            ignore_st=False,
-            entity_ids=entity_ids,
-            entity_type="stock",
-            adjust_type=None,
-            top_count=30,
-            turnover_threshold=0,
-            turnover_rate_threshold=0,
-            return_type=TopType.positive,
-        )
-        limit_up_stocks = get_limit_up_stocks(timestamp=target_date)
-        short_selected = list(set(short_selected + limit_up_stocks))
-        top_stocks.short_count = len(short_selected)
-        top_stocks.short_stocks = json.dumps(short_selected, ensure_ascii=False)
-
-        long_period_start = short_period + 1
-        long_selected, long_period = get_top_performance_entities_by_periods(
-            entity_provider=provider,
-            data_provider=provider,
-            target_date=target_date,
-            periods=[*range(long_period_start, long_period_start + 30)],
-            ignore_new_stock=False,
-            ignore_st=False,
-            entity_ids=entity_ids,
-            entity_type="stock",
-            adjust_type=None,
-            top_count=30,
-            turnover_threshold=0,
-            turnover_rate_threshold=0,
-            return_type=TopType.positive,
-        )
-        top_stocks.long_count = len(long_selected)
-        top_stocks.long_stocks = json.dumps(long_selected, ensure_ascii=False)
+    long_period_start = short_period + 1
+    long_selected, long_period = get_top_performance_entities_by_periods(
+        entity_provider=provider,
+        data_provider=provider,
+        target_date=target_date,
+        periods=[*range(long_period_start, long_period_start + 30)],
+        ignore_new_stock=False,
+        ignore_st=False,
+        entity_ids=entity_ids,
+        entity_type="stock",
+        adjust_type=None,
+        top_count=30,
+        turnover_threshold=0,
+        turnover_rate_threshold=0,
+        return_type=TopType.positive,
+        close_df=close_df,
+    )
+    top_stocks["long_count"] = len(long_selected)
+    top_stocks["long_stocks"] = json.dumps(long_selected, ensure_ascii=False)
 
-        small_vol_up_stocks = get_vol_up_stocks(
-            target_date=target_date, provider=provider, stock_type="small", entity_ids=entity_ids
-        )
-        top_stocks.small_vol_up_count = len(small_vol_up_stocks)
-        top_stocks.small_vol_up_stocks = json.dumps(small_vol_up_stocks, ensure_ascii=False)
+    small_vol_up_stocks = get_vol_up_stocks(
+        target_date=target_date, provider=provider, stock_type="small", entity_ids=entity_ids
+    )
+    top_stocks["small_vol_up_count"] = len(small_vol_up_stocks)
+    top_stocks["small_vol_up_stocks"] = json.dumps(small_vol_up_stocks, ensure_ascii=False)
+
+    big_vol_up_stocks = get_vol_up_stocks(
+        target_date=target_date, provider=provider, stock_type="big", entity_ids=entity_ids
+    )
+    top_stocks["big_vol_up_count"] = len(big_vol_up_stocks)
+    top_stocks["big_vol_up_stocks"] = json.dumps(big_vol_up_stocks, ensure_ascii=False)
+
+    top_stocks["all_stocks_count"] = len(entity_ids)
+    return top_stocks
+
+
+def load_close_panel(provider="em", start_timestamp=None, end_timestamp=None) -> pd.DataFrame:
+    """
+    load the close matrix of Stock1dHfqKdata, index is timestamp and columns are entity_id
+    """
+    kdata_df = Stock1dHfqKdata.query_data(
+        provider=provider,
+        start_timestamp=start_timestamp,
+        end_timestamp=end_timestamp,
+        columns=["entity_id", "timestamp", "close"],
+        index=None,
+    )
+    if not pd_is_not_null(kdata_df):
+        return None
+    return kdata_df.pivot(index="timestamp", columns="entity_id", values="close").sort_index().sort_index(axis=1)
+
+
+# 子进程中共享的只读收盘价矩阵
+_backfill_close_df: pd.DataFrame = None
+
+
+def _init_backfill_worker(close_path, timestamps, entity_ids):
+    global _backfill_close_df
+    # fork出来的连接池不能和父进程共用
+    DatabaseManager.dispose_all(close=False)
+    closes = np.load(close_path, mmap_mode="r")
+    _backfill_close_df = pd.DataFrame(closes, index=pd.DatetimeIndex(timestamps), columns=entity_ids, copy=False)
+
+
+def _compute_top_stocks_of_dates(target_dates, provider):
+    return [
+        compute_top_stocks_of_date(target_date, provider=provider, close_df=_backfill_close_df)
+        for target_date in target_dates
+    ]
 
-        big_vol_up_stocks = get_vol_up_stocks(
-            target_date=target_date, provider=provider, stock_type="big", entity_ids=entity_ids
-        )
-        top_stocks.big_vol_up_count = len(big_vol_up_stocks)
-        top_stocks.big_vol_up_stocks = json.dumps(big_vol_up_stocks, ensure_ascii=False)
 
-        top_stocks.all_stocks_count = len(entity_ids)
+def backfill_top_stocks(trade_days, provider="em", processes: int = None):
+    """
+    compute the top stocks of the trade days with a process pool and save them at the end.
+
+    the trade days are split into continuous chunks for the processes, the close matrix used by the rankings
+    is loaded once and shared to the processes by memory mapped file.
+
+    :param trade_days:
+    :param provider:
+    :param processes: default os.cpu_count()
+    """
+    if not trade_days:
+        return
+    processes = min(processes or os.cpu_count(), len(trade_days))
+
+    close_df = load_close_panel(
+        provider=provider,
+        start_timestamp=date_time_by_interval(trade_days[0], -BACKFILL_PADDING_DAYS),
+        end_timestamp=trade_days[-1],
+    )
+
+    records = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        close_path = os.path.join(tmp_dir, "close.npy")
+        if pd_is_not_null(close_df):
+            np.save(close_path, close_df.to_numpy(dtype=float))
+            initargs = (close_path, close_df.index.to_numpy(), close_df.columns.to_numpy())
+        else:
+            np.save(close_path, np.empty((0, 0)))
+            initargs = (close_path, [], [])
+
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_backfill_worker, initargs=initargs) as executor:
+            futures = [
+                executor.submit(_compute_top_stocks_of_dates, list(target_dates), provider)
+                for target_dates in np.array_split(np.array(trade_days, dtype=object), processes)
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                records.extend(result)
+                print(f"finish {len(records)}/{len(trade_days)}")
+
+    df = pd.DataFrame.from_records(records)
+    df_to_db(df=df, data_schema=TopStocks, provider="zvt", force_update=True)
+
+
+def compute_top_stocks(provider="em", start="2024-01-01", end=None, processes: int = 1):
+    """
+    compute the top stocks from start to end day by day, or backfill them with processes if processes > 1
+    """
+    latest = TopStocks.query_data(limit=1, order=TopStocks.timestamp.desc(), return_type="domain")
+    if latest:
+        start = date_time_by_interval(to_time_str(latest[0].timestamp, fmt=TIME_FORMAT_DAY))
+
+    trade_days = get_trade_dates(start=start, end=end or today())
+
+    if processes > 1 and len(trade_days) > 1:
+        backfill_top_stocks(trade_days, provider=provider, processes=processes)
+        return
+
+    for target_date in trade_days:
+        print(f"to {target_date}")
+        session = get_db_session(provider="zvt", data_schema=TopStocks)
+        top_stocks = TopStocks(**compute_top_stocks_of_date(target_date, provider=provider))
 
         print(top_stocks)
         session.add(top_stocks)
@@ -288,6 +398,9 @@ __all__ = [
     "get_vol_up_stocks",
     "update_with_limit_up",
     "update_vol_up",
+    "compute_top_stocks_of_date",
+    "load_close_panel",
+    "backfill_top_stocks",
     "compute_top_stocks",
     "get_top_stocks",
 ]
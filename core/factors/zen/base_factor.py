@@ -22,8 +22,6 @@ from core.factors.shape import (
     Direction,
     handle_first_fenxing,
     decode_rect,
-    get_direction,
-    handle_including,
     fenxing_power,
     handle_duan,
 )
@@ -102,13 +100,13 @@ class ZenState(Bean):
         self.merge_zhongshu_interval = state.get("merge_zhongshu_interval")
 
 
-def handle_zhongshu(
-    points: list,
-    acc_df,
-    end_index,
-    zhongshu_col="zhongshu",
-    zhongshu_change_col="zhongshu_change",
-):
+def get_zhongshu(points: list):
+    """
+    用最近的4个点(笔或段)计算中枢
+
+    :param points: list of (timestamp, value, index)
+    :return: 剩余的点, 中枢, 中枢变化, 中枢周期
+    """
     zhongshu = None
     zhongshu_change = None
     interval = None
@@ -122,33 +120,124 @@ def handle_zhongshu(
         if points[0][1] < points[1][1]:
             # 向下段
             range = intersect((points[0][1], points[1][1]), (points[2][1], points[3][1]))
-            if range:
-                y1, y2 = range
-                # 记录中枢
-                zhongshu = Rect(x0=x1, x1=x2, y0=y1, y1=y2)
-                zhongshu_change = abs(y1 - y2) / abs(y1)
-                acc_df.loc[end_index, zhongshu_col] = zhongshu
-                acc_df.loc[end_index, zhongshu_change_col] = zhongshu_change
-                points = points[-1:]
-            else:
-                points = points[1:]
         else:
             # 向上段
             range = intersect((points[1][1], points[0][1]), (points[3][1], points[2][1]))
-            if range:
-                y1, y2 = range
-                # 记录中枢
-                zhongshu = Rect(x0=x1, x1=x2, y0=y1, y1=y2)
-                zhongshu_change = abs(y1 - y2) / abs(y1)
-
-                acc_df.loc[end_index, zhongshu_col] = zhongshu
-                acc_df.loc[end_index, zhongshu_change_col] = zhongshu_change
-                points = points[-1:]
-            else:
-                points = points[1:]
+        if range:
+            y1, y2 = range
+            # 记录中枢
+            zhongshu = Rect(x0=x1, x1=x2, y0=y1, y1=y2)
+            zhongshu_change = abs(y1 - y2) / abs(y1)
+            points = points[-1:]
+        else:
+            points = points[1:]
+    return points, zhongshu, zhongshu_change, interval
+
+
+def handle_zhongshu(
+    points: list,
+    acc_df,
+    end_index,
+    zhongshu_col="zhongshu",
+    zhongshu_change_col="zhongshu_change",
+):
+    points, zhongshu, zhongshu_change, interval = get_zhongshu(points)
+    if zhongshu:
+        acc_df.loc[end_index, zhongshu_col] = zhongshu
+        acc_df.loc[end_index, zhongshu_change_col] = zhongshu_change
     return points, zhongshu, zhongshu_change, interval
 
 
+def _direction_and_including(raw_high, raw_low, high, low, start_index, direction):
+    """
+    计算每根k线的临时方向(1:up, -1:down), 并在high/low上处理包含关系
+
+    方向和包含只依赖原始的高低点, 与分型的状态无关, 所以可以在遍历之前一次算完
+
+    :param raw_high: 原始高点
+    :param raw_low: 原始低点
+    :param high: 处理包含后的高点, 原地修改
+    :param low: 处理包含后的低点, 原地修改
+    :param start_index: 开始的位置
+    :param direction: start_index之前的方向
+    :return: 临时方向
+    """
+    size = len(raw_high)
+    directions = np.zeros(size, dtype=np.int8)
+    for index in range(start_index, size):
+        pre_index = index - 1
+        if raw_high[index] > raw_high[pre_index]:
+            direction = 1
+        elif raw_low[index] < raw_low[pre_index]:
+            direction = -1
+        directions[index] = direction
+
+        # 长的k线变短
+        if raw_high[index] >= raw_high[pre_index] and raw_low[index] <= raw_low[pre_index]:
+            if direction == 1:
+                low[index] = raw_low[pre_index]
+            else:
+                high[index] = raw_high[pre_index]
+        elif raw_high[pre_index] >= raw_high[index] and raw_low[pre_index] <= raw_low[index]:
+            if direction == -1:
+                low[pre_index] = raw_low[index]
+            else:
+                high[pre_index] = raw_high[index]
+    return directions
+
+
+try:
+    from numba import njit
+
+    direction_and_including = njit(cache=True)(_direction_and_including)
+except ImportError:
+    direction_and_including = _direction_and_including
+
+#: acc_one遍历时写入的列
+ZEN_ACC_COLUMNS = [
+    "bi_di",
+    "bi_ding",
+    "bi_value",
+    "bi_change",
+    "bi_slope",
+    "bi_interval",
+    "tmp_ding",
+    "tmp_di",
+    "fenxing_power",
+    "current_direction",
+    "current_change",
+    "current_interval",
+    "current_slope",
+    "current_zhongshu_change",
+    "current_zhongshu_y0",
+    "current_zhongshu_y1",
+    "current_merge_zhongshu_change",
+    "current_merge_zhongshu_y0",
+    "current_merge_zhongshu_y1",
+    "current_merge_zhongshu_level",
+    "current_merge_zhongshu_interval",
+    "tmp_direction",
+    "opposite_change",
+    "opposite_interval",
+    "opposite_slope",
+    "duan_state",
+    "duan_di",
+    "duan_ding",
+    "duan_value",
+    "duan_change",
+    "duan_slope",
+    "duan_interval",
+    "zhongshu",
+    "zhongshu_change",
+    "bi_zhongshu",
+    "bi_zhongshu_change",
+    "merge_zhongshu",
+    "merge_zhongshu_change",
+    "merge_zhongshu_level",
+    "merge_zhongshu_interval",
+]
+
+
 class ZenAccumulator(Accumulator):
     def __init__(self, acc_window: int = 1) -> None:
         """
@@ -306,10 +395,54 @@ class ZenAccumulator(Accumulator):
             zen_state.duans = []
             zen_state.bis = []
 
-        pre_kdata = acc_df.iloc[start_index - 1]
-        pre_index = start_index - 1
+        return self.acc_by_arrays(acc_df, zen_state, start_index, current_interval)
+
+    def acc_by_arrays(self, acc_df: pd.DataFrame, zen_state: ZenState, start_index: int, current_interval):
+        """
+        从start_index开始遍历, 状态机在numpy数组上运行, 结束时一次性写回acc_df
+
+        :param acc_df: RangeIndex的df, 已包含所有输出列
+        :param zen_state: 当前状态
+        :param start_index: 遍历开始的位置
+        :param current_interval: start_index前一根k线的current_interval
+        :return: 结果和状态
+        """
+        size = len(acc_df)
+        cols = {}
+        for col in ZEN_ACC_COLUMNS:
+            values = acc_df[col].to_numpy(copy=True)
+            # 整数列可能写入nan和小数
+            cols[col] = values.astype(float) if np.issubdtype(values.dtype, np.integer) else values
+        high = acc_df["high"].to_numpy(dtype=float, copy=True)
+        low = acc_df["low"].to_numpy(dtype=float, copy=True)
+        close = acc_df["close"].to_numpy(dtype=float)
+        # 原始的高低点, 处理包含关系只修改high/low, 判断方向和包含时用的是原始值
+        raw_high = high.copy()
+        raw_low = low.copy()
+        timestamps = acc_df["timestamp"].tolist()
+
+        # 临时方向和包含关系只依赖k线本身, 先整体算出来
+        tmp_directions = direction_and_including(
+            raw_high, raw_low, high, low, start_index, 1 if zen_state.direction == Direction.up else -1
+        )
+
+        current_direction_col = cols["current_direction"]
+        current_interval_col = cols["current_interval"]
+        current_change_col = cols["current_change"]
+        current_slope_col = cols["current_slope"]
+        current_zhongshu_y0_col = cols["current_zhongshu_y0"]
+        current_zhongshu_y1_col = cols["current_zhongshu_y1"]
+        current_zhongshu_change_col = cols["current_zhongshu_change"]
+        current_merge_zhongshu_y0_col = cols["current_merge_zhongshu_y0"]
+        current_merge_zhongshu_y1_col = cols["current_merge_zhongshu_y1"]
+        current_merge_zhongshu_change_col = cols["current_merge_zhongshu_change"]
+        current_merge_zhongshu_level_col = cols["current_merge_zhongshu_level"]
+        current_merge_zhongshu_interval_col = cols["current_merge_zhongshu_interval"]
+        tmp_direction_col = cols["tmp_direction"]
+        opposite_interval_col = cols["opposite_interval"]
+        opposite_change_col = cols["opposite_change"]
+        opposite_slope_col = cols["opposite_slope"]
 
-        tmp_direction = zen_state.direction
         current_merge_zhongshu = decode_rect(zen_state.merge_zhongshu) if zen_state.merge_zhongshu else None
         current_merge_zhongshu_change = None
         current_merge_zhongshu_interval = zen_state.merge_zhongshu_interval
@@ -317,65 +450,45 @@ class ZenAccumulator(Accumulator):
 
         current_zhongshu = None
         current_zhongshu_change = None
-        for index, kdata in acc_df.iloc[start_index:].iterrows():
-            # print(f'timestamp: {kdata.timestamp}')
+        for index in range(start_index, size):
+            pre_index = index - 1
             # 临时方向
-            tmp_direction = get_direction(kdata, pre_kdata, current=tmp_direction)
+            tmp_direction = Direction.up if tmp_directions[index] == 1 else Direction.down
 
             # current states
             current_interval = current_interval + 1
             if zen_state.direction == Direction.up:
-                pre_value = acc_df.loc[zen_state.fenxing_list[0].index, "low"]
-                current_value = kdata["high"]
+                pre_value = low[zen_state.fenxing_list[0].index]
+                current_value = raw_high[index]
             else:
-                pre_value = acc_df.loc[zen_state.fenxing_list[0].index, "high"]
-                current_value = kdata["low"]
-            acc_df.loc[index, "current_direction"] = zen_state.direction.value
-            acc_df.loc[index, "current_interval"] = current_interval
+                pre_value = high[zen_state.fenxing_list[0].index]
+                current_value = raw_low[index]
+            current_direction_col[index] = zen_state.direction.value
+            current_interval_col[index] = current_interval
             change = (current_value - pre_value) / abs(pre_value)
-            acc_df.loc[index, "current_change"] = change
-            acc_df.loc[index, "current_slope"] = change / current_interval
+            current_change_col[index] = change
+            current_slope_col[index] = change / current_interval
             if current_zhongshu:
-                # acc_df.loc[index, 'current_zhongshu'] = current_zhongshu
-                acc_df.loc[index, "current_zhongshu_y0"] = current_zhongshu.y0
-                acc_df.loc[index, "current_zhongshu_y1"] = current_zhongshu.y1
-                acc_df.loc[index, "current_zhongshu_change"] = current_zhongshu_change
+                current_zhongshu_y0_col[index] = current_zhongshu.y0
+                current_zhongshu_y1_col[index] = current_zhongshu.y1
+                current_zhongshu_change_col[index] = current_zhongshu_change
             else:
-                # acc_df.loc[index, 'current_zhongshu'] = acc_df.loc[index - 1, 'current_zhongshu']
-                acc_df.loc[index, "current_zhongshu_y0"] = acc_df.loc[index - 1, "current_zhongshu_y0"]
-                acc_df.loc[index, "current_zhongshu_y1"] = acc_df.loc[index - 1, "current_zhongshu_y1"]
-                acc_df.loc[index, "current_zhongshu_change"] = acc_df.loc[index - 1, "current_zhongshu_change"]
+                current_zhongshu_y0_col[index] = current_zhongshu_y0_col[pre_index]
+                current_zhongshu_y1_col[index] = current_zhongshu_y1_col[pre_index]
+                current_zhongshu_change_col[index] = current_zhongshu_change_col[pre_index]
 
             if current_merge_zhongshu:
-                # acc_df.loc[index, 'current_merge_zhongshu'] = current_merge_zhongshu
-                acc_df.loc[index, "current_merge_zhongshu_y0"] = current_merge_zhongshu.y0
-                acc_df.loc[index, "current_merge_zhongshu_y1"] = current_merge_zhongshu.y1
-                acc_df.loc[index, "current_merge_zhongshu_change"] = current_merge_zhongshu_change
-                acc_df.loc[index, "current_merge_zhongshu_level"] = current_merge_zhongshu_level
-                acc_df.loc[index, "current_merge_zhongshu_interval"] = current_merge_zhongshu_interval
+                current_merge_zhongshu_y0_col[index] = current_merge_zhongshu.y0
+                current_merge_zhongshu_y1_col[index] = current_merge_zhongshu.y1
+                current_merge_zhongshu_change_col[index] = current_merge_zhongshu_change
+                current_merge_zhongshu_level_col[index] = current_merge_zhongshu_level
+                current_merge_zhongshu_interval_col[index] = current_merge_zhongshu_interval
             else:
-                # acc_df.loc[index, 'current_merge_zhongshu'] = acc_df.loc[index - 1, 'current_merge_zhongshu']
-                acc_df.loc[index, "current_merge_zhongshu_y0"] = acc_df.loc[index - 1, "current_merge_zhongshu_y0"]
-                acc_df.loc[index, "current_merge_zhongshu_y1"] = acc_df.loc[index - 1, "current_merge_zhongshu_y1"]
-                acc_df.loc[index, "current_merge_zhongshu_change"] = acc_df.loc[
-                    index - 1, "current_merge_zhongshu_change"
-                ]
-                acc_df.loc[index, "current_merge_zhongshu_level"] = acc_df.loc[
-                    index - 1, "current_merge_zhongshu_level"
-                ]
-                acc_df.loc[index, "current_merge_zhongshu_interval"] = acc_df.loc[
-                    index - 1, "current_merge_zhongshu_interval"
-                ]
-
-            # 处理包含关系
-            handle_including(
-                one_df=acc_df,
-                index=index,
-                kdata=kdata,
-                pre_index=pre_index,
-                pre_kdata=pre_kdata,
-                tmp_direction=tmp_direction,
-            )
+                current_merge_zhongshu_y0_col[index] = current_merge_zhongshu_y0_col[pre_index]
+                current_merge_zhongshu_y1_col[index] = current_merge_zhongshu_y1_col[pre_index]
+                current_merge_zhongshu_change_col[index] = current_merge_zhongshu_change_col[pre_index]
+                current_merge_zhongshu_level_col[index] = current_merge_zhongshu_level_col[pre_index]
+                current_merge_zhongshu_interval_col[index] = current_merge_zhongshu_interval_col[pre_index]
 
             # 根据方向，寻找对应的分型 和 段
             if zen_state.direction == Direction.up:
@@ -395,24 +508,24 @@ class ZenAccumulator(Accumulator):
                 # opposite states
                 current_interval = zen_state.opposite_count
                 if tmp_direction == Direction.up:
-                    pre_value = acc_df.loc[index - zen_state.opposite_count, "low"]
-                    current_value = kdata["high"]
+                    pre_value = low[index - zen_state.opposite_count]
+                    current_value = raw_high[index]
                 else:
-                    pre_value = acc_df.loc[index - zen_state.opposite_count, "high"]
-                    current_value = kdata["low"]
-                acc_df.loc[index, "tmp_direction"] = tmp_direction.value
-                acc_df.loc[index, "opposite_interval"] = current_interval
+                    pre_value = high[index - zen_state.opposite_count]
+                    current_value = raw_low[index]
+                tmp_direction_col[index] = tmp_direction.value
+                opposite_interval_col[index] = current_interval
                 change = (current_value - pre_value) / abs(pre_value)
-                acc_df.loc[index, "opposite_change"] = change
-                acc_df.loc[index, "opposite_slope"] = change / current_interval
+                opposite_change_col[index] = change
+                opposite_slope_col[index] = change / current_interval
 
                 # 第一次反向
                 if zen_state.opposite_count == 1:
-                    acc_df.loc[pre_index, tmp_fenxing_col] = True
-                    acc_df.loc[pre_index, "fenxing_power"] = fenxing_power(
-                        acc_df.loc[pre_index - 1],
-                        pre_kdata,
-                        kdata,
+                    cols[tmp_fenxing_col][pre_index] = True
+                    cols["fenxing_power"][pre_index] = fenxing_power(
+                        {"high": high[pre_index - 1], "low": low[pre_index - 1], "close": close[pre_index - 1]},
+                        {"high": raw_high[pre_index], "low": raw_low[pre_index], "close": close[pre_index]},
+                        {"high": raw_high[index], "low": raw_low[index], "close": close[index]},
                         fenxing=tmp_fenxing_col,
                     )
 
@@ -420,67 +533,59 @@ class ZenAccumulator(Accumulator):
                         # 候选底分型
                         if tmp_direction == Direction.up:
                             # 取小的
-                            if pre_kdata["low"] <= zen_state.can_fenxing["low"]:
-                                zen_state.can_fenxing = pre_kdata[["low", "high"]]
+                            if raw_low[pre_index] <= zen_state.can_fenxing["low"]:
+                                zen_state.can_fenxing = {"low": raw_low[pre_index], "high": raw_high[pre_index]}
                                 zen_state.can_fenxing_index = pre_index
 
                         # 候选顶分型
                         else:
                             # 取大的
-                            if pre_kdata["high"] >= zen_state.can_fenxing["high"]:
-                                zen_state.can_fenxing = pre_kdata[["low", "high"]]
+                            if raw_high[pre_index] >= zen_state.can_fenxing["high"]:
+                                zen_state.can_fenxing = {"low": raw_low[pre_index], "high": raw_high[pre_index]}
                                 zen_state.can_fenxing_index = pre_index
                     else:
-                        zen_state.can_fenxing = pre_kdata[["low", "high"]]
+                        zen_state.can_fenxing = {"low": raw_low[pre_index], "high": raw_high[pre_index]}
                         zen_state.can_fenxing_index = pre_index
 
                 # 分型确立
                 if zen_state.can_fenxing is not None:
                     if zen_state.opposite_count >= 4 or (index - zen_state.can_fenxing_index >= 8):
-                        acc_df.loc[zen_state.can_fenxing_index, fenxing_col] = True
+                        can_fenxing_index = zen_state.can_fenxing_index
+                        cols[fenxing_col][can_fenxing_index] = True
 
                         # 记录笔的值
                         if fenxing_col == "bi_ding":
-                            bi_value = acc_df.loc[zen_state.can_fenxing_index, "high"]
+                            bi_value = high[can_fenxing_index]
                         else:
-                            bi_value = acc_df.loc[zen_state.can_fenxing_index, "low"]
-                        acc_df.loc[zen_state.can_fenxing_index, "bi_value"] = bi_value
+                            bi_value = low[can_fenxing_index]
+                        cols["bi_value"][can_fenxing_index] = bi_value
 
                         # 计算笔斜率
                         if zen_state.pre_bi:
                             change = (bi_value - zen_state.pre_bi[1]) / abs(zen_state.pre_bi[1])
-                            interval = zen_state.can_fenxing_index - zen_state.pre_bi[0]
+                            interval = can_fenxing_index - zen_state.pre_bi[0]
                             bi_slope = change / interval
-                            acc_df.loc[zen_state.can_fenxing_index, "bi_change"] = change
-                            acc_df.loc[zen_state.can_fenxing_index, "bi_slope"] = bi_slope
-                            acc_df.loc[zen_state.can_fenxing_index, "bi_interval"] = interval
+                            cols["bi_change"][can_fenxing_index] = change
+                            cols["bi_slope"][can_fenxing_index] = bi_slope
+                            cols["bi_interval"][can_fenxing_index] = interval
 
                         # 记录用于计算笔中枢的笔
-                        zen_state.bis.append(
-                            (
-                                acc_df.loc[zen_state.can_fenxing_index, "timestamp"],
-                                bi_value,
-                                zen_state.can_fenxing_index,
-                            )
-                        )
+                        zen_state.bis.append((timestamps[can_fenxing_index], bi_value, can_fenxing_index))
 
                         # 计算笔中枢，当下来说这个 中枢 是确定的，并且是不可变的
                         # 但标记的点为 过去，注意在回测时最近的一个中枢可能用到未来函数，前一个才是 已知的
                         # 所以记了一个 current_zhongshu_y0 current_zhongshu_y1 这个是可直接使用的
-                        end_index = zen_state.can_fenxing_index
+                        end_index = can_fenxing_index
 
                         (
                             zen_state.bis,
                             current_zhongshu,
                             current_zhongshu_change,
                             current_zhongshu_interval,
-                        ) = handle_zhongshu(
-                            points=zen_state.bis,
-                            acc_df=acc_df,
-                            end_index=end_index,
-                            zhongshu_col="bi_zhongshu",
-                            zhongshu_change_col="bi_zhongshu_change",
-                        )
+                        ) = get_zhongshu(points=zen_state.bis)
+                        if current_zhongshu:
+                            cols["bi_zhongshu"][end_index] = current_zhongshu
+                            cols["bi_zhongshu_change"][end_index] = current_zhongshu_change
 
                         if not current_merge_zhongshu:
                             current_merge_zhongshu = current_zhongshu
@@ -515,16 +620,16 @@ class ZenAccumulator(Accumulator):
                                     current_merge_zhongshu_level = 1
                                     current_merge_zhongshu_interval = current_zhongshu_interval
 
-                                acc_df.loc[end_index, "merge_zhongshu"] = current_merge_zhongshu
-                                acc_df.loc[end_index, "merge_zhongshu_change"] = current_merge_zhongshu_change
-                                acc_df.loc[end_index, "merge_zhongshu_level"] = current_merge_zhongshu_level
-                                acc_df.loc[end_index, "merge_zhongshu_interval"] = current_merge_zhongshu_interval
+                                cols["merge_zhongshu"][end_index] = current_merge_zhongshu
+                                cols["merge_zhongshu_change"][end_index] = current_merge_zhongshu_change
+                                cols["merge_zhongshu_level"][end_index] = current_merge_zhongshu_level
+                                cols["merge_zhongshu_interval"][end_index] = current_merge_zhongshu_interval
 
                         zen_state.merge_zhongshu = current_merge_zhongshu
                         zen_state.merge_zhongshu_interval = current_merge_zhongshu_interval
                         zen_state.merge_zhongshu_level = current_merge_zhongshu_level
 
-                        zen_state.pre_bi = (zen_state.can_fenxing_index, bi_value)
+                        zen_state.pre_bi = (can_fenxing_index, bi_value)
 
                         zen_state.opposite_count = 0
                         zen_state.direction = zen_state.direction.opposite()
@@ -536,10 +641,10 @@ class ZenAccumulator(Accumulator):
                                 Fenxing(
                                     state=fenxing_col,
                                     kdata={
-                                        "low": float(acc_df.loc[zen_state.can_fenxing_index]["low"]),
-                                        "high": float(acc_df.loc[zen_state.can_fenxing_index]["high"]),
+                                        "low": float(low[can_fenxing_index]),
+                                        "high": float(high[can_fenxing_index]),
                                     },
-                                    index=zen_state.can_fenxing_index,
+                                    index=can_fenxing_index,
                                 )
                             )
 
@@ -555,63 +660,57 @@ class ZenAccumulator(Accumulator):
                                     zen_state.current_duan_state = duan_state
 
                                     # 确定状态
-                                    acc_df.loc[
-                                        zen_state.fenxing_list[0].index : zen_state.fenxing_list[-1].index,
-                                        "duan_state",
+                                    cols["duan_state"][
+                                        zen_state.fenxing_list[0].index : zen_state.fenxing_list[-1].index + 1
                                     ] = zen_state.current_duan_state
 
                                     duan_index = zen_state.fenxing_list[0].index
                                     if zen_state.current_duan_state == "up":
-                                        acc_df.loc[duan_index, "duan_di"] = True
-                                        duan_value = acc_df.loc[duan_index, "low"]
+                                        cols["duan_di"][duan_index] = True
+                                        duan_value = low[duan_index]
                                     else:
-                                        duan_index = zen_state.fenxing_list[0].index
-                                        acc_df.loc[duan_index, "duan_ding"] = True
-                                        duan_value = acc_df.loc[duan_index, "high"]
+                                        cols["duan_ding"][duan_index] = True
+                                        duan_value = high[duan_index]
                                     # 记录段的值
-                                    acc_df.loc[duan_index, "duan_value"] = duan_value
+                                    cols["duan_value"][duan_index] = duan_value
 
                                     # 计算段斜率
                                     if zen_state.pre_duan:
                                         change = (duan_value - zen_state.pre_duan[1]) / abs(zen_state.pre_duan[1])
                                         interval = duan_index - zen_state.pre_duan[0]
                                         duan_slope = change / interval
-                                        acc_df.loc[duan_index, "duan_change"] = change
-                                        acc_df.loc[duan_index, "duan_slope"] = duan_slope
-                                        acc_df.loc[duan_index, "duan_interval"] = interval
+                                        cols["duan_change"][duan_index] = change
+                                        cols["duan_slope"][duan_index] = duan_slope
+                                        cols["duan_interval"][duan_index] = interval
 
                                     zen_state.pre_duan = (duan_index, duan_value)
 
                                     # 记录用于计算中枢的段
-                                    zen_state.duans.append(
-                                        (
-                                            acc_df.loc[duan_index, "timestamp"],
-                                            duan_value,
-                                            duan_index,
-                                        )
-                                    )
+                                    zen_state.duans.append((timestamps[duan_index], duan_value, duan_index))
 
                                     # 计算中枢
-                                    zen_state.duans, _, _, _ = handle_zhongshu(
-                                        points=zen_state.duans,
-                                        acc_df=acc_df,
-                                        end_index=duan_index,
-                                        zhongshu_col="zhongshu",
-                                        zhongshu_change_col="zhongshu_change",
+                                    zen_state.duans, zhongshu, zhongshu_change, _ = get_zhongshu(
+                                        points=zen_state.duans
                                     )
+                                    if zhongshu:
+                                        cols["zhongshu"][duan_index] = zhongshu
+                                        cols["zhongshu_change"][duan_index] = zhongshu_change
 
                                     # 只留最后一个
                                     zen_state.fenxing_list = zen_state.fenxing_list[-1:]
                                 else:
                                     # 保持之前的状态并踢出候选
-                                    acc_df.loc[zen_state.fenxing_list[0].index, "duan_state"] = (
-                                        zen_state.current_duan_state
-                                    )
+                                    cols["duan_state"][zen_state.fenxing_list[0].index] = zen_state.current_duan_state
                                     zen_state.fenxing_list = zen_state.fenxing_list[1:]
 
-            pre_kdata = kdata
-            pre_index = index
-
+        acc_df["high"] = high
+        acc_df["low"] = low
+        for col, values in cols.items():
+            dtype = acc_df[col].dtype
+            # 与loc赋值一致: 整数列写入的都是整数时保持原类型
+            if np.issubdtype(dtype, np.integer) and np.all(np.mod(values, 1) == 0):
+                values = values.astype(dtype)
+            acc_df[col] = values
         acc_df = acc_df.set_index("timestamp", drop=False)
         return acc_df, zen_state
 
@@ -726,4 +825,14 @@ if __name__ == "__main__":
 
 
 # the __all__ is generated
-__all__ = ["FactorStateEncoder", "get_zen_factor_schema", "ZenState", "handle_zhongshu", "ZenAccumulator", "ZenFactor"]
+__all__ = [
+    "FactorStateEncoder",
+    "get_zen_factor_schema",
+    "ZenState",
+    "get_zhongshu",
+    "handle_zhongshu",
+    "direction_and_including",
+    "ZEN_ACC_COLUMNS",
+    "ZenAccumulator",
+    "ZenFactor",
+]
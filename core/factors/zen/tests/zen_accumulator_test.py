@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from core.factors.zen import base_factor
+from core.factors.zen.base_factor import FactorStateEncoder, ZenAccumulator
+
+nan = np.nan
+
+# 以下为原iterrows实现在gen_kdata_df(150)上的结果, 比较时要求完全一致
+EXPECTED_BI_DI = [0, 13, 34, 52, 69, 90, 109, 126, 145]
+EXPECTED_BI_DING = [6, 23, 42, 62, 80, 98, 118, 138]
+#: index -> (bi_value, bi_change, bi_slope, bi_interval)
+EXPECTED_BI = {
+    6: (12.51, nan, nan, nan),
+    13: (10.49, -0.1614708233413269, -0.023067260477332412, 7.0),
+    23: (13.59, 0.29551954242135364, 0.029551954242135366, 10.0),
+    34: (8.98, -0.33922001471670343, -0.030838183156063948, 11.0),
+    42: (10.7, 0.19153674832962125, 0.023942093541202657, 8.0),
+    52: (6.97, -0.34859813084112146, -0.034859813084112144, 10.0),
+    62: (11.02, 0.5810616929698709, 0.05810616929698709, 10.0),
+    69: (9.3, -0.15607985480943729, -0.022297122115633897, 7.0),
+    80: (14.12, 0.5182795698924729, 0.047116324535679356, 11.0),
+    90: (11.26, -0.2025495750708215, -0.02025495750708215, 10.0),
+    98: (13.54, 0.20248667850799285, 0.025310834813499106, 8.0),
+    109: (8.59, -0.3655834564254062, -0.03323485967503693, 11.0),
+    118: (10.85, 0.2630966239813737, 0.029232958220152632, 9.0),
+    126: (8.04, -0.25898617511520744, -0.03237327188940093, 8.0),
+    138: (12.74, 0.5845771144278609, 0.04871475953565507, 12.0),
+    145: (11.1, -0.1287284144427002, -0.018389773491814313, 7.0),
+}
+EXPECTED_DUAN_DI = [0, 52, 109]
+EXPECTED_DUAN_DING = [23, 80]
+#: index -> (duan_value, duan_change, duan_slope, duan_interval)
+EXPECTED_DUAN = {
+    0: (9.95, nan, nan, nan),
+    23: (13.59, 0.3658291457286433, 0.015905615031680143, 23.0),
+    52: (6.97, -0.48712288447387786, -0.01679734084392682, 29.0),
+    80: (14.12, 1.0258249641319943, 0.03663660586185694, 28.0),
+    109: (8.59, -0.391643059490085, -0.013504933085865, 29.0),
+}
+#: 开始的index -> duan_state
+EXPECTED_DUAN_STATE = {0: "up", 23: "down", 52: "up", 80: "down", 109: "up", 139: "yi"}
+#: 变化时的index -> (current_zhongshu_y0, current_zhongshu_y1, current_zhongshu_change), 之前为nan
+EXPECTED_CURRENT_ZHONGSHU = {
+    39: (10.49, 12.51, 0.1925643469971401),
+    67: (8.98, 10.7, 0.19153674832962125),
+    103: (11.26, 13.54, 0.20248667850799285),
+    131: (8.59, 10.85, 0.2630966239813737),
+}
+
+
+def gen_kdata_df(size=150) -> pd.DataFrame:
+    """
+    两个周期叠加的高低点, 足够出现多个笔, 段和中枢
+    """
+    i = np.arange(size)
+    close = np.round(10 + 1.5 * np.sin(i / 3) + 2 * np.sin(i / 11) + 0.01 * i, 2)
+    timestamps = pd.date_range("2020-01-01", periods=size)
+    return pd.DataFrame(
+        {
+            "timestamp": timestamps,
+            "entity_id": "stock_sz_000001",
+            "open": close,
+            "close": close,
+            "high": np.round(close + 0.05 * (1 + i % 3), 2),
+            "low": np.round(close - 0.05 * (1 + i % 2), 2),
+            "volume": 1000.0,
+        },
+        index=pd.Index(timestamps, name="timestamp"),
+    )
+
+
+def marks(values: pd.Series) -> list:
+    return np.flatnonzero(values.eq(True).to_numpy()).tolist()
+
+
+def points(df: pd.DataFrame, cols: list) -> dict:
+    df = df.reset_index(drop=True)
+    df = df.loc[df[cols[0]].notna(), cols]
+    return {index: tuple(row) for index, row in zip(df.index, df.itertuples(index=False))}
+
+
+def changes(df: pd.DataFrame, cols: list) -> dict:
+    df = df.reset_index(drop=True)[cols]
+    changed = df.ne(df.shift()).any(axis=1) & df.notna().any(axis=1)
+    return {index: tuple(row) for index, row in zip(df.index[changed], df[changed].itertuples(index=False))}
+
+
+class ZenAccumulatorTest(unittest.TestCase):
+    def assert_same_floats(self, result: dict, expected: dict):
+        self.assertEqual(result.keys(), expected.keys())
+        for index, values in expected.items():
+            # nan == nan 且 逐位相同
+            np.testing.assert_array_equal(np.array(result[index]), np.array(values), err_msg=f"index {index}")
+
+    def assert_expected(self, acc_df: pd.DataFrame, incremental_from: int = None):
+        self.assertEqual(marks(acc_df["bi_di"]), EXPECTED_BI_DI)
+        self.assertEqual(marks(acc_df["bi_ding"]), EXPECTED_BI_DING)
+        self.assertEqual(marks(acc_df["duan_di"]), EXPECTED_DUAN_DI)
+        self.assertEqual(marks(acc_df["duan_ding"]), EXPECTED_DUAN_DING)
+        self.assert_same_floats(points(acc_df, ["bi_value", "bi_change", "bi_slope", "bi_interval"]), EXPECTED_BI)
+        self.assert_same_floats(
+            points(acc_df, ["duan_value", "duan_change", "duan_slope", "duan_interval"]), EXPECTED_DUAN
+        )
+        cols = ["current_zhongshu_y0", "current_zhongshu_y1", "current_zhongshu_change"]
+        self.assert_same_floats(changes(acc_df, cols), EXPECTED_CURRENT_ZHONGSHU)
+        self.assertTrue(acc_df[cols].iloc[: min(EXPECTED_CURRENT_ZHONGSHU)].isna().all().all())
+
+        duan_state = acc_df["duan_state"].reset_index(drop=True)
+        last_start = max(EXPECTED_DUAN_STATE)
+        expected_states = {index: (state,) for index, state in EXPECTED_DUAN_STATE.items() if index < last_start}
+        self.assertEqual(changes(duan_state.iloc[:last_start].to_frame(), ["duan_state"]), expected_states)
+        if incremental_from is None:
+            self.assertTrue((duan_state.iloc[last_start:] == EXPECTED_DUAN_STATE[last_start]).all())
+        else:
+            # 增量计算时新加入的k线在确定段之前没有duan_state
+            self.assertTrue(duan_state.iloc[last_start:].isna().all())
+
+    def run_full(self) -> pd.DataFrame:
+        acc_df, _ = ZenAccumulator().acc_one("stock_sz_000001", gen_kdata_df(), None, None)
+        return acc_df
+
+    def run_incremental(self, cut: int) -> pd.DataFrame:
+        kdata_df = gen_kdata_df()
+        acc_df, state = ZenAccumulator().acc_one("stock_sz_000001", kdata_df.iloc[:cut].copy(), None, None)
+        # 与持久化一样经过json
+        state = json.loads(json.dumps(state, cls=FactorStateEncoder))
+        acc_df, _ = ZenAccumulator().acc_one("stock_sz_000001", kdata_df, acc_df, state)
+        return acc_df
+
+    def test_full(self):
+        self.assert_expected(self.run_full())
+
+    def test_incremental(self):
+        for cut in (60, 100, 120):
+            with self.subTest(cut=cut):
+                self.assert_expected(self.run_incremental(cut), incremental_from=cut)
+
+    def test_without_numba(self):
+        with mock.patch.object(base_factor, "direction_and_including", base_factor._direction_and_including):
+            self.assert_expected(self.run_full())
+            self.assert_expected(self.run_incremental(100), incremental_from=100)
+
+    @unittest.skipIf(
+        base_factor.direction_and_including is base_factor._direction_and_including, "numba is not installed"
+    )
+    def test_with_numba(self):
+        self.assert_expected(self.run_full())
+        self.assert_expected(self.run_incremental(100), incremental_from=100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -38,6 +38,12 @@ from .em_api import __all__ as _em_api_all
 
 __all__ += _em_api_all
 
+# import all from submodule em_client
+from .em_client import *
+from .em_client import __all__ as _em_client_all
+
+__all__ += _em_client_all
+
 # import all from submodule macro
 from .macro import *
 from .macro import __all__ as _macro_all
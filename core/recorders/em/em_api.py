@@ -1,16 +1,17 @@
 # -*- coding: utf-8 -*-
+import io
 import logging
 import random
-from typing import Union
+from typing import Dict, List, Union
 
 import demjson3
+import numpy as np
 import pandas as pd
-import requests
 import sqlalchemy
 from requests import Session
 
-from core.api.kdata import generate_kdata_id
-from core.api.utils import value_to_pct, china_stock_code_to_id
+from core.api.kdata import generate_kdata_ids
+from core.api.utils import china_stock_code_to_id
 from core.contract import (
     ActorType,
     AdjustType,
@@ -23,6 +24,7 @@ from core.contract import (
 from core.contract.api import decode_entity_id, df_to_db
 from core.domain import BlockCategory, StockHotTopic
 from core.recorders.consts import DEFAULT_HEADER
+from core.recorders.em.em_client import AsyncEMClient, get_default_client
 from core.utils.time_utils import (
     to_pd_timestamp,
     now_timestamp,
@@ -30,7 +32,7 @@ from core.utils.time_utils import (
     current_date,
     now_pd_timestamp,
 )
-from core.utils.utils import to_float, json_callback_param
+from core.utils.utils import json_callback_param, none_values
 
 logger = logging.getLogger(__name__)
 
@@ -336,24 +338,15 @@ def get_em_data(
         params=params,
     )
     logger.debug(f"current url: {url}")
-    if session:
-        resp = session.get(url)
-    else:
-        resp = requests.get(url)
+    if not session:
+        session = get_default_client()
+    resp = session.get(url)
     if resp.status_code == 200:
         json_result = resp.json()
         resp.close()
 
         if json_result:
-            if json_result.get("result"):
-                data: list = json_result["result"]["data"]
-                need_next = pn < json_result["result"]["pages"]
-            elif json_result.get("data"):
-                data: list = json_result["data"]
-                need_next = json_result["hasNext"] == 1
-            else:
-                data = []
-                need_next = False
+            data, need_next = _parse_em_data(json_result, pn=pn)
             if fetch_all or fetch_count - 1 > 0:
                 if need_next:
                     next_data = get_em_data(
@@ -383,6 +376,59 @@ def get_em_data(
     raise RuntimeError(f"request em data code: {resp.status_code}, error: {resp.text}")
 
 
+def _parse_em_data(json_result, pn=1):
+    """
+    :return: (data of the page, whether has next page)
+    """
+    if json_result.get("result"):
+        return json_result["result"]["data"], pn < json_result["result"]["pages"]
+    elif json_result.get("data"):
+        return json_result["data"], json_result["hasNext"] == 1
+    return [], False
+
+
+async def get_em_data_async(
+    request_type,
+    fields,
+    client: AsyncEMClient,
+    source="SECURITIES",
+    filters=None,
+    sort_by="",
+    sort="asc",
+    pn=1,
+    ps=2000,
+    fetch_all=True,
+    fetch_count=1,
+    params=None,
+):
+    """
+    asyncio version of get_em_data, the pages are fetched one by one as the page count is known from the previous page
+    """
+    data = None
+    while True:
+        url = get_url(
+            type=request_type,
+            sty=fields,
+            source=source,
+            filters=filters,
+            order_by=sort_by,
+            order=sort,
+            pn=pn,
+            ps=ps,
+            params=params,
+        )
+        logger.debug(f"current url: {url}")
+        json_result = await client.get_json(url)
+        if not json_result:
+            return data
+        page_data, need_next = _parse_em_data(json_result, pn=pn)
+        data = page_data if data is None else data + page_data
+        if not (need_next and (fetch_all or fetch_count - 1 > 0)):
+            return data
+        pn = pn + 1
+        fetch_count = fetch_count - 1
+
+
 def get_quotes():
     {
         # 市场,2 A股, 3 港股
@@ -497,75 +543,134 @@ def get_quotes():
 #
 # 上海
 # secid=1.512660&klt=101&fqt=1&lmt=66&end=20500000&iscca=1&fields1=f1,f2,f3,f4,f5,f6,f7,f8&fields2=f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61,f62,f63,f64&ut=f057cbcbce2a86e2866ab8877db1d059&forcect=1
-def get_kdata(entity_id, session=None, level=IntervalLevel.LEVEL_1DAY, adjust_type=AdjustType.qfq, limit=10000):
-    entity_type, exchange, code = decode_entity_id(entity_id)
-    level = IntervalLevel(level)
 
+
+EM_KDATA_URL = "https://push2his.eastmoney.com/api/qt/stock/kline/get"
+# 解析用到的kline字段: 0 时间, 1-6 开收高低量额, 8 涨跌幅, 10 换手率
+_kline_fields = (0, 1, 2, 3, 4, 5, 6, 8, 10)
+
+
+def _kdata_url(entity_id, level=IntervalLevel.LEVEL_1DAY, adjust_type=AdjustType.qfq, limit=10000):
     sec_id = to_em_sec_id(entity_id)
     fq_flag = to_em_fq_flag(adjust_type)
-    level_flag = to_em_level_flag(level)
+    level_flag = to_em_level_flag(IntervalLevel(level))
     # f131 结算价
     # f133 持仓
     # 目前未获取
-    url = f"https://push2his.eastmoney.com/api/qt/stock/kline/get?secid={sec_id}&klt={level_flag}&fqt={fq_flag}&lmt={limit}&end=20500000&iscca=1&fields1=f1,f2,f3,f4,f5,f6,f7,f8&fields2=f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61,f62,f63,f64&ut=f057cbcbce2a86e2866ab8877db1d059&forcect=1"
+    return f"{EM_KDATA_URL}?secid={sec_id}&klt={level_flag}&fqt={fq_flag}&lmt={limit}&end=20500000&iscca=1&fields1=f1,f2,f3,f4,f5,f6,f7,f8&fields2=f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61,f62,f63,f64&ut=f057cbcbce2a86e2866ab8877db1d059&forcect=1"
 
-    if session:
-        resp = session.get(url, headers=DEFAULT_HEADER)
-    else:
-        resp = requests.get(url, headers=DEFAULT_HEADER)
+
+def get_kdata(entity_id, session=None, level=IntervalLevel.LEVEL_1DAY, adjust_type=AdjustType.qfq, limit=10000):
+    url = _kdata_url(entity_id, level=level, adjust_type=adjust_type, limit=limit)
+
+    if not session:
+        session = get_default_client()
+    resp = session.get(url, headers=DEFAULT_HEADER)
     resp.raise_for_status()
     results = resp.json()
     resp.close()
-    data = results["data"]
+    return _parse_kdata(results, entity_id=entity_id, level=level)
 
-    kdatas = []
 
-    if data:
+async def get_kdata_async(
+    entity_id, client: AsyncEMClient, level=IntervalLevel.LEVEL_1DAY, adjust_type=AdjustType.qfq, limit=10000
+):
+    url = _kdata_url(entity_id, level=level, adjust_type=adjust_type, limit=limit)
+    results = await client.get_json(url)
+    return _parse_kdata(results, entity_id=entity_id, level=level)
+
+
+async def get_kdata_many(
+    entity_ids: List[str],
+    client: AsyncEMClient = None,
+    level=IntervalLevel.LEVEL_1DAY,
+    adjust_type=AdjustType.qfq,
+    limit=10000,
+    return_exceptions=False,
+) -> Dict[str, pd.DataFrame]:
+    """
+    get kdata of the entities concurrently
+
+    :param client: the client to use, a temporary one is created if not set
+    :param return_exceptions: if True, the failed entity maps to its exception instead of raising it
+    :return: entity_id -> kdata df(None if no data)
+    """
+    if client is None:
+        async with AsyncEMClient() as client:
+            return await get_kdata_many(
+                entity_ids,
+                client=client,
+                level=level,
+                adjust_type=adjust_type,
+                limit=limit,
+                return_exceptions=return_exceptions,
+            )
+
+    results = await client.gather(
+        [
+            get_kdata_async(entity_id, client=client, level=level, adjust_type=adjust_type, limit=limit)
+            for entity_id in entity_ids
+        ],
+        return_exceptions=return_exceptions,
+    )
+    return dict(zip(entity_ids, results))
+
+
+def _parse_kdata(results, entity_id, level=IntervalLevel.LEVEL_1DAY):
+    entity_type, exchange, code = decode_entity_id(entity_id)
+    level = IntervalLevel(level)
+    data = results["data"]
+
+    if data and data["klines"]:
         klines = data["klines"]
         name = data["name"]
 
-        for result in klines:
-            # "2000-01-28,1005.26,1012.56,1173.12,982.13,3023326,3075552000.00"
-            # "2021-08-27,19.39,20.30,20.30,19.25,1688497,3370240912.00,5.48,6.01,1.15,3.98,0,0,0"
-            # time,open,close,high,low,volume,turnover
-            # "2022-04-13,10708,10664,10790,10638,402712,43124771328,1.43,0.57,60,0.00,4667112399583576064,4690067230254170112,1169270784"
-            fields = result.split(",")
-            the_timestamp = to_pd_timestamp(fields[0])
-
-            the_id = generate_kdata_id(entity_id=entity_id, timestamp=the_timestamp, level=level)
-
-            open = to_float(fields[1])
-            close = to_float(fields[2])
-            high = to_float(fields[3])
-            low = to_float(fields[4])
-            volume = to_float(fields[5])
-            turnover = to_float(fields[6])
-            # 7 振幅
-            change_pct = value_to_pct(to_float(fields[8]))
-            # 9 变动
-            turnover_rate = value_to_pct(to_float(fields[10]))
-
-            kdatas.append(
-                dict(
-                    id=the_id,
-                    timestamp=the_timestamp,
-                    entity_id=entity_id,
-                    provider="em",
-                    code=code,
-                    name=name,
-                    level=level.value,
-                    open=open,
-                    close=close,
-                    high=high,
-                    low=low,
-                    volume=volume,
-                    turnover=turnover,
-                    turnover_rate=turnover_rate,
-                    change_pct=change_pct,
-                )
-            )
-    if kdatas:
-        df = pd.DataFrame.from_records(kdatas)
+        # "2000-01-28,1005.26,1012.56,1173.12,982.13,3023326,3075552000.00"
+        # "2021-08-27,19.39,20.30,20.30,19.25,1688497,3370240912.00,5.48,6.01,1.15,3.98,0,0,0"
+        # time,open,close,high,low,volume,turnover
+        # "2022-04-13,10708,10664,10790,10638,402712,43124771328,1.43,0.57,60,0.00,4667112399583576064,4690067230254170112,1169270784"
+        # 所有行一次性交给read_csv解析, 不再逐行split
+        field_count = klines[0].count(",") + 1
+        raw_df = pd.read_csv(
+            io.StringIO("\n".join(klines)),
+            header=None,
+            usecols=[col for col in _kline_fields if col < field_count],
+            dtype={0: str},
+            na_values=none_values,
+            keep_default_na=False,
+            float_precision="round_trip",
+        )
+        for col in _kline_fields:
+            if col not in raw_df.columns:
+                raw_df[col] = np.nan
+            elif col != 0 and raw_df[col].dtype == object:
+                raw_df[col] = pd.to_numeric(raw_df[col], errors="coerce")
+
+        timestamps = pd.to_datetime(raw_df[0])
+        # 7 振幅
+        # 9 变动
+        change_pct = raw_df[8].astype(float)
+        turnover_rate = raw_df[10].astype(float)
+        df = pd.DataFrame(
+            {
+                "id": generate_kdata_ids(entity_id, timestamps, level=level),
+                "timestamp": timestamps,
+                "entity_id": entity_id,
+                "provider": "em",
+                "code": code,
+                "name": name,
+                "level": level.value,
+                "open": raw_df[1].astype(float),
+                "close": raw_df[2].astype(float),
+                "high": raw_df[3].astype(float),
+                "low": raw_df[4].astype(float),
+                "volume": raw_df[5].astype(float),
+                "turnover": raw_df[6].astype(float),
+                # 与value_to_pct一致, 空值和0都为0
+                "turnover_rate": (turnover_rate / 100).where(turnover_rate.notna() & (turnover_rate != 0), 0),
+                "change_pct": (change_pct / 100).where(change_pct.notna() & (change_pct != 0), 0),
+            }
+        )
         return df
 
 
@@ -584,7 +689,7 @@ def get_basic_info(entity_id):
         assert False
 
     data = {"fc": to_em_fc(entity_id=entity_id), "color": "w"}
-    resp = requests.post(url=url, json=data, headers=DEFAULT_HEADER)
+    resp = get_default_client().post(url=url, json=data, headers=DEFAULT_HEADER)
 
     resp.raise_for_status()
     resp.close()
@@ -595,7 +700,7 @@ def get_basic_info(entity_id):
 def get_future_list():
     # 主连
     url = f"https://futsseapi.eastmoney.com/list/filter/2?fid=sp_all&mktid=0&typeid=0&pageSize=1000&pageIndex=0&callbackName=jQuery34106875017735118845_1649736551642&sort=asc&orderBy=idx&_={now_timestamp()}"
-    resp = requests.get(url, headers=DEFAULT_HEADER)
+    resp = get_default_client().get(url, headers=DEFAULT_HEADER)
     resp.raise_for_status()
     result = json_callback_param(resp.text)
     resp.close()
@@ -643,7 +748,7 @@ def _calculate_limit(row):
 
 def get_stock_turnover():
     sz_url = "https://push2his.eastmoney.com/api/qt/stock/trends2/get?fields1=f1,f2&fields2=f51,f57&ut=fa5fd1943c7b386f172d6893dbfba10b&iscr=0&iscca=0&secid=0.399001&time=0&ndays=2"
-    resp = requests.get(sz_url, headers=DEFAULT_HEADER)
+    resp = get_default_client().get(sz_url, headers=DEFAULT_HEADER)
 
     resp.raise_for_status()
 
@@ -654,7 +759,7 @@ def get_stock_turnover():
 
 def get_top_tradable_list(entity_type, fields, limit, entity_flag, exchange=None, return_quote=False):
     url = f"https://push2.eastmoney.com/api/qt/clist/get?np=1&fltt=2&invt=2&fields={fields}&pn=1&pz={limit}&fid=f3&po=1&{entity_flag}&ut=f057cbcbce2a86e2866ab8877db1d059&forcect=1&cb=cbCallbackMore&&callback=jQuery34109676853980006124_{now_timestamp() - 1}&_={now_timestamp()}"
-    resp = requests.get(url, headers=DEFAULT_HEADER)
+    resp = get_default_client().get(url, headers=DEFAULT_HEADER)
 
     resp.raise_for_status()
 
@@ -821,15 +926,44 @@ def get_tradable_list(
     return pd.concat(dfs)
 
 
-def get_block_stocks(block_id, name="", session=None):
+def _block_stocks_url(block_id):
     entity_type, exchange, code = decode_entity_id(block_id)
-    category_stocks_url = f"http://48.push2.eastmoney.com/api/qt/clist/get?cb=jQuery11240710111145777397_{now_timestamp() - 1}&pn=1&pz=1000&po=1&np=1&ut=bd1d9ddb04089700cf9c27f6f7426281&fltt=2&invt=2&wbp2u=4668014655929990|0|1|0|web&fid=f3&fs=b:{code}+f:!50&fields=f1,f2,f3,f4,f5,f6,f7,f8,f9,f10,f12,f13,f14,f15,f16,f17,f18,f20,f21,f23,f24,f25,f22,f11,f62,f128,f136,f115,f152,f45&_={now_timestamp()}"
-    if session:
-        resp = session.get(category_stocks_url, headers=DEFAULT_HEADER)
-    else:
-        resp = requests.get(category_stocks_url, headers=DEFAULT_HEADER)
+    return f"http://48.push2.eastmoney.com/api/qt/clist/get?cb=jQuery11240710111145777397_{now_timestamp() - 1}&pn=1&pz=1000&po=1&np=1&ut=bd1d9ddb04089700cf9c27f6f7426281&fltt=2&invt=2&wbp2u=4668014655929990|0|1|0|web&fid=f3&fs=b:{code}+f:!50&fields=f1,f2,f3,f4,f5,f6,f7,f8,f9,f10,f12,f13,f14,f15,f16,f17,f18,f20,f21,f23,f24,f25,f22,f11,f62,f128,f136,f115,f152,f45&_={now_timestamp()}"
+
 
-    data = json_callback_param(resp.text)["data"]
+def get_block_stocks(block_id, name="", session=None):
+    if not session:
+        session = get_default_client()
+    resp = session.get(_block_stocks_url(block_id), headers=DEFAULT_HEADER)
+    return _parse_block_stocks(resp.text, block_id=block_id, name=name)
+
+
+async def get_block_stocks_many(
+    block_ids: List[str], names: List[str] = None, client: AsyncEMClient = None
+) -> Dict[str, List[dict]]:
+    """
+    get stocks of the blocks concurrently
+
+    :param names: block names in the same order as block_ids
+    :param client: the client to use, a temporary one is created if not set
+    :return: block_id -> stock list
+    """
+    if client is None:
+        async with AsyncEMClient() as client:
+            return await get_block_stocks_many(block_ids, names=names, client=client)
+
+    if not names:
+        names = [""] * len(block_ids)
+    texts = await client.gather([client.get_text(_block_stocks_url(block_id)) for block_id in block_ids])
+    return {
+        block_id: _parse_block_stocks(text, block_id=block_id, name=name)
+        for block_id, name, text in zip(block_ids, names, texts)
+    }
+
+
+def _parse_block_stocks(text, block_id, name=""):
+    entity_type, exchange, code = decode_entity_id(block_id)
+    data = json_callback_param(text)["data"]
     the_list = []
     if data:
         results = data["diff"]
@@ -881,10 +1015,9 @@ def get_hot_topic(session: Session = None):
         "parm": "",
     }
     logger.debug(f"get hot topic from: {url}")
-    if session:
-        resp = session.post(url=url, json=data, headers=DEFAULT_HEADER)
-    else:
-        resp = requests.post(url=url, json=data, headers=DEFAULT_HEADER)
+    if not session:
+        session = get_default_client()
+    resp = session.post(url=url, json=data, headers=DEFAULT_HEADER)
 
     if resp.status_code == 200:
         data_list = resp.json().get("re")
@@ -932,10 +1065,9 @@ def get_news(entity_id, ps=200, index=1, start_timestamp=None, session=None, lat
     sec_id = to_em_sec_id(entity_id=entity_id)
     url = f"https://np-listapi.eastmoney.com/comm/wap/getListInfo?cb=callback&client=wap&type=1&mTypeAndCode={sec_id}&pageSize={ps}&pageIndex={index}&callback=jQuery1830017478247906740352_{now_timestamp() - 1}&_={now_timestamp()}"
     logger.debug(f"get news from: {url}")
-    if session:
-        resp = session.get(url)
-    else:
-        resp = requests.get(url)
+    if not session:
+        session = get_default_client()
+    resp = session.get(url)
     # {
     #     "Art_ShowTime": "2022-02-11 14:29:25",
     #     "Art_Image": "",
@@ -972,7 +1104,7 @@ def get_news(entity_id, ps=200, index=1, start_timestamp=None, session=None, lat
                 ]
                 if len(news) < len(json_result):
                     return news
-                next_data = get_news(entity_id=entity_id, ps=ps, index=index + 1)
+                next_data = get_news(entity_id=entity_id, ps=ps, index=index + 1, session=session)
                 if next_data:
                     return news + next_data
                 else:
@@ -1181,8 +1313,11 @@ __all__ = [
     "actor_type_to_org_type",
     "generate_filters",
     "get_em_data",
+    "get_em_data_async",
     "get_quotes",
     "get_kdata",
+    "get_kdata_async",
+    "get_kdata_many",
     "get_basic_info",
     "get_future_list",
     "get_top_tradable_list",
@@ -1190,6 +1325,7 @@ __all__ = [
     "get_top_stockhks",
     "get_tradable_list",
     "get_block_stocks",
+    "get_block_stocks_many",
     "market_code_to_entity_id",
     "get_hot_topic",
     "record_hot_topic",
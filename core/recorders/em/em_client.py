@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import logging
+import threading
+from typing import Awaitable, Iterable, List
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from core.recorders.consts import DEFAULT_HEADER
+
+logger = logging.getLogger(__name__)
+
+# status worth retrying, em returns 5xx/429 when it is throttling
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class EMClient(object):
+    """
+    sync em client, the keep-alive connections are pooled per host and reused across calls,
+    failed requests are retried with exponential backoff and gzip/deflate responses are decompressed.
+
+    it could be passed as the session of em_api functions, e.g. em_api.get_kdata(entity_id, session=client)
+    """
+
+    def __init__(
+        self,
+        pool_maxsize: int = 10,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: float = 10,
+    ) -> None:
+        """
+        :param pool_maxsize: connections kept for every host
+        :param retries: max retry times for connection errors and RETRY_STATUS
+        :param backoff_factor: sleep backoff_factor * 2 ** (retry - 1) seconds between retries
+        :param timeout: request timeout in seconds
+        """
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset(["GET", "POST"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+
+    def get(self, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> EMClient:
+    """
+    process wide client used by em_api when no session is passed
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = EMClient()
+    return _default_client
+
+
+class AsyncEMClient(object):
+    """
+    asyncio em client based on aiohttp, use it as async context manager:
+
+        async with AsyncEMClient(concurrency=20) as client:
+            dfs = await em_api.get_kdata_many(entity_ids, client=client)
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 10,
+        limit_per_host: int = 10,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: float = 10,
+    ) -> None:
+        """
+        :param concurrency: max in flight requests of the client
+        :param limit_per_host: connections kept for every host
+        :param retries: max retry times for connection errors, timeout and RETRY_STATUS
+        :param backoff_factor: sleep backoff_factor * 2 ** retry seconds between retries
+        :param timeout: total timeout of one request in seconds
+        """
+        self.concurrency = concurrency
+        self.limit_per_host = limit_per_host
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.session: aiohttp.ClientSession = None
+        self.semaphore: asyncio.Semaphore = None
+
+    async def open(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.limit_per_host)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={**DEFAULT_HEADER, "Accept-Encoding": "gzip, deflate"},
+                auto_decompress=True,
+            )
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def request_text(self, method: str, url: str, **kwargs) -> str:
+        await self.open()
+        async with self.semaphore:
+            retry = 0
+            while True:
+                try:
+                    async with self.session.request(method, url, **kwargs) as resp:
+                        if resp.status in RETRY_STATUS and retry < self.retries:
+                            logger.warning(f"request {url} status: {resp.status}, retry: {retry + 1}")
+                        else:
+                            resp.raise_for_status()
+                            return await resp.text()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if retry >= self.retries:
+                        raise
+                    logger.warning(f"request {url} error: {e}, retry: {retry + 1}")
+                await asyncio.sleep(self.backoff_factor * (2**retry))
+                retry = retry + 1
+
+    async def get_text(self, url: str, **kwargs) -> str:
+        return await self.request_text("GET", url, **kwargs)
+
+    async def get_json(self, url: str, **kwargs):
+        return json.loads(await self.get_text(url, **kwargs))
+
+    async def post_json(self, url: str, **kwargs):
+        return json.loads(await self.request_text("POST", url, **kwargs))
+
+    @staticmethod
+    async def gather(aws: Iterable[Awaitable], return_exceptions: bool = False) -> List:
+        """
+        run the awaitables concurrently, the concurrency is bounded by the client semaphore
+        """
+        return await asyncio.gather(*aws, return_exceptions=return_exceptions)
+
+
+# the __all__ is generated
+__all__ = ["RETRY_STATUS", "EMClient", "get_default_client", "AsyncEMClient"]
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
-from core.api.kdata import get_kdata_schema
+from core.api.kdata import get_kdata_schema, get_index_trade_calendar
 from core.contract import IntervalLevel, AdjustType
-from core.contract.api import df_to_db
 from core.contract.recorder import FixedCycleDataRecorder
 from core.domain import (
     Stock,
@@ -32,6 +31,8 @@ class BaseEMStockKdataRecorder(FixedCycleDataRecorder):
 
     provider = "em"
 
+    host_rate_limits = {"push2his.eastmoney.com": 5}
+
     def __init__(
         self,
         force_update=True,
@@ -53,6 +54,7 @@ class BaseEMStockKdataRecorder(FixedCycleDataRecorder):
         one_day_trading_minutes=24 * 60,
         adjust_type=AdjustType.qfq,
         return_unfinished=False,
+        max_workers=1,
     ) -> None:
         level = IntervalLevel(level)
         self.adjust_type = AdjustType(adjust_type)
@@ -79,16 +81,17 @@ class BaseEMStockKdataRecorder(FixedCycleDataRecorder):
             kdata_use_begin_time,
             one_day_trading_minutes,
             return_unfinished,
+            max_workers,
         )
 
     def record(self, entity, start, end, size, timestamps):
         df = em_api.get_kdata(
             session=self.http_session, entity_id=entity.id, limit=size, adjust_type=self.adjust_type, level=self.level
         )
-        if pd_is_not_null(df):
-            df_to_db(df=df, data_schema=self.data_schema, provider=self.provider, force_update=self.force_update)
-        else:
+        if not pd_is_not_null(df):
             self.logger.info(f"no kdata for {entity.id}")
+        #: persisted by handle_record_result, so it could run in the worker thread of run_concurrently
+        return df
 
     def on_finish_entity(self, entity):
         # fill timestamp
@@ -158,6 +161,13 @@ class EMIndexKdataRecorder(BaseEMStockKdataRecorder):
 
     data_schema = IndexKdataCommon
 
+    def on_finish_entity(self, entity):
+        super().on_finish_entity(entity)
+        # 交易日历来自该指数的日k线,已读入的交易日历需要增量刷新
+        trade_calendar = get_index_trade_calendar()
+        if trade_calendar.loaded and entity.id == trade_calendar.entity_id and self.level == IntervalLevel.LEVEL_1DAY:
+            trade_calendar.refresh()
+
 
 class EMIndexusKdataRecorder(BaseEMStockKdataRecorder):
     entity_provider = "em"
@@ -191,7 +201,11 @@ if __name__ == "__main__":
     df = Stock.query_data(filters=[Stock.exchange == "bj"], provider="em")
     entity_ids = df["entity_id"].tolist()
     recorder = EMStockKdataRecorder(
-        level=IntervalLevel.LEVEL_1DAY, entity_ids=entity_ids, sleeping_time=0, adjust_type=AdjustType.hfq
+        level=IntervalLevel.LEVEL_1DAY,
+        entity_ids=entity_ids,
+        sleeping_time=0,
+        adjust_type=AdjustType.hfq,
+        max_workers=8,
     )
     recorder.run()
 
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import gzip
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from core.recorders.em.em_client import AsyncEMClient, EMClient
+
+
+class StubEMHandler(BaseHTTPRequestHandler):
+    """本地模拟东财接口: kline返回gzip压缩的k线, /flaky前两次返回503"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.ports.add(self.client_address[1])
+            server.hits[self.path.split("?")[0]] = server.hits.get(self.path.split("?")[0], 0) + 1
+            hits = server.hits[self.path.split("?")[0]]
+
+        url = urlparse(self.path)
+        if url.path == "/flaky" and hits <= 2:
+            self._send(503, b"busy")
+        elif url.path == "/flaky":
+            self._send(200, json.dumps({"ok": hits}).encode())
+        elif url.path == "/api/qt/stock/kline/get":
+            sec_id = parse_qs(url.query)["secid"][0]
+            result = {
+                "data": {
+                    "name": sec_id,
+                    "klines": [
+                        "2024-01-02,10.0,10.5,10.8,9.9,1000,10500.00,9.00,5.00,0.50,1.20",
+                        "2024-01-03,10.5,10.2,10.6,10.1,2000,20400.00,4.76,-2.86,-0.30,2.40",
+                    ],
+                }
+            }
+            self._send(200, gzip.compress(json.dumps(result).encode()), {"Content-Encoding": "gzip"})
+        else:
+            self._send(404, b"not found")
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class EMClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubEMHandler)
+        self.server.lock = threading.Lock()
+        self.server.ports = set()
+        self.server.hits = {}
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sync_keep_alive_and_retry(self):
+        with EMClient(backoff_factor=0.01) as client:
+            for _ in range(5):
+                resp = client.get(f"{self.base_url}/api/qt/stock/kline/get?secid=1.600000")
+                self.assertEqual(resp.json()["data"]["name"], "1.600000")
+            self.assertEqual(len(self.server.ports), 1)
+
+            resp = client.get(f"{self.base_url}/flaky")
+            self.assertEqual(resp.json(), {"ok": 3})
+
+    def test_async_gather_and_retry(self):
+        async def run():
+            async with AsyncEMClient(concurrency=4, backoff_factor=0.01) as client:
+                urls = [f"{self.base_url}/api/qt/stock/kline/get?secid=0.{i:06d}" for i in range(20)]
+                results = await client.gather([client.get_json(url) for url in urls])
+                flaky = await client.get_json(f"{self.base_url}/flaky")
+                return results, flaky
+
+        results, flaky = asyncio.run(run())
+        self.assertEqual([r["data"]["name"] for r in results], [f"0.{i:06d}" for i in range(20)])
+        self.assertLessEqual(len(self.server.ports), 4)
+        self.assertEqual(flaky, {"ok": 3})
+
+    def test_async_raise_after_retries(self):
+        async def run():
+            async with AsyncEMClient(retries=1, backoff_factor=0.01) as client:
+                await client.get_text(f"{self.base_url}/flaky")
+
+        with self.assertRaises(Exception):
+            asyncio.run(run())
+
+    def test_get_kdata_many(self):
+        from core.recorders.em import em_api
+
+        entity_ids = ["stock_sh_600000", "stock_sz_000001"]
+        with mock.patch.object(em_api, "EM_KDATA_URL", f"{self.base_url}/api/qt/stock/kline/get"):
+            dfs = asyncio.run(em_api.get_kdata_many(entity_ids))
+            with EMClient() as client:
+                df = em_api.get_kdata("stock_sh_600000", session=client)
+
+        self.assertEqual(list(dfs.keys()), entity_ids)
+        self.assertEqual(dfs["stock_sz_000001"]["name"].tolist(), ["0.000001", "0.000001"])
+        self.assertEqual(dfs["stock_sh_600000"]["id"].tolist(), df["id"].tolist())
+        self.assertAlmostEqual(df["change_pct"].iloc[1], -0.0286)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from core.contract import IntervalLevel
+from core.recorders.em.em_api import _parse_kdata
+
+
+def expected_df(ids, timestamps, level, rows) -> pd.DataFrame:
+    columns = ["open", "close", "high", "low", "volume", "turnover", "turnover_rate", "change_pct"]
+    df = pd.DataFrame(
+        {
+            "id": ids,
+            "timestamp": pd.to_datetime(timestamps),
+            "entity_id": "stock_sh_600000",
+            "provider": "em",
+            "code": "600000",
+            "name": "浦发银行",
+            "level": level,
+        }
+    )
+    return pd.concat([df, pd.DataFrame(rows, columns=columns, dtype=float)], axis=1)
+
+
+class ParseKdataTest(unittest.TestCase):
+    def test_parse_day(self):
+        results = {
+            "data": {
+                "name": "浦发银行",
+                "klines": [
+                    "2024-01-02,10.00,10.50,10.80,9.90,1000,10500.00,9.00,5.00,0.50,1.20,0,0,0",
+                    # 停牌等缺失值: 收盘为空, 换手率为空, 涨跌幅为0
+                    "2024-01-03,10.50,-,10.60,10.20,2000,21000.00,3.80,0.00,-0.10,-,0,0,0",
+                    "2024-01-04,10.40,10.45,10.70,10.30,1500,15600.00,3.80,-0.48,-0.05,0.90,0,0,0",
+                ],
+            }
+        }
+        expected = expected_df(
+            ids=[f"stock_sh_600000_2024-01-0{i}" for i in (2, 3, 4)],
+            timestamps=["2024-01-02", "2024-01-03", "2024-01-04"],
+            level="1d",
+            rows=[
+                [10.0, 10.5, 10.8, 9.9, 1000, 10500.0, 0.012, 0.05],
+                [10.5, np.nan, 10.6, 10.2, 2000, 21000.0, 0, 0],
+                [10.4, 10.45, 10.7, 10.3, 1500, 15600.0, 0.009, -0.0048],
+            ],
+        )
+        pd.testing.assert_frame_equal(_parse_kdata(results, entity_id="stock_sh_600000"), expected)
+
+    def test_parse_minute(self):
+        results = {
+            "data": {
+                "name": "浦发银行",
+                "klines": [
+                    "2024-01-02 09:31,10.00,10.02,10.03,9.99,300,3006.00,0.40,0.20,0.02,0.01,0,0,0",
+                    "2024-01-02 09:32,10.02,10.01,10.02,10.00,200,2002.00,0.20,-0.10,-0.01,0.01,0,0,0",
+                ],
+            }
+        }
+        expected = expected_df(
+            ids=["stock_sh_600000_2024-01-02T09:31:00.000", "stock_sh_600000_2024-01-02T09:32:00.000"],
+            timestamps=["2024-01-02 09:31", "2024-01-02 09:32"],
+            level="1m",
+            rows=[
+                [10.0, 10.02, 10.03, 9.99, 300, 3006.0, 0.0001, 0.002],
+                [10.02, 10.01, 10.02, 10.0, 200, 2002.0, 0.0001, -0.001],
+            ],
+        )
+        df = _parse_kdata(results, entity_id="stock_sh_600000", level=IntervalLevel.LEVEL_1MIN)
+        pd.testing.assert_frame_equal(df, expected)
+
+    def test_parse_short_klines(self):
+        # 只有时间,开收高低量额的k线, 涨跌幅和换手率为0
+        results = {"data": {"name": "浦发银行", "klines": ["2024-01-02,10.00,10.50,10.80,9.90,1000,10500.00"]}}
+        expected = expected_df(
+            ids=["stock_sh_600000_2024-01-02"],
+            timestamps=["2024-01-02"],
+            level="1d",
+            rows=[[10.0, 10.5, 10.8, 9.9, 1000, 10500.0, 0, 0]],
+        )
+        pd.testing.assert_frame_equal(_parse_kdata(results, entity_id="stock_sh_600000"), expected)
+
+    def test_parse_empty(self):
+        self.assertIsNone(_parse_kdata({"data": None}, entity_id="stock_sh_600000"))
+        self.assertIsNone(_parse_kdata({"data": {"name": "浦发银行", "klines": []}}, entity_id="stock_sh_600000"))
+
+
+if __name__ == "__main__":
+    unittest.main()
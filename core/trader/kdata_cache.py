@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from core.api.kdata import get_kdata
+from core.contract import IntervalLevel, AdjustType
+from core.contract.api import get_entity_type
+from core.utils.pd_utils import pd_is_not_null
+from core.utils.time_utils import to_pd_timestamp
+
+
+class KdataCache(object):
+    """
+    close price of the bars in memory, the bars of the entities are loaded in bulk for the backtest range
+    and stored as sorted numpy arrays, so looking up the price is a binary search instead of a sql query.
+
+    the bars are keyed by (level, entity_id), entity which is not loaded would be loaded on the first lookup.
+    """
+
+    def __init__(
+        self,
+        provider: str = None,
+        adjust_type: Union[AdjustType, str] = None,
+        start_timestamp: Union[str, pd.Timestamp] = None,
+        end_timestamp: Union[str, pd.Timestamp] = None,
+    ) -> None:
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.provider = provider
+        self.adjust_type = adjust_type
+        self.start_timestamp = to_pd_timestamp(start_timestamp)
+        self.end_timestamp = to_pd_timestamp(end_timestamp)
+
+        #: (level, entity_id) -> (timestamps, closes)
+        self.bars: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def load(self, entity_ids: List[str], level: Union[IntervalLevel, str] = IntervalLevel.LEVEL_1DAY):
+        """
+        load the bars of the entities with one query for every entity type
+
+        :param entity_ids:
+        :param level:
+        """
+        level = IntervalLevel(level)
+        entity_ids = [entity_id for entity_id in entity_ids if (level.value, entity_id) not in self.bars]
+        if not entity_ids:
+            return
+
+        entity_type_map_ids: Dict[str, List[str]] = {}
+        for entity_id in entity_ids:
+            entity_type_map_ids.setdefault(get_entity_type(entity_id), []).append(entity_id)
+
+        for ids in entity_type_map_ids.values():
+            df = get_kdata(
+                provider=self.provider,
+                entity_ids=ids,
+                level=level,
+                columns=["entity_id", "timestamp", "close"],
+                start_timestamp=self.start_timestamp,
+                end_timestamp=self.end_timestamp,
+                index=None,
+                adjust_type=self.adjust_type,
+            )
+            if pd_is_not_null(df):
+                df = df.sort_values(["entity_id", "timestamp"], kind="stable")
+                df_entity_ids = df["entity_id"].to_numpy()
+                timestamps = df["timestamp"].to_numpy(dtype="datetime64[ns]")
+                closes = df["close"].to_numpy(dtype=float)
+                uniques, starts = np.unique(df_entity_ids, return_index=True)
+                ends = np.append(starts[1:], len(df_entity_ids))
+                for entity_id, start, end in zip(uniques, starts, ends):
+                    self.bars[(level.value, entity_id)] = (timestamps[start:end], closes[start:end])
+
+            for entity_id in ids:
+                self.bars.setdefault((level.value, entity_id), (np.array([], dtype="datetime64[ns]"), np.array([])))
+
+            self.logger.info(f"loaded {len(ids)} entities {level.value} kdata, size:{len(df) if df is not None else 0}")
+
+    def get_close(
+        self,
+        entity_id: str,
+        timestamp: Union[str, pd.Timestamp],
+        level: Union[IntervalLevel, str] = IntervalLevel.LEVEL_1DAY,
+        exact: bool = True,
+    ) -> Optional[float]:
+        """
+        get the close of the bar at timestamp, or the latest bar before timestamp if not exact
+
+        :param entity_id:
+        :param timestamp:
+        :param level:
+        :param exact: only the bar at timestamp
+        :return: None if the bar is not in the cache
+        """
+        timestamp = to_pd_timestamp(timestamp)
+        if (self.start_timestamp and timestamp < self.start_timestamp) or (
+            self.end_timestamp and timestamp > self.end_timestamp
+        ):
+            return None
+
+        level = IntervalLevel(level)
+        key = (level.value, entity_id)
+        if key not in self.bars:
+            self.load([entity_id], level=level)
+
+        timestamps, closes = self.bars[key]
+        the_time = np.datetime64(timestamp, "ns")
+        index = np.searchsorted(timestamps, the_time, side="right") - 1
+        if index < 0:
+            return None
+        if exact and timestamps[index] != the_time:
+            return None
+        return float(closes[index])
+
+    def get_closes(
+        self,
+        entity_ids: List[str],
+        timestamp: Union[str, pd.Timestamp],
+        level: Union[IntervalLevel, str] = IntervalLevel.LEVEL_1DAY,
+        exact: bool = True,
+    ) -> np.ndarray:
+        """
+        get the closes of the entities at timestamp, the entities not loaded are loaded together, see get_close
+
+        :param entity_ids:
+        :param timestamp:
+        :param level:
+        :param exact: only the bar at timestamp
+        :return: the closes, NaN if the bar is not in the cache
+        """
+        closes = np.full(len(entity_ids), np.nan)
+        timestamp = to_pd_timestamp(timestamp)
+        if (self.start_timestamp and timestamp < self.start_timestamp) or (
+            self.end_timestamp and timestamp > self.end_timestamp
+        ):
+            return closes
+
+        level = IntervalLevel(level)
+        self.load(entity_ids, level=level)
+
+        the_time = np.datetime64(timestamp, "ns")
+        for i, entity_id in enumerate(entity_ids):
+            timestamps, entity_closes = self.bars[(level.value, entity_id)]
+            index = np.searchsorted(timestamps, the_time, side="right") - 1
+            if index >= 0 and (not exact or timestamps[index] == the_time):
+                closes[i] = entity_closes[index]
+        return closes
+
+
+# the __all__ is generated
+__all__ = ["KdataCache"]
@@ -1,12 +1,17 @@
 # -*- coding: utf-8 -*-
 import logging
 import math
-from typing import List, Optional
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
 
 from core.api.kdata import get_kdata, get_kdata_schema
 from core.contract import IntervalLevel, TradableEntity, AdjustType
 from core.contract.api import get_db_session, decode_entity_id
 from core.trader import TradingSignal, AccountService, OrderType, trading_signal_type_to_order_type
+from core.trader.kdata_cache import KdataCache
 from core.trader.errors import (
     NotEnoughMoneyError,
     InvalidOrderError,
@@ -15,13 +20,159 @@ from core.trader.errors import (
     WrongKdataError,
 )
 from core.trader.trader_info_api import get_trader_info, clear_trader
-from core.trader.trader_models import AccountStatsModel, PositionModel
+from core.trader.trader_models import AccountStatsModel
 from core.trader.trader_schemas import AccountStats, Position, Order, TraderInfo
 from core.utils.pd_utils import pd_is_not_null
 from core.utils.time_utils import to_pd_timestamp, to_time_str, TIME_FORMAT_ISO8601, is_same_date
 from core.utils.utils import fill_domain_from_dict
 
 
+class SimPosition(object):
+    """
+    position used in simulation, it's materialized to Position when the account is persisted
+    """
+
+    __slots__ = (
+        "id",
+        "entity_id",
+        "timestamp",
+        "trader_name",
+        "long_amount",
+        "available_long",
+        "average_long_price",
+        "short_amount",
+        "available_short",
+        "average_short_price",
+        "profit",
+        "profit_rate",
+        "value",
+        "trading_t",
+    )
+
+    def __init__(
+        self,
+        entity_id,
+        trader_name,
+        long_amount=0,
+        available_long=0,
+        average_long_price=0,
+        short_amount=0,
+        available_short=0,
+        average_short_price=0,
+        profit=0,
+        profit_rate=None,
+        value=0,
+        trading_t=None,
+        id=None,
+        timestamp=None,
+    ) -> None:
+        self.id = id
+        self.entity_id = entity_id
+        self.timestamp = timestamp
+        self.trader_name = trader_name
+        self.long_amount = long_amount
+        self.available_long = available_long
+        self.average_long_price = average_long_price
+        self.short_amount = short_amount
+        self.available_short = available_short
+        self.average_short_price = average_short_price
+        self.profit = profit
+        self.profit_rate = profit_rate
+        self.value = value
+        self.trading_t = trading_t
+
+    @classmethod
+    def from_position(cls, position: Position) -> "SimPosition":
+        return cls(**{field: getattr(position, field) for field in cls.__slots__})
+
+    def to_position(self, account_stats_id=None) -> Position:
+        return Position(account_stats_id=account_stats_id, **{field: getattr(self, field) for field in self.__slots__})
+
+    def __repr__(self) -> str:
+        return "SimPosition({})".format(", ".join(f"{field}={getattr(self, field)}" for field in self.__slots__))
+
+
+class PositionArrays(object):
+    """
+    struct of arrays of the holding amounts and average prices, row i is the position of entity_ids[i],
+    it's kept in the order of SimAccountService.positions and updated on every order
+    """
+
+    def __init__(self, capacity: int = 16) -> None:
+        self.entity_ids: List[str] = []
+        #: entity_id -> row
+        self.index: Dict[str, int] = {}
+        self._long_amounts = np.zeros(capacity)
+        self._short_amounts = np.zeros(capacity)
+        self._average_long_prices = np.zeros(capacity)
+        self._average_short_prices = np.zeros(capacity)
+
+    def __len__(self) -> int:
+        return len(self.entity_ids)
+
+    @property
+    def long_amounts(self) -> np.ndarray:
+        return self._long_amounts[: len(self)]
+
+    @property
+    def short_amounts(self) -> np.ndarray:
+        return self._short_amounts[: len(self)]
+
+    @property
+    def average_long_prices(self) -> np.ndarray:
+        return self._average_long_prices[: len(self)]
+
+    @property
+    def average_short_prices(self) -> np.ndarray:
+        return self._average_short_prices[: len(self)]
+
+    def update(self, position: SimPosition):
+        """
+        add or refresh the row of the position
+        """
+        row = self.index.get(position.entity_id)
+        if row is None:
+            row = len(self)
+            if row == len(self._long_amounts):
+                self._resize(2 * row)
+            self.entity_ids.append(position.entity_id)
+            self.index[position.entity_id] = row
+        self._long_amounts[row] = position.long_amount or 0
+        self._short_amounts[row] = position.short_amount or 0
+        self._average_long_prices[row] = position.average_long_price or 0
+        self._average_short_prices[row] = position.average_short_price or 0
+
+    def reset(self, positions: List[SimPosition]):
+        self.entity_ids = []
+        self.index = {}
+        for position in positions:
+            self.update(position)
+
+    def remove_empty(self) -> List[str]:
+        """
+        remove the rows without long or short amount, the order of the left rows is kept
+
+        :return: the removed entity ids
+        """
+        size = len(self)
+        keep = (self.long_amounts > 0) | (self.short_amounts > 0)
+        if keep.all():
+            return []
+        removed = [entity_id for entity_id, kept in zip(self.entity_ids, keep.tolist()) if not kept]
+        left = int(keep.sum())
+        for array in (self._long_amounts, self._short_amounts, self._average_long_prices, self._average_short_prices):
+            array[:left] = array[:size][keep]
+        self.entity_ids = [entity_id for entity_id, kept in zip(self.entity_ids, keep.tolist()) if kept]
+        self.index = {entity_id: row for row, entity_id in enumerate(self.entity_ids)}
+        return removed
+
+    def _resize(self, capacity: int):
+        for name in ("_long_amounts", "_short_amounts", "_average_long_prices", "_average_short_prices"):
+            array = np.zeros(capacity)
+            array[: len(self)] = getattr(self, name)[: len(self)]
+            setattr(self, name, array)
+
+
 class SimAccountService(AccountService):
     def __init__(
         self,
@@ -39,7 +190,14 @@ class SimAccountService(AccountService):
         keep_history=False,
         real_time=False,
         kdata_use_begin_time=False,
+        kdata_cache: KdataCache = None,
+        flush_interval: int = 1,
     ):
+        """
+        :param kdata_cache: the cache for getting the order price and closing price, query the db if not set
+        :param flush_interval: commit the account stats, positions and orders to db every flush_interval
+            trading close, the left would be committed on trading finish
+        """
         self.logger = logging.getLogger(self.__class__.__name__)
 
         self.entity_schema = entity_schema
@@ -58,11 +216,19 @@ class SimAccountService(AccountService):
         self.keep_history = keep_history
         self.real_time = real_time
         self.kdata_use_begin_time = kdata_use_begin_time
+        self.kdata_cache = kdata_cache
+        self.flush_interval = max(flush_interval, 1)
+        #: 未提交到db的收盘次数
+        self.pending_close_count = 0
+        #: entity_id -> 当前持仓, 账户的positions只在收盘持久化时生成
+        self.positions: Dict[str, SimPosition] = {}
+        #: 持仓的数量和均价, 与positions的顺序一致, 收盘时一次计算所有持仓的市值
+        self.position_arrays = PositionArrays()
 
         self.account = self.init_account()
 
         account_info = (
-            f"init_account,holding size:{len(self.account.positions)} profit:{self.account.profit} input_money:{self.account.input_money} "
+            f"init_account,holding size:{len(self.positions)} profit:{self.account.profit} input_money:{self.account.input_money} "
             f"cash:{self.account.cash} value:{self.account.value} all_value:{self.account.all_value}"
         )
         self.logger.info(account_info)
@@ -85,9 +251,10 @@ class SimAccountService(AccountService):
 
         # 读取之前保存的账户
         if self.keep_history:
-            self.account = self.load_account()
-            if self.account:
-                return self.account
+            latest_record = self.load_account()
+            if latest_record:
+                self.positions = self.to_sim_positions(latest_record.positions)
+                return self.copy_account(latest_record)
 
         # init trader info
         entity_type = self.entity_schema.__name__.lower()
@@ -118,7 +285,10 @@ class SimAccountService(AccountService):
             closing=False,
         )
 
-    def load_account(self) -> AccountStats:
+    def load_account(self) -> Optional[AccountStats]:
+        """
+        :return: the latest account record in db
+        """
         records = AccountStats.query_data(
             filters=[AccountStats.trader_name == self.trader_name],
             order=AccountStats.timestamp.desc(),
@@ -126,37 +296,52 @@ class SimAccountService(AccountService):
             return_type="domain",
         )
         if not records:
-            return self.account
-        latest_record: AccountStats = records[0]
+            return None
+        return records[0]
 
-        # create new orm object from latest record
+    def copy_account(self, latest_record: AccountStats) -> AccountStats:
+        """
+        create new orm object from latest record, the positions are kept in self.positions
+        """
         account_stats_model = AccountStatsModel.from_orm(latest_record)
         account = AccountStats()
         fill_domain_from_dict(account, account_stats_model.model_dump(exclude={"id", "positions"}))
-
-        positions: List[Position] = []
-        for position_domain in latest_record.positions:
-            position_model = PositionModel.from_orm(position_domain)
-            self.logger.debug("current position:{}".format(position_model))
-            position = Position()
-            fill_domain_from_dict(position, position_model.model_dump())
-            positions.append(position)
-
-        account.positions = positions
-
         return account
 
+    def to_sim_positions(self, positions: List[Position]) -> Dict[str, SimPosition]:
+        sim_positions = {}
+        for position in positions:
+            self.logger.debug("current position:{}".format(position))
+            sim_positions[position.entity_id] = SimPosition.from_position(position)
+        self.position_arrays.reset(list(sim_positions.values()))
+        return sim_positions
+
     def on_trading_open(self, timestamp):
         self.logger.info("on_trading_open:{}".format(timestamp))
         if is_same_date(timestamp, self.start_timestamp):
             return
-        self.account = self.load_account()
+        if self.account.closing and self.account.id:
+            # 上次收盘的账户就是db中最新的记录,直接复制,持仓也还在self.positions中
+            self.account = self.copy_account(self.account)
+        else:
+            latest_record = self.load_account()
+            if latest_record:
+                self.account = self.copy_account(latest_record)
+                self.positions = self.to_sim_positions(latest_record.positions)
 
     def on_trading_error(self, timestamp, error):
         pass
 
     def on_trading_finish(self, timestamp):
-        pass
+        self.flush()
+
+    def flush(self):
+        """
+        commit the buffered account stats, positions and orders
+        """
+        if self.pending_close_count or self.session.new or self.session.dirty:
+            self.session.commit()
+            self.pending_close_count = 0
 
     def on_trading_signals(self, trading_signals: List[TradingSignal]):
         for trading_signal in trading_signals:
@@ -172,25 +357,9 @@ class SimAccountService(AccountService):
         order_type = trading_signal_type_to_order_type(trading_signal.trading_signal_type)
         trading_level = trading_signal.trading_level.value
         if order_type:
-            try:
-                kdata = get_kdata(
-                    provider=self.provider,
-                    entity_id=entity_id,
-                    level=trading_level,
-                    start_timestamp=happen_timestamp,
-                    end_timestamp=happen_timestamp,
-                    limit=1,
-                    adjust_type=self.adjust_type,
-                )
-            except Exception as e:
-                self.logger.error(e)
-                raise WrongKdataError("could not get kdata")
-
-            if pd_is_not_null(kdata):
-                entity_type, _, _ = decode_entity_id(kdata["entity_id"][0])
-
-                the_price = kdata["close"][0]
+            the_price = self.get_close_price(entity_id=entity_id, timestamp=happen_timestamp, level=trading_level)
 
+            if the_price is not None:
                 if the_price:
                     if trading_signal.position_pct:
                         self.order_by_position_pct(
@@ -220,8 +389,8 @@ class SimAccountService(AccountService):
                         assert False
                 else:
                     self.logger.warning(
-                        "ignore trading signal,wrong kdata,entity_id:{},timestamp:{},kdata:{}".format(
-                            entity_id, happen_timestamp, kdata.to_dict(orient="records")
+                        "ignore trading signal,wrong kdata,entity_id:{},timestamp:{},close:{}".format(
+                            entity_id, happen_timestamp, the_price
                         )
                     )
 
@@ -235,57 +404,70 @@ class SimAccountService(AccountService):
     def on_trading_close(self, timestamp):
         self.logger.info("on_trading_close:{}".format(timestamp))
         # remove the empty position
-        self.account.positions = [
-            position for position in self.account.positions if position.long_amount > 0 or position.short_amount > 0
-        ]
+        for entity_id in self.position_arrays.remove_empty():
+            del self.positions[entity_id]
 
         # clear the data which need recomputing
         the_id = "{}_{}".format(self.trader_name, to_time_str(timestamp, TIME_FORMAT_ISO8601))
 
+        positions = [self.positions[entity_id] for entity_id in self.position_arrays.entity_ids]
         self.account.value = 0
         self.account.all_value = 0
-        for position in self.account.positions:
-            entity_type, _, _ = decode_entity_id(position.entity_id)
-            data_schema = get_kdata_schema(entity_type, level=IntervalLevel.LEVEL_1DAY, adjust_type=self.adjust_type)
-
-            kdata = get_kdata(
-                provider=self.provider,
+        if positions:
+            closing_prices = self.get_close_prices(
+                entity_ids=self.position_arrays.entity_ids,
+                timestamp=timestamp,
                 level=IntervalLevel.LEVEL_1DAY,
-                entity_id=position.entity_id,
-                order=data_schema.timestamp.desc(),
-                end_timestamp=timestamp,
-                limit=1,
-                adjust_type=self.adjust_type,
             )
+            long_amounts = self.position_arrays.long_amounts
+            short_amounts = self.position_arrays.short_amounts
+            average_long_prices = self.position_arrays.average_long_prices
+            average_short_prices = self.position_arrays.average_short_prices
+
+            # 一次计算所有持仓的市值和收益
+            valid = ~np.isnan(closing_prices) & (closing_prices != 0)
+            is_long = long_amounts > 0
+            is_short = ~is_long & (short_amounts > 0)
+            values = np.where(
+                is_long,
+                long_amounts * closing_prices,
+                2 * (short_amounts * average_short_prices) - short_amounts * closing_prices,
+            )
+            profits = (closing_prices - average_long_prices) * long_amounts
+            cost = average_long_prices * long_amounts
+            with np.errstate(divide="ignore", invalid="ignore"):
+                profit_rates = np.where(cost != 0, profits / cost, 0)
+
+            self.account.value = float(values[valid & (is_long | is_short)].sum())
+
+            valid_list = valid.tolist()
+            value_list = values.tolist()
+            profit_list = profits.tolist()
+            profit_rate_list = profit_rates.tolist()
+            the_time = to_pd_timestamp(timestamp)
+            time_str = to_time_str(timestamp, TIME_FORMAT_ISO8601)
+            for i, position in enumerate(positions):
+                position.available_long = position.long_amount
+                position.available_short = position.short_amount
+
+                if valid_list[i]:
+                    if is_long[i] or is_short[i]:
+                        position.value = value_list[i]
+                    # refresh profit
+                    position.profit = profit_list[i]
+                    position.profit_rate = profit_rate_list[i]
+                else:
+                    self.logger.warning(
+                        "could not refresh close value for position:{},timestamp:{}".format(
+                            position.entity_id, timestamp
+                        )
+                    )
 
-            closing_price = kdata["close"][0]
-
-            position.available_long = position.long_amount
-            position.available_short = position.short_amount
-
-            if closing_price:
-                if (position.long_amount is not None) and position.long_amount > 0:
-                    position.value = position.long_amount * closing_price
-                    self.account.value += position.value
-                elif (position.short_amount is not None) and position.short_amount > 0:
-                    position.value = 2 * (position.short_amount * position.average_short_price)
-                    position.value -= position.short_amount * closing_price
-                    self.account.value += position.value
-
-                # refresh profit
-                position.profit = (closing_price - position.average_long_price) * position.long_amount
-                position.profit_rate = position.profit / (position.average_long_price * position.long_amount)
-
-            else:
-                self.logger.warning(
-                    "could not refresh close value for position:{},timestamp:{}".format(position.entity_id, timestamp)
-                )
+                position.id = "{}_{}_{}".format(self.trader_name, position.entity_id, time_str)
+                position.timestamp = the_time
 
-            position.id = "{}_{}_{}".format(
-                self.trader_name, position.entity_id, to_time_str(timestamp, TIME_FORMAT_ISO8601)
-            )
-            position.timestamp = to_pd_timestamp(timestamp)
-            position.account_stats_id = the_id
+        # 持久化时才生成Position
+        self.account.positions = [position.to_position(account_stats_id=the_id) for position in positions]
 
         self.account.id = the_id
         self.account.all_value = self.account.value + self.account.cash
@@ -295,14 +477,126 @@ class SimAccountService(AccountService):
         self.account.profit_rate = self.account.profit / self.account.input_money
 
         self.session.add(self.account)
-        self.session.commit()
+        self.pending_close_count += 1
+        if self.pending_close_count >= self.flush_interval:
+            self.flush()
         account_info = (
-            f"on_trading_close,holding size:{len(self.account.positions)} profit:{self.account.profit} input_money:{self.account.input_money} "
+            f"on_trading_close,holding size:{len(self.positions)} profit:{self.account.profit} input_money:{self.account.input_money} "
             f"cash:{self.account.cash} value:{self.account.value} all_value:{self.account.all_value}"
         )
         self.logger.info(account_info)
 
-    def get_current_position(self, entity_id, create_if_not_exist=False) -> Optional[Position]:
+    def get_close_prices(self, entity_ids: List[str], timestamp, level, exact=False) -> np.ndarray:
+        """
+        get the close prices of the entities, the prices not in the kdata cache are queried with one sql
+        for every entity type, see get_close_price
+
+        :return: the prices, NaN if no bar
+        """
+        if self.kdata_cache:
+            prices = self.kdata_cache.get_closes(entity_ids=entity_ids, timestamp=timestamp, level=level, exact=exact)
+        else:
+            prices = np.full(len(entity_ids), np.nan)
+
+        missing = np.flatnonzero(np.isnan(prices))
+        if not len(missing):
+            return prices
+
+        entity_type_map_rows: Dict[str, List[int]] = {}
+        for row in missing.tolist():
+            entity_type, _, _ = decode_entity_id(entity_ids[row])
+            entity_type_map_rows.setdefault(entity_type, []).append(row)
+
+        for entity_type, rows in entity_type_map_rows.items():
+            ids = [entity_ids[row] for row in rows]
+            data_schema = get_kdata_schema(entity_type, level=level, adjust_type=self.adjust_type)
+            if exact:
+                filters = None
+                start_timestamp = timestamp
+            else:
+                # 每个标的timestamp之前最新的一根k线
+                latest = aliased(data_schema)
+                filters = [
+                    data_schema.timestamp
+                    == select(func.max(latest.timestamp))
+                    .where(latest.entity_id == data_schema.entity_id, latest.timestamp <= to_pd_timestamp(timestamp))
+                    .scalar_subquery()
+                ]
+                start_timestamp = None
+            try:
+                kdata = get_kdata(
+                    provider=self.provider,
+                    entity_ids=ids,
+                    level=level,
+                    columns=["entity_id", "close"],
+                    start_timestamp=start_timestamp,
+                    end_timestamp=timestamp,
+                    filters=filters,
+                    index=None,
+                    adjust_type=self.adjust_type,
+                )
+            except Exception as e:
+                self.logger.error(e)
+                raise WrongKdataError("could not get kdata")
+
+            if pd_is_not_null(kdata):
+                closes = dict(zip(kdata["entity_id"], kdata["close"]))
+                for row, entity_id in zip(rows, ids):
+                    close = closes.get(entity_id)
+                    if close is not None:
+                        prices[row] = close
+        return prices
+
+    def get_close_price(self, entity_id, timestamp, level, exact=True) -> Optional[float]:
+        """
+        get the close of the bar at timestamp, or the latest bar before timestamp if not exact
+
+        :param entity_id: the entity id
+        :param timestamp: the bar timestamp
+        :param level: the bar level
+        :param exact: only the bar at timestamp
+        :return: None if no bar
+        """
+        if self.kdata_cache:
+            close = self.kdata_cache.get_close(entity_id=entity_id, timestamp=timestamp, level=level, exact=exact)
+            if close is not None:
+                return close
+
+        try:
+            if exact:
+                kdata = get_kdata(
+                    provider=self.provider,
+                    entity_id=entity_id,
+                    level=level,
+                    start_timestamp=timestamp,
+                    end_timestamp=timestamp,
+                    limit=1,
+                    adjust_type=self.adjust_type,
+                )
+            else:
+                entity_type, _, _ = decode_entity_id(entity_id)
+                data_schema = get_kdata_schema(entity_type, level=level, adjust_type=self.adjust_type)
+                kdata = get_kdata(
+                    provider=self.provider,
+                    level=level,
+                    entity_id=entity_id,
+                    order=data_schema.timestamp.desc(),
+                    end_timestamp=timestamp,
+                    limit=1,
+                    adjust_type=self.adjust_type,
+                )
+        except Exception as e:
+            self.logger.error(e)
+            raise WrongKdataError("could not get kdata")
+
+        if pd_is_not_null(kdata):
+            return kdata["close"].iloc[0]
+        return None
+
+    def get_positions(self) -> List[SimPosition]:
+        return list(self.positions.values())
+
+    def get_current_position(self, entity_id, create_if_not_exist=False) -> Optional[SimPosition]:
         """
         get position for entity_id
 
@@ -310,28 +604,18 @@ class SimAccountService(AccountService):
         :param create_if_not_exist: create an empty position if not exist in current account
         :return:
         """
-        for position in self.account.positions:
-            if position.entity_id == entity_id:
-                return position
-        if create_if_not_exist:
+        current_position = self.positions.get(entity_id)
+        if current_position is None and create_if_not_exist:
             trading_t = self.entity_schema.get_trading_t()
-            current_position = Position(
+            current_position = SimPosition(
                 trader_name=self.trader_name,
                 entity_id=entity_id,
-                long_amount=0,
-                available_long=0,
-                average_long_price=0,
-                short_amount=0,
-                available_short=0,
-                average_short_price=0,
-                profit=0,
-                value=0,
                 trading_t=trading_t,
             )
             # add it to account
-            self.account.positions.append(current_position)
-            return current_position
-        return None
+            self.positions[entity_id] = current_position
+            self.position_arrays.update(current_position)
+        return current_position
 
     def get_current_account(self):
         return self.account
@@ -409,6 +693,8 @@ class SimAccountService(AccountService):
         else:
             assert False
 
+        self.position_arrays.update(current_position)
+
         # save the order info to db
         order_id = "{}_{}_{}_{}".format(
             self.trader_name, order_type, current_position.entity_id, to_time_str(timestamp, TIME_FORMAT_ISO8601)
@@ -425,7 +711,8 @@ class SimAccountService(AccountService):
             status="success",
         )
         self.session.add(order)
-        self.session.commit()
+        if self.flush_interval == 1:
+            self.session.commit()
 
     def cal_amount_by_money(
         self,
@@ -548,4 +835,4 @@ class SimAccountService(AccountService):
 
 
 # the __all__ is generated
-__all__ = ["AccountService", "SimAccountService"]
+__all__ = ["AccountService", "SimPosition", "PositionArrays", "SimAccountService"]
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from core.contract import IntervalLevel
+from core.trader import kdata_cache
+from core.trader.kdata_cache import KdataCache
+
+DAYS = pd.date_range("2024-01-02", periods=5)
+#: 000001第2天停牌, 000002第4天才有数据
+KDATA = {
+    "stock_sz_000001": {0: 10.0, 1: 11.0, 3: 13.0, 4: 14.0},
+    "stock_sz_000002": {3: 7.0, 4: 8.0},
+    "index_sh_000001": {0: 3000.0, 1: 3010.0, 2: 3020.0, 3: 3030.0, 4: 3040.0},
+}
+
+
+class KdataCacheTest(unittest.TestCase):
+    """KdataCache test"""
+
+    def setUp(self):
+        self.kdata_df = pd.DataFrame(
+            [
+                {"entity_id": entity_id, "timestamp": DAYS[i], "close": close}
+                for entity_id, closes in KDATA.items()
+                for i, close in closes.items()
+            ]
+        )
+        # 和数据库一样按时间排序返回
+        self.kdata_df = self.kdata_df.sort_values("timestamp", kind="stable")
+        patch = mock.patch.object(kdata_cache, "get_kdata", side_effect=self.get_kdata)
+        self.query = patch.start()
+        self.addCleanup(patch.stop)
+        self.cache = KdataCache(start_timestamp=DAYS[0], end_timestamp=DAYS[-1])
+
+    def get_kdata(self, entity_ids, start_timestamp, end_timestamp, **kwargs):
+        df = self.kdata_df
+        df = df[df["entity_id"].isin(entity_ids)]
+        return df[(df["timestamp"] >= start_timestamp) & (df["timestamp"] <= end_timestamp)]
+
+    def queried_ids(self) -> list:
+        return [call.kwargs["entity_ids"] for call in self.query.call_args_list]
+
+    def test_load(self):
+        self.cache.load(["stock_sz_000001", "index_sh_000001", "stock_sz_000002", "stock_sz_000003"])
+        # 每个类型一次查询
+        self.assertEqual(
+            self.queried_ids(),
+            [["stock_sz_000001", "stock_sz_000002", "stock_sz_000003"], ["index_sh_000001"]],
+        )
+        timestamps, closes = self.cache.bars[("1d", "stock_sz_000001")]
+        self.assertEqual(timestamps.tolist(), DAYS[[0, 1, 3, 4]].to_numpy(dtype="datetime64[ns]").tolist())
+        self.assertEqual(closes.tolist(), [10.0, 11.0, 13.0, 14.0])
+        # 没有数据的标的也记录下来, 不再查询
+        self.assertEqual(len(self.cache.bars[("1d", "stock_sz_000003")][0]), 0)
+
+        self.cache.load(["stock_sz_000001", "stock_sz_000003"])
+        self.assertEqual(self.query.call_count, 2)
+        # 不同的级别分开缓存
+        self.cache.load(["stock_sz_000001"], level=IntervalLevel.LEVEL_1WEEK)
+        self.assertEqual(self.query.call_count, 3)
+
+    def test_get_close(self):
+        self.assertEqual(self.cache.get_close("stock_sz_000001", DAYS[1]), 11.0)
+        # 第一次查询时读入
+        self.assertEqual(self.queried_ids(), [["stock_sz_000001"]])
+
+        # 停牌
+        self.assertIsNone(self.cache.get_close("stock_sz_000001", DAYS[2]))
+        self.assertEqual(self.cache.get_close("stock_sz_000001", DAYS[2], exact=False), 11.0)
+        self.assertEqual(self.cache.get_close("stock_sz_000001", "2024-01-04 15:00", exact=False), 11.0)
+        # 之前没有数据
+        self.assertIsNone(self.cache.get_close("stock_sz_000002", DAYS[2], exact=False))
+        self.assertEqual(self.cache.get_close("stock_sz_000002", DAYS[3]), 7.0)
+        self.assertEqual(self.query.call_count, 2)
+
+        # 超出缓存的范围
+        self.assertIsNone(self.cache.get_close("stock_sz_000001", DAYS[-1] + pd.Timedelta(days=1), exact=False))
+        self.assertIsNone(self.cache.get_close("stock_sz_000001", DAYS[0] - pd.Timedelta(days=1), exact=False))
+
+    def test_get_closes(self):
+        entity_ids = ["stock_sz_000001", "stock_sz_000002", "index_sh_000001", "stock_sz_000003"]
+        np.testing.assert_array_equal(self.cache.get_closes(entity_ids, DAYS[2]), [np.nan, np.nan, 3020.0, np.nan])
+        self.assertEqual(self.query.call_count, 2)
+        np.testing.assert_array_equal(
+            self.cache.get_closes(entity_ids, DAYS[2], exact=False), [11.0, np.nan, 3020.0, np.nan]
+        )
+        np.testing.assert_array_equal(self.cache.get_closes(entity_ids, DAYS[4]), [14.0, 8.0, 3040.0, np.nan])
+        self.assertEqual(self.query.call_count, 2)
+
+        # 超出范围不查询
+        cache = KdataCache(start_timestamp=DAYS[0], end_timestamp=DAYS[-1])
+        closes = cache.get_closes(entity_ids, DAYS[-1] + pd.Timedelta(days=1), exact=False)
+        self.assertTrue(np.isnan(closes).all())
+        self.assertEqual(self.query.call_count, 2)
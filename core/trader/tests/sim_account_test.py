@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from core.contract import AdjustType, IntervalLevel
+from core.domain import Stock
+from core.domain.constants import stock_db_name
+from core.trader import OrderType, sim_account
+from core.trader.kdata_cache import KdataCache
+from core.trader.sim_account import SimAccountService, SimPosition
+from core.trader.trader_schemas import AccountStats, Order, Position, TraderBase
+from core.utils.testing import use_sqlite_db
+
+DAYS = pd.date_range("2024-01-02", periods=4)
+CLOSES = {"stock_sz_000001": [10.0, 11.0, 12.0, 13.0], "stock_sz_000002": [5.0, 4.0, 6.0, 7.0]}
+
+
+def gen_kdata_cache() -> KdataCache:
+    kdata_cache = KdataCache(start_timestamp=DAYS[0], end_timestamp=DAYS[-1])
+    for entity_id, closes in CLOSES.items():
+        kdata_cache.bars[("1d", entity_id)] = (DAYS.to_numpy(dtype="datetime64[ns]"), np.array(closes))
+    return kdata_cache
+
+
+def run_account(trader_name: str, flush_interval: int, on_close=None) -> SimAccountService:
+    service = SimAccountService(
+        entity_schema=Stock,
+        trader_name=trader_name,
+        timestamp=DAYS[0],
+        adjust_type=AdjustType.hfq,
+        kdata_cache=gen_kdata_cache(),
+        flush_interval=flush_interval,
+    )
+    for i, day in enumerate(DAYS):
+        service.on_trading_open(day)
+        if i == 0:
+            service.order_by_amount("stock_sz_000001", 10.0, day, OrderType.order_long, 100)
+            service.order_by_amount("stock_sz_000002", 5.0, day, OrderType.order_long, 200)
+        elif i == 2:
+            service.order_by_amount("stock_sz_000001", 12.0, day, OrderType.order_close_long, 100)
+        service.on_trading_close(day)
+        if on_close:
+            on_close(i)
+    service.on_trading_finish(DAYS[-1])
+    return service
+
+
+class SimAccountServiceTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.engine = use_sqlite_db(self, provider="zvt", db_name=stock_db_name, schema_base=TraderBase)
+
+    def read_table(self, schema, trader_name: str) -> pd.DataFrame:
+        df = pd.read_sql(
+            f"select * from {schema.__tablename__} where trader_name = '{trader_name}' order by timestamp, entity_id",
+            self.engine,
+        )
+        return df.drop(columns=["id", "entity_id", "trader_name", "account_stats_id"], errors="ignore")
+
+    def test_close_values(self):
+        run_account("sim_test", flush_interval=1)
+        account_df = self.read_table(AccountStats, "sim_test")
+        # 买入成本 1000 * 1.002 * 2, 第三天卖出得到 1200 * 0.998
+        cash = 1000000 - 2004
+        np.testing.assert_allclose(account_df["cash"], [cash, cash, cash + 1197.6, cash + 1197.6])
+        np.testing.assert_allclose(account_df["value"], [2000, 1900, 1200, 1400])
+        np.testing.assert_allclose(account_df["all_value"], account_df["cash"] + account_df["value"])
+        np.testing.assert_allclose(account_df["profit"], account_df["all_value"] - 1000000)
+
+        position_df = pd.read_sql(
+            "select * from position where trader_name = 'sim_test' order by timestamp, entity_id", self.engine
+        )
+        expected_ids = ["stock_sz_000001", "stock_sz_000002"] * 2 + ["stock_sz_000002"] * 2
+        self.assertEqual(position_df["entity_id"].tolist(), expected_ids)
+        np.testing.assert_allclose(position_df["value"], [1000, 1000, 1100, 800, 1200, 1400])
+        np.testing.assert_allclose(position_df["profit"], [0, 0, 100, -200, 200, 400])
+        np.testing.assert_allclose(position_df["profit_rate"], [0, 0, 0.1, -0.2, 0.2, 0.4])
+        np.testing.assert_allclose(position_df["available_long"], [100, 200, 100, 200, 200, 200])
+
+    def test_flush_interval(self):
+        def check_buffered(i):
+            # 前两次收盘还在session中, 第三次收盘时提交
+            self.assertEqual(len(self.read_table(AccountStats, "sim_test_buffered")), 0 if i < 2 else 3)
+
+        run_account("sim_test", flush_interval=1)
+        run_account("sim_test_buffered", flush_interval=3, on_close=check_buffered)
+
+        for schema in (AccountStats, Position, Order):
+            pd.testing.assert_frame_equal(
+                self.read_table(schema, "sim_test_buffered"), self.read_table(schema, "sim_test"), check_exact=True
+            )
+
+    def test_position_arrays(self):
+        service = run_account("sim_test", flush_interval=1)
+        service.on_trading_open(DAYS[-1])
+        service.order_by_amount("stock_sz_000003", 20.0, DAYS[-1], OrderType.order_short, 10)
+        service.order_by_amount("stock_sz_000002", 8.0, DAYS[-1], OrderType.order_long, 200)
+
+        arrays = service.position_arrays
+        self.assertEqual(arrays.entity_ids, list(service.positions.keys()))
+        self.assertEqual(arrays.long_amounts.tolist(), [400, 0])
+        self.assertEqual(arrays.average_long_prices.tolist(), [6.5, 0])
+        self.assertEqual(arrays.short_amounts.tolist(), [0, 10])
+        self.assertEqual(arrays.average_short_prices.tolist(), [0, 20])
+
+
+    def test_close_price_fallback(self):
+        service = SimAccountService(
+            entity_schema=Stock,
+            trader_name="sim_test",
+            timestamp=DAYS[0],
+            adjust_type=AdjustType.hfq,
+            kdata_cache=gen_kdata_cache(),
+        )
+        kdata = pd.DataFrame({"entity_id": ["stock_sz_000003"], "close": [20.0]})
+        with mock.patch.object(sim_account, "get_kdata", return_value=kdata) as query:
+            # 缓存中有的不查询数据库
+            self.assertEqual(service.get_close_price("stock_sz_000001", DAYS[1], IntervalLevel.LEVEL_1DAY), 11.0)
+            self.assertEqual(query.call_count, 0)
+
+            # 缓存中没有的查询数据库
+            self.assertEqual(service.get_close_price("stock_sz_000003", DAYS[1], IntervalLevel.LEVEL_1DAY), 20.0)
+            self.assertEqual(query.call_args.kwargs["entity_id"], "stock_sz_000003")
+            self.assertEqual(query.call_args.kwargs["start_timestamp"], DAYS[1])
+
+            prices = service.get_close_prices(
+                ["stock_sz_000001", "stock_sz_000003", "stock_sz_000002"], DAYS[1], IntervalLevel.LEVEL_1DAY
+            )
+            np.testing.assert_array_equal(prices, [11.0, 20.0, 4.0])
+            self.assertEqual(query.call_count, 2)
+            # 只查询缓存中没有的
+            self.assertEqual(query.call_args.kwargs["entity_ids"], ["stock_sz_000003"])
+
+            query.return_value = None
+            self.assertIsNone(service.get_close_price("stock_sz_000004", DAYS[1], IntervalLevel.LEVEL_1DAY))
+            prices = service.get_close_prices(["stock_sz_000004"], DAYS[1], IntervalLevel.LEVEL_1DAY)
+            self.assertTrue(np.isnan(prices).all())
+
+
+    def test_sim_position_round_trip(self):
+        position = Position(
+            id="sim_test_stock_sz_000001_2024-01-02",
+            entity_id="stock_sz_000001",
+            timestamp=DAYS[0],
+            trader_name="sim_test",
+            long_amount=100,
+            available_long=100,
+            average_long_price=10.0,
+            short_amount=0,
+            available_short=0,
+            average_short_price=0,
+            profit=100.0,
+            profit_rate=0.1,
+            value=1100.0,
+            trading_t=1,
+        )
+        sim_position = SimPosition.from_position(position)
+        result = sim_position.to_position(account_stats_id="account_stats_id")
+        self.assertIsNot(result, position)
+        self.assertEqual(result.account_stats_id, "account_stats_id")
+        for field in SimPosition.__slots__:
+            self.assertEqual(getattr(result, field), getattr(position, field), field)
+
+    def test_keep_history(self):
+        run_account("sim_test", flush_interval=1)
+        latest = self.read_table(AccountStats, "sim_test").iloc[-1]
+
+        service = SimAccountService(
+            entity_schema=Stock,
+            trader_name="sim_test",
+            timestamp=DAYS[-1],
+            adjust_type=AdjustType.hfq,
+            kdata_cache=gen_kdata_cache(),
+            keep_history=True,
+        )
+        # 从最新的记录复制账户, 不修改已保存的记录
+        self.assertIsNone(service.account.id)
+        self.assertEqual(service.account.positions, [])
+        self.assertEqual(service.account.cash, latest["cash"])
+        self.assertEqual(service.account.all_value, latest["all_value"])
+
+        self.assertEqual(list(service.positions.keys()), ["stock_sz_000002"])
+        position = service.positions["stock_sz_000002"]
+        self.assertIsInstance(position, SimPosition)
+        self.assertEqual((position.long_amount, position.average_long_price, position.value), (200, 5.0, 1400))
+        self.assertEqual(service.position_arrays.entity_ids, ["stock_sz_000002"])
+        self.assertEqual(service.position_arrays.long_amounts.tolist(), [200])
+
+        # 继续交易后持久化的持仓
+        day = DAYS[-1] + pd.Timedelta(days=1)
+        service.kdata_cache.end_timestamp = day
+        for entity_id, closes in CLOSES.items():
+            service.kdata_cache.bars[("1d", entity_id)] = (
+                DAYS.append(pd.DatetimeIndex([day])).to_numpy(dtype="datetime64[ns]"),
+                np.array(closes + [closes[-1] + 1]),
+            )
+        service.on_trading_open(day)
+        service.order_by_amount("stock_sz_000002", 8.0, day, OrderType.order_close_long, 100)
+        service.on_trading_close(day)
+        service.on_trading_finish(day)
+
+        position_df = self.read_table(Position, "sim_test")
+        self.assertEqual(position_df["long_amount"].tolist(), [100, 200, 100, 200, 200, 200, 100])
+        self.assertEqual(position_df["average_long_price"].iloc[-1], 5.0)
+        self.assertEqual(len(self.read_table(AccountStats, "sim_test")), len(DAYS) + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,14 +11,17 @@ from core.contract.factor import Factor, TargetType
 from core.contract.normal_data import NormalData
 from core.domain import Stock
 from core.trader import TradingSignal, TradingSignalType, TradingListener
-from core.trader.sim_account import SimAccountService
+from core.trader.kdata_cache import KdataCache
+from core.trader.sim_account import SimAccountService, SimPosition
 from core.trader.trader_info_api import AccountStatsReader
-from core.trader.trader_schemas import AccountStats, Position
+from core.trader.trader_schemas import AccountStats
 from core.utils.time_utils import to_pd_timestamp, now_pd_timestamp, to_time_str, is_same_date, date_time_by_interval
 
 
 class Trader(object):
     entity_schema: Type[TradableEntity] = None
+    #: 回测时每多少个交易日提交一次账户数据
+    account_flush_interval: int = 20
 
     def __init__(
         self,
@@ -86,6 +89,19 @@ class Trader(object):
         self.trading_signals: List[TradingSignal] = []
         self.trading_signal_listeners: List[TradingListener] = []
 
+        # 回测时k线不会变化,一次读入下单和收盘估值需要的k线
+        self.kdata_cache = None
+        if not self.real_time:
+            self.kdata_cache = KdataCache(
+                provider=self.provider,
+                adjust_type=self.adjust_type,
+                start_timestamp=self.start_timestamp,
+                end_timestamp=date_time_by_interval(self.end_timestamp, 1),
+            )
+            if self.entity_ids:
+                for level in {self.level, IntervalLevel.LEVEL_1DAY}:
+                    self.kdata_cache.load(self.entity_ids, level=level)
+
         self.account_service = SimAccountService(
             entity_schema=self.entity_schema,
             trader_name=self.trader_name,
@@ -95,6 +111,8 @@ class Trader(object):
             rich_mode=self.rich_mode,
             adjust_type=self.adjust_type,
             keep_history=self.keep_history,
+            kdata_cache=self.kdata_cache,
+            flush_interval=1 if self.real_time else self.account_flush_interval,
         )
 
         self.register_trading_signal_listener(self.account_service)
@@ -217,8 +235,8 @@ class Trader(object):
     def get_current_account(self) -> AccountStats:
         return self.account_service.get_current_account()
 
-    def get_current_positions(self) -> List[Position]:
-        return self.get_current_account().positions
+    def get_current_positions(self) -> List[SimPosition]:
+        return self.account_service.get_positions()
 
     def long_position_control(self):
         positions = self.get_current_positions()
@@ -259,13 +277,11 @@ class Trader(object):
 
     def buy(self, timestamp, entity_ids, ignore_in_position=True):
         if ignore_in_position:
-            account = self.get_current_account()
+            positions = self.get_current_positions()
             current_holdings = []
-            if account.positions:
+            if positions:
                 current_holdings = [
-                    position.entity_id
-                    for position in account.positions
-                    if position != None and position.available_long > 0
+                    position.entity_id for position in positions if position != None and position.available_long > 0
                 ]
 
             entity_ids = set(entity_ids) - set(current_holdings)
@@ -288,11 +304,11 @@ class Trader(object):
 
     def sell(self, timestamp, entity_ids):
         # current position
-        account = self.get_current_account()
+        positions = self.get_current_positions()
         current_holdings = []
-        if account.positions:
+        if positions:
             current_holdings = [
-                position.entity_id for position in account.positions if position != None and position.available_long > 0
+                position.entity_id for position in positions if position != None and position.available_long > 0
             ]
 
         shorted = set(current_holdings) & set(entity_ids)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from core.trading.trading_models import DataFormat
+from core.trading.trading_service import KDATA_DATA_COLUMNS, build_arrow_stream, build_entity_datas
+from core.utils.testing import gen_kdata_df
+
+
+COMMON_COLUMNS = ["code", "name", "level"]
+
+
+def small_kdata_df() -> pd.DataFrame:
+    """两个标的两天的k线, 和数据库返回的一样按timestamp排序"""
+    return pd.DataFrame(
+        {
+            "entity_id": ["stock_sz_000001", "stock_sz_000002"] * 2,
+            "code": ["000001", "000002"] * 2,
+            "name": ["平安银行", "万科A"] * 2,
+            "level": "1d",
+            "timestamp": pd.to_datetime(["2024-01-02", "2024-01-02", "2024-01-03", "2024-01-03"]),
+            "open": [10.0, 8.0, 10.5, 7.5],
+            "high": [10.8, 8.2, 10.9, 7.9],
+            "low": [9.9, 7.6, 10.1, 7.2],
+            "close": [10.5, 7.8, 10.2, 7.4],
+            "volume": [1000.0, 2000.0, 1500.0, 1800.0],
+            "turnover": [10500.0, 15600.0, 15300.0, 13320.0],
+            "change_pct": [0.05, -0.025, -0.0286, -0.0513],
+            "turnover_rate": [0.01, 0.02, 0.015, 0.018],
+        }
+    )
+
+
+#: 2024-01-02, 2024-01-03 00:00:00 UTC
+TIMESTAMPS = [1704153600, 1704240000]
+EXPECTED_ROWS = {
+    "stock_sz_000001": [
+        [TIMESTAMPS[0], 10.0, 10.8, 9.9, 10.5, 1000.0, 10500.0, 0.05, 0.01],
+        [TIMESTAMPS[1], 10.5, 10.9, 10.1, 10.2, 1500.0, 15300.0, -0.0286, 0.015],
+    ],
+    "stock_sz_000002": [
+        [TIMESTAMPS[0], 8.0, 8.2, 7.6, 7.8, 2000.0, 15600.0, -0.025, 0.02],
+        [TIMESTAMPS[1], 7.5, 7.9, 7.2, 7.4, 1800.0, 13320.0, -0.0513, 0.018],
+    ],
+}
+EXPECTED_COMMON = {
+    "stock_sz_000001": {"code": "000001", "name": "平安银行", "level": "1d"},
+    "stock_sz_000002": {"code": "000002", "name": "万科A", "level": "1d"},
+}
+
+
+def build(kdata_df: pd.DataFrame, data_format: DataFormat):
+    kdata_df["timestamp"] = kdata_df["timestamp"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+    if data_format == DataFormat.arrow:
+        return build_arrow_stream(kdata_df, KDATA_DATA_COLUMNS, COMMON_COLUMNS)
+    return build_entity_datas(kdata_df, KDATA_DATA_COLUMNS, COMMON_COLUMNS, data_format)
+
+
+class BuildEntityDatasTest(unittest.TestCase):
+    """query_kdata response test"""
+
+    def setUp(self):
+        self.kdata_df = small_kdata_df()
+
+    def test_rows(self):
+        result = build(self.kdata_df.copy(), DataFormat.rows)
+        self.assertEqual(
+            result,
+            [
+                {"entity_id": entity_id, **EXPECTED_COMMON[entity_id], "columns": KDATA_DATA_COLUMNS, "datas": datas}
+                for entity_id, datas in EXPECTED_ROWS.items()
+            ],
+        )
+
+    def test_columns(self):
+        result = build(self.kdata_df.copy(), DataFormat.columns)
+        self.assertEqual(
+            result,
+            [
+                {
+                    "entity_id": entity_id,
+                    **EXPECTED_COMMON[entity_id],
+                    "columns": KDATA_DATA_COLUMNS,
+                    "datas": [list(column) for column in zip(*datas)],
+                }
+                for entity_id, datas in EXPECTED_ROWS.items()
+            ],
+        )
+
+    def test_arrow(self):
+        table = pa.ipc.open_stream(build(self.kdata_df.copy(), DataFormat.arrow)).read_all()
+        self.assertEqual(table.column_names, ["entity_id"] + COMMON_COLUMNS + KDATA_DATA_COLUMNS)
+        self.assertEqual(table.column("entity_id").to_pylist(), ["stock_sz_000001"] * 2 + ["stock_sz_000002"] * 2)
+        self.assertEqual(table.column("name").to_pylist(), ["平安银行"] * 2 + ["万科A"] * 2)
+        rows = [datas for entity_datas in EXPECTED_ROWS.values() for datas in entity_datas]
+        for i, column in enumerate(KDATA_DATA_COLUMNS):
+            self.assertEqual(table.column(column).to_pylist(), [row[i] for row in rows])
+
+    def test_formats_agree(self):
+        kdata_df = gen_kdata_df(20, 30, columns=KDATA_DATA_COLUMNS[1:])
+        rows = build(kdata_df.copy(), DataFormat.rows)
+        columns = build(kdata_df.copy(), DataFormat.columns)
+        self.assertEqual(len(rows), 20)
+        self.assertEqual([list(map(list, zip(*record["datas"]))) for record in columns], [r["datas"] for r in rows])
+        table = pa.ipc.open_stream(build(kdata_df.copy(), DataFormat.arrow)).read_all()
+        self.assertEqual(table.num_rows, len(kdata_df))
+        self.assertEqual(table.column("close").to_pylist(), [data[4] for record in rows for data in record["datas"]])
+
+    def test_empty_arrow(self):
+        table = pa.ipc.open_stream(build_arrow_stream(None, KDATA_DATA_COLUMNS, COMMON_COLUMNS)).read_all()
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.column_names, ["entity_id"] + COMMON_COLUMNS + KDATA_DATA_COLUMNS)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
+from enum import Enum
 from typing import List, Optional
 from typing import Union
 
@@ -16,6 +17,15 @@ from core.utils.time_utils import date_time_by_interval, current_date
 from core.utils.time_utils import tomorrow_date, to_pd_timestamp
 
 
+class DataFormat(Enum):
+    #: datas为行的列表, 每行按columns的顺序
+    rows = "rows"
+    #: datas为列的列表, 每列按columns的顺序, 比rows紧凑
+    columns = "columns"
+    #: 所有标的在一个Arrow IPC stream中
+    arrow = "arrow"
+
+
 class KdataRequestModel(BaseModel):
     entity_ids: List[str]
     data_provider: str = Field(default="qmt")
@@ -31,6 +41,8 @@ class KdataModel(BaseModel):
     name: str
     level: IntervalLevel = Field(default=IntervalLevel.LEVEL_1DAY)
     datas: List
+    #: datas中数据的列名
+    columns: Optional[List[str]] = Field(default=None)
 
 
 class TSRequestModel(BaseModel):
@@ -44,6 +56,8 @@ class TSModel(BaseModel):
     code: str
     name: str
     datas: List
+    #: datas中数据的列名
+    columns: Optional[List[str]] = Field(default=None)
 
 
 class QuoteStatsModel(BaseModel):
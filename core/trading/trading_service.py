@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 import logging
-from typing import List
+from typing import List, Optional
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from fastapi_pagination.ext.sqlalchemy import paginate
 
 import core.api.kdata as kdata_api
@@ -19,6 +21,7 @@ from core.trading.trading_models import (
     BuildQueryStockQuoteSettingModel,
     KdataRequestModel,
     TSRequestModel,
+    DataFormat,
 )
 from core.trading.trading_schemas import TradingPlan, QueryStockQuoteSetting, TagQuoteStats
 from core.utils.pd_utils import pd_is_not_null
@@ -34,7 +37,72 @@ from core.utils.time_utils import (
 logger = logging.getLogger(__name__)
 
 
-def query_kdata(kdata_request_model: KdataRequestModel):
+KDATA_DATA_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume", "turnover", "change_pct", "turnover_rate"]
+TS_DATA_COLUMNS = ["time", "price", "avg_price", "change_pct", "volume", "turnover", "turnover_rate"]
+
+
+def build_entity_datas(
+    df: pd.DataFrame, data_columns: List[str], meta_columns: List[str], data_format: DataFormat = DataFormat.rows
+) -> List[dict]:
+    """
+    按entity_id分组, 每个标的一个记录, 包含meta_columns的第一个值和data_columns组成的datas
+
+    数据按entity_id稳定排序后, 每列只转换一次为list, 再按分组的边界切片
+
+    :param df:
+    :param data_columns: datas的列
+    :param meta_columns: 每个标的取第一个值的列
+    :param data_format: rows为行的列表, columns为列的列表
+    :return:
+    """
+    df = df.sort_values("entity_id", kind="stable", ignore_index=True)
+    entity_ids = df["entity_id"].to_numpy()
+    starts = np.flatnonzero(np.append(True, entity_ids[1:] != entity_ids[:-1]))
+    ends = np.append(starts[1:], len(entity_ids))
+
+    columns = [df[column].to_numpy().tolist() for column in data_columns]
+    if data_format == DataFormat.rows:
+        rows = list(map(list, zip(*columns)))
+    meta_df = df.groupby("entity_id", sort=False)[meta_columns].first()
+
+    records = []
+    for entity_id, meta, start, end in zip(
+        entity_ids[starts].tolist(), meta_df.to_dict(orient="records"), starts.tolist(), ends.tolist()
+    ):
+        if data_format == DataFormat.rows:
+            datas = rows[start:end]
+        else:
+            datas = [column[start:end] for column in columns]
+        records.append({"entity_id": entity_id, **meta, "columns": data_columns, "datas": datas})
+    return records
+
+
+def build_arrow_stream(df: Optional[pd.DataFrame], data_columns: List[str], meta_columns: List[str]) -> bytes:
+    """
+    按entity_id稳定排序后的Arrow IPC stream, 没有数据时为只有schema的stream
+
+    :param df:
+    :param data_columns: 第一列为UNIX时间戳
+    :param meta_columns:
+    :return:
+    """
+    if pd_is_not_null(df):
+        df = df.sort_values("entity_id", kind="stable", ignore_index=True)
+        table = pa.Table.from_pandas(df[["entity_id"] + meta_columns + data_columns], preserve_index=False)
+    else:
+        schema = pa.schema(
+            [(column, pa.string()) for column in ["entity_id"] + meta_columns]
+            + [(data_columns[0], pa.int64())]
+            + [(column, pa.float64()) for column in data_columns[1:]]
+        )
+        table = schema.empty_table()
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def query_kdata(kdata_request_model: KdataRequestModel, data_format: DataFormat = DataFormat.rows):
     kdata_df = kdata_api.get_kdata(
         entity_ids=kdata_request_model.entity_ids,
         provider=kdata_request_model.data_provider,
@@ -42,45 +110,28 @@ def query_kdata(kdata_request_model: KdataRequestModel):
         end_timestamp=kdata_request_model.end_timestamp,
         adjust_type=kdata_request_model.adjust_type,
     )
+    if data_format == DataFormat.arrow and not pd_is_not_null(kdata_df):
+        return build_arrow_stream(None, KDATA_DATA_COLUMNS, ["code", "name", "level"])
     if pd_is_not_null(kdata_df):
-        kdata_df["timestamp"] = kdata_df["timestamp"].apply(lambda x: int(x.timestamp()))
-        kdata_df["data"] = kdata_df.apply(
-            lambda x: x[
-                ["timestamp", "open", "high", "low", "close", "volume", "turnover", "change_pct", "turnover_rate"]
-            ].values.tolist(),
-            axis=1,
-        )
-        df = kdata_df.groupby("entity_id").agg(
-            code=("code", "first"),
-            name=("name", "first"),
-            level=("level", "first"),
-            datas=("data", lambda data: list(data)),
-        )
-        df = df.reset_index(drop=False)
-        return df.to_dict(orient="records")
+        kdata_df["timestamp"] = kdata_df["timestamp"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+        if data_format == DataFormat.arrow:
+            return build_arrow_stream(kdata_df, KDATA_DATA_COLUMNS, ["code", "name", "level"])
+        return build_entity_datas(kdata_df, KDATA_DATA_COLUMNS, ["code", "name", "level"], data_format)
 
 
-def query_ts(ts_request_model: TSRequestModel):
+def query_ts(ts_request_model: TSRequestModel, data_format: DataFormat = DataFormat.rows):
     trading_dates = kdata_api.get_recent_trade_dates(days_count=ts_request_model.days_count)
     ts_df = Stock1mQuote.query_data(
         entity_ids=ts_request_model.entity_ids,
         provider=ts_request_model.data_provider,
         start_timestamp=trading_dates[0],
     )
+    if data_format == DataFormat.arrow and not pd_is_not_null(ts_df):
+        return build_arrow_stream(None, TS_DATA_COLUMNS, ["code", "name"])
     if pd_is_not_null(ts_df):
-        ts_df["data"] = ts_df.apply(
-            lambda x: x[
-                ["time", "price", "avg_price", "change_pct", "volume", "turnover", "turnover_rate"]
-            ].values.tolist(),
-            axis=1,
-        )
-        df = ts_df.groupby("entity_id").agg(
-            code=("code", "first"),
-            name=("name", "first"),
-            datas=("data", lambda data: list(data)),
-        )
-        df = df.reset_index(drop=False)
-        return df.to_dict(orient="records")
+        if data_format == DataFormat.arrow:
+            return build_arrow_stream(ts_df, TS_DATA_COLUMNS, ["code", "name"])
+        return build_entity_datas(ts_df, TS_DATA_COLUMNS, ["code", "name"], data_format)
 
 
 def build_trading_plan(build_trading_plan_model: BuildTradingPlanModel):
@@ -440,6 +491,10 @@ if __name__ == "__main__":
     print(query_quote_stats())
 # the __all__ is generated
 __all__ = [
+    "build_entity_datas",
+    "build_arrow_stream",
+    "query_kdata",
+    "query_ts",
     "build_trading_plan",
     "query_trading_plan",
     "get_current_trading_plan",
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+
+
+class TokenBucket(object):
+    """
+    thread safe token bucket, refill rate tokens per second and burst at most capacity tokens
+    """
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        assert rate > 0
+        self.rate = rate
+        self.capacity = capacity if capacity else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        """
+        block until the tokens are available
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter(object):
+    """
+    token bucket per host, e.g. {"push2his.eastmoney.com": 5} means 5 requests per second for the host
+    """
+
+    def __init__(self, host_rates: Dict[str, float] = None, default_rate: float = None) -> None:
+        self.host_rates = host_rates or {}
+        self.default_rate = default_rate
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, host: str):
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if not bucket:
+                rate = self.host_rates.get(host, self.default_rate)
+                if not rate:
+                    return None
+                bucket = TokenBucket(rate=rate)
+                self.buckets[host] = bucket
+            return bucket
+
+    def acquire(self, url_or_host: str):
+        host = urlparse(url_or_host).hostname if "://" in url_or_host else url_or_host
+        bucket = self.get_bucket(host)
+        if bucket:
+            bucket.acquire()
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    requests adapter which waits for the rate limiter of the request host before sending
+    """
+
+    def __init__(self, rate_limiter: HostRateLimiter, **kwargs) -> None:
+        self.rate_limiter = rate_limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.rate_limiter.acquire(request.url)
+        return super().send(request, **kwargs)
+
+
+def mount_rate_limiter(session, rate_limiter: HostRateLimiter, pool_maxsize: int = 10):
+    """
+    apply the rate limiter to all the requests of the session
+
+    :param session: requests session
+    :param rate_limiter: host rate limiter
+    :param pool_maxsize: connections kept for every host, set it to the worker count for concurrent requests
+    """
+    adapter = RateLimitedAdapter(rate_limiter, pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# the __all__ is generated
+__all__ = ["TokenBucket", "HostRateLimiter", "RateLimitedAdapter", "mount_rate_limiter"]
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+单元测试共用的数据和数据库工具
+"""
+import os
+import tempfile
+import unittest
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Column, Float, create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import declarative_base
+
+from core.contract.api import get_db_session_factory
+from core.contract.context import zvt_context
+from core.contract.data_string import String
+from core.contract.register import register_schema
+from core.contract.schema import Mixin, TradableEntity
+
+#: 测试用的schema, 不依赖core.domain, 通过use_sqlite_db绑定到临时的sqlite
+MockBase = declarative_base()
+MOCK_PROVIDER = "mock"
+MOCK_DB_NAME = "mock"
+
+
+class MockEntity(MockBase, TradableEntity):
+    __tablename__ = "mock_stock"
+
+
+class MockKdata(MockBase, Mixin):
+
+    __tablename__ = "mock_1d_kdata"
+
+    code = Column(String(length=32))
+    name = Column(String(length=32))
+    level = Column(String(length=32))
+    open = Column(Float)
+    close = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    volume = Column(Float)
+
+
+MockEntity.register_provider(MOCK_PROVIDER)
+MockKdata.register_provider(MOCK_PROVIDER)
+
+
+def use_sqlite_db(test_case: unittest.TestCase, provider: str, db_name: str, schema_base) -> Engine:
+    """
+    把provider和db_name对应的数据库换成临时的sqlite文件并建表, 测试结束时恢复原来的engine
+
+    :param test_case: the test case to register the cleanup
+    :param provider: data provider
+    :param db_name: db name
+    :param schema_base: declarative base of the schemas
+    :return: the sqlite engine
+    """
+    tmp = tempfile.TemporaryDirectory()
+    engine = create_engine(
+        f"sqlite:///{os.path.join(tmp.name, db_name)}.db", connect_args={"check_same_thread": False}
+    )
+    key = f"{provider}_{db_name}"
+    old_engine = zvt_context.db_engine_map.get(key)
+    old_session = zvt_context.sessions.pop(key, None)
+    zvt_context.db_engine_map[key] = engine
+
+    registered = db_name in zvt_context.provider_map_dbnames.get(provider, [])
+    if registered and schema_base in zvt_context.dbname_map_base.get(db_name, []):
+        schema_base.metadata.create_all(bind=engine)
+        get_db_session_factory(provider, db_name=db_name).configure(bind=engine)
+    else:
+        register_schema(providers=[provider], db_name=db_name, schema_base=schema_base)
+
+    def restore():
+        session = zvt_context.sessions.pop(key, None)
+        if session:
+            session.close()
+        if old_session:
+            zvt_context.sessions[key] = old_session
+        if old_engine:
+            zvt_context.db_engine_map[key] = old_engine
+            get_db_session_factory(provider, db_name=db_name).configure(bind=old_engine)
+        else:
+            zvt_context.db_engine_map.pop(key, None)
+        engine.dispose()
+        tmp.cleanup()
+
+    test_case.addCleanup(restore)
+    return engine
+
+
+def gen_kdata_df(
+    entity_count: int = 20,
+    size: int = 30,
+    columns: Sequence[str] = ("close",),
+    start_timestamp: str = "2023-01-01",
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    随机游走的日k线, 和数据库返回的一样按timestamp, entity_id排序
+
+    :param entity_count: 标的个数
+    :param size: 每个标的的k线个数
+    :param columns: 数据列, open/close/high/low为价格, 其他为(0,100)的随机数
+    :param start_timestamp: 第一根k线的时间
+    :param seed: 随机数种子
+    :return: entity_id, code, name, level, timestamp和数据列
+    """
+    rng = np.random.default_rng(seed)
+    codes = [f"{i:06d}" for i in range(entity_count)]
+    df = pd.DataFrame(
+        {
+            "entity_id": np.repeat([f"stock_sz_{code}" for code in codes], size),
+            "code": np.repeat(codes, size),
+            "name": np.repeat([f"name{i}" for i in range(entity_count)], size),
+            "level": "1d",
+            "timestamp": np.tile(pd.date_range(start_timestamp, periods=size), entity_count),
+        }
+    )
+    close = (10 + rng.standard_normal((entity_count, size)).cumsum(axis=1) * 0.1).ravel()
+    for column in columns:
+        if column == "close":
+            df[column] = close
+        elif column in ("open", "high", "low"):
+            df[column] = close + rng.standard_normal(len(close)) * 0.05
+        else:
+            df[column] = rng.random(len(close)) * 100
+    return df.sort_values(["timestamp", "entity_id"], ignore_index=True)
+
+
+# the __all__ is generated
+__all__ = ["MockBase", "MOCK_PROVIDER", "MOCK_DB_NAME", "MockEntity", "MockKdata", "use_sqlite_db", "gen_kdata_df"]
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+from core.utils import rate_limiter
+from core.utils.rate_limiter import HostRateLimiter, RateLimitedAdapter, TokenBucket, mount_rate_limiter
+
+
+class FakeClock(object):
+    """
+    sleep只推进时间, 记录每次等待的秒数, 测试中的速率都是2的幂, 时间的计算没有误差
+    """
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps = []
+        self.lock = threading.Lock()
+
+    def monotonic(self):
+        with self.lock:
+            return self.now
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.sleeps.append(seconds)
+            self.now += seconds
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        patcher = mock.patch.object(rate_limiter, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+        # 桶空了, 每个token等待1/rate秒
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5, 0.5])
+
+    def test_refill(self):
+        bucket = TokenBucket(rate=2)
+        self.assertEqual(bucket.capacity, 2)
+        bucket.acquire(2)
+        # 经过1秒补满, 但不超过capacity
+        self.clock.now += 10
+        bucket.acquire(2)
+        self.assertEqual(self.clock.sleeps, [])
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5])
+
+    def test_rate(self):
+        bucket = TokenBucket(rate=4, capacity=1)
+        for _ in range(9):
+            bucket.acquire()
+        # 第一个是桶中已有的, 之后每秒4个
+        self.assertEqual(self.clock.now, 2.0)
+
+    def test_concurrent_acquire(self):
+        bucket = TokenBucket(rate=8, capacity=1)
+        threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(5)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 20次请求, 除了第一个都要等待补充, 多线程同时等待也不会多发
+        self.assertGreaterEqual(self.clock.now, 19 / 8)
+        self.assertLessEqual(bucket.tokens, 1)
+
+    def test_host_rate_limiter(self):
+        limiter = HostRateLimiter(host_rates={"push2his.eastmoney.com": 1})
+        limiter.acquire("https://push2his.eastmoney.com/api/qt/stock/kline/get?secid=1.600000")
+        # 其他host不限制, 也不创建bucket
+        for _ in range(5):
+            limiter.acquire("https://push2.eastmoney.com/api/qt/clist/get")
+        self.assertEqual(self.clock.sleeps, [])
+        self.assertEqual(list(limiter.buckets.keys()), ["push2his.eastmoney.com"])
+
+        limiter.acquire("push2his.eastmoney.com")
+        self.assertEqual(self.clock.sleeps, [1.0])
+
+    def test_default_rate(self):
+        limiter = HostRateLimiter(host_rates={"a.com": 1}, default_rate=2)
+        limiter.acquire("http://b.com/1")
+        limiter.acquire("http://b.com/2")
+        limiter.acquire("http://b.com/3")
+        limiter.acquire("http://a.com/1")
+        self.assertEqual(self.clock.sleeps, [0.5])
+        self.assertEqual(limiter.buckets["b.com"].rate, 2)
+        self.assertEqual(limiter.buckets["a.com"].rate, 1)
+
+    def test_mount_rate_limiter(self):
+        limiter = HostRateLimiter(host_rates={"a.com": 1})
+        session = mount_rate_limiter(requests.Session(), limiter, pool_maxsize=4)
+        adapter = session.get_adapter("https://a.com/1")
+        self.assertIsInstance(adapter, RateLimitedAdapter)
+        self.assertIs(adapter.rate_limiter, limiter)
+        self.assertEqual(adapter._pool_maxsize, 4)
+
+        with mock.patch("requests.adapters.HTTPAdapter.send", return_value="sent") as send:
+            self.assertEqual(session.get_adapter("http://a.com").send(mock.Mock(url="http://a.com/x")), "sent")
+            self.assertEqual(session.get_adapter("http://a.com").send(mock.Mock(url="http://a.com/y")), "sent")
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(self.clock.sleeps, [1.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -23,44 +23,79 @@ def calculate_technical_indicators(data, symbol_dict, lookback_days=20):
         data[f'涨跌幅_{name}'] = (data[f'收盘_{name}'] - data[f'收盘_{name}_1']) / data[f'收盘_{name}_1']
     return data
 
+def select_indices(pct_matrix):
+    """
+    选择每日收益率最高的标的序号，收益率不为正（或有缺失）时为-1
+    """
+    max_indices = np.argmax(pct_matrix, axis=1)
+    max_values = np.take_along_axis(pct_matrix, max_indices[:, None], axis=1).flatten()
+    return np.where(max_values > 0, max_indices, -1)
+
 def select_stocks(data, symbol_dict):
     """
     执行选股逻辑，选择收益率最高的股票
     """
     pct_columns = [f'收盘_{name}_pct' for name in symbol_dict]
-    pct_matrix = data[pct_columns].values
-    max_indices = np.argmax(pct_matrix, axis=1)
-    max_values = np.take_along_axis(pct_matrix, max_indices[:, None], axis=1).flatten()
+    selected = select_indices(data[pct_columns].values)
 
     stocks = np.array(list(symbol_dict.keys()))
     data['下一日购买标的'] = np.where(
-        max_values > 0,
-        stocks[max_indices],
+        selected >= 0,
+        stocks[selected],
         None
     )
     return data
 
+def run_rotation_engine(open_matrix, close_matrix, held):
+    """
+    按每日持有的标的序号计算每日收益率
+
+    :param open_matrix: 开盘价矩阵，行是日期，列是标的
+    :param close_matrix: 收盘价矩阵
+    :param held: 当日持有的标的序号，-1为空仓
+    """
+    held = np.asarray(held)
+    size = len(held)
+    profit = np.zeros(size)
+    if size < 2:
+        return profit
+
+    rows = np.arange(1, size)
+    current = held[1:]
+    holding = current >= 0
+    # 换仓（前一日无持仓或切换标的）当日开盘买入，否则持有上一日的标的
+    switch = holding & (held[:-1] != current)
+    keep = holding & ~switch
+    columns = np.where(holding, current, 0)
+
+    close_price = close_matrix[rows, columns]
+    open_price = open_matrix[rows, columns]
+    close_price_pre = close_matrix[rows - 1, columns]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        profit[1:][switch] = ((close_price - open_price) / open_price)[switch]
+        profit[1:][keep] = ((close_price - close_price_pre) / close_price_pre)[keep]
+    return profit
+
+def performance_metrics(net_value):
+    """
+    计算每日的最大回撤和年化收益率，最大回撤为相对之前最高净值的回撤
+    """
+    net_value = np.asarray(net_value, dtype=float)
+    profit_ratio = (net_value - 1) * 365 / np.arange(1, len(net_value) + 1)
+    max_backup = np.empty(len(net_value))
+    if len(net_value):
+        max_backup[0] = abs(net_value[0] - 1)
+        pre_max = np.fmax.accumulate(net_value)[:-1]
+        max_backup[1:] = (pre_max - net_value[1:]) / pre_max
+    return max_backup, profit_ratio
+
 def calculate_performance_metrics(data):
     """
     计算绩效指标：最大回撤、年化收益率等
     """
-    max_backup_list = []
-    profit_ratio_list = []
-    net_value_list = data['累计净值'].values.tolist()
-
-    for i in range(len(net_value_list)):
-        # 年化收益率
-        profit_ratio_list.append((net_value_list[i] - 1) * 365 / (i + 1))
-
-        # 最大回撤
-        if i == 0:
-            max_backup_list.append(abs(net_value_list[i] - 1))
-        else:
-            tmp_value = (max(net_value_list[:i]) - net_value_list[i]) / max(net_value_list[:i])
-            max_backup_list.append(tmp_value)
-
-    data['最大回撤'] = max_backup_list
-    data['年化收益率'] = profit_ratio_list
+    max_backup, profit_ratio = performance_metrics(data['累计净值'].values)
+    data['最大回撤'] = max_backup
+    data['年化收益率'] = profit_ratio
     return data
 
 def backtest_strategy(data, symbol_dict):
@@ -70,28 +105,62 @@ def backtest_strategy(data, symbol_dict):
     data = data.copy()
     data.index = range(data.shape[0])
     data['当日购买标的'] = data['下一日购买标的'].shift(1)
-    buy_etf_list = data['当日购买标的'].values.tolist()
-    profit_list = [0]  # 初始收益为0
-
-    for i in range(1, len(buy_etf_list)):
-        # 情况1：当日无买入信号
-        if buy_etf_list[i] is None:
-            profit_list.append(0)
-        # 情况2：换仓（前一日无持仓或切换股票）
-        elif buy_etf_list[i - 1] is None or buy_etf_list[i - 1] != buy_etf_list[i]:
-            open_price = data.loc[i, f'开盘_{buy_etf_list[i]}']
-            close_price = data.loc[i, f'收盘_{buy_etf_list[i]}']
-            profit_list.append((close_price - open_price) / open_price)  # 当日买入的收益率
-        else: # 情况3：持有上一日的股票
-            close_price_pre = data.loc[i - 1, f'收盘_{buy_etf_list[i]}']
-            close_price = data.loc[i, f'收盘_{buy_etf_list[i]}']
-            profit_list.append((close_price - close_price_pre) / close_price_pre) # 持有收益率
-
-    data['购买标的涨跌幅'] = profit_list
+
+    names = list(symbol_dict.keys())
+    name_indices = {name: i for i, name in enumerate(names)}
+    held = np.array([name_indices.get(name, -1) if isinstance(name, str) else -1 for name in data['当日购买标的']])
+    open_matrix = data[[f'开盘_{name}' for name in names]].to_numpy(dtype=float)
+    close_matrix = data[[f'收盘_{name}' for name in names]].to_numpy(dtype=float)
+
+    profit = run_rotation_engine(open_matrix, close_matrix, held)
+    # 一直空仓时收益率都是整数0
+    if not (held[1:] >= 0).any():
+        profit = profit.astype(np.int64)
+    data['购买标的涨跌幅'] = profit
     data['净值'] = 1 + data['购买标的涨跌幅']
     data['累计净值'] = data['净值'].cumprod()
     return data
 
+def backtest_rotation_grid(data, symbol_dict, lookback_days_list=range(5, 61), symbol_sets=None):
+    """
+    批量回测轮动周期和标的组合，返回每个组合的最终净值、最大回撤和年化收益率
+
+    :param data: get_zh_history获取的数据
+    :param symbol_dict: 所有标的
+    :param lookback_days_list: 轮动周期
+    :param symbol_sets: 标的组合，默认为所有标的
+    """
+    names = list(symbol_dict.keys())
+    if symbol_sets is None:
+        symbol_sets = [names]
+    data = data.reset_index(drop=True)
+    close_df = data[[f'收盘_{name}' for name in names]]
+    open_matrix = data[[f'开盘_{name}' for name in names]].to_numpy(dtype=float)
+    close_matrix = close_df.to_numpy(dtype=float)
+    name_indices = {name: i for i, name in enumerate(names)}
+
+    records = []
+    for lookback_days in lookback_days_list:
+        # 和calculate_technical_indicators的计算一致
+        change = close_df.pct_change(lookback_days)
+        pct_matrix = ((close_df - change) / change).to_numpy(dtype=float)
+        for symbol_set in symbol_sets:
+            columns = np.array([name_indices[name] for name in symbol_set])
+            selected = select_indices(pct_matrix[:, columns])
+            held = np.full(len(selected), -1)
+            held[1:] = np.where(selected[:-1] >= 0, columns[selected[:-1]], -1)
+            # 和backtest_strategy一样, 缺失价格当日的净值为空, 之后的净值跳过该日继续累乘
+            net_value = pd.Series(1 + run_rotation_engine(open_matrix, close_matrix, held)).cumprod().to_numpy()
+            max_backup, profit_ratio = performance_metrics(net_value)
+            records.append({
+                '轮动周期': lookback_days,
+                '标的组合': ','.join(symbol_set),
+                '最终净值': net_value[-1] if len(net_value) else np.nan,
+                '最大回撤': np.nanmax(max_backup) if len(max_backup) else np.nan,
+                '年化收益率': profit_ratio[-1] if len(profit_ratio) else np.nan,
+            })
+    return pd.DataFrame(records)
+
 
 def display_results(data, symbol_dict):
     """
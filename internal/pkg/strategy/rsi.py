@@ -4,6 +4,9 @@ import matplotlib.pyplot as plt
 from matplotlib.font_manager import FontProperties
 import platform
 
+import numpy as np
+import pandas as pd
+
 
 # 设置中文字体
 def set_chinese_font():
@@ -46,6 +49,60 @@ def calculate_rsi(data, period=14):
     return data
 
 
+# RSI上穿超卖线买入, 下穿超买线卖出, 信号在下一根k线开盘执行
+def rsi_cross_signals(rsi, overbought=70, oversold=30):
+    rsi = np.asarray(rsi, dtype=float)
+    buy = np.zeros(len(rsi), dtype=bool)
+    sell = np.zeros(len(rsi), dtype=bool)
+    if len(rsi) > 2:
+        prev, prev2 = rsi[1:-1], rsi[:-2]
+        buy[2:] = (prev > oversold) & (prev2 <= oversold)
+        sell[2:] = ~buy[2:] & (prev < overbought) & (prev2 >= overbought)
+    return buy, sell
+
+
+# 回测引擎, 持仓和现金只在信号处变化, 只遍历信号再向后填充
+def run_rsi_engine(open_prices, buy, sell, initial_capital=100000, trade_volume=100, commission_rate=0.0003):
+    size = len(open_prices)
+    signal = np.zeros(size, dtype=np.int64)
+    trade_amount = np.zeros(size, dtype=np.float64)
+    # 状态变化的位置和变化后的持仓, 现金
+    changed = [0]
+    positions = [0]
+    cashes = [float(initial_capital)]
+
+    position = 0
+    cash = float(initial_capital)
+    for i in np.flatnonzero(buy | sell):
+        if buy[i]:
+            buy_cost = open_prices[i] * trade_volume * (1 + commission_rate)
+            if cash >= buy_cost:
+                signal[i] = 1
+                position = position + trade_volume
+                cash = float(cash - buy_cost)
+                trade_amount[i] = -buy_cost
+            else:
+                continue
+        elif position >= trade_volume:
+            sell_revenue = open_prices[i] * trade_volume * (1 - commission_rate)
+            signal[i] = -1
+            position = position - trade_volume
+            cash = cash + sell_revenue
+            trade_amount[i] = sell_revenue
+        else:
+            continue
+        changed.append(i)
+        positions.append(position)
+        cashes.append(cash)
+
+    last_changed = np.zeros(size, dtype=np.int64)
+    last_changed[changed] = np.arange(len(changed))
+    last_changed = np.maximum.accumulate(last_changed)
+    position = np.asarray(positions, dtype=np.int64)[last_changed]
+    cash = np.asarray(cashes, dtype=np.float64)[last_changed]
+    return signal, position, cash, trade_amount
+
+
 # 回测策略
 def backtest_rsi_strategy(data, initial_capital=100000, trade_volume=100, commission_rate=0.0003, rsi_period=14,
                           overbought=70, oversold=30):
@@ -61,43 +118,54 @@ def backtest_rsi_strategy(data, initial_capital=100000, trade_volume=100, commis
     float_cols = ['cash', 'stock_value', 'total_asset']
     data[float_cols] = data[float_cols].astype('float64')
 
-    for i in range(1, len(data)):
-        prev_row = data.iloc[i - 1]
-        current_row = data.iloc[i]
-
-        data.iloc[i, data.columns.get_loc('position')] = prev_row['position']
-        data.iloc[i, data.columns.get_loc('cash')] = prev_row['cash']
-        data.iloc[i, data.columns.get_loc('signal')] = 0
-        data.iloc[i, data.columns.get_loc('trade_amount')] = 0
-
-        # 买入信号
-        if i >= 2 and prev_row['RSI'] > oversold and data.iloc[i - 2]['RSI'] <= oversold:
-            current_open = current_row['开盘']
-            buy_cost = current_open * trade_volume * (1 + commission_rate)
-            if prev_row['cash'] >= buy_cost:
-                data.iloc[i, data.columns.get_loc('signal')] = 1
-                data.iloc[i, data.columns.get_loc('position')] = prev_row['position'] + trade_volume
-                data.iloc[i, data.columns.get_loc('cash')] = float(prev_row['cash'] - buy_cost)
-                data.iloc[i, data.columns.get_loc('trade_amount')] = -buy_cost
-
-        # 卖出信号
-        elif i >= 2 and prev_row['RSI'] < overbought and data.iloc[i - 2]['RSI'] >= overbought:
-            if prev_row['position'] >= trade_volume:
-                current_open = current_row['开盘']
-                sell_revenue = current_open * trade_volume * (1 - commission_rate)
-                data.iloc[i, data.columns.get_loc('signal')] = -1
-                data.iloc[i, data.columns.get_loc('position')] = prev_row['position'] - trade_volume
-                data.iloc[i, data.columns.get_loc('cash')] = prev_row['cash'] + sell_revenue
-                data.iloc[i, data.columns.get_loc('trade_amount')] = sell_revenue
-
-        # 计算资产
-        current_close = current_row['收盘']
-        data.iloc[i, data.columns.get_loc('stock_value')] = data.iloc[i]['position'] * current_close
-        data.iloc[i, data.columns.get_loc('total_asset')] = data.iloc[i]['cash'] + data.iloc[i]['stock_value']
-
+    buy, sell = rsi_cross_signals(data['RSI'].to_numpy(), overbought, oversold)
+    signal, position, cash, trade_amount = run_rsi_engine(
+        data['开盘'].to_numpy(dtype=float), buy, sell, initial_capital, trade_volume, commission_rate
+    )
+    # 计算资产, 第一根k线保持初始值
+    stock_value = position * data['收盘'].to_numpy(dtype=float)
+    stock_value[:1] = 0.0
+    total_asset = cash + stock_value
+    total_asset[:1] = initial_capital
+
+    data['signal'] = signal
+    data['position'] = position
+    data['cash'] = cash
+    data['stock_value'] = stock_value
+    data['total_asset'] = total_asset
+    data['trade_amount'] = trade_amount
     return data
 
 
+# 批量回测参数组合, 每个周期只计算一次RSI, 用于参数寻优的热力图
+def backtest_rsi_grid(data, rsi_periods=range(5, 31), overboughts=range(60, 91, 5), oversolds=range(10, 41, 5),
+                      initial_capital=100000, trade_volume=100, commission_rate=0.0003):
+    columns = ['rsi_period', 'overbought', 'oversold', 'final_asset', 'total_return', 'trade_count']
+    if data.empty:
+        return pd.DataFrame(columns=columns)
+    open_prices = data['开盘'].to_numpy(dtype=float)
+    last_close = float(data['收盘'].iloc[-1])
+    records = []
+    for rsi_period in rsi_periods:
+        rsi = calculate_rsi(data[['收盘']], rsi_period)['RSI'].to_numpy()
+        for overbought in overboughts:
+            for oversold in oversolds:
+                buy, sell = rsi_cross_signals(rsi, overbought, oversold)
+                signal, position, cash, _ = run_rsi_engine(
+                    open_prices, buy, sell, initial_capital, trade_volume, commission_rate
+                )
+                final_asset = cash[-1] + position[-1] * last_close if len(data) > 1 else float(initial_capital)
+                records.append({
+                    'rsi_period': rsi_period,
+                    'overbought': overbought,
+                    'oversold': oversold,
+                    'final_asset': final_asset,
+                    'total_return': (final_asset - initial_capital) / initial_capital,
+                    'trade_count': int(np.count_nonzero(signal)),
+                })
+    return pd.DataFrame(records, columns=columns)
+
+
 # 绘制图表
 def plot_results(result_df, stock_name):
     fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(12, 12))
@@ -1,5 +1,7 @@
 from .ma_test import MaStrategyTest
 from .macross_test import MaCrossStrategyTest
+from .rotation_test import RotationStrategyTest
+from .rsi_test import RsiStrategyTest
 
 
-__all__ = ["MaStrategyTest", "MaCrossStrategyTest"]
\ No newline at end of file
+__all__ = ["MaStrategyTest", "MaCrossStrategyTest", "RotationStrategyTest", "RsiStrategyTest"]
\ No newline at end of file
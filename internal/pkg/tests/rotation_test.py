@@ -0,0 +1,108 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from internal.pkg.strategy.rotation import (
+    backtest_rotation_grid,
+    backtest_strategy,
+    calculate_performance_metrics,
+    calculate_technical_indicators,
+    performance_metrics,
+    run_rotation_engine,
+    select_stocks,
+)
+
+SYMBOL_DICT = {'沪深300': '510300', '创业板': '159915', '纳指': '513100', '黄金': '518880'}
+
+
+def backtest(data, symbol_dict, lookback_days):
+    """逐步回测一个组合, 作为批量回测的对照"""
+    data = calculate_technical_indicators(data.copy(), symbol_dict, lookback_days)
+    data = select_stocks(data, symbol_dict)
+    data = backtest_strategy(data, symbol_dict)
+    return calculate_performance_metrics(data)
+
+
+class RotationStrategyTest(unittest.TestCase):
+    """rotation strategy test"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        size = 300
+        self.data = pd.DataFrame({'日期': pd.bdate_range('2023-01-02', periods=size).strftime('%Y-%m-%d')})
+        for i, name in enumerate(SYMBOL_DICT):
+            close = 10 * (i + 1) * np.exp(rng.standard_normal(size).cumsum() * 0.02)
+            self.data[f'开盘_{name}'] = close * (1 + rng.standard_normal(size) * 0.005)
+            self.data[f'收盘_{name}'] = close
+        # 停牌缺失的价格
+        self.data.loc[100:104, '收盘_创业板'] = np.nan
+        self.data.loc[200, ['开盘_纳指', '收盘_纳指']] = np.nan
+
+    def test_run_rotation_engine(self):
+        open_matrix = np.array([[10, 20], [10, 20], [12, 20], [12, 20], [12, 20]], dtype=float)
+        close_matrix = np.array([[10, 20], [11, 20], [12.1, 20], [12, 22], [12, 30]], dtype=float)
+        # 空仓, 买入0, 持有0, 换成1, 空仓
+        profit = run_rotation_engine(open_matrix, close_matrix, [-1, 0, 0, 1, -1])
+        np.testing.assert_allclose(profit, [0, 0.1, 0.1, 0.1, 0])
+
+        # 缺失价格当日的收益率为空
+        close_matrix[2, 0] = np.nan
+        profit = run_rotation_engine(open_matrix, close_matrix, [-1, 0, 0, 1, -1])
+        np.testing.assert_allclose(profit, [0, 0.1, np.nan, 0.1, 0])
+
+        self.assertEqual(run_rotation_engine(open_matrix[:1], close_matrix[:1], [0]).tolist(), [0])
+
+    def test_performance_metrics(self):
+        max_backup, profit_ratio = performance_metrics([1.1, 0.99, 1.21, 1.1])
+        np.testing.assert_allclose(max_backup, [0.1, 0.1, -0.1, 0.11 / 1.21])
+        np.testing.assert_allclose(profit_ratio, [36.5, -0.01 * 365 / 2, 0.21 * 365 / 3, 0.1 * 365 / 4])
+
+        # 缺失的净值不参与之前最高净值
+        max_backup, profit_ratio = performance_metrics([1.1, np.nan, 0.88])
+        np.testing.assert_allclose(max_backup, [0.1, np.nan, 0.2])
+        np.testing.assert_allclose(profit_ratio, [36.5, np.nan, -0.12 * 365 / 3])
+
+    def test_grid(self):
+        symbol_sets = [list(SYMBOL_DICT), ['沪深300', '创业板'], ['纳指', '黄金', '创业板'], ['黄金']]
+        lookback_days_list = [3, 5, 20, 60]
+        result = backtest_rotation_grid(
+            self.data, SYMBOL_DICT, lookback_days_list=lookback_days_list, symbol_sets=symbol_sets
+        )
+        self.assertEqual(len(result), len(symbol_sets) * len(lookback_days_list))
+
+        for row in result.itertuples(index=False):
+            with self.subTest(lookback_days=row.轮动周期, symbol_set=row.标的组合):
+                symbol_dict = {name: SYMBOL_DICT[name] for name in row.标的组合.split(',')}
+                expected = backtest(self.data, symbol_dict, row.轮动周期)
+                np.testing.assert_array_equal(
+                    [row.最终净值, row.最大回撤, row.年化收益率],
+                    [expected['累计净值'].iloc[-1], expected['最大回撤'].max(), expected['年化收益率'].iloc[-1]],
+                )
+
+    def test_grid_nan_last_day(self):
+        # 最后一日持有的标的价格缺失时净值为空, 两种回测一致
+        data = self.data.copy()
+        data.loc[len(data) - 1, [f'收盘_{name}' for name in SYMBOL_DICT]] = np.nan
+        result = backtest_rotation_grid(data, SYMBOL_DICT, lookback_days_list=[5])
+        expected = backtest(data, SYMBOL_DICT, 5)
+        self.assertTrue(np.isnan(result['最终净值'].iloc[0]))
+        self.assertTrue(np.isnan(expected['累计净值'].iloc[-1]))
+        self.assertEqual(result['最大回撤'].iloc[0], expected['最大回撤'].max())
+
+    def test_no_trade(self):
+        # 一直下跌, 没有收益率为正的标的, 不买入
+        data = self.data.copy()
+        for i, name in enumerate(SYMBOL_DICT):
+            data[f'收盘_{name}'] = np.linspace(20, 10, len(data)) * (i + 1)
+        result = backtest(data, SYMBOL_DICT, 5)
+        self.assertEqual(result['购买标的涨跌幅'].dtype, np.int64)
+        self.assertTrue((result['购买标的涨跌幅'] == 0).all())
+        self.assertTrue((result['累计净值'] == 1).all())
+
+        trade_result = backtest(self.data, SYMBOL_DICT, 5)
+        self.assertEqual(trade_result['购买标的涨跌幅'].dtype, np.float64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from core.utils.testing import gen_kdata_df
+from internal.pkg.strategy.rsi import backtest_rsi_strategy, backtest_rsi_grid, calculate_rsi
+
+nan = np.nan
+
+
+def small_data() -> pd.DataFrame:
+    """
+    8根k线, rsi_period=2时:
+    RSI: nan, 0, 0, 50, 100, 100, 50, 0
+    第3根RSI上穿30, 第4根开盘买入; 第6根RSI下穿70, 第7根开盘卖出
+    """
+    data = pd.DataFrame(
+        {
+            '日期': pd.bdate_range('2023-01-02', periods=8).strftime('%Y-%m-%d'),
+            '开盘': [10, 9.5, 8, 8.5, 9, 10.5, 11, 9.5],
+            '收盘': [10, 9, 8, 9, 10, 11, 10, 9],
+        }
+    )
+    data.index = pd.to_datetime(data['日期'])
+    return data
+
+
+class RsiStrategyTest(unittest.TestCase):
+    """rsi strategy test"""
+
+    def setUp(self):
+        self.data = small_data()
+
+    def test_calculate_rsi(self):
+        result = calculate_rsi(self.data, 2)
+        np.testing.assert_allclose(result['RSI'], [nan, 0, 0, 50, 100, 100, 50, 0])
+
+    def test_backtest_rsi_strategy(self):
+        result = backtest_rsi_strategy(self.data, initial_capital=1000, commission_rate=0.001, rsi_period=2)
+        # 买入: 9 * 100 * 1.001 = 900.9, 卖出: 9.5 * 100 * 0.999 = 949.05
+        self.assertEqual(result['signal'].tolist(), [0, 0, 0, 0, 1, 0, 0, -1])
+        self.assertEqual(result['position'].tolist(), [0, 0, 0, 0, 100, 100, 100, 0])
+        np.testing.assert_allclose(result['trade_amount'], [0, 0, 0, 0, -900.9, 0, 0, 949.05])
+        np.testing.assert_allclose(result['cash'], [1000] * 4 + [99.1] * 3 + [1048.15])
+        np.testing.assert_allclose(result['stock_value'], [0, 0, 0, 0, 1000, 1100, 1000, 0])
+        np.testing.assert_allclose(result['total_asset'], [1000] * 4 + [1099.1, 1199.1, 1099.1, 1048.15])
+
+    def test_backtest_rsi_strategy_without_cash(self):
+        # 现金不够不买入, 没有持仓不卖出
+        result = backtest_rsi_strategy(self.data, initial_capital=900, commission_rate=0.001, rsi_period=2)
+        self.assertEqual(result['signal'].tolist(), [0] * 8)
+        self.assertEqual(result['position'].tolist(), [0] * 8)
+        np.testing.assert_allclose(result['total_asset'], [900] * 8)
+
+    def test_backtest_rsi_grid(self):
+        result = backtest_rsi_grid(
+            self.data, rsi_periods=[2], overboughts=[70, 110], oversolds=[30], initial_capital=1000,
+            commission_rate=0.001,
+        )
+        self.assertEqual(result['trade_count'].tolist(), [2, 1])
+        # 超买线110时不卖出, 按最后收盘价计算持仓
+        np.testing.assert_allclose(result['final_asset'], [1048.15, 99.1 + 900])
+        np.testing.assert_allclose(result['total_return'], [0.04815, -0.0009])
+
+    def test_backtest_rsi_grid_same_as_strategy(self):
+        data = gen_kdata_df(1, 500, columns=('open', 'close')).rename(columns={'open': '开盘', 'close': '收盘'})
+        data.index = pd.to_datetime(data['timestamp'])
+        result = backtest_rsi_grid(data, rsi_periods=[6, 14], overboughts=[60, 70], oversolds=[30, 40])
+        self.assertEqual(len(result), 8)
+        for row in result.itertuples():
+            expected = backtest_rsi_strategy(
+                data, rsi_period=row.rsi_period, overbought=row.overbought, oversold=row.oversold
+            )
+            self.assertAlmostEqual(row.final_asset, expected['total_asset'].iloc[-1])
+            self.assertEqual(row.trade_count, (expected['signal'] != 0).sum())
+
+    def test_backtest_rsi_grid_short_data(self):
+        result = backtest_rsi_grid(self.data.iloc[:0], rsi_periods=[6], overboughts=[70], oversolds=[30])
+        self.assertTrue(result.empty)
+        self.assertEqual(
+            result.columns.tolist(),
+            ['rsi_period', 'overbought', 'oversold', 'final_asset', 'total_return', 'trade_count'],
+        )
+
+        result = backtest_rsi_grid(self.data.iloc[:1], rsi_periods=[6], overboughts=[70], oversolds=[30])
+        self.assertEqual(result['final_asset'].tolist(), [100000.0])
+        self.assertEqual(result['trade_count'].tolist(), [0])
@@ -1,6 +1,15 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter
+import io
+from datetime import datetime
+from enum import Enum
+from typing import Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+from fastapi import APIRouter, HTTPException, Query
 from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Boolean, DateTime, Float, Integer
 
 import core.contract as contract
 import core.contract.api as contract_api
@@ -45,3 +54,116 @@ def query_data(provider: str, schema: str):
     model: contract.Mixin = contract_api.get_schema_by_name(schema)
     with contract_api.DBSession(provider=provider, data_schema=model)() as session:
         return jsonable_encoder(model.query_data(session=session, limit=100, return_type="domain"))
+
+
+class ExportFormat(Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+    arrow = "arrow"
+
+
+_export_media_types = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+    ExportFormat.arrow: "application/vnd.apache.arrow.stream",
+}
+
+
+def _iter_ndjson(chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    for df in chunks:
+        if not df.empty:
+            yield df.to_json(orient="records", lines=True, date_format="iso", force_ascii=False).rstrip("\n").encode(
+                "utf-8"
+            ) + b"\n"
+
+
+def _iter_csv(chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    header = True
+    for df in chunks:
+        yield df.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+
+
+def _arrow_type(column) -> pa.DataType:
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("ns")
+    return pa.string()
+
+
+def _iter_arrow(chunks: Iterator[pd.DataFrame], model) -> Iterator[bytes]:
+    sink = io.BytesIO()
+    writer = None
+    schema = None
+    for df in chunks:
+        if writer is None:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            # 第一块中全为空的列没有类型, 按数据库的列类型
+            for i, field in enumerate(schema):
+                if pa.types.is_null(field.type):
+                    schema = schema.set(i, pa.field(field.name, _arrow_type(model.__table__.columns[field.name])))
+            writer = pa.ipc.new_stream(sink, schema)
+        writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate(0)
+    if writer is not None:
+        writer.close()
+        yield sink.getvalue()
+
+
+@data_router.get("/export_data")
+def export_data(
+    provider: str,
+    schema: str,
+    entity_ids: Optional[List[str]] = Query(default=None),
+    codes: Optional[List[str]] = Query(default=None),
+    start_timestamp: Optional[datetime] = None,
+    end_timestamp: Optional[datetime] = None,
+    columns: Optional[List[str]] = Query(default=None),
+    export_format: ExportFormat = ExportFormat.ndjson,
+    after_id: Optional[str] = None,
+    limit: Optional[int] = Query(default=None, gt=0),
+    chunk_size: int = Query(default=10000, gt=0, le=100000),
+):
+    """
+    Export data ordered by id as ndjson, csv or arrow stream
+
+    The rows are read by server side cursor in chunks and streamed. For keyset pagination pass limit,
+    and the id of the last row as after_id to get the next page, which is returned in X-Next-Cursor header
+    """
+    model: contract.Mixin = contract_api.get_schema_by_name(schema)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"schema {schema} not found")
+    if columns:
+        unknown_columns = set(columns) - set(contract_api.get_schema_columns(model))
+        if unknown_columns:
+            raise HTTPException(status_code=400, detail=f"unknown columns: {sorted(unknown_columns)}")
+
+    filters = dict(
+        provider=provider,
+        entity_ids=entity_ids,
+        codes=codes,
+        start_timestamp=start_timestamp,
+        end_timestamp=end_timestamp,
+        after_id=after_id,
+    )
+    headers = {}
+    if limit:
+        next_cursor = contract_api.get_next_data_cursor(model, limit=limit, **filters)
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+
+    chunks = contract_api.iter_data(model, columns=columns, limit=limit, chunk_size=chunk_size, **filters)
+    if export_format == ExportFormat.csv:
+        content = _iter_csv(chunks)
+    elif export_format == ExportFormat.arrow:
+        content = _iter_arrow(chunks, model)
+    else:
+        content = _iter_ndjson(chunks)
+    return StreamingResponse(content, media_type=_export_media_types[export_format], headers=headers)
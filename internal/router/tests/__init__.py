@@ -0,0 +1,4 @@
+from .data_test import ExportDataTest
+
+
+__all__ = ["ExportDataTest"]
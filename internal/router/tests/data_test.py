@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import io
+import json
+import unittest
+
+import pandas as pd
+import pyarrow as pa
+
+from core.contract.api import df_to_db
+from core.utils.testing import MOCK_DB_NAME, MOCK_PROVIDER, MockBase, MockKdata, use_sqlite_db
+from internal.router.data import ExportFormat, export_data
+
+ENTITY_IDS = ["stock_sz_000001", "stock_sz_000002"]
+
+
+def gen_kdata() -> pd.DataFrame:
+    timestamps = pd.date_range("2024-01-01", periods=3)
+    return pd.DataFrame(
+        {
+            "id": [f"{entity_id}_{ts.strftime('%Y-%m-%d')}" for entity_id in ENTITY_IDS for ts in timestamps],
+            "entity_id": [entity_id for entity_id in ENTITY_IDS for _ in timestamps],
+            "code": [entity_id[-6:] for entity_id in ENTITY_IDS for _ in timestamps],
+            "timestamp": timestamps.append(timestamps),
+            # 第一个标的的close和name全为空
+            "name": [None] * 3 + ["平安"] * 3,
+            "close": [None] * 3 + [1.5, 2.5, 3.5],
+        }
+    )
+
+
+def export(**kwargs):
+    """直接调用时Query参数没有默认值, 按接口的默认值补全"""
+    params = dict(
+        provider=MOCK_PROVIDER,
+        schema="MockKdata",
+        entity_ids=None,
+        codes=None,
+        start_timestamp=None,
+        end_timestamp=None,
+        columns=None,
+        export_format=ExportFormat.ndjson,
+        after_id=None,
+        limit=None,
+        chunk_size=10000,
+    )
+    params.update(kwargs)
+    return export_data(**params)
+
+
+def read_body(response) -> bytes:
+    async def _read():
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    return asyncio.run(_read())
+
+
+class ExportDataTest(unittest.TestCase):
+    def setUp(self) -> None:
+        use_sqlite_db(self, provider=MOCK_PROVIDER, db_name=MOCK_DB_NAME, schema_base=MockBase)
+        df_to_db(gen_kdata(), MockKdata, provider=MOCK_PROVIDER)
+
+    def test_ndjson(self):
+        response = export(columns=["close"], chunk_size=2)
+        self.assertEqual(response.media_type, "application/x-ndjson")
+        self.assertNotIn("X-Next-Cursor", response.headers)
+        rows = [json.loads(line) for line in read_body(response).decode("utf-8").splitlines()]
+        self.assertEqual(
+            rows[0], {"id": "stock_sz_000001_2024-01-01", "close": None, "timestamp": "2024-01-01T00:00:00.000"}
+        )
+        self.assertEqual([row["close"] for row in rows], [None, None, None, 1.5, 2.5, 3.5])
+
+    def test_csv(self):
+        response = export(columns=["entity_id", "close"], export_format=ExportFormat.csv, chunk_size=4)
+        self.assertEqual(response.media_type, "text/csv")
+        # 只有第一块有表头
+        df = pd.read_csv(io.BytesIO(read_body(response)))
+        self.assertEqual(df.columns.tolist(), ["id", "entity_id", "close", "timestamp"])
+        self.assertEqual(df["entity_id"].tolist(), [ENTITY_IDS[0]] * 3 + [ENTITY_IDS[1]] * 3)
+        self.assertEqual(df["close"].fillna(0).tolist(), [0, 0, 0, 1.5, 2.5, 3.5])
+
+    def test_arrow_null_first_chunk(self):
+        response = export(columns=["name", "close"], export_format=ExportFormat.arrow, chunk_size=3)
+        self.assertEqual(response.media_type, "application/vnd.apache.arrow.stream")
+        table = pa.ipc.open_stream(read_body(response)).read_all()
+        # 第一块全为空的列按数据库的列类型
+        self.assertEqual(table.schema.field("name").type, pa.string())
+        self.assertEqual(table.schema.field("close").type, pa.float64())
+        self.assertEqual(table.schema.field("timestamp").type, pa.timestamp("ns"))
+        self.assertEqual(table.column("close").to_pylist(), [None, None, None, 1.5, 2.5, 3.5])
+        self.assertEqual(table.column("name").to_pylist(), [None, None, None, "平安", "平安", "平安"])
+
+    def test_keyset_paging(self):
+        ids = []
+        after_id = None
+        while True:
+            response = export(columns=["id"], after_id=after_id, limit=4, chunk_size=3)
+            ids.extend(json.loads(line)["id"] for line in read_body(response).decode("utf-8").splitlines())
+            after_id = response.headers.get("X-Next-Cursor")
+            if after_id is None:
+                break
+            self.assertEqual(after_id, ids[-1])
+        self.assertEqual(ids, sorted(gen_kdata()["id"]))
+
+    def test_bad_request(self):
+        from fastapi import HTTPException
+
+        with self.assertRaises(HTTPException) as context:
+            export(schema="NoSuchKdata")
+        self.assertEqual(context.exception.status_code, 404)
+        with self.assertRaises(HTTPException) as context:
+            export(columns=["close", "no_such_column"])
+        self.assertEqual(context.exception.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
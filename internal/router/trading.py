@@ -1,7 +1,7 @@
 import platform
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from fastapi_pagination import Page
 
 import core.contract.api as contract_api
@@ -22,6 +22,7 @@ from core.trading.trading_models import (
     TSModel,
     TSRequestModel,
     QuoteStatsModel,
+    DataFormat,
 )
 from core.trading.trading_schemas import QueryStockQuoteSetting
 
@@ -32,14 +33,23 @@ trading_router = APIRouter(
 )
 
 
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
 @trading_router.post("/query_kdata", response_model=Optional[List[KdataModel]])
-def query_kdata(kdata_request_model: KdataRequestModel):
-    return trading_service.query_kdata(kdata_request_model)
+def query_kdata(kdata_request_model: KdataRequestModel, data_format: DataFormat = DataFormat.rows):
+    result = trading_service.query_kdata(kdata_request_model, data_format)
+    if data_format == DataFormat.arrow:
+        return Response(content=result, media_type=ARROW_STREAM_MEDIA_TYPE)
+    return result
 
 
 @trading_router.post("/query_ts", response_model=Optional[List[TSModel]])
-def query_kdata(ts_request_model: TSRequestModel):
-    return trading_service.query_ts(ts_request_model)
+def query_ts(ts_request_model: TSRequestModel, data_format: DataFormat = DataFormat.rows):
+    result = trading_service.query_ts(ts_request_model, data_format)
+    if data_format == DataFormat.arrow:
+        return Response(content=result, media_type=ARROW_STREAM_MEDIA_TYPE)
+    return result
 
 
 @trading_router.get("/get_quote_stats", response_model=Optional[QuoteStatsModel])
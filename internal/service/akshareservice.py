@@ -1,5 +1,8 @@
 #AkShare 数据
 import akshare as ak
+import pandas as pd
+
+from internal.service.cacheservice import get_market_data_cache
 
 # 获取股票名称
 def get_stock_name(stock_code):
@@ -14,4 +17,26 @@ def get_stock_name(stock_code):
         print("未能找到股票简称信息")
     if len(stock_name) == 0:
         return
-    return stock_name
\ No newline at end of file
+    return stock_name
+
+
+# 获取个股历史行情, 优先读取本地缓存
+def get_stock_hist(symbol, period="daily", start_date="19700101", end_date="20500101", adjust="") -> pd.DataFrame:
+    return get_market_data_cache().get(
+        key=f"stock_zh_a_hist_{symbol}_{period}_{adjust or 'none'}",
+        start_date=start_date,
+        end_date=end_date,
+        fetch=lambda start, end: ak.stock_zh_a_hist(
+            symbol=symbol, period=period, start_date=start, end_date=end, adjust=adjust
+        ),
+    )
+
+
+# 获取指数历史行情, 优先读取本地缓存
+def get_index_hist(symbol, period="daily", start_date="19700101", end_date="22220101") -> pd.DataFrame:
+    return get_market_data_cache().get(
+        key=f"index_zh_a_hist_{symbol}_{period}",
+        start_date=start_date,
+        end_date=end_date,
+        fetch=lambda start, end: ak.index_zh_a_hist(symbol=symbol, period=period, start_date=start, end_date=end),
+    )
@@ -1,6 +1,12 @@
+import itertools
 import logging
+import math
+import os
+import threading
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Type
 
-import akshare as ak
 import backtrader as bt
 import backtrader.analyzers as btanalyzers
 import pandas as pd
@@ -8,6 +14,7 @@ import streamlit as st
 from loguru import logger
 
 from internal.domain.schemas import AkshareParams, StrategyBase, BacktraderParams
+from internal.service.akshareservice import get_stock_hist
 
 logging.getLogger("streamlit.runtime.scriptrunner_utils").setLevel(logging.ERROR)
 
@@ -15,9 +22,8 @@ logging.getLogger("streamlit.runtime.scriptrunner_utils").setLevel(logging.ERROR
 model_hash_func = lambda x: x.model_dump()
 
 
-@st.cache_data(hash_funcs={AkshareParams: model_hash_func})
 def gen_stock_df(ak_params: AkshareParams) -> pd.DataFrame:
-    """生成股票数据
+    """生成股票数据, 优先读取本地缓存
 
     Args:
         ak_params (AkshareParams): akshare 参数
@@ -25,32 +31,94 @@ def gen_stock_df(ak_params: AkshareParams) -> pd.DataFrame:
     Returns:
         pd.DataFrame: 股票历史数据
     """
-    df = ak.stock_zh_a_hist(**ak_params.model_dump())
+    df = get_stock_hist(**ak_params.model_dump())
     if not df.empty:
         return df[["日期", "开盘", "收盘", "最高", "最低", "成交量"]]
     return pd.DataFrame()
 
 
-@st.cache_data(hash_funcs={StrategyBase: model_hash_func, BacktraderParams: model_hash_func})
-def run_backtrader(stock_df: pd.DataFrame, strategy: StrategyBase, bt_params: BacktraderParams) -> pd.DataFrame:
-    """运行回测
+def get_strategy_class(name: str) -> Type[bt.Strategy]:
+    """根据策略名称导入策略类
 
     Args:
-        stock_df (pd.DataFrame): 股票数据
-        strategy (StrategyBase): 策略名称和参数
-        bt_params (BacktraderParams): 回测参数
+        name (str): 策略名称
 
     Returns:
-        pd.DataFrame: 回测结果
+        Type[bt.Strategy]: 策略类
+    """
+    try:
+        return getattr(__import__("strategy"), f"{name}Strategy")
+    except (ImportError, AttributeError) as e:
+        logger.error(f"策略导入失败: {e}")
+        raise ValueError(f"无法找到策略: {name}Strategy")
+
+
+def split_params(params: Dict[str, Any], shard_count: int) -> List[Dict[str, list]]:
+    """把参数网格按参数顺序切分为多个子网格, 依次拼接子网格的组合和原网格 cerebro.optstrategy 的顺序一致
+
+    前面的参数在每个子网格中只有一个值时才继续切分后面的参数, 所以子网格的个数可能少于 shard_count
+
+    Args:
+        params (Dict[str, Any]): 策略参数, 值为单个值或可迭代的候选值
+        shard_count (int): 期望的子网格个数
+
+    Returns:
+        List[Dict[str, list]]: 子网格
+    """
+    params = {k: list(v) if isinstance(v, Iterable) and not isinstance(v, str) else [v] for k, v in params.items()}
+    shards = [params]
+    for key, values in params.items():
+        if len(shards) >= shard_count:
+            break
+        chunk_size = math.ceil(len(values) / min(len(values), math.ceil(shard_count / len(shards))))
+        chunks = [values[i : i + chunk_size] for i in range(0, len(values), chunk_size)]
+        shards = [{**shard, key: chunk} for shard in shards for chunk in chunks]
+        # 子网格中这个参数有多个值时, 再切分后面的参数子网格就不是原网格中连续的一段了
+        if chunk_size > 1:
+            break
+    return shards
+
+
+class SweepCerebro(bt.Cerebro):
+    """在当前进程内运行参数网格的 Cerebro
+
+    cerebro.run(maxcpus=1) 每个参数组合都会重新加载数据, 这里和多进程寻优的 optdatas 一样,
+    数据只在第一个组合运行前预加载一次, 之后的组合复用预加载的数据.
     """
-    # 设置日期索引
-    stock_df.index = pd.to_datetime(stock_df["date"])
 
+    def runstrategies(self, iterstrat, predata=False):
+        if self._dooptimize and self.p.optdatas and self._dopreload and self._dorunonce:
+            if not getattr(self, "_sweep_preloaded", False):
+                for data in self.datas:
+                    data.reset()
+                    if self._exactbars < 1:  # datas can be full length
+                        data.extend(size=self.params.lookahead)
+                    data._start()
+                    data.preload()
+                self._sweep_preloaded = True
+            predata = True
+        return super().runstrategies(iterstrat, predata=predata)
+
+
+def run_backtrader_grid(
+    stock_df: pd.DataFrame, strategy_cls: Type[bt.Strategy], bt_params: BacktraderParams, params: Dict[str, Any]
+) -> List[list]:
+    """在当前进程运行参数网格的回测
+
+    Args:
+        stock_df (pd.DataFrame): 股票数据, 以日期为索引
+        strategy_cls (Type[bt.Strategy]): 策略类
+        bt_params (BacktraderParams): 回测参数
+        params (Dict[str, Any]): 策略参数网格
+
+    Returns:
+        List[list]: 每个参数组合的参数值和收益率, 最大回撤, 夏普比率
+    """
     # 创建数据源
     data = bt.feeds.PandasData(dataname=stock_df, fromdate=bt_params.start_date, todate=bt_params.end_date)
 
     # 初始化回测引擎
-    cerebro = bt.Cerebro()
+    cerebro = SweepCerebro()
     cerebro.adddata(data)
     cerebro.broker.setcash(bt_params.start_cash)# 设置初始资金
     cerebro.broker.setcommission(commission=bt_params.commission_fee) # 手续费 setcommission：支持按百分比或固定值设置手续费
@@ -64,23 +132,19 @@ def run_backtrader(stock_df: pd.DataFrame, strategy: StrategyBase, bt_params: Ba
     #计算年化收益率
     cerebro.addanalyzer(btanalyzers.Returns, _name="returns")
 
-    # 动态导入策略类
-    try:
-        strategy_cli = getattr(__import__("strategy"), f"{strategy.name}Strategy")
-        cerebro.optstrategy(strategy_cli, **strategy.params)
-    except (ImportError, AttributeError) as e:
-        logger.error(f"策略导入失败: {e}")
-        raise ValueError(f"无法找到策略: {strategy.name}Strategy")
+    cerebro.optstrategy(strategy_cls, **params)
 
-    # 运行回测
-    back = cerebro.run()
+    # 运行回测, 并行由调用方控制
+    back = cerebro.run(maxcpus=1)
+    for d in cerebro.datas:
+        d.stop()
 
     # 处理回测结果
     par_list = []
     for x in back:# 遍历所有参数组合的回测结果
         # 收集策略参数
         par = []
-        for param in strategy.params.keys():
+        for param in params.keys():
             par.append(x[0].params._getkwargs()[param])
 
         # 添加性能指标
@@ -92,9 +156,131 @@ def run_backtrader(stock_df: pd.DataFrame, strategy: StrategyBase, bt_params: Ba
             ]
         )
         par_list.append(par)
+    return par_list
+
 
-    # 创建结果数据框
-    columns = list(strategy.params.keys())
-    columns.extend(["return", "dd", "sharpe"])
-    par_df = pd.DataFrame(par_list, columns=columns)
-    return par_df
+# 子进程中的回测数据, 每个进程只传递一次
+_worker_context = {}
+
+
+def _init_sweep_worker(stock_df: pd.DataFrame, strategy_name: str, bt_params: BacktraderParams):
+    _worker_context["stock_df"] = stock_df
+    _worker_context["strategy_cls"] = get_strategy_class(strategy_name)
+    _worker_context["bt_params"] = bt_params
+
+
+def _run_sweep_shard(params: Dict[str, list]) -> List[list]:
+    return run_backtrader_grid(
+        _worker_context["stock_df"], _worker_context["strategy_cls"], _worker_context["bt_params"], params
+    )
+
+
+class ParamSweep:
+    """参数寻优执行器
+
+    把策略参数网格切分为子网格后交给进程池运行, 股票数据在每个进程初始化时传递一次,
+    iter_results 按完成顺序返回每个子网格的结果, cancel 可在运行中取消还未开始的子网格.
+
+    Example:
+        sweep = ParamSweep(stock_df, strategy, bt_params)
+        for part_df in sweep.iter_results():
+            ...
+    """
+
+    def __init__(
+        self,
+        stock_df: pd.DataFrame,
+        strategy: StrategyBase,
+        bt_params: BacktraderParams,
+        maxcpus: Optional[int] = None,
+        shard_count: Optional[int] = None,
+    ):
+        """
+        Args:
+            stock_df (pd.DataFrame): 股票数据
+            strategy (StrategyBase): 策略名称和参数
+            bt_params (BacktraderParams): 回测参数
+            maxcpus (Optional[int]): 最大进程数, 默认为cpu个数, 1则在当前进程运行
+            shard_count (Optional[int]): 子网格个数, 默认每个进程4个
+        """
+        self.stock_df = stock_df.copy()
+        # 设置日期索引
+        self.stock_df.index = pd.to_datetime(self.stock_df["date"])
+        self.strategy = strategy
+        self.bt_params = bt_params
+        self.maxcpus = maxcpus or os.cpu_count() or 1
+        self.shards = split_params(strategy.params, shard_count or self.maxcpus * 4)
+        self.maxcpus = min(self.maxcpus, len(self.shards))
+        self.columns = list(strategy.params.keys()) + ["return", "dd", "sharpe"]
+        # 每个子网格的参数组合个数
+        self.shard_sizes = [math.prod(len(v) for v in shard.values()) for shard in self.shards]
+        self.cancelled = threading.Event()
+
+    @property
+    def size(self) -> int:
+        """参数组合的总个数"""
+        return sum(self.shard_sizes)
+
+    def cancel(self):
+        """取消寻优, 正在运行的子网格完成后停止"""
+        self.cancelled.set()
+
+    def iter_results(self) -> Iterator[pd.DataFrame]:
+        """按完成顺序返回子网格的回测结果, 索引为参数组合在原网格中的位置
+
+        Yields:
+            pd.DataFrame: 子网格的回测结果
+        """
+        strategy_cls = get_strategy_class(self.strategy.name)
+        # 子网格第一个组合在原网格中的位置
+        offsets = list(itertools.accumulate(self.shard_sizes, initial=0))
+
+        def to_df(i, par_list):
+            return pd.DataFrame(par_list, index=range(offsets[i], offsets[i] + len(par_list)), columns=self.columns)
+
+        if self.maxcpus == 1:
+            for i, shard in enumerate(self.shards):
+                if self.cancelled.is_set():
+                    return
+                yield to_df(i, run_backtrader_grid(self.stock_df, strategy_cls, self.bt_params, shard))
+            return
+
+        executor = ProcessPoolExecutor(
+            max_workers=self.maxcpus,
+            initializer=_init_sweep_worker,
+            initargs=(self.stock_df, self.strategy.name, self.bt_params),
+        )
+        try:
+            futures = {executor.submit(_run_sweep_shard, shard): i for i, shard in enumerate(self.shards)}
+            for future in as_completed(futures):
+                if self.cancelled.is_set():
+                    return
+                yield to_df(futures[future], future.result())
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def run(self) -> pd.DataFrame:
+        """运行所有参数组合
+
+        Returns:
+            pd.DataFrame: 回测结果, 顺序和参数网格一致
+        """
+        dfs = list(self.iter_results())
+        if not dfs:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(dfs).sort_index().reset_index(drop=True)
+
+
+@st.cache_data(hash_funcs={StrategyBase: model_hash_func, BacktraderParams: model_hash_func})
+def run_backtrader(stock_df: pd.DataFrame, strategy: StrategyBase, bt_params: BacktraderParams) -> pd.DataFrame:
+    """运行回测
+
+    Args:
+        stock_df (pd.DataFrame): 股票数据
+        strategy (StrategyBase): 策略名称和参数
+        bt_params (BacktraderParams): 回测参数
+
+    Returns:
+        pd.DataFrame: 回测结果
+    """
+    return ParamSweep(stock_df, strategy, bt_params).run()
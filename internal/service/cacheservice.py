@@ -0,0 +1,253 @@
+#行情数据本地缓存
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# 缓存根目录, 多个streamlit进程共用
+MARKET_DATA_CACHE_DIR = "data/market_cache"
+# 缓存文件总大小上限, 超过时删除最久未使用的文件
+MARKET_DATA_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+_DATE_FORMAT = "%Y-%m-%d"
+
+
+def _normalize(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    if df is None or df.empty:
+        return pd.DataFrame()
+    df = df.copy()
+    df['日期'] = pd.to_datetime(df['日期']).dt.strftime(_DATE_FORMAT)
+    return df
+
+
+class MarketDataCache:
+    """
+    按日期的行情数据缓存, 每个key(如 stock_zh_a_hist_000001_daily_hfq)一个parquet文件
+
+    文件的元数据记录已经覆盖的日期范围, 请求的日期超出范围时只获取缺少的头部和尾部,
+    覆盖范围最多到今天, 今天的数据可能是盘中数据, 会按refresh_interval重新获取. 复权数据在除权后会整体变化,
+    获取头部和尾部时和缓存重叠一个交易日, 校验不一致时重新获取整个范围.
+    获取到空数据(常见于限流)时不扩展覆盖的日期范围, 下次请求会重新获取.
+
+    文件通过临时文件替换写入, 多进程读写是安全的, 读取会更新文件的修改时间, 用于按LRU淘汰.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = MARKET_DATA_CACHE_DIR,
+        max_bytes: int = MARKET_DATA_CACHE_MAX_BYTES,
+        refresh_interval: float = 600,
+    ):
+        """
+        :param cache_dir: 缓存目录
+        :param max_bytes: 缓存文件总大小上限
+        :param refresh_interval: 请求包含今天时, 重新获取尾部的最小间隔(秒)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def _read(self, path: str):
+        table = pq.read_table(path)
+        metadata = table.schema.metadata or {}
+        if b"covered_start" not in metadata:
+            return None, None, None, 0
+        return (
+            table.to_pandas(),
+            pd.Timestamp(metadata[b"covered_start"].decode()),
+            pd.Timestamp(metadata[b"covered_end"].decode()),
+            float(metadata.get(b"fetched_at", b"0").decode()),
+        )
+
+    def _write(
+        self, path: str, df: pd.DataFrame, covered_start: pd.Timestamp, covered_end: pd.Timestamp, fetched_at: float
+    ):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {
+                **(table.schema.metadata or {}),
+                b"covered_start": covered_start.strftime(_DATE_FORMAT).encode(),
+                b"covered_end": covered_end.strftime(_DATE_FORMAT).encode(),
+                b"fetched_at": str(fetched_at).encode(),
+            }
+        )
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep: str = None):
+        """删除最久未使用的文件, 直到总大小不超过max_bytes"""
+        if not self.max_bytes or not os.path.isdir(self.cache_dir):
+            return
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".parquet"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total = total - size
+                logger.info(f"evict market data cache: {path}")
+            except FileNotFoundError:
+                pass
+
+    def get(
+        self,
+        key: str,
+        start_date,
+        end_date,
+        fetch: Callable[[str, str], pd.DataFrame],
+        verify_column: Optional[str] = "收盘",
+    ) -> pd.DataFrame:
+        """
+        获取[start_date, end_date]的数据, 优先读取缓存
+
+        :param key: 缓存的key
+        :param start_date:
+        :param end_date:
+        :param fetch: fetch(start_date, end_date)从网络获取数据, 日期格式为YYYYMMDD, 数据包含日期列
+        :param verify_column: 校验重叠交易日是否一致的列, None则不校验
+        :return: 按日期排序的数据
+        """
+        start = pd.Timestamp(start_date).normalize()
+        end = pd.Timestamp(end_date).normalize()
+        path = self.get_path(key)
+        now = time.time()
+        # 只能覆盖到今天, 今天的数据可能是盘中数据, 每隔refresh_interval秒重新获取
+        today = pd.Timestamp.now().normalize()
+        target_end = min(end, today)
+
+        def fetch_range(from_date, to_date):
+            return _normalize(fetch(from_date.strftime("%Y%m%d"), to_date.strftime("%Y%m%d")))
+
+        cached, covered_start, covered_end, fetched_at = None, None, None, 0
+        if os.path.exists(path):
+            try:
+                cached, covered_start, covered_end, fetched_at = self._read(path)
+            except Exception as e:
+                logger.warning(f"read market data cache {path} failed: {e}")
+
+        if cached is None:
+            df = fetch_range(start, end)
+            # 限流或网络错误时akshare常返回空数据, 不写入缓存
+            if df.empty:
+                return df
+            covered_start, covered_end, fetched_at = start, target_end, now
+            changed = True
+        else:
+            dates = cached['日期'].tolist() if not cached.empty else []
+            parts = [cached]
+            fetch_all = False
+            if start < covered_start:
+                # 和缓存重叠第一个交易日
+                head = fetch_range(start, pd.Timestamp(dates[0]) if dates else covered_start)
+                if not head.empty:
+                    if verify_column and dates and not self._is_consistent(cached, head, dates[0], verify_column):
+                        fetch_all = True
+                    else:
+                        parts.append(head)
+                        covered_start = start
+
+            if not fetch_all and (
+                target_end > covered_end or (target_end >= today and now - fetched_at > self.refresh_interval)
+            ):
+                # 和缓存重叠一个已经收盘的交易日
+                overlap_date = pd.Timestamp(dates[-2]) if len(dates) >= 2 else covered_end
+                tail = fetch_range(min(overlap_date, covered_end), target_end)
+                if not tail.empty:
+                    if verify_column and len(dates) >= 2 and not self._is_consistent(cached, tail, dates[-2], verify_column):
+                        fetch_all = True
+                    else:
+                        parts.append(tail)
+                        covered_end, fetched_at = target_end, now
+
+            if fetch_all:
+                # 复权数据整体变化, 重新获取整个范围, 获取失败时仍使用原来的缓存
+                logger.info(f"{key} changed, fetch all")
+                all_start, all_end = min(start, covered_start), max(target_end, covered_end)
+                all_df = fetch_range(all_start, all_end)
+                if not all_df.empty:
+                    parts = [all_df]
+                    covered_start, covered_end, fetched_at = all_start, all_end, now
+                else:
+                    parts = [cached]
+
+            changed = len(parts) > 1 or parts[0] is not cached
+            if len(parts) > 1:
+                df = pd.concat([part for part in parts if not part.empty], ignore_index=True)
+            else:
+                df = parts[0]
+
+        if changed:
+            if not df.empty:
+                df = df.drop_duplicates(subset=['日期'], keep='last').sort_values('日期', ignore_index=True)
+            with self.lock:
+                self._write(path, df, covered_start, covered_end, fetched_at)
+        else:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+
+        if df.empty:
+            return df
+        dates = df['日期']
+        return df[(dates >= start.strftime(_DATE_FORMAT)) & (dates <= end.strftime(_DATE_FORMAT))].reset_index(
+            drop=True
+        )
+
+    @staticmethod
+    def _is_consistent(cached: pd.DataFrame, fresh: pd.DataFrame, date: str, column: str) -> bool:
+        if fresh.empty or column not in fresh.columns:
+            return True
+        old_values = cached.loc[cached['日期'] == date, column].to_numpy(dtype=float)
+        new_values = fresh.loc[fresh['日期'] == date, column].to_numpy(dtype=float)
+        if len(old_values) == 0 or len(new_values) == 0:
+            return True
+        return bool(np.isclose(old_values[-1], new_values[-1]))
+
+    def clear(self):
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".parquet"):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+
+_market_data_cache = None
+_market_data_cache_lock = threading.Lock()
+
+
+def get_market_data_cache() -> MarketDataCache:
+    """进程内共用的行情缓存"""
+    global _market_data_cache
+    if _market_data_cache is None:
+        with _market_data_cache_lock:
+            if _market_data_cache is None:
+                _market_data_cache = MarketDataCache()
+    return _market_data_cache
@@ -1,7 +1,11 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import akshare as ak
 import pandas as pd
 import streamlit as st
 
+from internal.service.akshareservice import get_index_hist
+
 # etf数据获取函数
 @st.cache_data(ttl=3600)
 def get_etf_data():
@@ -33,31 +37,54 @@ def get_etf_data():
         st.error(f"ETF数据获取失败: {str(e)}")
         return pd.DataFrame()
 
+# 获取数据的最大并发数
+INDEX_HISTORY_MAX_WORKERS = 8
+
+
+def load_index_history(code, start_date, end_date):
+    """
+    获取指数的日线数据, 优先读取本地缓存, 只从网络补齐缓存没有覆盖的日期
+    """
+    df = get_index_hist(symbol=code, period="daily", start_date=start_date, end_date=end_date)
+    if df.empty:
+        return pd.DataFrame(columns=['日期', '开盘', '收盘'])
+    return df[['日期', '开盘', '收盘']]
+
+
 #获取多个指数的历史数据并合并
 def get_zh_history(symbol_dict, start_date, end_date):
     """
     获取多个指数的历史数据并合并
+
+    各指数并发获取(优先读取本地缓存), 再以第一个指数的日期为准一次拼接
     """
-    index_his = None
-    for name, code in symbol_dict.items():
-        try:
-            index_his_tmp = ak.index_zh_a_hist(
-                symbol=code,
-                period="daily",
-                start_date=start_date,
-                end_date=end_date
-            )
-            index_his_tmp = index_his_tmp[['日期', '开盘', '收盘']]
-            index_his_tmp.columns = ['日期', f'开盘_{name}', f'收盘_{name}']
-
-            if index_his is None:
-                index_his = index_his_tmp
-            else:
-                index_his = index_his.merge(index_his_tmp, on=['日期'], how='left')
-        except Exception as e:
-            st.error(f"获取{name}({code})数据失败: {str(e)}")
+    items = list(symbol_dict.items())
+    if not items:
+        return None
+
+    frames = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=min(INDEX_HISTORY_MAX_WORKERS, len(items))) as executor:
+        futures = {executor.submit(load_index_history, code, start_date, end_date): name for name, code in items}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                frames[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+
+    # streamlit的组件只能在主线程调用
+    wides = []
+    for name, code in items:
+        if name in errors:
+            st.error(f"获取{name}({code})数据失败: {str(errors[name])}")
             continue
+        index_his_tmp = frames[name].set_index('日期')
+        index_his_tmp.columns = [f'开盘_{name}', f'收盘_{name}']
+        wides.append(index_his_tmp)
 
-    if index_his is not None:
-        index_his = index_his.sort_values(['日期'])
-    return index_his
+    if not wides:
+        return None
+    # 和逐个left merge一样, 以第一个指数的日期为准
+    index_his = pd.concat(wides, axis=1).reindex(wides[0].index)
+    return index_his.rename_axis('日期').reset_index().sort_values(['日期'])
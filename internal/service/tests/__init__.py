@@ -0,0 +1,5 @@
+from .backtraderservice_test import ParamSweepTest, SplitParamsTest
+from .cacheservice_test import MarketDataCacheTest
+
+
+__all__ = ["ParamSweepTest", "SplitParamsTest", "MarketDataCacheTest"]
@@ -0,0 +1,127 @@
+import datetime
+import itertools
+import unittest
+from unittest import mock
+
+import backtrader as bt
+import backtrader.analyzers as btanalyzers
+import numpy as np
+import pandas as pd
+
+from internal.domain.schemas import BacktraderParams, StrategyBase
+from internal.pkg.strategy import MaCrossStrategy
+from internal.service import backtraderservice
+from internal.service.backtraderservice import ParamSweep, split_params
+
+
+class SplitParamsTest(unittest.TestCase):
+    """split_params test"""
+
+    def assert_product_order(self, params, shard_count):
+        shards = split_params(params, shard_count)
+        values = [list(v) if isinstance(v, (list, range)) else [v] for v in params.values()]
+        expected = list(itertools.product(*values))
+        result = [combination for shard in shards for combination in itertools.product(*shard.values())]
+        self.assertEqual(result, expected)
+        return shards
+
+    def test_split_params(self):
+        grids = [
+            {'a': [1, 2, 3, 4, 5], 'b': [10, 20, 30]},
+            {'a': [1, 2], 'b': [10, 20, 30], 'c': [7, 8, 9, 10]},
+            {'a': range(1, 8), 'b': 3, 'c': [1, 2]},
+            {'a': 1, 'b': 'x'},
+        ]
+        for params in grids:
+            for shard_count in [1, 2, 3, 4, 7, 16, 100]:
+                with self.subTest(params=params, shard_count=shard_count):
+                    self.assert_product_order(params, shard_count)
+
+    def test_split_later_params(self):
+        shards = self.assert_product_order({'a': [1, 2], 'b': [10, 20, 30]}, 6)
+        self.assertEqual(len(shards), 6)
+
+
+def plain_optstrategy(stock_df, strategy_cls, bt_params, params):
+    """不切分网格, 直接用 cerebro.optstrategy 运行, 作为寻优结果的对照"""
+    cerebro = bt.Cerebro()
+    cerebro.adddata(
+        bt.feeds.PandasData(
+            dataname=stock_df.set_index(pd.to_datetime(stock_df["date"])),
+            fromdate=bt_params.start_date,
+            todate=bt_params.end_date,
+        )
+    )
+    cerebro.broker.setcash(bt_params.start_cash)
+    cerebro.broker.setcommission(commission=bt_params.commission_fee)
+    cerebro.addsizer(bt.sizers.FixedSize, stake=bt_params.stake)
+    cerebro.addanalyzer(btanalyzers.SharpeRatio, _name="sharpe", riskfreerate=0.0)
+    cerebro.addanalyzer(btanalyzers.DrawDown, _name="drawdown")
+    cerebro.addanalyzer(btanalyzers.Returns, _name="returns")
+    cerebro.optstrategy(strategy_cls, **params)
+    rows = []
+    for x in cerebro.run(maxcpus=1):
+        kwargs = x[0].params._getkwargs()
+        rows.append(
+            [kwargs[param] for param in params]
+            + [
+                x[0].analyzers.returns.get_analysis()["rnorm100"],
+                x[0].analyzers.drawdown.get_analysis()["max"]["drawdown"],
+                x[0].analyzers.sharpe.get_analysis()["sharperatio"],
+            ]
+        )
+    return pd.DataFrame(rows, columns=list(params) + ["return", "dd", "sharpe"])
+
+
+class ParamSweepTest(unittest.TestCase):
+    """ParamSweep test, the result should be same as running the whole grid by optstrategy"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        size = 300
+        close = 10 + rng.standard_normal(size).cumsum() * 0.2
+        self.stock_df = pd.DataFrame(
+            {
+                "date": pd.bdate_range("2022-01-03", periods=size),
+                "open": close + rng.standard_normal(size) * 0.05,
+                "close": close,
+                "high": close + 0.2,
+                "low": close - 0.2,
+                "volume": 1000.0,
+            }
+        )
+        self.bt_params = BacktraderParams(
+            start_date=datetime.date(2022, 1, 1),
+            end_date=datetime.date(2023, 12, 31),
+            start_cash=100000,
+            commission_fee=0.001,
+            stake=100,
+        )
+        self.strategy = StrategyBase(name="MaCross", params={"fast_length": range(3, 12, 2), "slow_length": [20, 30]})
+        # 子进程由fork创建, 同样使用替换后的函数
+        patch = mock.patch.object(backtraderservice, "get_strategy_class", return_value=MaCrossStrategy)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.expected = plain_optstrategy(self.stock_df, MaCrossStrategy, self.bt_params, self.strategy.params)
+
+    def test_single_process(self):
+        for shard_count in (1, 3, 10):
+            with self.subTest(shard_count=shard_count):
+                sweep = ParamSweep(self.stock_df, self.strategy, self.bt_params, maxcpus=1, shard_count=shard_count)
+                self.assertEqual(sweep.size, 10)
+                pd.testing.assert_frame_equal(sweep.run(), self.expected)
+
+    def test_multi_process(self):
+        sweep = ParamSweep(self.stock_df, self.strategy, self.bt_params, maxcpus=2, shard_count=4)
+        self.assertEqual(sweep.maxcpus, 2)
+        pd.testing.assert_frame_equal(sweep.run(), self.expected)
+
+    def test_cancel(self):
+        sweep = ParamSweep(self.stock_df, self.strategy, self.bt_params, maxcpus=1, shard_count=5)
+        dfs = []
+        for part_df in sweep.iter_results():
+            dfs.append(part_df)
+            sweep.cancel()
+        # 取消后不再运行后面的子网格
+        self.assertEqual(len(dfs), 1)
+        pd.testing.assert_frame_equal(dfs[0], self.expected.iloc[: len(dfs[0])])
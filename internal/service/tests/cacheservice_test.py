@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from internal.service.cacheservice import MarketDataCache
+
+
+class MarketDataCacheTest(unittest.TestCase):
+    """MarketDataCache test"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = MarketDataCache(cache_dir=self.cache_dir)
+        self.dates = pd.bdate_range('2020-01-01', '2023-12-29')
+        self.scale = 1.0
+        self.fail = False
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def fetch(self, start_date, end_date):
+        self.calls.append((start_date, end_date))
+        if self.fail:
+            return pd.DataFrame()
+        mask = (self.dates >= pd.Timestamp(start_date)) & (self.dates <= pd.Timestamp(end_date))
+        return pd.DataFrame({'日期': self.dates[mask].date, '收盘': (np.flatnonzero(mask) + 1) * self.scale})
+
+    def expected(self, start_date, end_date):
+        return self.fetch(start_date, end_date)['收盘'].tolist()
+
+    def test_incremental_fetch(self):
+        self.cache.get('k', '20210101', '20220101', self.fetch)
+        df = self.cache.get('k', '20200601', '20230101', self.fetch)
+        self.assertEqual(self.calls[1:], [('20200601', '20210101'), ('20211230', '20230101')])
+        self.assertEqual(df['收盘'].tolist(), self.expected('20200601', '20230101'))
+
+        self.calls.clear()
+        self.cache.get('k', '20200801', '20221201', self.fetch)
+        self.assertEqual(self.calls, [])
+
+    def test_empty_fetch_not_covered(self):
+        self.fail = True
+        self.assertTrue(self.cache.get('k', '20210101', '20220101', self.fetch).empty)
+        self.fail = False
+        self.cache.get('k', '20210101', '20220101', self.fetch)
+
+        self.fail = True
+        self.cache.get('k', '20200601', '20230101', self.fetch)
+        self.fail = False
+        self.calls.clear()
+        df = self.cache.get('k', '20200601', '20230101', self.fetch)
+        self.assertEqual(self.calls, [('20200601', '20210101'), ('20211230', '20230101')])
+        self.assertEqual(df['收盘'].tolist(), self.expected('20200601', '20230101'))
+
+    def test_adjusted_head_fetch_all(self):
+        self.cache.get('k', '20210101', '20220101', self.fetch)
+        # 除权后前复权价格整体变化
+        self.scale = 2.0
+        df = self.cache.get('k', '20200601', '20220101', self.fetch)
+        self.assertEqual(df['收盘'].tolist(), self.expected('20200601', '20220101'))
+
+    def test_adjusted_tail_fetch_all(self):
+        self.cache.get('k', '20210101', '20220101', self.fetch)
+        self.scale = 2.0
+        df = self.cache.get('k', '20210101', '20230101', self.fetch)
+        self.assertEqual(df['收盘'].tolist(), self.expected('20210101', '20230101'))
@@ -1,8 +1,10 @@
 import datetime
 import logging
 
+import pandas as pd
+
 from internal.pkg.frames import params_selector_ui
-from internal.service.backtraderservice import gen_stock_df, run_backtrader
+from internal.service.backtraderservice import ParamSweep, gen_stock_df
 from core.utils.load import load_strategy
 from internal.domain.schemas import AkshareParams, BacktraderParams
 import streamlit as st
@@ -43,12 +45,39 @@ def stockAnalysis():
                 }
             )
             strategy = StrategyBase(name=name, params=params)
-            par_df = run_backtrader(stock_df, strategy, bt_params)
+            par_df = run_param_sweep(stock_df, strategy, bt_params)
+            if par_df.empty:
+                st.warning("Backtrader cancelled!")
+                return
             st.dataframe(par_df.style.highlight_max(subset=par_df.columns[-3:]))
             bar = draw_result_bar(par_df)
             st_pyecharts(bar, height="500px")
 
 
+def run_param_sweep(stock_df: pd.DataFrame, strategy: StrategyBase, bt_params: BacktraderParams) -> pd.DataFrame:
+    """run the param sweep with progress, the sweep could be cancelled before it's finished
+
+    :return: the results in the order of the params grid, empty if it's cancelled
+    """
+    sweep = ParamSweep(stock_df, strategy, bt_params)
+    progress = st.progress(0.0, text=f"0/{sweep.size}")
+    # 点击取消会重新运行页面, 回调中先停止还没开始的子网格
+    cancel = st.empty()
+    cancel.button("Cancel", on_click=sweep.cancel)
+
+    dfs = []
+    done = 0
+    for part_df in sweep.iter_results():
+        dfs.append(part_df)
+        done += len(part_df)
+        progress.progress(done / sweep.size, text=f"{done}/{sweep.size}")
+    cancel.empty()
+    progress.empty()
+    if sweep.cancelled.is_set() or not dfs:
+        return pd.DataFrame(columns=sweep.columns)
+    return pd.concat(dfs).sort_index().reset_index(drop=True)
+
+
 def akshare_selector_ui() -> AkshareParams:
     """akshare params
 
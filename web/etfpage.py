@@ -1,4 +1,5 @@
 import datetime
+import itertools
 
 import streamlit as st
 import re
@@ -6,7 +7,7 @@ from datetime import datetime, timedelta
 from internal.service.akshareservice import get_stock_name
 from internal.service.etfservice import get_etf_data, get_zh_history
 from internal.pkg.strategy.rotation import calculate_technical_indicators, calculate_performance_metrics, backtest_strategy, \
-    select_stocks, display_results
+    select_stocks, display_results, backtest_rotation_grid
 from core.utils.streamlit_utils import download_csv_button, color_negative_red
 
 
@@ -120,6 +121,7 @@ def show_rotation_strategy_page():
 
     # 回测按钮
     run_backtest = st.button("执行回测分析")
+    run_optimize = st.button("轮动周期和标的组合寻优")
 
     # 主内容区
     if run_backtest and selected_indices:
@@ -158,7 +160,29 @@ def show_rotation_strategy_page():
                     st.error(f"回测过程中发生错误: {str(e)}")
                     st.exception(e)
 
-    elif not selected_indices and run_backtest:
+    elif run_optimize and selected_indices:
+        st.divider()
+        st.subheader("📊 寻优结果")
+        select_pool = {k: default_pool[k] for k in selected_indices}
+        with st.spinner("正在获取数据并批量回测..."):
+            try:
+                index_data = get_zh_history(select_pool, start_date, end_date)
+                if index_data is None or len(index_data) == 0:
+                    st.error("未能获取有效数据，请检查参数设置")
+                    return
+                # 所有标的组合 × 轮动周期
+                symbol_sets = [
+                    list(c) for k in range(1, len(selected_indices) + 1)
+                    for c in itertools.combinations(selected_indices, k)
+                ]
+                grid_df = backtest_rotation_grid(index_data, select_pool, range(5, 61), symbol_sets)
+                st.metric("回测组合数", len(grid_df))
+                st.dataframe(grid_df.sort_values('最终净值', ascending=False).head(20), use_container_width=True)
+            except Exception as e:
+                st.error(f"寻优过程中发生错误: {str(e)}")
+                st.exception(e)
+
+    elif not selected_indices and (run_backtest or run_optimize):
        st.warning("请至少选择一个股票指数进行分析！")
     else:
        st.info("请在左侧边栏设置参数并点击【执行回测分析】按钮")
@@ -1,7 +1,6 @@
 import os
 import re
 import streamlit as st
-import akshare as ak
 import pandas as pd
 
 from core.contract import zvt_context, IntervalLevel, Mixin
@@ -10,8 +9,8 @@ from core.contract.drawer import StackedDrawer
 from core.trader.trader_info_api import get_order_securities, OrderReader, get_trader_info, AccountStatsReader
 from core.utils.pd_utils import pd_is_not_null
 from internal.domain.schemas import Stock
-from internal.service.akshareservice import get_stock_name
-from internal.pkg.strategy.rsi import backtest_rsi_strategy, plot_results
+from internal.service.akshareservice import get_stock_name, get_stock_hist
+from internal.pkg.strategy.rsi import backtest_rsi_strategy, backtest_rsi_grid, plot_results
 
 # 页面内容
 def show_stock_page():
@@ -52,13 +51,7 @@ def show_rsi_page():
         with st.spinner("正在执行回测..."):
             try:
                 # 获取数据
-                stock_df = ak.stock_zh_a_hist(
-                    symbol=stock_code,
-                    start_date=start_date.strftime("%Y%m%d"),
-                    end_date=end_date.strftime("%Y%m%d"),
-                    adjust="hfq"
-                )
-                stock_df.index = pd.to_datetime(stock_df['日期'])
+                stock_df = get_rsi_stock_df(stock_code, start_date, end_date)
 
                 # 执行回测
                 result_df = backtest_rsi_strategy(
@@ -76,6 +69,22 @@ def show_rsi_page():
             except Exception as e:
                 st.error(f"回测失败: {str(e)}")
 
+    if st.button("参数寻优"):
+        with st.spinner("正在批量回测参数组合..."):
+            try:
+                stock_df = get_rsi_stock_df(stock_code, start_date, end_date)
+                grid_df = backtest_rsi_grid(stock_df, initial_capital=initial_capital, trade_volume=trade_volume)
+                st.subheader("参数组合收益(各超买线中的最高收益)")
+                heatmap_df = grid_df.pivot_table(
+                    index="rsi_period", columns="oversold", values="total_return", aggfunc="max"
+                )
+                st.dataframe(heatmap_df.style.background_gradient(cmap="RdYlGn").format("{:.2%}"),
+                             use_container_width=True)
+                st.subheader("收益最高的参数组合")
+                st.dataframe(grid_df.nlargest(10, "total_return"), use_container_width=True)
+            except Exception as e:
+                st.error(f"参数寻优失败: {str(e)}")
+
     # 主显示区域
     if 'result_df' in st.session_state:
         result_df = st.session_state.result_df
@@ -120,6 +129,17 @@ def show_rsi_page():
     else:
         st.info("请在左侧设置参数并点击【开始回测】")
 
+def get_rsi_stock_df(stock_code, start_date, end_date):
+    stock_df = get_stock_hist(
+        symbol=stock_code,
+        start_date=start_date.strftime("%Y%m%d"),
+        end_date=end_date.strftime("%Y%m%d"),
+        adjust="hfq"
+    )
+    stock_df.index = pd.to_datetime(stock_df['日期'])
+    return stock_df
+
+
 def order_type_flag(order_type):
     if order_type == "order_long" or order_type == "order_close_short":
         return "B"